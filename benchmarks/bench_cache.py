@@ -0,0 +1,87 @@
+"""
+Бенчмарк кэша /events и /myevents в оживленном групповом чате
+
+--users участников шлют --requests команд /events и /myevents пачками по
+--concurrency одновременных запросов; каждый --write-every запрос -
+/addevent, который сбрасывает кэш. Сравнивается Database с кэшем и без
+него (cache_ttl=0) на базе с --rows событий.
+
+Запуск: python -m benchmarks.bench_cache --requests 20000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from benchmarks.fakes import make_message
+from benchmarks.stats import summarize
+from db.database import Database
+from handlers.commands import cmd_addevent, cmd_events, cmd_myevents, rendered_texts
+
+
+def fill(db_path: str, rows: int, users: int):
+    now = int(time.time())
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany("""
+            INSERT INTO events (title, description, event_date, created_by, created_at, chat_id)
+            VALUES (?, ?, ?, ?, ?, -100)
+        """, ((f"Событие {i}", "Описание", now + 3600 + i * 60, i % users, now) for i in range(rows)))
+
+
+async def run(db: Database, requests: int, concurrency: int, users: int, write_every: int, seed: int) -> list:
+    rng = random.Random(seed)
+    latencies = []
+    
+    async def one(index: int):
+        user_id = rng.randrange(users)
+        started = time.perf_counter()
+        if write_every and index % write_every == 0:
+            await cmd_addevent(make_message("/addevent +1 Новое событие", user_id, -100), None, db)
+        elif rng.random() < 0.7:
+            await cmd_events(make_message("/events", user_id, -100), db)
+        else:
+            await cmd_myevents(make_message("/myevents", user_id, -100), db)
+        latencies.append(time.perf_counter() - started)
+    
+    for start in range(0, requests, concurrency):
+        await asyncio.gather(*(one(index) for index in range(start, min(start + concurrency, requests))))
+    return latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--write-every", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    
+    for name, ttl in (("без кэша", 0), ("с кэшем", 30)):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "bench.db")
+            db = Database(db_path, cache_ttl=ttl)
+            fill(db_path, args.rows, args.users)
+            rendered_texts.clear()
+            rendered_texts.ttl = ttl
+            
+            started = time.perf_counter()
+            latencies = await run(db, args.requests, args.concurrency, args.users, args.write_every, args.seed)
+            elapsed = time.perf_counter() - started
+            stats = summarize(latencies)
+            cache = db.cache.stats()
+            print(
+                f"{name}: {args.requests / elapsed:.0f} команд/с, "
+                f"p50={stats['p50_ms']:.2f} мс p99={stats['p99_ms']:.2f} мс, "
+                f"попадания {cache['hit_rate']:.0%}, тексты {rendered_texts.stats()['hit_rate']:.0%}"
+            )
+            db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
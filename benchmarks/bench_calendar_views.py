@@ -0,0 +1,126 @@
+"""
+Бенчмарк /month: время вида месяца в календаре чата со 100 тыс. событий
+
+В календаре чата --events обычных событий, равномерно разбросанных по году,
+и --series еженедельных серий; в базе есть и другие чаты. Для каждого месяца
+года замеряется подсчет событий по дням:
+
+- счетчики: Database.get_day_counts по счетчикам за сутки UTC и краям
+  местных суток из 15-минутных корзин (холодный кэш);
+- скан: прежний способ - все события месяца по индексу
+  (chat_id, event_date) и подсчет по дням в Python;
+- кэш: повторный вид того же месяца.
+
+Отдельно замеряется, во сколько триггеры счетчиков обходятся массовой вставке.
+
+Запуск: python -m benchmarks.bench_calendar_views --events 100000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from bisect import bisect_right
+from datetime import date, datetime
+
+from benchmarks.stats import summarize
+from db.database import Database, _expand_series
+from db.timezones import get_zone
+from handlers.calendar_views import MONTH, day_bounds, shift_view, view_days
+
+CHAT = -100
+OTHER_CHATS = 100
+ZONE = "Europe/Moscow"
+
+
+def fill(db_path: str, events: int, series: int, year: int, seed: int) -> float:
+    """События чата CHAT за год year и столько же - в других чатах; вернуть время вставки"""
+    rng = random.Random(seed)
+    start = int(datetime(year, 1, 1).timestamp())
+    year_seconds = 365 * 86400
+    started = time.perf_counter()
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany("""
+            INSERT INTO events (title, description, event_date, created_by, created_at, chat_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (
+            (f"Событие {i}", "", start + rng.randrange(year_seconds), 1, start, CHAT if i % 2 else -1 - i % OTHER_CHATS)
+            for i in range(events * 2)
+        ))
+        conn.executemany("""
+            INSERT INTO events (title, description, event_date, created_by, created_at, chat_id, rrule)
+            VALUES (?, ?, ?, ?, ?, ?, 'FREQ=WEEKLY')
+        """, ((f"Серия {i}", "", start + rng.randrange(7 * 86400), 1, start, CHAT) for i in range(series)))
+    return time.perf_counter() - started
+
+
+def scan_counts(conn: sqlite3.Connection, bounds) -> list:
+    """Прежний способ: прочитать все события месяца и разложить по дням"""
+    counts = [0] * (len(bounds) - 1)
+    for (event_date,) in conn.execute("""
+        SELECT event_date FROM events WHERE chat_id = ? AND rrule IS NULL AND event_date >= ? AND event_date < ?
+    """, (CHAT, bounds[0], bounds[-1])):
+        counts[bisect_right(bounds, event_date) - 1] += 1
+    for row in _expand_series(conn, bounds[0], bounds[-1], CHAT).rows:
+        counts[bisect_right(bounds, row[3]) - 1] += 1
+    return counts
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=100_000)
+    parser.add_argument("--series", type=int, default=20)
+    parser.add_argument("--year", type=int, default=2030)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    zone = get_zone(ZONE)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        plain_path = os.path.join(tmp, "plain.db")
+        Database(plain_path).close()
+        with sqlite3.connect(plain_path) as conn:
+            for trigger in ("insert", "delete", "update_old", "update_new"):
+                conn.execute(f"DROP TRIGGER event_buckets_{trigger}")
+        plain = fill(plain_path, args.events, args.series, args.year, args.seed)
+        
+        db_path = os.path.join(tmp, "views.db")
+        db = Database(db_path)
+        counted = fill(db_path, args.events, args.series, args.year, args.seed)
+        print(
+            f"вставка {args.events * 2} событий: {plain:.1f} с без счетчиков, "
+            f"{counted:.1f} с с триггерами счетчиков"
+        )
+        
+        buckets, scans, cached = [], [], []
+        conn = sqlite3.connect(db_path)
+        first = date(args.year, 1, 1)
+        for _ in range(12):
+            bounds = day_bounds(first, view_days(MONTH, first), zone)
+            for _ in range(args.repeat):
+                db.cache.clear()
+                started = time.perf_counter()
+                counts = await db.get_day_counts(CHAT, bounds)
+                buckets.append(time.perf_counter() - started)
+                started = time.perf_counter()
+                await db.get_day_counts(CHAT, bounds)
+                cached.append(time.perf_counter() - started)
+                started = time.perf_counter()
+                expected = scan_counts(conn, bounds)
+                scans.append(time.perf_counter() - started)
+            assert counts == expected, first
+            first = shift_view(MONTH, first, 1)
+        conn.close()
+        db.close()
+    
+    print(f"вид месяца, {args.events} событий в календаре чата ({ZONE}):")
+    for name, samples in (("счетчики", buckets), ("скан", scans), ("кэш", cached)):
+        stats = summarize(samples)
+        print(f"  {name:<9} p50 {stats['p50_ms']:8.2f} мс, p99 {stats['p99_ms']:8.2f} мс")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+"""
+Бенчмарк /events в календарях чатов при большом числе групп
+
+В базе --chats групп по --per-chat предстоящих событий (у доли --series
+групп есть еще и ежедневная серия). Команды /events приходят из случайных
+групп; кэш списков выключен (cache_ttl=0), чтобы каждая команда доходила до
+SQLite. Сравнивается выборка по индексу (chat_id, event_date) с той же
+выборкой без него: тогда SQLite идет по общему индексу дат и отбрасывает
+события чужих чатов, пока не наберет страницу.
+
+Запуск: python -m benchmarks.bench_chats --chats 50000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from benchmarks.fakes import make_message
+from benchmarks.stats import summarize
+from db.database import Database
+from handlers.commands import cmd_events
+
+# id групп в Telegram отрицательные
+CHAT_BASE = -10 ** 12
+
+
+def fill(db_path: str, chats: int, per_chat: int, series: float, seed: int):
+    """События групп вперемешку по датам на месяц вперед"""
+    rng = random.Random(seed)
+    now = int(time.time())
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany("""
+            INSERT INTO events (title, description, event_date, created_by, created_at, chat_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (
+            (f"Событие {i}", "Описание", now + 3600 + rng.randrange(30 * 86400), i % 1000, now, CHAT_BASE - i % chats)
+            for i in range(chats * per_chat)
+        ))
+        conn.executemany("""
+            INSERT INTO events (title, description, event_date, created_by, created_at, chat_id, rrule)
+            VALUES (?, ?, ?, ?, ?, ?, 'FREQ=DAILY')
+        """, (
+            (f"Планерка {chat}", "", now - 86400 + rng.randrange(86400), chat % 1000, now, CHAT_BASE - chat)
+            for chat in range(chats) if rng.random() < series
+        ))
+
+
+async def run(db: Database, chats: int, requests: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    latencies = []
+    for _ in range(requests):
+        chat_id = CHAT_BASE - rng.randrange(chats)
+        started = time.perf_counter()
+        await cmd_events(make_message("/events", 1, chat_id), db)
+        latencies.append(time.perf_counter() - started)
+    return summarize(latencies)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=50_000)
+    parser.add_argument("--per-chat", type=int, default=10)
+    parser.add_argument("--series", type=float, default=0.1, help="доля групп с ежедневной серией")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--slow-requests", type=int, default=200, help="команд без индекса чата")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "chats.db")
+        Database(db_path).close()
+        started = time.perf_counter()
+        fill(db_path, args.chats, args.per_chat, args.series, args.seed)
+        print(
+            f"{args.chats} групп, {args.chats * args.per_chat} событий, "
+            f"заполнение {time.perf_counter() - started:.1f} с"
+        )
+        
+        db = Database(db_path, cache_ttl=0)
+        stats = await run(db, args.chats, args.requests, args.seed)
+        db.close()
+        print(f"индекс (chat_id, event_date): p50={stats['p50_ms']:.2f} мс  p99={stats['p99_ms']:.2f} мс  n={stats['count']}")
+        
+        with sqlite3.connect(db_path) as conn:
+            conn.execute("DROP INDEX idx_events_chat_date")
+            conn.execute("DROP INDEX idx_events_chat_series")
+        db = Database(db_path, cache_ttl=0)
+        stats = await run(db, args.chats, args.slow_requests, args.seed)
+        db.close()
+        print(f"без индекса чата:            p50={stats['p50_ms']:.2f} мс  p99={stats['p99_ms']:.2f} мс  n={stats['count']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,102 @@
+"""
+Бенчмарк разбора дат
+
+Сравнивает прежний parse_date (strptime с исключениями вместо проверок) с
+handlers.dates на смеси аргументов /addevent: абсолютные даты с временем и
+без, today/tomorrow, +N и неверные строки. Для новых форм (завтра в 10:00,
+in 2 hours) отдельно замеряется parse_date_prefix.
+
+Запуск: python -m benchmarks.bench_dates --calls 200000
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional
+
+from handlers.dates import parse_date, parse_date_prefix
+
+
+def legacy_parse_date(date_str: str) -> Optional[datetime]:
+    """Прежний parse_date из handlers/commands.py"""
+    date_str = date_str.lower().strip()
+    
+    try:
+        if " " in date_str:
+            return datetime.strptime(date_str, "%Y-%m-%d %H:%M")
+        else:
+            return datetime.strptime(date_str, "%Y-%m-%d")
+    except ValueError:
+        pass
+    
+    now = datetime.now()
+    
+    if date_str == "today":
+        return now.replace(hour=12, minute=0, second=0, microsecond=0)
+    elif date_str == "tomorrow":
+        tomorrow = now + timedelta(days=1)
+        return tomorrow.replace(hour=12, minute=0, second=0, microsecond=0)
+    elif date_str.startswith("+"):
+        try:
+            days = int(date_str[1:])
+            future_date = now + timedelta(days=days)
+            return future_date.replace(hour=12, minute=0, second=0, microsecond=0)
+        except ValueError:
+            pass
+    
+    return None
+
+
+def make_inputs(count: int, seed: int) -> List[str]:
+    """Аргументы в пропорциях живого чата: в основном даты с временем"""
+    rng = random.Random(seed)
+    inputs = []
+    for _ in range(count):
+        roll = rng.random()
+        day = f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        if roll < 0.5:
+            inputs.append(f"{day} {rng.randint(8, 20):02d}:{rng.choice((0, 15, 30, 45)):02d}")
+        elif roll < 0.7:
+            inputs.append(day)
+        elif roll < 0.85:
+            inputs.append(rng.choice(("today", "tomorrow")))
+        elif roll < 0.95:
+            inputs.append(f"+{rng.randint(1, 30)}")
+        else:
+            inputs.append(rng.choice(("завтра", "next week", "2024-13-01")))
+    return inputs
+
+
+def measure(parse: Callable, inputs: List) -> float:
+    started = time.perf_counter()
+    for value in inputs:
+        parse(value)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    
+    inputs = make_inputs(args.calls, args.seed)
+    legacy = measure(legacy_parse_date, inputs)
+    print(f"strptime + исключения: {args.calls / legacy:,.0f} разборов/с ({legacy / args.calls * 1e6:.2f} мкс)")
+    current = measure(parse_date, inputs)
+    print(f"handlers.dates:        {args.calls / current:,.0f} разборов/с ({current / args.calls * 1e6:.2f} мкс)")
+    print(f"ускорение: {legacy / current:.1f}x")
+    
+    rng = random.Random(args.seed)
+    phrases = [
+        rng.choice(("завтра в 10:00", "next monday 10:00", "in 2 hours", "через 30 минут", "в пятницу в 18:00")).split()
+        + ["Встреча", "с", "командой"]
+        for _ in range(args.calls)
+    ]
+    relative = measure(parse_date_prefix, phrases)
+    print(f"относительные формы (префикс /addevent): {args.calls / relative:,.0f} разборов/с")
+
+
+if __name__ == "__main__":
+    main()
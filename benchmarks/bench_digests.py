@@ -0,0 +1,99 @@
+"""
+Бенчмарк сводок: число отправок и время доставки со сводками и без
+
+У --users пользователей по --per-user событий, разбросанных по ближайшим
+суткам, у каждого события одно напоминание. Все напоминания суток
+наступают разом (сжатые в один всплеск сутки работы бота), и сервис
+уведомлений доставляет их через outbox и SendPipeline в бот без лимитов.
+Сравниваются:
+
+- без сводок: сообщение на каждое напоминание;
+- утренняя сводка (daily) у всех пользователей: отдельные напоминания
+  отбрасываются, а события суток приходят одним сообщением на чат,
+  события читаются одним сгруппированным запросом на окно сводки.
+
+Печатается число отправок, время постановки в outbox и отправки и оценка
+времени доставки при лимите Telegram в 30 сообщений в секунду.
+
+Запуск: python -m benchmarks.bench_digests --users 10000 --per-user 10
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from benchmarks.fakes import RateLimitedBot
+from db.database import Database, shard_of
+from db.digests import DAILY
+from handlers.notifications import NotificationService
+from handlers.sender import GLOBAL_RATE, SendPipeline
+
+UNLIMITED = 10 ** 6
+
+
+def fill(db_path: str, users: int, per_user: int, digests: bool, seed: int):
+    """События на сутки вперед, наступившие напоминания и (с digests) наступившие сводки"""
+    rng = random.Random(seed)
+    now = int(time.time())
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany("""
+            INSERT INTO events (id, title, description, event_date, created_by, created_at, chat_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (
+            (i, f"Событие {i}", "Описание", now + 60 + rng.randrange(86400 - 120), 1 + i % users, now, 1 + i % users)
+            for i in range(1, users * per_user + 1)
+        ))
+        conn.execute("""
+            INSERT INTO reminders (event_id, offset, due_at, shard)
+            SELECT id, 3600, ?, created_by % 64 FROM events
+        """, (now - 1,))
+        if digests:
+            conn.executemany("""
+                INSERT INTO digests (chat_id, kind, minute, next_at, shard) VALUES (?, ?, ?, ?, ?)
+            """, ((user, DAILY, 8 * 60, now - 1, shard_of(user)) for user in range(1, users + 1)))
+
+
+async def run(db_path: str) -> tuple:
+    db = Database(db_path)
+    bot = RateLimitedBot(global_rate=UNLIMITED, chat_rate=UNLIMITED, latency=0)
+    # Все сутки наступили разом: grace не должен отбросить конец всплеска
+    service = NotificationService(
+        bot, db, grace=86400, sender=SendPipeline(bot, global_rate=UNLIMITED, chat_rate=UNLIMITED),
+    )
+    started = time.perf_counter()
+    await service.send_due_notifications()
+    enqueued = time.perf_counter()
+    await service.outbox.drain()
+    finished = time.perf_counter()
+    await service.sender.stop()
+    db.close()
+    return len(bot.sent), enqueued - started, finished - enqueued
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--per-user", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    
+    for digests in (False, True):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "digests.db")
+            Database(db_path).close()
+            fill(db_path, args.users, args.per_user, digests, args.seed)
+            sends, enqueue, send = await run(db_path)
+        limited = sends / GLOBAL_RATE
+        print(
+            f"{'утренняя сводка' if digests else 'без сводок':16} {sends:7d} сообщений, "
+            f"постановка {enqueue:.1f} с, отправка {send:.1f} с; "
+            f"при лимите {GLOBAL_RATE:.0f}/с - {limited // 60:.0f} мин {limited % 60:.0f} с"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
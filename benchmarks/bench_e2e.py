@@ -0,0 +1,272 @@
+"""
+Сквозной нагрузочный тест бота с локальным Bot API
+
+Собирает CalendarBot из main/bot.py (диспетчер с middleware, FSM в SQLite,
+NotificationService с конвейером отправки), а вместо Telegram поднимает
+FakeBotApi: ответы бота и напоминания уходят настоящими HTTP-запросами.
+Синтетические обновления (/addevent, /events, /myevents, /deleteevent в
+пропорциях --mix) подаются в Dispatcher.feed_update: с --rate > 0 - по
+пуассоновскому расписанию (задержка считается от запланированного прихода),
+с --rate 0 - как можно быстрее, по --concurrency одновременно.
+
+В базе заранее лежат --events событий пользователей (их и удаляет
+/deleteevent) и --reminders событий, чьи напоминания наступают в первые
+--reminder-window секунд прогона. Опоздание напоминания - время, когда
+FakeBotApi получил сообщение, минус срок.
+
+Команды, пользователи и удаляемые события задаются --seed. Результат -
+сводка в консоли и JSON (--output) для сравнения между версиями; с
+--baseline печатается изменение относительно прошлого JSON.
+
+Запуск: python -m benchmarks.bench_e2e --rate 0 --updates 10000 --output e2e.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from aiogram.types import Update
+
+from benchmarks.fakes import FakeBotApi, make_update
+from benchmarks.stats import summarize
+from db.database import Database
+
+COMMANDS = ("addevent", "events", "myevents", "deleteevent")
+
+# Пользователи нагрузки и получатели напоминаний не пересекаются
+USER_BASE = 1000
+REMINDER_CHAT_BASE = 10 ** 6
+
+# id событий в тексте напоминания: одно событие - "ID события: N", несколько - "🆔 N"
+REMINDER_IDS = re.compile(r"(?:ID события: |🆔 )(\d+)")
+
+
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=10000)
+    parser.add_argument("--rate", type=float, default=0, help="обновлений в секунду (0 - как можно быстрее)")
+    parser.add_argument("--concurrency", type=int, default=50, help="обновлений одновременно при --rate 0")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--events", type=int, default=10000, help="событий пользователей в базе")
+    parser.add_argument("--reminders", type=int, default=300, help="напоминаний, наступающих во время прогона")
+    parser.add_argument("--reminder-window", type=float, default=10, help="за сколько секунд наступают напоминания")
+    parser.add_argument("--mix", default="addevent=0.2,events=0.5,myevents=0.2,deleteevent=0.1")
+    parser.add_argument("--api-latency", type=float, default=0.005, help="задержка ответа Bot API, секунды")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="куда записать JSON с результатами")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    return parser
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """Доли команд из строки вида "events=0.5,addevent=0.2" """
+    mix = {}
+    for part in text.split(","):
+        command, _, weight = part.partition("=")
+        if command.strip() not in COMMANDS:
+            raise ValueError(f"Неизвестная команда в --mix: {command}")
+        mix[command.strip()] = float(weight)
+    return mix
+
+
+def seed_events(db_path: str, count: int, users: int) -> Dict[int, List[int]]:
+    """События пользователей на месяц вперед; вернуть id событий каждого пользователя"""
+    Database(db_path).close()
+    now = int(time.time())
+    owned: Dict[int, List[int]] = {}
+    with sqlite3.connect(db_path) as conn:
+        for i in range(count):
+            user_id = USER_BASE + i % users
+            cursor = conn.execute("""
+                INSERT INTO events (title, description, event_date, created_by, created_at, chat_id)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (f"Событие {i}", "Описание", now + 86400 + 257 * i, user_id, now, user_id))
+            owned.setdefault(user_id, []).append(cursor.lastrowid)
+    return owned
+
+
+def make_updates(args, owned: Dict[int, List[int]]) -> List[Tuple[str, dict]]:
+    """Воспроизводимый по --seed поток обновлений: (команда, JSON обновления)"""
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    commands, weights = list(mix), list(mix.values())
+    date = (datetime.now() + timedelta(days=2)).strftime("%Y-%m-%d")
+    # Каждое событие удаляется не больше одного раза
+    deletable = {user_id: rng.sample(ids, len(ids)) for user_id, ids in owned.items()}
+    updates = []
+    for update_id in range(args.updates):
+        command = rng.choices(commands, weights)[0]
+        user_id = USER_BASE + rng.randrange(args.users)
+        if command == "deleteevent" and not deletable.get(user_id):
+            command = "events"
+        if command == "addevent":
+            text = f"/addevent {date} {rng.randrange(8, 20)}:00 Нагрузка {update_id}"
+        elif command == "deleteevent":
+            text = f"/deleteevent {deletable[user_id].pop()}"
+        else:
+            text = f"/{command}"
+        updates.append((command, make_update(update_id, text, user_id)))
+    return updates
+
+
+async def run(args) -> dict:
+    """Прогнать нагрузку и вернуть результаты (то, что пишется в JSON)"""
+    fake = FakeBotApi(latency=args.api_latency)
+    await fake.start()
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "e2e.db")
+        owned = seed_events(db_path, args.events, args.users)
+        updates = make_updates(args, owned)
+        
+        os.environ.update(BOT_TOKEN="42:TEST", DB_PATH=db_path, TELEGRAM_API_URL=fake.url)
+        # Импорт здесь: модуль настраивает логирование и читает .env
+        from main.bot import CalendarBot
+        calendar = CalendarBot()
+        
+        # Напоминания за час, наступающие равномерно в первые reminder_window секунд
+        started = time.time()
+        due: Dict[int, float] = {}
+        for i in range(args.reminders):
+            due_at = int(started + 2 + args.reminder_window * i / max(args.reminders, 1))
+            event_id = await calendar.db.add_event(
+                f"Напоминание {i}", "Описание", due_at + 3600, REMINDER_CHAT_BASE + i, reminder_offsets=(3600,),
+            )
+            due[event_id] = due_at
+        # Задачу сервиса, как и в CalendarBot.start(), дожидается calendar.stop()
+        calendar.notification_task = asyncio.create_task(calendar.notifier.start_notification_service())
+        
+        latencies: Dict[str, List[float]] = {command: [] for command in COMMANDS}
+        failed = 0
+        
+        async def handle(command: str, data: dict, arrival: float):
+            nonlocal failed
+            try:
+                update = Update.model_validate(data, context={"bot": calendar.bot})
+                await calendar.dp.feed_update(calendar.bot, update)
+            except Exception as e:
+                failed += 1
+                logging.getLogger(__name__).error(f"Update {data['update_id']} failed: {e}")
+            latencies[command].append(time.perf_counter() - arrival)
+        
+        load_started = time.perf_counter()
+        if args.rate > 0:
+            rng = random.Random(args.seed)
+            tasks = []
+            arrival = load_started
+            for command, data in updates:
+                arrival += rng.expovariate(args.rate)
+                delay = arrival - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(handle(command, data, arrival)))
+            await asyncio.gather(*tasks)
+        else:
+            pending = iter(updates)
+            
+            async def worker():
+                for command, data in pending:
+                    await handle(command, data, time.perf_counter())
+            
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - load_started
+        
+        # Ждем последние напоминания (лимит Telegram - 30 сообщений в секунду)
+        deadline = started + 2 + args.reminder_window + 30 + args.reminders / 30
+        while time.time() < deadline and len(_lateness(fake, due)) < len(due):
+            await asyncio.sleep(0.2)
+        lateness = _lateness(fake, due)
+        
+        await calendar.stop()
+    await fake.stop()
+    
+    return {
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "updates": {
+            "count": len(updates),
+            "failed": failed,
+            "elapsed_s": elapsed,
+            "per_second": len(updates) / elapsed,
+        },
+        "latency": summarize([sample for samples in latencies.values() for sample in samples]),
+        "commands": {command: summarize(samples) for command, samples in latencies.items() if samples},
+        "reminders": {"scheduled": len(due), "delivered": len(lateness), "lateness": summarize(lateness)},
+        "api_calls": fake.calls,
+    }
+
+
+def _lateness(fake: FakeBotApi, due: Dict[int, float]) -> List[float]:
+    """Опоздание каждого доставленного напоминания (первое получение)"""
+    delivered: Dict[int, float] = {}
+    for received_at, _, text in fake.messages:
+        if text.startswith("🔔"):
+            for event_id in map(int, REMINDER_IDS.findall(text)):
+                if event_id in due and event_id not in delivered:
+                    delivered[event_id] = received_at - due[event_id]
+    return list(delivered.values())
+
+
+def flatten(results: dict, prefix: str = "") -> Dict[str, float]:
+    """Числовые показатели JSON в виде {"commands.events.p99_ms": ...}"""
+    flat = {}
+    for key, value in results.items():
+        if key == "config":
+            continue
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def print_results(results: dict, baseline: Optional[dict]):
+    updates = results["updates"]
+    print(
+        f"{updates['count']} обновлений за {updates['elapsed_s']:.1f} с: {updates['per_second']:.0f} обновлений/с, "
+        f"ошибок {updates['failed']}"
+    )
+    for command, stats in results["commands"].items():
+        print(
+            f"  /{command:<12} n={stats['count']:<6} "
+            f"p50={stats['p50_ms']:.2f} мс  p99={stats['p99_ms']:.2f} мс  max={stats['max_ms']:.2f} мс"
+        )
+    reminders = results["reminders"]
+    lateness = reminders["lateness"]
+    print(
+        f"напоминаний доставлено {reminders['delivered']} из {reminders['scheduled']}, опоздание "
+        f"p50={lateness['p50_ms']:.0f} мс  p99={lateness['p99_ms']:.0f} мс  max={lateness['max_ms']:.0f} мс"
+    )
+    if baseline is None:
+        return
+    print("изменение относительно --baseline:")
+    before = flatten(baseline)
+    for key, value in flatten(results).items():
+        if key in before and before[key] and not key.startswith("api_calls.") and not key.endswith("count"):
+            print(f"  {key:<40}{before[key]:>12.2f} -> {value:<12.2f}{(value / before[key] - 1) * 100:+.1f}%")
+
+
+async def main():
+    args = make_parser().parse_args()
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+    # Лог aiogram пишет строку на каждое обновление
+    logging.disable(logging.INFO)
+    results = await run(args)
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,135 @@
+"""
+Бенчмарк выборок событий на большой таблице
+
+Заполняет базу со старой схемой (даты TEXT, без индексов), замеряет прежние
+запросы, затем открывает ее через Database (миграция на UTC epoch и индексы)
+и замеряет те же выборки.
+
+Запуск: python -m benchmarks.bench_event_queries --rows 1000000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+from statistics import median
+
+from db.database import Database
+
+LEGACY_SCHEMA = """
+    CREATE TABLE events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        description TEXT,
+        event_date TEXT NOT NULL,
+        created_by INTEGER NOT NULL,
+        created_at TEXT NOT NULL,
+        notification_sent BOOLEAN DEFAULT FALSE
+    )
+"""
+
+
+def fill_legacy(db_path: str, rows: int, users: int, seed: int):
+    """Создать базу старого формата с rows событиями в диапазоне +-1 год"""
+    rng = random.Random(seed)
+    now = datetime.now()
+    created_at = now.isoformat()
+    
+    def generate():
+        for i in range(rows):
+            event_date = now + timedelta(seconds=rng.randint(-365 * 86400, 365 * 86400))
+            yield (f"Событие {i}", "Описание", event_date.isoformat(), rng.randrange(users), created_at, rng.random() < 0.5)
+    
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(LEGACY_SCHEMA)
+        conn.executemany("""
+            INSERT INTO events (title, description, event_date, created_by, created_at, notification_sent)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, generate())
+
+
+def time_sync(func, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return median(samples) * 1000
+
+
+async def time_async(func, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await func()
+        samples.append(time.perf_counter() - started)
+    return median(samples) * 1000
+
+
+def bench_legacy(db_path: str, user_id: int, repeat: int) -> dict:
+    """Прежние запросы: полный просмотр таблицы и сортировка строк"""
+    conn = sqlite3.connect(db_path)
+    future_time = (datetime.now() + timedelta(hours=2)).isoformat()
+    queries = {
+        "get_events": lambda: conn.execute("""
+            SELECT id, title, description, event_date, created_by, created_at
+            FROM events WHERE event_date >= date('now') ORDER BY event_date ASC LIMIT 10
+        """).fetchall(),
+        "/myevents": lambda: conn.execute("""
+            SELECT id, title, description, event_date, created_at
+            FROM events WHERE created_by = ? ORDER BY event_date ASC
+        """, (user_id,)).fetchall(),
+        "get_upcoming_events": lambda: conn.execute("""
+            SELECT id, title, description, event_date, created_by
+            FROM events WHERE event_date BETWEEN datetime('now') AND ?
+            AND notification_sent = FALSE ORDER BY event_date ASC
+        """, (future_time,)).fetchall(),
+    }
+    result = {name: time_sync(query, repeat) for name, query in queries.items()}
+    conn.close()
+    return result
+
+
+async def bench_indexed(db: Database, user_id: int, repeat: int) -> dict:
+    return {
+        "get_events": await time_async(lambda: db.get_events(limit=10), repeat),
+        # Прежний /myevents читал все события пользователя, теперь - страницу из 10
+        "/myevents": await time_async(lambda: db.get_events_page(user_id=user_id, limit=10), repeat),
+        "get_upcoming_events": await time_async(lambda: db.get_upcoming_events(hours_ahead=2), repeat),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        started = time.perf_counter()
+        fill_legacy(db_path, args.rows, args.users, args.seed)
+        print(f"Заполнение {args.rows} строк: {time.perf_counter() - started:.1f} с")
+        
+        legacy = bench_legacy(db_path, user_id=7, repeat=args.repeat)
+        
+        started = time.perf_counter()
+        # Кэш выключен: меряем сами запросы, а не попадания
+        db = Database(db_path, cache_ttl=0)
+        print(f"Миграция на epoch + индексы: {time.perf_counter() - started:.1f} с")
+        indexed = await bench_indexed(db, user_id=7, repeat=args.repeat)
+        db.close()
+    
+    print(f"{'запрос':<22}{'TEXT, без индекса':>20}{'epoch + индекс':>18}")
+    for name in legacy:
+        print(f"{name:<22}{legacy[name]:>17.2f} мс{indexed[name]:>15.2f} мс")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
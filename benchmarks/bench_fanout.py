@@ -0,0 +1,120 @@
+"""
+Бенчмарк рассылки напоминаний подписчикам
+
+--events событий наступают одновременно; они разложены по календарям
+--subscribers чатов, каждый из которых подписан на свой календарь, а еще
+каждый из --subscribers пользователей следит за --per-user случайными
+событиями. Сравниваются:
+
+- наивный перебор: список всех пар (событие, подписчик) и сообщение на пару;
+- iter_deliveries: получатели читаются из базы страницами, подписчики
+  календаря получают события своего календаря одним сообщением (по 20 событий).
+
+Отправка не выполняется - меряется только стадия разбора получателей
+и формирования текстов: время, пик памяти и число сообщений.
+
+Запуск: python -m benchmarks.bench_fanout --events 1000 --subscribers 10000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+
+from db.database import Database
+from handlers.fanout import iter_deliveries
+from handlers.notifications import format_notifications
+
+
+def fill(db_path: str, events: int, subscribers: int, per_user: int, seed: int) -> list:
+    """События, подписки и строки захваченных напоминаний в формате claim_due_reminders"""
+    rng = random.Random(seed)
+    now = int(time.time())
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany("""
+            INSERT INTO events (id, title, description, event_date, created_by, created_at, chat_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (
+            (i, f"Событие {i}", "Описание", now + 900, i % 100, now, 100_000 + i % subscribers)
+            for i in range(1, events + 1)
+        ))
+        conn.executemany(
+            "INSERT INTO calendar_subscriptions (chat_id, created_at) VALUES (?, ?)",
+            ((chat_id, now) for chat_id in range(100_000, 100_000 + subscribers)),
+        )
+        conn.executemany("INSERT OR IGNORE INTO subscriptions (event_id, chat_id) VALUES (?, ?)", (
+            (rng.randint(1, events), chat_id)
+            for chat_id in range(1_000_000, 1_000_000 + subscribers)
+            for _ in range(per_user)
+        ))
+    return [
+        (i, i, 900, now, 1, f"Событие {i}", now + 900, i % 100, 100_000 + i % subscribers)
+        for i in range(1, events + 1)
+    ]
+
+
+def bench_naive(reminders: list, subscribers: int) -> tuple:
+    """Перебор участников: пара (событие, подписчик) на каждое сообщение"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    pairs = [(reminder, chat_id) for reminder in reminders for chat_id in range(subscribers)]
+    messages = 0
+    for reminder, chat_id in pairs:
+        messages += len(format_notifications((reminder,))) if chat_id == 0 else 1
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, len(pairs), messages
+
+
+async def bench_streaming(db: Database, reminders: list, batch: int) -> tuple:
+    tracemalloc.start()
+    started = time.perf_counter()
+    rendered = {}
+    deliveries = messages = 0
+    async for deliveries_batch in iter_deliveries(db, reminders, batch):
+        for _, items in deliveries_batch:
+            if id(items) not in rendered:
+                rendered[id(items)] = (items, format_notifications(items))
+            messages += len(rendered[id(items)][1])
+        deliveries += len(deliveries_batch)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, deliveries, messages
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=1000)
+    parser.add_argument("--subscribers", type=int, default=10_000)
+    parser.add_argument("--per-user", type=int, default=5)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        db = Database(db_path)
+        reminders = fill(db_path, args.events, args.subscribers, args.per_user, args.seed)
+        
+        elapsed, peak, pairs, messages = bench_naive(reminders, args.subscribers)
+        print(
+            f"наивный перебор: {pairs} пар, {messages} сообщений, "
+            f"{elapsed:.2f} с, пик памяти {peak / 2 ** 20:.0f} МБ"
+        )
+        
+        elapsed, peak, deliveries, messages = await bench_streaming(db, reminders, args.batch)
+        print(
+            f"iter_deliveries: {deliveries} получателей, {messages} сообщений, "
+            f"{elapsed:.2f} с, пик памяти {peak / 2 ** 20:.1f} МБ"
+        )
+        db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,133 @@
+"""
+Бенчмарк /free и пересечений в /addevent в календаре чата со 100k событий
+
+В календаре чата --events событий длительностью от 15 минут до 3 часов,
+разбросанных по году, и --long событий на несколько недель (отпуска,
+командировки); в базе есть и другие чаты. Замеряется:
+
+- построение индекса интервалов чата (первый запрос после запуска);
+- /free на случайный день: индекс интервалов против прежнего способа -
+  выборки по индексу (chat_id, event_date) всех событий, начавшихся не
+  раньше чем за самую большую длительность в чате до начала дня;
+- проверка пересечений /addevent для часа;
+- /addevent целиком: запись события, обновление индекса и проверка.
+
+Запуск: python -m benchmarks.bench_free --events 100000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.stats import summarize
+from db.database import Database
+from db.intervals import free_slots
+
+CHAT = -100
+OTHER_CHATS = 100
+HOUR = 3600
+DAY = 86400
+
+
+def fill(db_path: str, events: int, long: int, year: int, seed: int) -> int:
+    """События чата CHAT за год year и столько же - в других чатах; вернуть начало года"""
+    rng = random.Random(seed)
+    start = int(datetime(year, 1, 1).timestamp())
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany("""
+            INSERT INTO events (title, description, event_date, created_by, created_at, chat_id, duration)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (
+            (
+                f"Событие {i}", "", start + rng.randrange(365 * DAY) // 900 * 900, 1, start,
+                CHAT if i % 2 else -1 - i % OTHER_CHATS, rng.randrange(1, 13) * 900,
+            )
+            for i in range(events * 2)
+        ))
+        conn.executemany("""
+            INSERT INTO events (title, description, event_date, created_by, created_at, chat_id, duration)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (
+            (f"Отпуск {i}", "", start + rng.randrange(365 * DAY), 1, start, CHAT, rng.randrange(7, 29) * DAY)
+            for i in range(long)
+        ))
+    return start
+
+
+def scan_free(conn: sqlite3.Connection, longest: int, start: int, end: int, length: int) -> list:
+    """Прежний способ: все события, которые могут пересекать окно, по индексу SQLite"""
+    busy = conn.execute("""
+        SELECT event_date, duration FROM events
+        WHERE chat_id = ? AND rrule IS NULL AND event_date > ? AND event_date < ? AND event_date + duration > ?
+        ORDER BY event_date
+    """, (CHAT, start - longest - 1, end, start)).fetchall()
+    return free_slots(busy, start, end, length)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=100_000)
+    parser.add_argument("--long", type=int, default=20)
+    parser.add_argument("--year", type=int, default=2030)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "free.db")
+        Database(db_path).close()
+        year_start = fill(db_path, args.events, args.long, args.year, args.seed)
+        db = Database(db_path)
+        conn = sqlite3.connect(db_path)
+        # Самая большая длительность известна заранее - скан за нее не платит
+        longest = conn.execute("SELECT MAX(duration) FROM events WHERE chat_id = ?", (CHAT,)).fetchone()[0]
+        
+        started = time.perf_counter()
+        await db.find_free_slots(CHAT, year_start, year_start + HOUR, HOUR)
+        built = time.perf_counter() - started
+        print(f"индекс интервалов чата: {len(db.intervals.get(CHAT))} событий, построение {built * 1000:.0f} мс")
+        
+        free, scans, conflicts, adds = [], [], [], []
+        for number in range(args.queries):
+            day = year_start + rng.randrange(365) * DAY
+            start, end = day + 8 * HOUR, day + 22 * HOUR
+            started = time.perf_counter()
+            slots = await db.find_free_slots(CHAT, start, end, HOUR)
+            free.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            expected = scan_free(conn, longest, start, end, HOUR)
+            scans.append(time.perf_counter() - started)
+            assert slots == expected, day
+            
+            moment = day + rng.randrange(8, 21) * HOUR
+            started = time.perf_counter()
+            await db.find_overlapping(CHAT, moment, moment + HOUR)
+            conflicts.append(time.perf_counter() - started)
+            
+            started = time.perf_counter()
+            event_id = await db.add_event(f"Новое {number}", "", moment, 1, chat_id=CHAT, duration=HOUR)
+            await db.find_overlapping(CHAT, moment, moment + HOUR)
+            adds.append(time.perf_counter() - started)
+            await db.delete_event(event_id, 1)
+        conn.close()
+        db.close()
+    
+    print(f"{args.events} событий в календаре чата, из них {args.long} длиной в недели:")
+    for name, samples in (
+        ("/free, индекс", free),
+        ("/free, скан SQLite", scans),
+        ("пересечения за час", conflicts),
+        ("/addevent с проверкой", adds),
+    ):
+        stats = summarize(samples)
+        print(f"  {name:<22} p50 {stats['p50_ms']:7.2f} мс, p99 {stats['p99_ms']:7.2f} мс")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,204 @@
+"""
+Бенчмарк задержки обработчиков /events и /addevent при конкурентной нагрузке
+
+Сравнивает прежнюю схему (новое sqlite3-соединение на каждый вызов прямо
+в цикле событий) с асинхронным пулом соединений Database. Затем замеряет
+накладные расходы метрик: те же команды без открытой модели, подряд пачками
+по --concurrency, с выключенным реестром и без MetricsMiddleware против
+полного сбора (middleware, запросы к базе). Прогоны чередуются, берется
+медиана.
+
+Запуск: python -m benchmarks.bench_handlers --rate 500 --duration 5
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+from statistics import median
+from typing import Dict, List
+
+from aiogram.dispatcher.event.handler import HandlerObject
+
+from benchmarks.fakes import make_message
+from benchmarks.stats import summarize
+from db.database import Database, to_timestamp
+from db.metrics import REGISTRY
+from handlers.commands import cmd_addevent, cmd_events
+from handlers.middleware import MetricsMiddleware
+
+
+class LegacyDatabase:
+    """Прежняя реализация: блокирующий connect/commit на каждый вызов"""
+    
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        # Схему создает Database, здесь только прежняя логика запросов
+        Database(db_path).close()
+    
+    async def add_event(self, title: str, description: str, event_date, user_id: int) -> int:
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO events (title, description, event_date, created_by, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (title, description, to_timestamp(event_date), user_id, int(time.time())))
+            conn.commit()
+            return cursor.lastrowid
+    
+    async def get_events(self, limit: int = 10):
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT id, title, description, event_date, created_by, created_at
+                FROM events
+                WHERE event_date >= ?
+                ORDER BY event_date ASC
+                LIMIT ?
+            """, (int(time.time()), limit))
+            return cursor.fetchall()
+    
+    def close(self):
+        pass
+
+
+async def run_load(db, rate: float, duration: float, write_ratio: float, seed: int) -> Dict[str, List[float]]:
+    """
+    Открытая модель нагрузки: обновления приходят по пуассоновскому расписанию
+    независимо от того, успел ли бот обработать предыдущие. Задержка считается
+    от запланированного момента прихода, поэтому блокировки цикла событий
+    тоже попадают в измерение.
+    """
+    rng = random.Random(seed)
+    latencies: Dict[str, List[float]] = {"events": [], "addevent": []}
+    date = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+    
+    async def handle(command: str, user_id: int, arrival: float):
+        if command == "events":
+            await cmd_events(make_message("/events", user_id, -100), db=db)
+        else:
+            message = make_message(f"/addevent {date} Нагрузочный тест", user_id, -100)
+            await cmd_addevent(message, state=None, db=db)
+        latencies[command].append(time.perf_counter() - arrival)
+    
+    tasks = []
+    started = time.perf_counter()
+    arrival = started
+    while arrival - started < duration:
+        arrival += rng.expovariate(rate)
+        delay = arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        command = "addevent" if rng.random() < write_ratio else "events"
+        tasks.append(asyncio.create_task(handle(command, rng.randrange(1000, 2000), arrival)))
+    await asyncio.gather(*tasks)
+    return latencies
+
+
+def seed_events(db_path: str, count: int):
+    """Заполнить таблицу событиями на ближайший месяц"""
+    now = int(time.time())
+    rows = [(f"Событие {i}", "Описание", now + 37 * 60 * i, i % 100, now) for i in range(count)]
+    with sqlite3.connect(db_path) as conn:
+        # Все события - в календаре группы, из которой идет нагрузка
+        conn.executemany("""
+            INSERT INTO events (title, description, event_date, created_by, created_at, chat_id)
+            VALUES (?, ?, ?, ?, ?, -100)
+        """, rows)
+
+
+async def bench(name: str, factory, args) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        db = factory(db_path)
+        seed_events(db_path, args.events)
+        started = time.perf_counter()
+        latencies = await run_load(db, args.rate, args.duration, args.write_ratio, args.seed)
+        elapsed = time.perf_counter() - started
+        db.close()
+    
+    total = sum(len(samples) for samples in latencies.values())
+    print(f"{name}: {total} команд за {elapsed:.1f} с ({total / elapsed:.0f} команд/с)")
+    for command, samples in latencies.items():
+        stats = summarize(samples)
+        print(
+            f"  /{command:<9} n={stats['count']:<5} "
+            f"p50={stats['p50_ms']:.2f} мс  p99={stats['p99_ms']:.2f} мс  max={stats['max_ms']:.2f} мс"
+        )
+
+
+async def run_closed(db: Database, args, instrumented: bool) -> float:
+    """Время на команду при обработке --commands команд пачками по --concurrency"""
+    rng = random.Random(args.seed)
+    date = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+    middleware = MetricsMiddleware()
+    handlers = {"events": HandlerObject(cmd_events), "addevent": HandlerObject(cmd_addevent)}
+    REGISTRY.enabled = instrumented
+    
+    async def call(message, data):
+        if data["handler"].callback is cmd_events:
+            await cmd_events(message, db=db)
+        else:
+            await cmd_addevent(message, state=None, db=db)
+    
+    async def handle(command: str, user_id: int):
+        text = "/events" if command == "events" else f"/addevent {date} Нагрузочный тест"
+        data = {"handler": handlers[command]}
+        if instrumented:
+            await middleware(call, make_message(text, user_id), data)
+        else:
+            await call(make_message(text, user_id), data)
+    
+    started = time.perf_counter()
+    for _ in range(0, args.commands, args.concurrency):
+        await asyncio.gather(*(
+            handle("addevent" if rng.random() < args.write_ratio else "events", rng.randrange(1000, 2000))
+            for _ in range(args.concurrency)
+        ))
+    elapsed = time.perf_counter() - started
+    REGISTRY.enabled = True
+    return elapsed / args.commands
+
+
+async def bench_overhead(args) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        db = Database(db_path)
+        seed_events(db_path, args.events)
+        # Прогрев: кэши, пул соединений, индекс
+        await run_closed(db, args, True)
+        samples = {False: [], True: []}
+        for _ in range(args.rounds):
+            for instrumented in (False, True):
+                samples[instrumented].append(await run_closed(db, args, instrumented))
+        db.close()
+    
+    plain, instrumented = median(samples[False]), median(samples[True])
+    print(f"метрики: {args.commands} команд x {args.rounds} прогонов, по {args.concurrency} одновременно")
+    print(f"  без метрик   {plain * 1e6:.1f} мкс на команду")
+    print(f"  с метриками  {instrumented * 1e6:.1f} мкс на команду ({(instrumented / plain - 1) * 100:+.1f}%)")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=500, help="обновлений в секунду")
+    parser.add_argument("--duration", type=float, default=5, help="секунд нагрузки")
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--commands", type=int, default=20000, help="команд в прогоне замера метрик")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    
+    await bench("before (connect per call)", LegacyDatabase, args)
+    await bench("after (async pool + WAL)", Database, args)
+    await bench_overhead(args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+"""
+Бенчмарк массового импорта и экспорта событий
+
+Генерирует .ics файл на --events событий (потоково, файл на диске),
+импортирует его через Database.import_events и выгружает обратно. Для
+сравнения --baseline событий добавляются по одному через add_event.
+Пиковый RSS процесса показывает, что файл не читается целиком.
+
+Запуск: python -m benchmarks.bench_import --events 500000
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import tempfile
+import time
+
+from db.calendar_files import ICS_FOOTER, ICS_HEADER, ParseStats, iter_events_file, iter_ics_events, write_events
+from db.database import Database
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss в килобайтах на Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def generate_ics(path: str, count: int):
+    now = int(time.time())
+    rows = (
+        (i, f"Событие {i}", f"Описание события номер {i}, импорт из календаря", now + 3600 + i * 60, 0, now)
+        for i in range(count)
+    )
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        file.write(ICS_HEADER)
+        file.writelines(iter_ics_events(rows))
+        file.write(ICS_FOOTER)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=500_000)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--baseline", type=int, default=5000)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        ics_path = os.path.join(tmp, "events.ics")
+        generate_ics(ics_path, args.events)
+        print(f"файл: {args.events} событий, {os.path.getsize(ics_path) / 2 ** 20:.0f} МБ")
+        
+        db = Database(os.path.join(tmp, "bench.db"))
+        stats = ParseStats()
+        rss_before = peak_rss_mb()
+        started = time.perf_counter()
+        with open(ics_path, encoding="utf-8-sig", newline="") as file:
+            result = await db.import_events(iter_events_file(file, ics_path, stats), 1, batch_size=args.batch_size)
+        elapsed = time.perf_counter() - started
+        print(
+            f"import_events: {result.imported} событий за {elapsed:.1f} с "
+            f"({result.imported / elapsed:.0f} в секунду), рост пикового RSS {peak_rss_mb() - rss_before:.0f} МБ"
+        )
+        
+        export_path = os.path.join(tmp, "export.ics")
+        started = time.perf_counter()
+        with open(export_path, "w", encoding="utf-8", newline="") as file:
+            count = await write_events(db.iter_events(), file, export_path)
+        elapsed = time.perf_counter() - started
+        print(f"экспорт: {count} событий за {elapsed:.1f} с ({count / elapsed:.0f} в секунду), пиковый RSS {peak_rss_mb():.0f} МБ")
+        db.close()
+        
+        db = Database(os.path.join(tmp, "baseline.db"))
+        now = int(time.time())
+        started = time.perf_counter()
+        for i in range(args.baseline):
+            await db.add_event(f"Событие {i}", "Описание", now + 3600 + i * 60, 1)
+        elapsed = time.perf_counter() - started
+        print(f"add_event по одному: {args.baseline} событий за {elapsed:.1f} с ({args.baseline / elapsed:.0f} в секунду)")
+        db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+"""
+Бенчмарк листания /events на большой таблице
+
+Сравнивает страницу по курсору (event_date, id) и страницу через OFFSET
+на разной глубине списка из --rows предстоящих событий.
+
+Запуск: python -m benchmarks.bench_pagination --rows 1000000
+"""
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+from statistics import median
+
+from db.database import Database
+
+
+def fill(db_path: str, rows: int):
+    now = int(time.time())
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany("""
+            INSERT INTO events (title, description, event_date, created_by, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, ((f"Событие {i}", "Описание", now + 3600 + i * 30, i % 10_000, now) for i in range(rows)))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--page", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        db = Database(db_path, cache_ttl=0)
+        fill(db_path, args.rows)
+        conn = sqlite3.connect(db_path)
+        
+        print(f"{'глубина':>10}{'курсор':>12}{'OFFSET':>12}")
+        for depth in (0, 1000, args.rows // 10, args.rows - args.page):
+            cursor = conn.execute(
+                "SELECT event_date, id FROM events ORDER BY event_date, id LIMIT 1 OFFSET ?", (max(depth - 1, 0),)
+            ).fetchone()
+            keyset, offset = [], []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                await db.get_events_page(after=cursor if depth else None, limit=args.page)
+                keyset.append(time.perf_counter() - started)
+                started = time.perf_counter()
+                conn.execute("""
+                    SELECT id, title, description, event_date, created_by, created_at
+                    FROM events WHERE event_date >= ? ORDER BY event_date, id LIMIT ? OFFSET ?
+                """, (int(time.time()), args.page, depth)).fetchall()
+                offset.append(time.perf_counter() - started)
+            print(f"{depth:>10}{median(keyset) * 1000:>9.2f} мс{median(offset) * 1000:>9.2f} мс")
+        
+        conn.close()
+        db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
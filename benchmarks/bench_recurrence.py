@@ -0,0 +1,149 @@
+"""
+Бенчмарк повторяющихся событий
+
+Создает --series серий (ежедневные, еженедельные по будням и ежемесячные),
+затем измеряет: раскрытие повторений за год, листание /events (холодное окно
+и из кэша), загрузку напоминаний в планировщик и перевод отправленных
+напоминаний на следующее повторение. Для сравнения --materialized серий
+записываются копиями на год вперед, как до появления серий.
+
+Запуск: python -m benchmarks.bench_recurrence --series 100000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from statistics import median
+
+from db.database import Database
+from db.recurrence import iter_occurrences, parse_rule
+from handlers.scheduler import ReminderScheduler
+
+YEAR = 365 * 86400
+RULES = ("daily", "FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR", "weekly", "monthly")
+
+
+def make_series(count: int, now: int, rng: random.Random):
+    """(title, description, dtstart, rrule): серии, начавшиеся за последние 90 дней"""
+    return [
+        (f"Серия {i}", "Описание", now - rng.randrange(90 * 86400) // 60 * 60, rng.choice(RULES))
+        for i in range(count)
+    ]
+
+
+def year_of_occurrences(series, start: int):
+    for title, description, dtstart, rrule in series:
+        for occurrence in iter_occurrences(dtstart, parse_rule(rrule), start):
+            if occurrence >= start + YEAR:
+                break
+            yield title, description, occurrence
+
+
+async def timed(coro_factory, repeat: int = 1) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await coro_factory()
+        samples.append(time.perf_counter() - started)
+    return median(samples)
+
+
+async def bench_series(db_path: str, series, now: int):
+    db = Database(db_path)
+    
+    started = time.perf_counter()
+    for start in range(0, len(series), 1000):
+        await asyncio.gather(*(
+            db.add_event(title, description, dtstart, i % 1000, rrule=rrule)
+            for i, (title, description, dtstart, rrule) in enumerate(series[start:start + 1000], start)
+        ))
+    elapsed = time.perf_counter() - started
+    print(f"серии: {len(series)} строк events за {elapsed:.1f} с ({len(series) / elapsed:.0f} серий в секунду)")
+    
+    started = time.perf_counter()
+    occurrences = sum(1 for _ in year_of_occurrences(series, now))
+    elapsed = time.perf_counter() - started
+    print(f"раскрытие за год: {occurrences} повторений за {elapsed:.1f} с ({occurrences / elapsed:.0f} в секунду)")
+    
+    db.cache.clear()
+    cold = await timed(lambda: db.get_events_page(limit=10))
+    warm = await timed(lambda: db.get_events_page(limit=10), repeat=100)
+    
+    async def walk(pages: int):
+        page = await db.get_events_page(limit=10)
+        for _ in range(pages):
+            last = page.rows[-1]
+            page = await db.get_events_page(after=(last[3], last[0]), limit=10)
+    
+    db.cache.clear()
+    walk_time = await timed(lambda: walk(100))
+    db.cache.clear()
+    far = (now + 180 * 86400, 0)
+    far_cold = await timed(lambda: db.get_events_page(after=far, limit=10))
+    print(
+        f"/events: первая страница {cold * 1000:.0f} мс (раскрытие окна), из кэша {warm * 1000:.3f} мс, "
+        f"100 страниц подряд {walk_time * 1000:.0f} мс, страница через полгода {far_cold * 1000:.0f} мс"
+    )
+    
+    started = time.perf_counter()
+    scheduler = ReminderScheduler()
+    scheduler.schedule_many(await db.get_pending_reminders())
+    elapsed = time.perf_counter() - started
+    print(f"планировщик: {len(scheduler)} напоминаний загружено за {elapsed * 1000:.0f} мс")
+    
+    with sqlite3.connect(db.db_path) as conn:
+        conn.execute("""
+            UPDATE reminders SET due_at = ? WHERE id IN (SELECT id FROM reminders ORDER BY id LIMIT 1000)
+        """, (int(time.time()) - 1,))
+    started = time.perf_counter()
+    claimed = await db.claim_due_reminders(limit=1000)
+    wakeups = await db.complete_reminders(sent=[row[0] for row in claimed])
+    elapsed = time.perf_counter() - started
+    print(f"отправка: {len(claimed)} напоминаний захвачено и переведено на следующее повторение за {elapsed * 1000:.0f} мс ({len(wakeups)} новых сроков)")
+    
+    db.close()
+    print(f"размер базы: {os.path.getsize(db.db_path) / 2 ** 20:.0f} МБ")
+
+
+async def bench_materialized(db_path: str, series, now: int):
+    db = Database(db_path)
+    started = time.perf_counter()
+    result = await db.import_events(year_of_occurrences(series, now), 1)
+    elapsed = time.perf_counter() - started
+    print(f"копии: {result.imported} строк events за {elapsed:.1f} с")
+    
+    db.cache.clear()
+    cold = await timed(lambda: db.get_events_page(limit=10))
+    started = time.perf_counter()
+    scheduler = ReminderScheduler()
+    scheduler.schedule_many(await db.get_pending_reminders())
+    load = time.perf_counter() - started
+    print(f"/events: первая страница {cold * 1000:.1f} мс; планировщик: {len(scheduler)} напоминаний за {load * 1000:.0f} мс")
+    db.close()
+    print(f"размер базы: {os.path.getsize(db.db_path) / 2 ** 20:.0f} МБ")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--series", type=int, default=100_000)
+    parser.add_argument("--materialized", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    
+    rng = random.Random(args.seed)
+    now = int(time.time())
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"== {args.series} серий")
+        await bench_series(os.path.join(tmp, "series.db"), make_series(args.series, now, rng), now)
+        print(f"\n== {args.materialized} серий копиями на год")
+        await bench_materialized(os.path.join(tmp, "copies.db"), make_series(args.materialized, now, rng), now)
+        print(f"\n== {args.materialized} серий")
+        await bench_series(os.path.join(tmp, "small.db"), make_series(args.materialized, now, rng), now)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
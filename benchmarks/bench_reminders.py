@@ -0,0 +1,88 @@
+"""
+Бенчмарк захвата и отметки наступивших напоминаний
+
+Создает --reminders наступивших напоминаний и проводит их через
+claim_due_reminders/complete_reminders пачками по --batch. Для сравнения
+замеряет прежнюю схему: отдельный connect + UPDATE + commit на каждое
+событие (mark_notification_sent) на --legacy строках.
+
+Запуск: python -m benchmarks.bench_reminders --reminders 100000
+"""
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+
+from db.database import Database
+
+
+def fill(db_path: str, count: int):
+    """События через час и по одному напоминанию, наступившему в последнюю минуту"""
+    now = int(time.time())
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany("""
+            INSERT INTO events (id, title, description, event_date, created_by, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, ((i, f"Событие {i}", "Описание", now + 3600, i % 10_000, now) for i in range(1, count + 1)))
+        conn.executemany("""
+            INSERT INTO reminders (event_id, offset, due_at) VALUES (?, ?, ?)
+        """, ((i, 3600, now - i % 60) for i in range(1, count + 1)))
+
+
+async def bench_batched(db: Database, batch: int) -> tuple:
+    claim_time = complete_time = 0.0
+    total = 0
+    while True:
+        started = time.perf_counter()
+        rows = await db.claim_due_reminders(limit=batch)
+        claim_time += time.perf_counter() - started
+        if not rows:
+            return total, claim_time, complete_time
+        started = time.perf_counter()
+        await db.complete_reminders(sent=[row[0] for row in rows])
+        complete_time += time.perf_counter() - started
+        total += len(rows)
+
+
+def bench_legacy(db_path: str, count: int) -> float:
+    """Прежний mark_notification_sent: соединение и коммит на каждое событие"""
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE legacy_events (id INTEGER PRIMARY KEY, notification_sent BOOLEAN DEFAULT FALSE)")
+        conn.executemany("INSERT INTO legacy_events (id) VALUES (?)", ((i,) for i in range(1, count + 1)))
+    started = time.perf_counter()
+    for event_id in range(1, count + 1):
+        with sqlite3.connect(db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE legacy_events SET notification_sent = TRUE WHERE id = ?", (event_id,))
+            conn.commit()
+    return time.perf_counter() - started
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reminders", type=int, default=100_000)
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--legacy", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        db = Database(db_path)
+        fill(db_path, args.reminders)
+
+        total, claim_time, complete_time = await bench_batched(db, args.batch)
+        elapsed = claim_time + complete_time
+        print(f"пачки по {args.batch}: {total} напоминаний за {elapsed:.2f} с ({total / elapsed:.0f} в секунду)")
+        print(f"  claim_due_reminders: {claim_time:.2f} с, complete_reminders: {complete_time:.2f} с")
+        db.close()
+
+        legacy_path = os.path.join(tmp, "legacy.db")
+        legacy_time = bench_legacy(legacy_path, args.legacy)
+        print(f"прежняя схема: {args.legacy} UPDATE за {legacy_time:.2f} с ({args.legacy / legacy_time:.0f} в секунду)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
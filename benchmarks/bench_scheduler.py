@@ -0,0 +1,103 @@
+"""
+Бенчмарк планировщика напоминаний на куче
+
+Планирует --events событий на ближайшую неделю и --burst событий, напоминания
+о которых наступают в ближайшие секунды, затем измеряет опоздание напоминаний
+относительно срока, память планировщика и загрузку CPU в простое.
+
+Запуск: python -m benchmarks.bench_scheduler --events 1000000
+"""
+
+import argparse
+import asyncio
+import random
+import time
+import tracemalloc
+
+from benchmarks.stats import summarize
+from db.database import DEFAULT_REMINDER_OFFSETS
+from handlers.scheduler import ReminderScheduler
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--burst", type=int, default=2000)
+    parser.add_argument("--burst-window", type=float, default=5.0, help="секунд, за которые наступают напоминания burst")
+    parser.add_argument("--idle", type=float, default=3.0, help="секунд замера CPU в простое")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    
+    rng = random.Random(args.seed)
+    now = int(time.time())
+    
+    def event_wakeups(event_ts: int):
+        return [event_ts - offset for offset in DEFAULT_REMINDER_OFFSETS]
+    
+    def generate_wakeups(count: int):
+        # Так же, как их возвращает Database.get_pending_reminders: (due_at, event_id)
+        return [
+            (due_at, event_id)
+            for event_id in range(count)
+            for due_at in event_wakeups(now + 7200 + rng.randrange(7 * 86400))
+        ]
+    
+    # Память считаем вместе с кортежами, которые иначе создал бы запрос к базе
+    tracemalloc.start()
+    probe = ReminderScheduler()
+    probe.schedule_many(generate_wakeups(args.events))
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del probe
+    
+    wakeups = generate_wakeups(args.events)
+    scheduler = ReminderScheduler()
+    started = time.perf_counter()
+    scheduler.schedule_many(wakeups)
+    elapsed = time.perf_counter() - started
+    print(f"загрузка {args.events} событий ({len(wakeups)} напоминаний): {elapsed:.2f} с, "
+          f"память {memory / 2 ** 20:.0f} МБ ({memory / max(args.events, 1):.0f} байт/событие)")
+    
+    new_events = [event_wakeups(now + 7200 + rng.randrange(7 * 86400)) for _ in range(10_000)]
+    started = time.perf_counter()
+    for event_id, due_times in enumerate(new_events, start=args.events):
+        scheduler.schedule(event_id, due_times)
+    print(f"schedule() одного события: {(time.perf_counter() - started) / len(new_events) * 1e6:.1f} мкс")
+    
+    # Напоминания burst наступают равномерно в ближайшие burst_window секунд
+    start = time.time() + 0.5
+    due_times = {}
+    for i in range(args.burst):
+        event_id = args.events + 10_000 + i
+        due_at = int(start + args.burst_window * i / args.burst) + 1
+        due_times[event_id] = due_at
+        scheduler.schedule(event_id, [due_at])
+    
+    lateness = []
+    
+    async def handler(reminders):
+        fired_at = time.time()
+        for due_at, event_id in reminders:
+            if event_id in due_times:
+                lateness.append(fired_at - due_at)
+        if len(lateness) == args.burst:
+            done.set()
+    
+    done = asyncio.Event()
+    task = asyncio.create_task(scheduler.run(handler))
+    await asyncio.wait_for(done.wait(), timeout=args.burst_window + 10)
+    stats = summarize(lateness)
+    print(f"опоздание {stats['count']} напоминаний: p50={stats['p50_ms']:.1f} мс "
+          f"p99={stats['p99_ms']:.1f} мс max={stats['max_ms']:.1f} мс")
+    
+    cpu_started = time.process_time()
+    await asyncio.sleep(args.idle)
+    cpu = time.process_time() - cpu_started
+    print(f"CPU в простое: {cpu * 1000:.1f} мс за {args.idle:.0f} с ({cpu / args.idle * 100:.2f}%)")
+    
+    scheduler.stop()
+    await task
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+"""
+Бенчмарк /search на большой таблице
+
+Заполняет --rows событий с названиями и описаниями из словаря (частые и
+редкие слова) и сравнивает поиск по индексу FTS5 с прежним способом -
+LIKE по всей таблице (он же запасной путь без FTS5). Отдельно замеряется,
+во сколько триггеры индекса обходятся массовой вставке.
+
+Запуск: python -m benchmarks.bench_search --rows 1000000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from statistics import median
+
+from db.database import Database
+
+COMMON = ("встреча", "созвон", "отчет", "планерка", "обед", "проект", "команда", "клиент")
+RARE = tuple(f"слово{i}" for i in range(5000))
+
+QUERIES = (
+    ("частое слово", "встреча", None),
+    ("редкое слово", "слово4242", None),
+    ("нет совпадений", "отпуск", None),
+    ("префикс", "план", None),
+    ("два слова", "отчет клиент", None),
+    ("частое + неделя", "созвон", 7),
+    ("редкое + неделя", "слово4242", 7),
+)
+
+
+def fill(db_path: str, rows: int, seed: int) -> float:
+    rng = random.Random(seed)
+    now = int(time.time())
+    started = time.perf_counter()
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany("""
+            INSERT INTO events (title, description, event_date, created_by, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, (
+            (
+                f"{rng.choice(COMMON).capitalize()} {rng.choice(RARE)}",
+                f"{rng.choice(COMMON)} {rng.choice(COMMON)} {rng.choice(RARE)}",
+                now + 3600 + i * 30, i % 10_000, now,
+            )
+            for i in range(rows)
+        ))
+    return time.perf_counter() - started
+
+
+async def measure(db: Database, text: str, days, repeat: int) -> float:
+    start = int(time.time()) if days else None
+    end = start + days * 86400 if days else None
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await db.search_events(text, start, end, limit=10)
+        samples.append(time.perf_counter() - started)
+    return median(samples)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        plain_path = os.path.join(tmp, "plain.db")
+        Database(plain_path).close()
+        with sqlite3.connect(plain_path) as conn:
+            for trigger in ("events_fts_insert", "events_fts_delete", "events_fts_update"):
+                conn.execute(f"DROP TRIGGER {trigger}")
+            conn.execute("DROP TABLE events_fts")
+        plain = fill(plain_path, args.rows, args.seed)
+        
+        db_path = os.path.join(tmp, "bench.db")
+        db = Database(db_path, cache_ttl=0)
+        indexed = fill(db_path, args.rows, args.seed)
+        print(f"вставка {args.rows} событий: {plain:.1f} с без индекса, {indexed:.1f} с с триггерами FTS5")
+        
+        print(f"{'запрос':<18}{'FTS5':>12}{'LIKE':>12}")
+        for name, text, days in QUERIES:
+            db.full_text = True
+            fts = await measure(db, text, days, args.repeat)
+            db.full_text = False
+            like = await measure(db, text, days, args.repeat)
+            print(f"{name:<18}{fts * 1000:>9.2f} мс{like * 1000:>9.2f} мс")
+        
+        db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
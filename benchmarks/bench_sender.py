@@ -0,0 +1,111 @@
+"""
+Бенчмарк отправки всплеска напоминаний при лимитах Telegram
+
+Имитирует --messages напоминаний, наступивших одновременно (09:00):
+большинство в личные чаты, доля --group-share в несколько групповых чатов.
+Бот-заглушка соблюдает лимиты Telegram (30 сообщений в секунду всего,
+1 в секунду на чат) и отвечает 429 при превышении. Сравниваются прежняя
+последовательная отправка (ошибка - сообщение потеряно) и SendPipeline.
+
+Чтобы не ждать минутами, время ускорено в --speedup раз: лимиты умножаются,
+задержка API делится, а результаты пересчитываются в реальное время.
+
+Запуск: python -m benchmarks.bench_sender --messages 5000
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks.fakes import RateLimitedBot
+from benchmarks.stats import summarize
+from handlers.sender import CHAT_RATE, GLOBAL_RATE, SendPipeline
+
+
+def make_burst(count: int, group_share: float, groups: int, seed: int) -> list:
+    rng = random.Random(seed)
+    return [
+        -rng.randrange(1, groups + 1) if rng.random() < group_share else 1000 + i
+        for i in range(count)
+    ]
+
+
+async def bench_serial(bot: RateLimitedBot, chats: list) -> tuple:
+    """Прежний check_and_send_notifications: await на каждое сообщение, без повторов"""
+    started = time.monotonic()
+    latencies, lost = [], 0
+    for chat_id in chats:
+        try:
+            await bot.send_message(chat_id=chat_id, text="🔔 Напоминание о событии!")
+            latencies.append(time.monotonic() - started)
+        except Exception:
+            lost += 1
+    return time.monotonic() - started, latencies, lost
+
+
+async def bench_pipeline(bot: RateLimitedBot, chats: list, workers: int, speedup: float) -> tuple:
+    pipeline = SendPipeline(bot, workers=workers, global_rate=GLOBAL_RATE * speedup, chat_rate=CHAT_RATE * speedup)
+    started = time.monotonic()
+    max_depth = 0
+    
+    async def send(chat_id: int):
+        delivered = await pipeline.send(chat_id=chat_id, text="🔔 Напоминание о событии!")
+        return time.monotonic() - started if delivered else None
+    
+    async def watch_depth():
+        nonlocal max_depth
+        while True:
+            max_depth = max(max_depth, pipeline.queue_depth)
+            await asyncio.sleep(0.01)
+    
+    watcher = asyncio.create_task(watch_depth())
+    results = await asyncio.gather(*(send(chat_id) for chat_id in chats))
+    elapsed = time.monotonic() - started
+    watcher.cancel()
+    await pipeline.stop()
+    latencies = [result for result in results if result is not None]
+    return elapsed, latencies, len(results) - len(latencies), max_depth, pipeline.metrics
+
+
+def report(name: str, elapsed: float, latencies: list, lost: int, bot: RateLimitedBot, speedup: float):
+    stats = summarize([latency * speedup for latency in latencies])
+    print(
+        f"{name}: доставлено {len(latencies)}, потеряно {lost}, ответов 429: {bot.rate_limited}, "
+        f"всего {elapsed * speedup:.1f} с, "
+        f"задержка от 09:00 p50={stats['p50_ms'] / 1000:.1f} с p99={stats['p99_ms'] / 1000:.1f} с"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--group-share", type=float, default=0.05)
+    parser.add_argument("--groups", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка ответа API, секунды")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--speedup", type=float, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    
+    chats = make_burst(args.messages, args.group_share, args.groups, args.seed)
+    
+    def make_bot() -> RateLimitedBot:
+        return RateLimitedBot(
+            global_rate=GLOBAL_RATE * args.speedup,
+            chat_rate=CHAT_RATE * args.speedup,
+            latency=args.latency / args.speedup,
+        )
+    
+    bot = make_bot()
+    elapsed, latencies, lost = await bench_serial(bot, chats)
+    report("последовательно", elapsed, latencies, lost, bot, args.speedup)
+    
+    bot = make_bot()
+    elapsed, latencies, lost, max_depth, metrics = await bench_pipeline(bot, chats, args.workers, args.speedup)
+    report(f"SendPipeline ({args.workers} воркеров)", elapsed, latencies, lost, bot, args.speedup)
+    print(f"  повторов: {metrics.retried}, максимальная глубина очереди: {max_depth}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
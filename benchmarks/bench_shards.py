@@ -0,0 +1,114 @@
+"""
+Бенчмарк отправки напоминаний несколькими воркерами по шардам
+
+Запускает в одном процессе от 1 до 8 NotificationService, у каждого своя
+Database, свой SendPipeline и своя аренда шардов (ShardLeases), как у
+отдельных процессов бота. Когда шарды распределены, в базу добавляются
+--reminders наступивших напоминаний от --users пользователей; Bot API
+отвечает с задержкой --latency. Для каждого числа воркеров выводится,
+сколько напоминаний в секунду отправлено, сколько шардов у каждого воркера
+и сколько было дублей.
+
+Лимиты Telegram в бенчмарке сняты: настоящий бот упирается в 30 сообщений
+в секунду на токен, сколько бы воркеров ни было.
+
+Запуск: python -m benchmarks.bench_shards --reminders 5000
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from collections import Counter
+from typing import List
+
+from db.database import Database, shard_of
+from handlers.leader import ShardLeases
+from handlers.notifications import NotificationService
+from handlers.sender import SendPipeline
+
+
+class LatencyBot:
+    """Bot.send_message с фиксированной задержкой ответа"""
+    
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.sent: List[int] = []
+    
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        await asyncio.sleep(self.latency)
+        self.sent.append(chat_id)
+
+
+def fill(db_path: str, count: int, users: int):
+    """События через час и по одному наступившему напоминанию"""
+    now = int(time.time())
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany("""
+            INSERT INTO events (title, description, event_date, created_by, created_at) VALUES (?, '', ?, ?, ?)
+        """, ((f"Событие {i}", now + 3600, i % users, now) for i in range(count)))
+        conn.executemany("""
+            INSERT INTO reminders (event_id, offset, due_at, shard) VALUES (?, 3600, ?, ?)
+        """, ((i + 1, now, shard_of(i % users)) for i in range(count)))
+
+
+async def bench(tmp: str, workers: int, args) -> dict:
+    db_path = os.path.join(tmp, f"shards_{workers}.db")
+    Database(db_path).close()
+    bot = LatencyBot(args.latency)
+    services = []
+    for number in range(workers):
+        db = Database(db_path)
+        lease = ShardLeases(db, ttl=args.ttl, holder=f"worker-{number}")
+        sender = SendPipeline(bot, workers=args.senders, global_rate=10 ** 6, chat_rate=10 ** 6)
+        services.append(NotificationService(bot, db, sender=sender, lease=lease))
+    tasks = [asyncio.create_task(service.start_notification_service()) for service in services]
+    # Две балансировки: воркеры узнают друг о друге и делят шарды поровну
+    await asyncio.sleep(args.ttl)
+    
+    fill(db_path, args.reminders, args.users)
+    started = time.perf_counter()
+    while len(bot.sent) < args.reminders:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    owned = [len(service.lease.owned) for service in services]
+    
+    for service in services:
+        await service.stop_notification_service()
+    await asyncio.gather(*tasks)
+    for service in services:
+        service.db.close()
+    duplicates = sum(count - 1 for count in Counter(bot.sent).values() if count > 1)
+    return {"elapsed": elapsed, "owned": owned, "duplicates": duplicates}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reminders", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=5000, help="разных пользователей (чатов)")
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка ответа Bot API, секунды")
+    parser.add_argument("--senders", type=int, default=8, help="отправителей в SendPipeline каждого воркера")
+    parser.add_argument("--ttl", type=float, default=0.6, help="срок аренды шардов, секунды")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    
+    print(
+        f"{args.reminders} напоминаний, {args.users} чатов, задержка Bot API {args.latency * 1000:.0f} мс, "
+        f"{args.senders} отправителей на воркер"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        for workers in args.workers:
+            result = await bench(tmp, workers, args)
+            # Напоминания находит контрольный захват раз в ttl / 3: это время входит в замер
+            print(
+                f"воркеров {workers}: {args.reminders / result['elapsed']:.0f} напоминаний/с "
+                f"({result['elapsed']:.2f} с), шардов у воркеров {result['owned']}, дублей {result['duplicates']}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
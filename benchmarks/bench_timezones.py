@@ -0,0 +1,92 @@
+"""
+Бенчмарк вывода списков событий в поясах пользователей
+
+Выводит --listings страниц /events по PAGE_SIZE событий для чатов в
+--zones разных поясах. Сравнивается перевод времени при каждом выводе без
+кэша поясов (ZoneInfo.no_cache, как если бы пояс загружался на каждый
+запрос), с кэшированными объектами ZoneInfo и с кэшем готовых текстов
+render_cached (страницы повторяются: многие чаты смотрят одни и те же
+ближайшие события). Для сравнения - вывод по времени сервера.
+
+Запуск: python -m benchmarks.bench_timezones --listings 10000
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime
+from typing import List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from db.timezones import get_zone
+from handlers.commands import PAGE_SIZE, format_events, render_cached, rendered_texts
+
+ZONES = (
+    "Europe/Moscow", "Europe/Berlin", "Europe/London", "America/New_York",
+    "America/Los_Angeles", "Asia/Tokyo", "Asia/Yekaterinburg", "Australia/Sydney",
+    "Asia/Kolkata", "America/Sao_Paulo", "Africa/Cairo", "Pacific/Auckland",
+)
+
+
+def make_pages(pages: int) -> List[List[Tuple]]:
+    """Страницы /events: события через минуту друг за другом, начиная с завтра"""
+    start = int(time.time()) + 86400
+    return [
+        [
+            (page * PAGE_SIZE + i, f"Событие {page * PAGE_SIZE + i}", "Описание", start + (page * PAGE_SIZE + i) * 60, 1, start)
+            for i in range(PAGE_SIZE)
+        ]
+        for page in range(pages)
+    ]
+
+
+def render_uncached(rows: List[Tuple], tz: Optional[str]) -> str:
+    """Пояс загружается заново при каждом выводе"""
+    zone = ZoneInfo.no_cache(tz) if tz else None
+    response = "📅 Ближайшие события:\n\n"
+    for event_id, title, description, event_date, created_by, created_at in rows:
+        response += (
+            f"🆔 {event_id}\n"
+            f"📅 {datetime.fromtimestamp(event_date, zone).strftime('%d.%m.%Y %H:%M')}\n"
+            f"📝 {title}\n"
+            f"👤 Создал: {created_by}\n\n"
+        )
+    return response
+
+
+def measure(render, requests: List[Tuple[List[Tuple], Optional[str]]]) -> float:
+    started = time.perf_counter()
+    for rows, tz in requests:
+        render(rows, tz)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--listings", type=int, default=10_000)
+    parser.add_argument("--pages", type=int, default=50, help="разных страниц событий")
+    parser.add_argument("--zones", type=int, default=8, help="разных поясов у чатов")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    
+    rng = random.Random(args.seed)
+    pages = make_pages(args.pages)
+    zones = ZONES[:args.zones]
+    requests = [(rng.choice(pages), rng.choice(zones)) for _ in range(args.listings)]
+    local = [(rows, None) for rows, _ in requests]
+    
+    variants = [
+        ("время сервера", lambda rows, tz: format_events(rows), local),
+        ("без кэша поясов", render_uncached, requests),
+        ("кэш объектов ZoneInfo", lambda rows, tz: format_events(rows, get_zone(tz)), requests),
+        ("кэш ZoneInfo и текстов", lambda rows, tz: render_cached(rows, format_events, tz), requests),
+    ]
+    print(f"{args.listings} списков по {PAGE_SIZE} событий, {args.pages} страниц, {len(zones)} поясов")
+    for name, render, inputs in variants:
+        rendered_texts.clear()
+        elapsed = measure(render, inputs)
+        print(f"{name:<24}: {args.listings / elapsed:>9,.0f} списков/с ({elapsed / args.listings * 1e6:.1f} мкс на список)")
+
+
+if __name__ == "__main__":
+    main()
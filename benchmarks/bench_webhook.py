@@ -0,0 +1,128 @@
+"""
+Бенчмарк приема обновлений через webhook
+
+Поднимает WebhookServer с настоящими роутерами бота и базой, вызовы Bot API
+идут в сессию без сети с задержкой --latency. Клиент, как Telegram, держит
+до --connections параллельных POST и шлет записанные обновления
+(/events, /myevents, /addevent). Для каждого числа воркеров выводится,
+сколько обновлений в секунду сервер принимает и обрабатывает.
+
+Запуск: python -m benchmarks.bench_webhook --updates 5000
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import socket
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+import aiohttp
+from aiogram import Bot, Dispatcher
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from benchmarks.fakes import FakeApiSession, make_update
+from benchmarks.stats import summarize
+from db.database import Database
+from handlers.callbacks import router as callbacks_router
+from handlers.commands import router as commands_router
+from main.webhook import WebhookServer
+
+
+GROUP_ID = -100
+
+
+def make_updates(count: int, users: int, seed: int) -> List[dict]:
+    rng = random.Random(seed)
+    date = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+    updates = []
+    for update_id in range(count):
+        roll = rng.random()
+        if roll < 0.8:
+            text = "/events"
+        elif roll < 0.95:
+            text = "/myevents"
+        else:
+            text = f"/addevent {date} 12:00 Событие из webhook"
+        # Все пользователи пишут в одну группу с общим календарем
+        updates.append(make_update(update_id, text, rng.randrange(1, users + 1), GROUP_ID))
+    return updates
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def bench(dp: Dispatcher, bot: Bot, updates: List[dict], concurrency: int, connections: int) -> dict:
+    server = WebhookServer(dp, bot, concurrency=concurrency, queue_size=connections * 4)
+    port = free_port()
+    await server.start("127.0.0.1", port)
+    
+    url = f"http://127.0.0.1:{port}{server.path}"
+    pending = iter(updates)
+    latencies: List[float] = []
+    
+    async def client(session: aiohttp.ClientSession):
+        for update in pending:
+            started = time.perf_counter()
+            async with session.post(url, json=update) as response:
+                assert response.status == 200
+            latencies.append(time.perf_counter() - started)
+    
+    started = time.perf_counter()
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=connections)) as session:
+        await asyncio.gather(*(client(session) for _ in range(connections)))
+    accepted = time.perf_counter() - started
+    # Остановка ждет обработки всей очереди
+    await server.stop()
+    processed = time.perf_counter() - started
+    return {
+        "accepted": len(updates) / accepted,
+        "processed": server.processed / processed,
+        "failed": server.failed,
+        "http": summarize(latencies),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--events", type=int, default=10000, help="событий в базе")
+    parser.add_argument("--connections", type=int, default=40, help="параллельных POST (max_connections в Telegram)")
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка ответа Bot API, секунды")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[4, 32, 128])
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    # Лог aiogram пишет строку на каждое обновление
+    logging.disable(logging.INFO)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "webhook.db"))
+        now = datetime.now()
+        events = ((f"Событие {i}", "Описание", int((now + timedelta(minutes=i)).timestamp())) for i in range(args.events))
+        await db.import_events(events, user_id=1, chat_id=GROUP_ID)
+        bot = Bot("42:TEST", session=FakeApiSession(args.latency))
+        dp = Dispatcher(storage=MemoryStorage(), db=db)
+        dp.include_router(commands_router)
+        dp.include_router(callbacks_router)
+        updates = make_updates(args.updates, args.users, args.seed)
+        print(f"{args.updates} обновлений, {args.connections} соединений, задержка Bot API {args.latency * 1000:.0f} мс")
+        for concurrency in args.concurrency:
+            result = await bench(dp, bot, updates, concurrency, args.connections)
+            http = result["http"]
+            print(
+                f"воркеров {concurrency:>4}: принято {result['accepted']:.0f}/с, обработано {result['processed']:.0f}/с, "
+                f"ошибок {result['failed']}, ответ webhook p50={http['p50_ms']:.1f} мс p99={http['p99_ms']:.1f} мс"
+            )
+        db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
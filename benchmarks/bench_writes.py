@@ -0,0 +1,58 @@
+"""
+Бенчмарк пакетной записи
+
+--adders корутин одновременно добавляют событие, затем столько же
+одновременно удаляют свои события; так повторяется --rounds раз. Сравнивается
+коммит на каждый вызов (write_window=0, как раньше) с накоплением записей
+в общую транзакцию. Замеры идут при synchronous=NORMAL (режим бота: fsync
+только при чекпоинте WAL) и при synchronous=FULL (fsync на каждый коммит).
+
+Запуск: python -m benchmarks.bench_writes --adders 1000
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from db.database import Database
+
+WINDOWS = (0.0, 0.001, 0.005)
+
+
+async def measure(db_path: str, window: float, synchronous: str, adders: int, rounds: int) -> float:
+    db = Database(db_path, cache_ttl=0, write_window=window)
+    db._writer.submit(db._run, lambda conn: conn.execute(f"PRAGMA synchronous={synchronous}"), (), False).result()
+    event_date = int(time.time()) + 86400
+    started = time.perf_counter()
+    for _ in range(rounds):
+        ids = await asyncio.gather(*(
+            db.add_event(f"Событие {user_id}", "Описание", event_date, user_id) for user_id in range(adders)
+        ))
+        await asyncio.gather(*(db.delete_event(event_id, user_id) for user_id, event_id in enumerate(ids)))
+    elapsed = time.perf_counter() - started
+    db.close()
+    return elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--adders", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    
+    writes = args.adders * args.rounds * 2
+    print(f"{args.rounds} раундов по {args.adders} добавлений и {args.adders} удалений")
+    print(f"{'synchronous':<13}{'окно':>8}{'записей/с':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for synchronous in ("NORMAL", "FULL"):
+            for window in WINDOWS:
+                db_path = os.path.join(tmp, f"bench-{synchronous}-{window}.db")
+                elapsed = await measure(db_path, window, synchronous, args.adders, args.rounds)
+                label = "нет" if window == 0 else f"{window * 1000:g} мс"
+                print(f"{synchronous:<13}{label:>8}{writes / elapsed:>14,.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,172 @@
+"""
+Заглушки объектов aiogram для бенчмарков и тестов без Telegram
+"""
+
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Tuple
+
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+from aiogram.types import Chat, Message
+from aiohttp import web
+
+
+@dataclass
+class FakeUser:
+    id: int
+
+
+@dataclass
+class FakeChat:
+    id: int
+
+
+@dataclass
+class FakeMessage:
+    text: str
+    from_user: FakeUser
+    chat: FakeChat
+    answers: List[str] = field(default_factory=list)
+    
+    async def answer(self, text: str, **kwargs):
+        self.answers.append(text)
+
+
+def make_message(text: str, user_id: int, chat_id: int = None) -> FakeMessage:
+    """Создать сообщение от пользователя (по умолчанию в личном чате)"""
+    return FakeMessage(
+        text=text,
+        from_user=FakeUser(id=user_id),
+        chat=FakeChat(id=chat_id if chat_id is not None else user_id),
+    )
+
+
+def make_update(update_id: int, text: str, user_id: int, chat_id: int = None) -> Dict:
+    """JSON обновления с текстовым сообщением, как его присылает Telegram в webhook"""
+    chat_id = chat_id if chat_id is not None else user_id
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id == user_id else "group"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+            "text": text,
+        },
+    }
+
+
+class RateLimitedBot:
+    """
+    Имитация Bot.send_message с лимитами Telegram: при превышении общего
+    лимита или лимита чата отвечает TelegramRetryAfter, как настоящий API.
+    """
+    
+    def __init__(self, global_rate: float = 30, chat_rate: float = 1, latency: float = 0.01, retry_after: int = 1, slack: float = 0.1):
+        self.global_rate = global_rate
+        self.chat_interval = 1 / chat_rate
+        self.latency = latency
+        self.retry_after = retry_after
+        # Допуск на неточность таймеров, как у настоящего сервера
+        self.slack = slack
+        self.sent: List[Tuple[int, str, float]] = []
+        self.rate_limited = 0
+        self._window: Deque[float] = deque()
+        self._chat_last: Dict[int, float] = {}
+    
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        await asyncio.sleep(self.latency)
+        now = time.monotonic()
+        while self._window and now - self._window[0] >= 1:
+            self._window.popleft()
+        last = self._chat_last.get(chat_id)
+        if (len(self._window) >= self.global_rate * (1 + self.slack)
+                or last is not None and now - last < self.chat_interval * (1 - self.slack)):
+            self.rate_limited += 1
+            raise TelegramRetryAfter(SendMessage(chat_id=chat_id, text=text), "Too Many Requests", self.retry_after)
+        self._window.append(now)
+        self._chat_last[chat_id] = now
+        self.sent.append((chat_id, text, now))
+
+
+class FakeApiSession(BaseSession):
+    """
+    Сессия Bot API без сети: вызовы бота записываются и через latency
+    секунд получают ответ (отправленное сообщение или True).
+    """
+    
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls = 0
+    
+    async def make_request(self, bot, method, timeout=None):
+        await asyncio.sleep(self.latency)
+        self.calls += 1
+        if isinstance(method, SendMessage):
+            return Message(
+                message_id=self.calls,
+                date=int(time.time()),
+                chat=Chat(id=method.chat_id, type="private"),
+                text=method.text,
+            )
+        return True
+    
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+    
+    async def close(self):
+        pass
+
+
+class FakeBotApi:
+    """
+    Локальный HTTP-сервер с протоколом Bot API: бот ходит в него настоящей
+    сессией aiohttp (TelegramAPIServer.from_base(fake.url)). Каждый вызов
+    через latency секунд получает успешный ответ; отправленные сообщения
+    записываются с временем получения (time.time()).
+    """
+    
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: Dict[str, int] = {}
+        self.messages: List[Tuple[float, int, str]] = []
+        self.url = ""
+        self._runner: Optional[web.AppRunner] = None
+    
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        self._runner = web.AppRunner(app, handle_signals=False, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+    
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+    
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        form = await request.post()
+        await asyncio.sleep(self.latency)
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if not method.startswith(("send", "edit")):
+            return web.json_response({"ok": True, "result": True})
+        chat_id = int(form.get("chat_id", 0))
+        text = str(form.get("text", form.get("caption", "")))
+        if method == "sendmessage":
+            self.messages.append((time.time(), chat_id, text))
+        return web.json_response({"ok": True, "result": {
+            "message_id": sum(self.calls.values()),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": text,
+        }})
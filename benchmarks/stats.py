@@ -0,0 +1,24 @@
+"""
+Вспомогательные функции для подсчета статистики в бенчмарках
+"""
+
+from typing import Dict, List
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """Перцентиль q (0..100) по отсортированной выборке"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """p50/p99/max в миллисекундах"""
+    return {
+        "count": len(samples),
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "max_ms": max(samples) * 1000 if samples else 0.0,
+    }
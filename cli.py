@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Импорт и экспорт событий без запуска бота
+
+Примеры:
+    python cli.py import events.ics --user 123456789
+    python cli.py import events.csv --user 123456789 --db calendar.db
+    python cli.py import team.ics --user 123456789 --chat -1001234567890
+    python cli.py export calendar.ics
+    python cli.py export my.csv --user 123456789
+    python cli.py export team.ics --chat -1001234567890
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from db.calendar_files import ParseStats, iter_events_file, write_events
+from db.database import Database
+
+
+async def import_file(db: Database, path: str, user_id: int, batch_size: int, chat_id: Optional[int] = None):
+    stats = ParseStats()
+    started = time.perf_counter()
+    with open(path, encoding="utf-8-sig", newline="") as file:
+        result = await db.import_events(iter_events_file(file, path, stats), user_id, batch_size=batch_size, chat_id=chat_id)
+    elapsed = time.perf_counter() - started
+    print(
+        f"Добавлено событий: {result.imported}, пропущено записей: {stats.skipped}, "
+        f"{elapsed:.1f} с ({result.imported / max(elapsed, 1e-9):.0f} в секунду)"
+    )
+
+
+async def export_file(db: Database, path: str, user_id: Optional[int], chat_id: Optional[int] = None):
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        count = await write_events(db.iter_events(user_id=user_id, chat_id=chat_id), file, path)
+    print(f"Выгружено событий: {count} в {path}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="calendar.db", help="путь к базе данных")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    import_parser = commands.add_parser("import", help="загрузить события из .ics или .csv")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--user", type=int, required=True, help="ID пользователя - автора событий")
+    import_parser.add_argument("--chat", type=int, default=None, help="ID чата, в календарь которого импортировать (по умолчанию личный)")
+    import_parser.add_argument("--batch-size", type=int, default=10_000)
+    
+    export_parser = commands.add_parser("export", help="выгрузить события в .ics или .csv")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--user", type=int, default=None, help="только события пользователя")
+    export_parser.add_argument("--chat", type=int, default=None, help="только календарь чата")
+    
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    
+    db = Database(args.db)
+    try:
+        if args.command == "import":
+            await import_file(db, args.path, args.user, args.batch_size, args.chat)
+        else:
+            await export_file(db, args.path, args.user, args.chat)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
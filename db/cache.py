@@ -0,0 +1,99 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Set, Tuple
+
+
+class TTLCache:
+    """
+    LRU-кэш с временем жизни записей, тегами для инвалидации и счетчиками.
+
+    Не потокобезопасен: используется только из цикла событий. Запись,
+    прочитанная до инвалидации, не попадет в кэш после нее: set() с
+    generation, взятым до чтения, отбрасывается, если инвалидация случилась
+    между чтением и записью.
+    """
+    
+    def __init__(self, maxsize: int = 1024, ttl: float = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # key -> (expires_at, value, tags)
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any, Tuple[Hashable, ...]]]" = OrderedDict()
+        self._tags: Dict[Hashable, Set[Hashable]] = {}
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def get(self, key: Hashable, now: Optional[float] = None) -> Any:
+        """Значение по ключу или None (промах, в том числе истекшая запись)"""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= (time.time() if now is None else now):
+            self._remove(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+    
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        tags: Iterable[Hashable] = (),
+        expires_at: Optional[float] = None,
+        generation: Optional[int] = None,
+        ttl: Optional[float] = None,
+    ):
+        """Сохранить значение на ttl секунд (или до expires_at, если раньше); ttl записи заменяет общий"""
+        if self.ttl <= 0 or generation is not None and generation != self.generation:
+            return
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+        if expires_at is not None:
+            expires = min(expires, expires_at)
+        
+        if key in self._entries:
+            self._remove(key)
+        tags = tuple(tags)
+        self._entries[key] = (expires, value, tags)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+        
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+    
+    def invalidate(self, *tags: Hashable):
+        """Удалить все записи с любым из тегов"""
+        self.generation += 1
+        for tag in tags:
+            for key in list(self._tags.get(tag, ())):
+                self._remove(key)
+    
+    def clear(self):
+        self.generation += 1
+        self._entries.clear()
+        self._tags.clear()
+    
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+    
+    def _remove(self, key: Hashable):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
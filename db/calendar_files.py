@@ -0,0 +1,228 @@
+"""
+Потоковое чтение и запись событий в форматах iCalendar (.ics) и CSV.
+
+Все функции работают с итераторами строк и событий: файл любого размера
+читается и пишется построчно, в памяти держится одно событие.
+"""
+
+import csv
+import logging
+from datetime import datetime, timezone, tzinfo
+from typing import AsyncIterable, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # Python 3.8: TZID игнорируется, время считается локальным
+    ZoneInfo = None
+
+logger = logging.getLogger(__name__)
+
+# (title, description, event_date) - событие, готовое к вставке
+ImportedEvent = Tuple[str, str, int]
+
+# Длина заголовка, как у событий из /addevent
+TITLE_LENGTH = 50
+CSV_FIELDS = ("title", "description", "event_date")
+
+ICS_HEADER = "BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//calendar_of_events//RU\r\n"
+ICS_FOOTER = "END:VCALENDAR\r\n"
+
+
+class ParseStats:
+    """Счетчики разбора файла"""
+    
+    def __init__(self):
+        self.parsed = 0
+        self.skipped = 0
+
+
+def _unfold(lines: Iterable[str]) -> Iterator[str]:
+    """Склеить перенесенные строки iCalendar (продолжение начинается с пробела)"""
+    current = None
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current is not None:
+        yield current
+
+
+def _unescape(value: str) -> str:
+    result, chars = [], iter(value)
+    for char in chars:
+        if char == "\\":
+            char = next(chars, "")
+            result.append("\n" if char in ("n", "N") else char)
+        else:
+            result.append(char)
+    return "".join(result)
+
+
+def _escape(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+        .replace("\r\n", "\\n").replace("\n", "\\n")
+    )
+
+
+def parse_ics_datetime(value: str, tzid: Optional[str] = None, zone: Optional[tzinfo] = None) -> int:
+    """
+    DTSTART iCalendar в UTC epoch: 20240115T150000Z, 20240115T150000 (TZID
+    или пояс импортирующего zone), 20240115.
+    """
+    if len(value) == 8:
+        return int(datetime.strptime(value, "%Y%m%d").replace(tzinfo=zone).timestamp())
+    if value.endswith("Z"):
+        parsed = datetime.strptime(value[:-1], "%Y%m%dT%H%M%S")
+        return int(parsed.replace(tzinfo=timezone.utc).timestamp())
+    parsed = datetime.strptime(value, "%Y%m%dT%H%M%S")
+    if tzid and ZoneInfo is not None:
+        parsed = parsed.replace(tzinfo=ZoneInfo(tzid))
+    else:
+        parsed = parsed.replace(tzinfo=zone)
+    return int(parsed.timestamp())
+
+
+def iter_ics(lines: Iterable[str], stats: Optional[ParseStats] = None, zone: Optional[tzinfo] = None) -> Iterator[ImportedEvent]:
+    """Разобрать поток строк .ics в события (VEVENT без DTSTART пропускаются)"""
+    stats = stats or ParseStats()
+    event = None
+    for line in _unfold(lines):
+        if line == "BEGIN:VEVENT":
+            event = {}
+            continue
+        if event is None:
+            continue
+        if line == "END:VEVENT":
+            try:
+                summary = _unescape(event.get("SUMMARY", ("", ""))[1]) or "Без названия"
+                description = _unescape(event.get("DESCRIPTION", ("", ""))[1]) or summary
+                params, value = event["DTSTART"]
+                event_date = parse_ics_datetime(value, params.get("TZID"), zone)
+            except Exception as e:
+                stats.skipped += 1
+                logger.warning(f"Skipped VEVENT: {e}")
+            else:
+                stats.parsed += 1
+                yield summary[:TITLE_LENGTH], description, event_date
+            event = None
+            continue
+        
+        name, _, value = line.partition(":")
+        name, *raw_params = name.split(";")
+        if name in ("SUMMARY", "DESCRIPTION", "DTSTART"):
+            params = dict(param.partition("=")[::2] for param in raw_params)
+            event[name] = (params, value)
+
+
+def parse_csv_date(value: str, zone: Optional[tzinfo] = None) -> int:
+    """Дата из CSV: epoch, ISO 8601 (наивная - по поясу zone) или YYYY-MM-DD HH:MM"""
+    value = value.strip()
+    if value.lstrip("-").isdigit():
+        return int(value)
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=zone)
+    return int(parsed.timestamp())
+
+
+def iter_csv(lines: Iterable[str], stats: Optional[ParseStats] = None, zone: Optional[tzinfo] = None) -> Iterator[ImportedEvent]:
+    """Разобрать поток строк CSV с заголовком title,description,event_date"""
+    stats = stats or ParseStats()
+    for row in csv.DictReader(lines):
+        try:
+            title = (row.get("title") or "").strip()
+            description = (row.get("description") or "").strip() or title
+            event_date = parse_csv_date(row.get("event_date") or row.get("date") or "", zone)
+            if not title:
+                raise ValueError("empty title")
+        except Exception as e:
+            stats.skipped += 1
+            logger.warning(f"Skipped CSV row {row}: {e}")
+        else:
+            stats.parsed += 1
+            yield title[:TITLE_LENGTH], description, event_date
+
+
+def iter_events_file(
+    file: TextIO,
+    name: str,
+    stats: Optional[ParseStats] = None,
+    zone: Optional[tzinfo] = None,
+) -> Iterator[ImportedEvent]:
+    """Выбрать разборщик по расширению файла; даты без пояса читаются по zone"""
+    if name.lower().endswith(".csv"):
+        return iter_csv(file, stats, zone)
+    if name.lower().endswith((".ics", ".ical", ".ifb")):
+        return iter_ics(file, stats, zone)
+    raise ValueError(f"Неизвестный формат файла: {name}")
+
+
+def _fold(line: str) -> Iterator[str]:
+    """Перенести строку iCalendar длиннее 75 байт (по границам символов UTF-8)"""
+    if len(line) <= 37 or len(line.encode("utf-8")) <= 75:
+        yield line
+        return
+    chunk, size = [], 0
+    for char in line:
+        char_size = len(char.encode("utf-8"))
+        if size + char_size > 75:
+            yield "".join(chunk)
+            chunk, size = [" "], 1
+        chunk.append(char)
+        size += char_size
+    yield "".join(chunk)
+
+
+def _ics_timestamp(value: int) -> str:
+    return datetime.fromtimestamp(value, timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def iter_ics_events(rows: Iterable[Tuple]) -> Iterator[str]:
+    """Строки VEVENT (с CRLF) для строк (id, title, description, event_date, created_by, created_at)"""
+    for event_id, title, description, event_date, _, created_at in rows:
+        for line in (
+            "BEGIN:VEVENT",
+            f"UID:{event_id}@calendar_of_events",
+            f"DTSTAMP:{_ics_timestamp(created_at)}",
+            f"DTSTART:{_ics_timestamp(event_date)}",
+            f"SUMMARY:{_escape(title)}",
+            f"DESCRIPTION:{_escape(description or '')}",
+            "END:VEVENT",
+        ):
+            for folded in _fold(line):
+                yield folded + "\r\n"
+
+
+def write_csv_rows(file: TextIO, rows: Iterable[Tuple], header: bool = True):
+    """Записать строки (id, title, description, event_date, ...) в CSV с ISO датами"""
+    writer = csv.writer(file)
+    if header:
+        writer.writerow(CSV_FIELDS)
+    for row in rows:
+        writer.writerow((row[1], row[2], datetime.fromtimestamp(row[3], timezone.utc).isoformat()))
+
+
+async def write_events(batches: AsyncIterable[List[Tuple]], file: TextIO, name: str) -> int:
+    """Записать пачки строк событий в .ics или .csv (по расширению); вернуть число событий"""
+    csv_format = name.lower().endswith(".csv")
+    count = 0
+    if not csv_format:
+        file.write(ICS_HEADER)
+    async for rows in batches:
+        if csv_format:
+            write_csv_rows(file, rows, header=count == 0)
+        else:
+            file.writelines(iter_ics_events(rows))
+        count += len(rows)
+    if not csv_format:
+        file.write(ICS_FOOTER)
+    elif count == 0:
+        write_csv_rows(file, ())
+    return count
@@ -1,114 +1,1884 @@
 import sqlite3
 import asyncio
-from datetime import datetime, timedelta
-from typing import List, Optional, Tuple
+import json
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple, Union
 import logging
+import time
+
+from db.cache import TTLCache
+from db.digests import next_digest_at
+from db.intervals import IntervalIndex, free_slots, overlaps
+from db.metrics import DB_QUERY_SECONDS
+from db.migrations import migrate
+from db.recurrence import DAY, format_rule, iter_occurrences, last_occurrence, next_occurrence, occurrences_between, parse_rule
+from db.timezones import get_zone
 
 logger = logging.getLogger(__name__)
 
+# Настройки каждого соединения. WAL позволяет читателям работать параллельно
+# с писателем, а synchronous=NORMAL в режиме WAL не делает fsync на каждый коммит
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",
+    "PRAGMA foreign_keys=ON",
+)
+
+# Напоминания по умолчанию: за 1 час и за 15 минут до события (в секундах)
+DEFAULT_REMINDER_OFFSETS = (60 * 60, 15 * 60)
+
+# Тег кэша для выборок, зависящих от всех событий
+EVENTS_TAG = "events"
+
+# Тег кэша для раскрытых повторений серий: сбрасывается только при изменении
+# серий, добавление обычного события его не трогает
+SERIES_TAG = "series"
+
+# Позиция в списке событий: (event_date, id) события на границе страницы
+Cursor = Tuple[int, int]
+MAX_ROWID = 2 ** 63 - 1
+
+# Повторения серий раскрываются и кэшируются окнами по суткам (UTC)
+WINDOW = DAY
+
+# Напоминания делятся на шарды по создателю события; шарды распределяются
+# между воркерами уведомлений через аренды (handlers/leader.py)
+REMINDER_SHARDS = 64
+
+# Ключ состояния FSM: (bot_id, chat_id, user_id, thread_id, destiny)
+FSMKey = Tuple[int, int, int, int, str]
+
+# Окно накопления записей в общую транзакцию (секунды) и предел пачки
+WRITE_WINDOW = 0.005
+MAX_WRITE_BATCH = 500
+
+# Корзина счетчиков для края местных суток (секунды, см. миграцию _day_buckets)
+BUCKET = 15 * 60
+
+# Индекс интервалов чата перестраивается не реже чем раз в столько секунд,
+# даже если его не сбросили записи других процессов
+INTERVALS_TTL = 60 * 60
+
+# Сколько слов запроса /search учитывается
+MAX_SEARCH_TERMS = 8
+SEARCH_TERM = re.compile(r"\w+")
+
+
+class ImportResult(NamedTuple):
+    """Итог массового импорта: сколько событий вставлено и id первого из них"""
+    imported: int
+    first_event_id: int
+
+
+class EventPage(NamedTuple):
+    """Страница событий и признаки наличия соседних страниц"""
+    rows: List[Tuple]
+    has_prev: bool
+    has_next: bool
+
+
+class Expansion(NamedTuple):
+    """Повторения серий в окне [start, start + WINDOW) и следующее окно с повторениями"""
+    # (event_date, id) строк rows, по возрастанию
+    keys: List[Cursor]
+    rows: List[Tuple]
+    # Начало окна со следующим повторением (оценка снизу) или None
+    next_start: Optional[int]
+
+
+def to_timestamp(value: Union[datetime, str, int]) -> int:
+    """Привести дату к UTC epoch (наивные даты считаются локальным временем)"""
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return int(value.timestamp())
+
+
+def search_terms(text: str) -> List[str]:
+    """Слова поискового запроса: без кавычек и операторов FTS5, в нижнем регистре"""
+    return SEARCH_TERM.findall(text.lower())[:MAX_SEARCH_TERMS]
+
+
+def shard_of(user_id: int) -> int:
+    """Шард напоминаний о событиях пользователя (все его напоминания - в одном шарде)"""
+    return user_id % REMINDER_SHARDS
+
+
+def _insert_reminders(conn: sqlite3.Connection, event_id: int, event_ts: int, offsets: Sequence[int], user_id: int):
+    """Создать строки напоминаний, срок которых еще не прошел"""
+    now = int(time.time())
+    conn.executemany("""
+        INSERT OR IGNORE INTO reminders (event_id, offset, due_at, shard)
+        VALUES (?, ?, ?, ?)
+    """, [(event_id, offset, event_ts - offset, shard_of(user_id)) for offset in offsets if event_ts - offset > now])
+
+
+def _window(timestamp: int) -> int:
+    return timestamp - timestamp % WINDOW
+
+
+def _exdates(conn: sqlite3.Connection, event_id: int, after: int) -> Set[int]:
+    """Исключенные повторения серии позже after"""
+    return {row[0] for row in conn.execute("""
+        SELECT occurrence FROM event_exceptions WHERE event_id = ? AND occurrence > ?
+    """, (event_id, after))}
+
+
+def _next_series_occurrence(
+    conn: sqlite3.Connection,
+    event_id: int,
+    dtstart: int,
+    rrule: str,
+    after: int,
+    tz: Optional[str] = None,
+) -> Optional[int]:
+    """Ближайшее неисключенное повторение серии позже after (по поясу серии tz)"""
+    return next_occurrence(dtstart, parse_rule(rrule), after, _exdates(conn, event_id, after), get_zone(tz))
+
+
+def _insert_series_reminders(
+    conn: sqlite3.Connection,
+    event_id: int,
+    dtstart: int,
+    rrule: str,
+    offsets: Sequence[int],
+    user_id: int,
+    tz: Optional[str] = None,
+):
+    """Напоминания серии: каждое - о ближайшем повторении, срок которого еще не прошел"""
+    now = int(time.time())
+    rows = []
+    for offset in offsets:
+        occurrence = _next_series_occurrence(conn, event_id, dtstart, rrule, now + offset, tz)
+        if occurrence is not None:
+            rows.append((event_id, offset, occurrence - offset, occurrence, shard_of(user_id)))
+    conn.executemany("""
+        INSERT OR IGNORE INTO reminders (event_id, offset, due_at, occurrence, shard)
+        VALUES (?, ?, ?, ?, ?)
+    """, rows)
+
+
+def _advance_reminders(conn: sqlite3.Connection, reminder_ids: Sequence[int]) -> List[Tuple[int, int]]:
+    """
+    Перевести отработавшие напоминания серий на следующее повторение.
+    
+    Серия держит по одной строке на смещение - о ближайшем повторении;
+    следующая вычисляется только когда текущая отработала. Возвращает новые
+    (due_at, event_id) для планировщика.
+    """
+    now = int(time.time())
+    wakeups, updates = [], []
+    for start in range(0, len(reminder_ids), 500):
+        chunk = reminder_ids[start:start + 500]
+        rows = conn.execute(f"""
+            SELECT r.id, r.event_id, r.offset, r.occurrence, e.event_date, e.rrule, e.tz
+            FROM reminders r
+            JOIN events e ON e.id = r.event_id
+            WHERE r.id IN ({",".join("?" * len(chunk))}) AND e.rrule IS NOT NULL
+        """, chunk).fetchall()
+        for reminder_id, event_id, offset, occurrence, dtstart, rrule, tz in rows:
+            occurrence = _next_series_occurrence(conn, event_id, dtstart, rrule, max(occurrence or 0, now + offset), tz)
+            if occurrence is not None:
+                updates.append((occurrence - offset, occurrence, reminder_id))
+                wakeups.append((occurrence - offset, event_id))
+    conn.executemany("""
+        UPDATE reminders SET status = 'pending', attempts = 0, due_at = ?, occurrence = ? WHERE id = ?
+    """, updates)
+    return wakeups
+
+
+def _expand_series(conn: sqlite3.Connection, start: int, end: int, chat_id: Optional[int] = None) -> Expansion:
+    """
+    Раскрыть повторения всех серий (или серий календаря чата) в окне [start, end).
+    
+    Для каждой серии вычисляются только повторения в окне; первое
+    повторение после окна дает оценку следующего непустого окна, по которой
+    листание перепрыгивает пустые дни.
+    """
+    chat_filter, chat_params = _chat_filter(chat_id)
+    series = conn.execute(f"""
+        SELECT id, title, description, event_date, created_by, created_at, rrule, tz
+        FROM events
+        WHERE rrule IS NOT NULL {chat_filter} AND event_date < ? AND (until IS NULL OR until >= ?)
+    """, (*chat_params, end, start)).fetchall()
+    exdates: Dict[int, Set[int]] = {}
+    for event_id, occurrence in conn.execute(f"""
+        SELECT x.event_id, x.occurrence FROM event_exceptions x
+        JOIN events e ON e.id = x.event_id
+        WHERE x.occurrence >= ? AND x.occurrence < ? {_chat_filter(chat_id, "e.chat_id")[0]}
+    """, (start, end, *chat_params)):
+        exdates.setdefault(event_id, set()).add(occurrence)
+    
+    # Серии, начинающиеся после окна
+    next_at = conn.execute(f"""
+        SELECT MIN(event_date) FROM events WHERE rrule IS NOT NULL {chat_filter} AND event_date >= ?
+    """, (*chat_params, end)).fetchone()[0]
+    
+    rows = []
+    for event_id, title, description, dtstart, created_by, created_at, rrule, tz in series:
+        occurrences, after = occurrences_between(
+            dtstart, parse_rule(rrule), start, end, exdates.get(event_id, frozenset()), get_zone(tz)
+        )
+        for occurrence in occurrences:
+            rows.append((event_id, title, description, occurrence, created_by, created_at))
+        if after is not None:
+            next_at = after if next_at is None else min(next_at, after)
+    
+    rows.sort(key=lambda row: (row[3], row[0]))
+    return Expansion([(row[3], row[0]) for row in rows], rows, None if next_at is None else _window(next_at))
+
+
+def _load_intervals(conn: sqlite3.Connection, chat_id: int) -> IntervalIndex:
+    """Индекс интервалов обычных событий календаря чата"""
+    return IntervalIndex(conn.execute("""
+        SELECT id, event_date, duration FROM events WHERE chat_id = ? AND rrule IS NULL ORDER BY event_date, id
+    """, (chat_id,)))
+
+
+def _series_intervals(conn: sqlite3.Connection, chat_id: int, start: int, end: int) -> List[Tuple]:
+    """Повторения серий календаря чата, пересекающие [start, end): (id, title, event_date, duration)"""
+    durations = dict(conn.execute("""
+        SELECT id, duration FROM events WHERE chat_id = ? AND rrule IS NOT NULL
+    """, (chat_id,)))
+    if not durations:
+        return []
+    # Повторение, начавшееся раньше start, может еще идти
+    rows = _expand_series(conn, start - max(durations.values()), end, chat_id).rows
+    return [
+        (event_id, title, occurrence, durations[event_id])
+        for event_id, title, _, occurrence, _, _ in rows
+        if overlaps(occurrence, durations[event_id], start, end)
+    ]
+
+
+def _previous_window(conn: sqlite3.Connection, start: int, chat_id: Optional[int] = None) -> Optional[int]:
+    """
+    Начало окна с последним повторением серий до start (оценка сверху) или None.
+    
+    Нужно только при листании назад через пустые окна: для каждой серии
+    ищется повторение за один период до start.
+    """
+    chat_filter, chat_params = _chat_filter(chat_id)
+    # Серии, закончившиеся до start
+    last_at = conn.execute(f"""
+        SELECT MAX(until) FROM events WHERE rrule IS NOT NULL {chat_filter} AND until < ?
+    """, (*chat_params, start)).fetchone()[0]
+    series = conn.execute(f"""
+        SELECT event_date, rrule, tz FROM events
+        WHERE rrule IS NOT NULL {chat_filter} AND event_date < ? AND (until IS NULL OR until >= ?)
+    """, (*chat_params, start, start)).fetchall()
+    for dtstart, rrule, tz in series:
+        rule = parse_rule(rrule)
+        lookback = start - rule.span()
+        # Без повторения за последний период оно было раньше lookback
+        last = lookback - 1 if dtstart < lookback else None
+        for occurrence in iter_occurrences(dtstart, rule, lookback, zone=get_zone(tz)):
+            if occurrence >= start:
+                break
+            last = occurrence
+        if last is not None:
+            last_at = last if last_at is None else max(last_at, last)
+    return None if last_at is None else _window(last_at)
+
+
+def _search_like(
+    conn: sqlite3.Connection,
+    terms: List[str],
+    low: int,
+    high: int,
+    limit: int,
+    offset: int,
+    chat_id: Optional[int] = None,
+) -> List[Tuple]:
+    """Поиск без FTS5: LIKE по всем событиям, от ближайших по дате (регистр не учитывается только для латиницы)"""
+    where = " AND ".join("(title LIKE ? OR description LIKE ?)" for _ in terms)
+    patterns = [pattern for term in terms for pattern in (f"%{term}%",) * 2]
+    chat_filter, chat_params = _chat_filter(chat_id)
+    return conn.execute(f"""
+        SELECT id, title, description, event_date, created_by, rrule FROM events
+        WHERE {where} {chat_filter}
+          AND event_date < ?
+          AND CASE WHEN rrule IS NULL THEN event_date ELSE COALESCE(until, ?) END >= ?
+        ORDER BY event_date, id
+        LIMIT ? OFFSET ?
+    """, (*patterns, *chat_params, high, MAX_ROWID, low, limit, offset)).fetchall()
+
+
+def _shard_filter(shards: Optional[Iterable[int]], column: str = "shard") -> str:
+    """Условие AND shard IN (...) для запросов к reminders (пустое - все шарды)"""
+    if shards is None:
+        return ""
+    return f"AND {column} IN ({','.join(str(int(shard)) for shard in shards) or 'NULL'})"
+
+
+def _chat_filter(chat_id: Optional[int], column: str = "chat_id") -> Tuple[str, tuple]:
+    """Условие AND chat_id = ? и его параметр для выборок календаря чата (None - всех чатов)"""
+    if chat_id is None:
+        return "", ()
+    return f"AND {column} = ?", (chat_id,)
+
+
+def _leased_shards(conn: sqlite3.Connection, name: str, holder: str) -> Optional[List[int]]:
+    """
+    Шарды, которыми сейчас владеет holder: None - все (аренда name целиком),
+    список - по арендам name:shard:N (пустой - ни одного).
+    """
+    shards = []
+    for lease_name, in conn.execute("""
+        SELECT name FROM leases WHERE holder = ? AND expires_at > ? AND (name = ? OR name LIKE ? || ':shard:%')
+    """, (holder, time.time(), name, name)):
+        if lease_name == name:
+            return None
+        shards.append(int(lease_name.rsplit(":", 1)[1]))
+    return shards
+
+
+def _drop_empty_fsm(conn: sqlite3.Connection, key: FSMKey):
+    """Удалить запись FSM без состояния и данных, чтобы таблица не росла от завершенных диалогов"""
+    conn.execute("""
+        DELETE FROM fsm_states
+        WHERE bot_id = ? AND chat_id = ? AND user_id = ? AND thread_id = ? AND destiny = ?
+          AND state IS NULL AND data = '{}'
+    """, key)
+
+
+def _run_batch(conn: sqlite3.Connection, operations: List[Tuple[Callable[..., Any], tuple]]) -> List[Tuple[bool, Any]]:
+    """Выполнить записи одной транзакцией; для каждой - (успех, результат или исключение)"""
+    # Без явного BEGIN выход из первой точки сохранения сразу коммитил бы ее.
+    # IMMEDIATE берет блокировку записи сразу (с ожиданием busy_timeout): иначе
+    # запись, начавшаяся с чтения, не сможет повысить снимок до записи, если
+    # другой процесс успел закоммитить, и сразу получит "database is locked"
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    results = []
+    for func, args in operations:
+        started = time.perf_counter()
+        conn.execute("SAVEPOINT batched_write")
+        try:
+            value = func(conn, *args)
+        except Exception as e:
+            conn.execute("ROLLBACK TO batched_write")
+            conn.execute("RELEASE batched_write")
+            results.append((False, e))
+        else:
+            conn.execute("RELEASE batched_write")
+            results.append((True, value))
+        DB_QUERY_SECONDS.observe(time.perf_counter() - started, _method_label(func))
+    return results
+
+
+# Метки гистограммы запросов по объекту кода: вложенные query создаются
+# заново при каждом вызове метода, а код у них один
+_method_labels: Dict[Any, str] = {}
+
+
+def _method_label(func: Callable[..., Any]) -> str:
+    """Имя метода Database, в котором объявлен запрос: Database.add_event.<locals>.query -> add_event"""
+    label = _method_labels.get(func.__code__)
+    if label is None:
+        parts = func.__qualname__.split(".<locals>.")[0].split(".")
+        label = "write_batch" if func is _run_batch else parts[-1]
+        _method_labels[func.__code__] = label
+    return label
+
+
+def _has_table(conn: sqlite3.Connection, name: str) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone() is not None
+
+
+def _merge(*parts: List[Tuple]) -> List[Tuple]:
+    """Слить списки строк событий по (event_date, id)"""
+    return sorted((row for part in parts for row in part), key=lambda row: (row[3], row[0]))
+
 
 class Database:
-    def __init__(self, db_path: str = "calendar.db"):
+    def __init__(
+        self,
+        db_path: str = "calendar.db",
+        pool_size: int = 4,
+        cache_size: int = 1024,
+        cache_ttl: float = 30.0,
+        series_ttl: float = 600.0,
+        write_window: float = WRITE_WINDOW,
+        index_ttl: float = 30.0,
+        interval_chats: int = 64,
+    ):
         self.db_path = db_path
+        self.pool_size = pool_size
+        # Кэш списков событий; сбрасывается при добавлении и удалении событий
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        # Раскрытые окна серий меняются только вместе с сериями, поэтому живут дольше
+        self.series_ttl = series_ttl
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        # SQLite допускает только одного писателя, поэтому все записи идут
+        # через один поток с долгоживущим соединением, а чтения - через пул
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._readers = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="db-reader")
+        # Частые мелкие записи копятся write_window секунд и коммитятся вместе
+        # (0 - каждая запись в своей транзакции)
+        self.write_window = write_window
+        self._pending_writes: List[Tuple[Callable[..., Any], tuple, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # Записи других процессов в индексах в памяти замечаются раз в index_ttl секунд
+        self.index_ttl = index_ttl
+        self._index_checked = 0.0
+        self._data_version: Optional[int] = None
+        # Индексы интервалов календарей чатов для /free и пересечений в /addevent:
+        # строятся при первом запросе и живут, пока их не вытеснят другие чаты
+        self.intervals = TTLCache(maxsize=interval_chats, ttl=INTERVALS_TTL)
         self.init_database()
     
     def init_database(self):
-        """Инициализация базы данных и создание таблиц"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS events (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    title TEXT NOT NULL,
-                    description TEXT,
-                    event_date TEXT NOT NULL,
-                    created_by INTEGER NOT NULL,
-                    created_at TEXT NOT NULL,
-                    notification_sent BOOLEAN DEFAULT FALSE
-                )
-            """)
-            conn.commit()
-            logger.info("Database initialized successfully")
-    
-    def add_event(self, title: str, description: str, event_date: str, user_id: int) -> int:
-        """Добавить событие в календарь"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO events (title, description, event_date, created_by, created_at)
-                VALUES (?, ?, ?, ?, ?)
-            """, (title, description, event_date, user_id, datetime.now().isoformat()))
-            conn.commit()
+        """Инициализация базы данных: создание таблиц и миграции схемы"""
+        self._writer.submit(self._run, migrate, (), False).result()
+        # Без FTS5 в SQLite миграция поиска не создает индекс, и поиск идет через LIKE
+        self.full_text = self._writer.submit(self._run, _has_table, ("events_fts",), False).result()
+        logger.info("Database initialized successfully")
+    
+    def close(self):
+        """Закрыть пул потоков и все соединения"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        for _, _, future in self._pending_writes:
+            if not future.done():
+                future.set_exception(RuntimeError("Database is closed"))
+        self._pending_writes.clear()
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+    
+    def _get_connection(self) -> sqlite3.Connection:
+        """Соединение текущего потока пула (создается один раз)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # check_same_thread=False нужен только для close() из другого потока
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            for pragma in CONNECTION_PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+    
+    def _run(self, func: Callable[..., Any], args: tuple, write: bool) -> Any:
+        conn = self._get_connection()
+        # Время записи включает коммит; у пачки записей еще и время каждой (см. _run_batch)
+        started = time.perf_counter()
+        try:
+            if not write:
+                return func(conn, *args)
+            with conn:
+                return func(conn, *args)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, _method_label(func))
+    
+    async def _read(self, func: Callable[..., Any], *args) -> Any:
+        """Выполнить запрос на чтение в пуле читателей"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, self._run, func, args, False)
+    
+    async def _write(self, func: Callable[..., Any], *args) -> Any:
+        """Выполнить запрос на запись в отдельной транзакции в потоке писателя"""
+        # Накопленные раньше записи уходят писателю первыми, порядок записей сохраняется
+        if self._pending_writes:
+            self._flush_writes()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, self._run, func, args, True)
+    
+    async def _write_batched(self, func: Callable[..., Any], *args) -> Any:
+        """
+        Выполнить запрос на запись в общей транзакции с соседними записями.
+        
+        Записи, пришедшие за write_window секунд (но не больше MAX_WRITE_BATCH),
+        выполняются писателем одной транзакцией: всплеск из сотен add_event
+        платит за один коммит, а не за сотни. Каждая запись идет в своей точке
+        сохранения, поэтому ошибка одной откатывает только ее, и каждый
+        вызывающий получает свой результат или свое исключение.
+        """
+        if self.write_window <= 0:
+            return await self._write(func, *args)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending_writes.append((func, args, future))
+        if len(self._pending_writes) >= MAX_WRITE_BATCH:
+            self._flush_writes()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.write_window, self._flush_writes)
+        return await future
+    
+    def _flush_writes(self):
+        """Отдать накопленные записи писателю одной транзакцией"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending_writes = self._pending_writes, []
+        if not batch:
+            return
+        
+        def resolve(done: asyncio.Future):
+            error = None if done.cancelled() else done.exception()
+            for index, (_, _, future) in enumerate(batch):
+                if future.done():
+                    continue
+                if done.cancelled():
+                    future.cancel()
+                elif error is not None:
+                    # Не удался сам коммит: ни одна запись пачки не сохранена
+                    future.set_exception(error)
+                else:
+                    ok, value = done.result()[index]
+                    if ok:
+                        future.set_result(value)
+                    else:
+                        future.set_exception(value)
+        
+        operations = [(func, args) for func, args, _ in batch]
+        loop = asyncio.get_running_loop()
+        loop.run_in_executor(self._writer, self._run, _run_batch, (operations,), True).add_done_callback(resolve)
+    
+    def _refresh_index(self, conn: sqlite3.Connection) -> bool:
+        """Вернуть, меняли ли базу другие процессы с прошлой проверки"""
+        # data_version соединения меняется только от коммитов других соединений,
+        # то есть других процессов: свои записи индексы уже учли
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return False
+        self._data_version = version
+        return True
+    
+    async def _check_other_writers(self):
+        """
+        Раз в index_ttl секунд заметить записи других процессов.
+        
+        Свои записи меняют индексы интервалов сразу. Записи других процессов
+        видны не позже чем через index_ttl секунд: тогда индексы интервалов
+        сбрасываются и строятся заново при следующем запросе.
+        """
+        if time.monotonic() - self._index_checked < self.index_ttl:
+            return
+        self._index_checked = time.monotonic()
+        loop = asyncio.get_running_loop()
+        if await loop.run_in_executor(self._writer, self._run, self._refresh_index, (), False):
+            self.intervals.clear()
+    
+    async def _chat_intervals(self, chat_id: int) -> IntervalIndex:
+        """Индекс интервалов обычных событий календаря чата (строится при первом запросе)"""
+        await self._check_other_writers()
+        index = self.intervals.get(chat_id)
+        if index is None:
+            # В потоке писателя: запись, закоммиченная до чтения, в индексе есть,
+            # а после - добавится в него сама
+            loop = asyncio.get_running_loop()
+            index = await loop.run_in_executor(self._writer, self._run, _load_intervals, (chat_id,), False)
+            self.intervals.set(chat_id, index, tags=(chat_id,))
+        return index
+    
+    def _update_intervals(self, chat_id: int, event_id: int, event_date: int, duration: int, added: bool):
+        """Изменить построенный индекс интервалов чата после своей записи"""
+        index = self.intervals.get(chat_id)
+        if index is None:
+            return
+        if added:
+            index.add(event_id, event_date, duration)
+        else:
+            index.remove(event_id, event_date, duration)
+    
+    async def add_event(
+        self,
+        title: str,
+        description: str,
+        event_date: Union[datetime, str, int],
+        user_id: int,
+        reminder_offsets: Sequence[int] = DEFAULT_REMINDER_OFFSETS,
+        rrule: Optional[str] = None,
+        tz: Optional[str] = None,
+        chat_id: Optional[int] = None,
+        duration: int = 0,
+    ) -> int:
+        """
+        Добавить событие (или серию с правилом rrule) вместе с его напоминаниями.
+        
+        tz - пояс создателя: по нему серия повторяется в то же время на часах
+        (None - местное время сервера). chat_id - чат, в календарь которого
+        попадает событие (None - личный чат создателя). duration - длительность
+        в секундах (0 - событие без длительности).
+        """
+        timestamp = to_timestamp(event_date)
+        rule = None if rrule is None else parse_rule(rrule)
+        created_at = int(time.time())
+        chat_id = user_id if chat_id is None else chat_id
+        
+        def query(conn: sqlite3.Connection) -> int:
+            cursor = conn.execute("""
+                INSERT INTO events (title, description, event_date, created_by, created_at, rrule, until, tz, chat_id, duration)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                title, description, timestamp, user_id, created_at,
+                None if rule is None else format_rule(rule),
+                None if rule is None else last_occurrence(timestamp, rule, get_zone(tz)),
+                tz, chat_id, duration,
+            ))
+            if rule is None:
+                _insert_reminders(conn, cursor.lastrowid, timestamp, reminder_offsets, user_id)
+            else:
+                _insert_series_reminders(conn, cursor.lastrowid, timestamp, format_rule(rule), reminder_offsets, user_id, tz)
             return cursor.lastrowid
+        
+        event_id = await self._write_batched(query)
+        if rule is None:
+            self._update_intervals(chat_id, event_id, timestamp, duration, added=True)
+            self.cache.invalidate(EVENTS_TAG, ("chat", chat_id), ("user", user_id))
+        else:
+            self.cache.invalidate(EVENTS_TAG, SERIES_TAG, ("chat", chat_id), ("user", user_id))
+        return event_id
     
-    def get_events(self, limit: int = 10) -> List[Tuple]:
-        """Получить список событий"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
+    async def get_events(self, limit: int = 10, chat_id: Optional[int] = None) -> List[Tuple]:
+        """Получить ближайшие события и повторения серий (из кэша; список не изменять)"""
+        return (await self.get_events_page(limit=limit, chat_id=chat_id)).rows
+    
+    async def get_events_page(
+        self,
+        user_id: Optional[int] = None,
+        after: Optional[Cursor] = None,
+        before: Optional[Cursor] = None,
+        limit: int = 10,
+        chat_id: Optional[int] = None,
+    ) -> EventPage:
+        """
+        Страница событий по ключу (event_date, id) (из кэша; строки не изменять).
+        
+        Без user_id - предстоящие события вместе с повторениями серий, с
+        user_id - все события пользователя (серия - одной строкой с правилом
+        rrule в последней колонке). chat_id - только предстоящие события
+        календаря чата. after/before - курсор последнего/первого события
+        соседней страницы. Каждая страница - поиск по индексу и чтение
+        limit + 1 строк, сколько бы страниц ни было до нее.
+        """
+        key = ("events_page", user_id, chat_id, after, before, limit)
+        page = self.cache.get(key)
+        if page is not None:
+            return page
+        
+        if user_id is None:
+            columns = "id, title, description, event_date, created_by, created_at"
+            # Серии показываются повторениями, а не строкой с первой датой;
+            # у чата - по индексу (chat_id, event_date)
+            where, params = "rrule IS NULL AND", ()
+            if chat_id is not None:
+                where, params = "chat_id = ? AND rrule IS NULL AND", (chat_id,)
+            # event_date >= now, записанное как нижний курсор: тогда поиск
+            # по индексу начинается сразу с курсора, а не с текущего времени
+            floor = (int(time.time()) - 1, MAX_ROWID)
+        else:
+            columns = "id, title, description, event_date, created_at, rrule"
+            where, params = "created_by = ? AND", (user_id,)
+            floor = (-2 ** 63, 0)
+        
+        def query(conn: sqlite3.Connection) -> List[Tuple]:
+            if before is not None:
+                rows = conn.execute(f"""
+                    SELECT {columns} FROM events
+                    WHERE {where} (event_date, id) < (?, ?) AND (event_date, id) > (?, ?)
+                    ORDER BY event_date DESC, id DESC
+                    LIMIT ?
+                """, (*params, *before, *floor, limit + 1)).fetchall()
+                rows.reverse()
+                return rows
+            
+            return conn.execute(f"""
+                SELECT {columns} FROM events
+                WHERE {where} (event_date, id) > (?, ?)
+                ORDER BY event_date ASC, id ASC
+                LIMIT ?
+            """, (*params, *max(after or floor, floor), limit + 1)).fetchall()
+        
+        generation = self.cache.generation
+        rows = await self._read(query)
+        if user_id is None:
+            # Повторения нужны только между курсором и крайней строкой страницы
+            if before is not None:
+                lower = (rows[0][3], rows[0][0]) if len(rows) > limit else floor
+                occurrences = await self._series_occurrences(lower, before, limit + 1, backward=True, chat_id=chat_id)
+                rows = _merge(occurrences, rows)[-(limit + 1):]
+            else:
+                upper = (rows[-1][3], rows[-1][0]) if len(rows) > limit else (MAX_ROWID, MAX_ROWID)
+                occurrences = await self._series_occurrences(max(after or floor, floor), upper, limit + 1, chat_id=chat_id)
+                rows = _merge(rows, occurrences)[:limit + 1]
+        
+        if before is not None:
+            page = EventPage(rows[-limit:], len(rows) > limit, True)
+        else:
+            page = EventPage(rows[:limit], after is not None, len(rows) > limit)
+        
+        if user_id is None:
+            # Страница предстоящих событий меняется, когда первое событие уходит
+            # в прошлое. Страницу чата сбрасывают только записи в его календарь
+            expires_at = page.rows[0][3] + 1 if page.rows else None
+            tags = (EVENTS_TAG,) if chat_id is None else (("chat", chat_id),)
+            self.cache.set(key, page, tags=tags, expires_at=expires_at, generation=generation)
+        else:
+            self.cache.set(key, page, tags=(("user", user_id),), generation=generation)
+        return page
+    
+    async def _series_occurrences(
+        self,
+        lower: Cursor,
+        upper: Cursor,
+        limit: int,
+        backward: bool = False,
+        chat_id: Optional[int] = None,
+    ) -> List[Tuple]:
+        """
+        До limit повторений серий (всех или календаря чата) строго между курсорами lower и upper.
+        
+        Окна раскрываются по одному (из кэша), пустые окна перепрыгиваются.
+        backward - брать ближайшие к upper (листание назад), иначе к lower.
+        Возвращает строки по возрастанию (event_date, id).
+        """
+        found: List[Tuple] = []
+        start = _window(upper[0] if backward else lower[0])
+        while start is not None and len(found) < limit:
+            if backward and start + WINDOW <= lower[0] or not backward and start > upper[0]:
+                break
+            expansion = await self._expansion(start, chat_id)
+            first = bisect_right(expansion.keys, lower)
+            last = bisect_left(expansion.keys, upper)
+            if backward:
+                found[:0] = expansion.rows[max(first, last - (limit - len(found))):last]
+                # Пустое окно - признак редких серий: ищем предыдущее непустое
+                start = start - WINDOW if expansion.rows else await self._read(_previous_window, start, chat_id)
+            else:
+                found.extend(expansion.rows[first:min(last, first + limit - len(found))])
+                start = expansion.next_start
+        return found
+    
+    async def _expansion(self, start: int, chat_id: Optional[int] = None) -> Expansion:
+        """Повторения серий (всех или календаря чата) в окне, начинающемся в start (из кэша)"""
+        key = ("series_window", chat_id, start)
+        expansion = self.cache.get(key)
+        if expansion is not None:
+            return expansion
+        generation = self.cache.generation
+        expansion = await self._read(_expand_series, start, start + WINDOW, chat_id)
+        # Окна чата сбрасываются только изменениями серий этого чата
+        tags = (SERIES_TAG,) if chat_id is None else (("chat", chat_id),)
+        self.cache.set(key, expansion, tags=tags, generation=generation, ttl=self.series_ttl)
+        return expansion
+    
+    async def search_events(
+        self,
+        text: str,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        limit: int = 10,
+        offset: int = 0,
+        chat_id: Optional[int] = None,
+    ) -> EventPage:
+        """
+        Найти события по словам text (из кэша; строки не изменять).
+        
+        Каждое слово ищется как префикс ("встр" находит "встреча"), событие
+        должно содержать все слова. start/end ограничивают дату события
+        промежутком [start, end); серия подходит, если у нее есть дни в нем.
+        chat_id - искать только в календаре чата.
+        Результаты идут по релевантности (bm25, название важнее описания)
+        страницами по offset: ранжирование и так перебирает все совпадения,
+        курсор по ключу здесь ничего бы не сэкономил. Строки: id, title,
+        description, event_date, created_by, rrule.
+        """
+        terms = search_terms(text)
+        if not terms:
+            return EventPage([], False, False)
+        key = ("search", tuple(terms), start, end, limit, offset, chat_id)
+        page = self.cache.get(key)
+        if page is not None:
+            return page
+        
+        low = -2 ** 63 if start is None else start
+        high = MAX_ROWID if end is None else end
+        chat_filter, chat_params = _chat_filter(chat_id, "e.chat_id")
+        
+        def query(conn: sqlite3.Connection) -> List[Tuple]:
+            if not self.full_text:
+                return _search_like(conn, terms, low, high, limit + 1, offset, chat_id)
+            match = " ".join(f'"{term}"*' for term in terms)
+            if start is None and end is None and chat_id is None:
+                # Без фильтра FTS5 сам выбирает лучшие limit строк, не сортируя все совпадения
+                return conn.execute("""
+                    SELECT e.id, e.title, e.description, e.event_date, e.created_by, e.rrule
+                    FROM (
+                        SELECT rowid, rank FROM events_fts WHERE events_fts MATCH ? ORDER BY rank LIMIT ? OFFSET ?
+                    ) AS m
+                    JOIN events e ON e.id = m.rowid
+                    ORDER BY m.rank
+                """, (match, limit + 1, offset)).fetchall()
+            return conn.execute(f"""
+                SELECT e.id, e.title, e.description, e.event_date, e.created_by, e.rrule
+                FROM events_fts m
+                JOIN events e ON e.id = m.rowid
+                WHERE events_fts MATCH ? {chat_filter}
+                  AND e.event_date < ?
+                  AND CASE WHEN e.rrule IS NULL THEN e.event_date ELSE COALESCE(e.until, ?) END >= ?
+                ORDER BY m.rank
+                LIMIT ? OFFSET ?
+            """, (match, *chat_params, high, MAX_ROWID, low, limit + 1, offset)).fetchall()
+        
+        generation = self.cache.generation
+        rows = await self._read(query)
+        page = EventPage(rows[:limit], offset > 0, len(rows) > limit)
+        tags = (EVENTS_TAG,) if chat_id is None else (("chat", chat_id),)
+        self.cache.set(key, page, tags=tags, generation=generation)
+        return page
+    
+    async def get_day_counts(self, chat_id: int, bounds: Sequence[int]) -> List[int]:
+        """
+        Число событий календаря чата по дням (из кэша).
+        
+        bounds - начала дней по возрастанию и конец последнего дня (местные
+        полуночи пояса), в ответе len(bounds) - 1 чисел. Обычные события
+        считаются по счетчикам за сутки UTC (event_days), а край местных суток
+        внутри суток UTC - по 15-минутным корзинам (event_buckets) с ближней
+        к полуночи UTC стороны: чтение - строка на день и не больше 48 корзин
+        на границу, сколько бы событий ни было в календаре. Повторения серий
+        раскрываются в окне.
+        """
+        bounds = tuple(bounds)
+        key = ("day_counts", chat_id, bounds)
+        counts = self.cache.get(key)
+        if counts is not None:
+            return counts
+        
+        def query(conn: sqlite3.Connection) -> List[int]:
+            first_day = bounds[0] // DAY
+            per_day = [0] * (bounds[-1] // DAY - first_day + 1)
+            for day, events in conn.execute("""
+                SELECT day, events FROM event_days WHERE chat_id = ? AND day >= ? AND day < ?
+            """, (chat_id, first_day, first_day + len(per_day))):
+                per_day[day - first_day] = events
+            before = [0]
+            for events in per_day:
+                before.append(before[-1] + events)
+            
+            def prefix(moment: int) -> int:
+                """Событий от начала первых суток до moment"""
+                day, offset = divmod(moment, DAY)
+                if not offset:
+                    return before[day - first_day]
+                # Границы кратны корзине; до полуночи UTC ближе сверху или снизу
+                low, high = moment // BUCKET, (day + 1) * DAY // BUCKET
+                if offset <= DAY // 2:
+                    low, high = day * DAY // BUCKET, moment // BUCKET
+                edge = conn.execute("""
+                    SELECT COALESCE(SUM(events), 0) FROM event_buckets WHERE chat_id = ? AND slot >= ? AND slot < ?
+                """, (chat_id, low, high)).fetchone()[0]
+                if offset <= DAY // 2:
+                    return before[day - first_day] + edge
+                return before[day - first_day + 1] - edge
+            
+            starts = [prefix(moment) for moment in bounds]
+            counts = [following - current for current, following in zip(starts, starts[1:])]
+            for row in _expand_series(conn, bounds[0], bounds[-1], chat_id).rows:
+                counts[bisect_right(bounds, row[3]) - 1] += 1
+            return counts
+        
+        generation = self.cache.generation
+        counts = await self._read(query)
+        # Прошедшие события в счетчиках остаются: сбрасывают их только записи в календарь чата
+        self.cache.set(key, counts, tags=(("chat", chat_id),), generation=generation, ttl=self.series_ttl)
+        return counts
+    
+    async def get_day_events(self, chat_id: int, start: int, end: int, limit: int = 10) -> List[Tuple]:
+        """
+        Первые limit событий календаря чата в промежутке [start, end) вместе с
+        повторениями серий, по дате (из кэша; строки не изменять). Строки -
+        как у /events: id, title, description, event_date, created_by, created_at.
+        """
+        key = ("day_events", chat_id, start, end, limit)
+        rows = self.cache.get(key)
+        if rows is not None:
+            return rows
+        
+        def query(conn: sqlite3.Connection) -> List[Tuple]:
+            rows = conn.execute("""
                 SELECT id, title, description, event_date, created_by, created_at
                 FROM events
-                WHERE event_date >= date('now')
-                ORDER BY event_date ASC
+                WHERE chat_id = ? AND rrule IS NULL AND event_date >= ? AND event_date < ?
+                ORDER BY event_date ASC, id ASC
                 LIMIT ?
-            """, (limit,))
-            return cursor.fetchall()
+            """, (chat_id, start, end, limit)).fetchall()
+            return _merge(rows, _expand_series(conn, start, end, chat_id).rows)[:limit]
+        
+        generation = self.cache.generation
+        rows = await self._read(query)
+        self.cache.set(key, rows, tags=(("chat", chat_id),), generation=generation)
+        return rows
+    
+    async def find_overlapping(self, chat_id: int, start: int, end: int) -> List[Tuple]:
+        """
+        События календаря чата, пересекающие [start, end), вместе с
+        повторениями серий: (id, title, event_date, duration) по возрастанию.
+        
+        Обычные события находятся по индексу интервалов чата в памяти; из
+        базы читаются только их названия и серии чата.
+        """
+        found = (await self._chat_intervals(chat_id)).overlapping(start, end)
+        
+        def query(conn: sqlite3.Connection) -> List[Tuple]:
+            titles: Dict[int, str] = {}
+            ids = [row[0] for row in found]
+            for first in range(0, len(ids), 500):
+                chunk = ids[first:first + 500]
+                titles.update(conn.execute(f"""
+                    SELECT id, title FROM events WHERE id IN ({",".join("?" * len(chunk))})
+                """, chunk))
+            # Событие, удаленное другим процессом, уходит из индекса не сразу
+            rows = [
+                (event_id, titles[event_id], event_date, duration)
+                for event_id, event_date, duration in found if event_id in titles
+            ]
+            return sorted(rows + _series_intervals(conn, chat_id, start, end), key=lambda row: (row[2], row[0]))
+        
+        return await self._read(query)
     
-    def get_event_by_id(self, event_id: int) -> Optional[Tuple]:
+    async def find_free_slots(self, chat_id: int, start: int, end: int, length: int) -> List[Tuple[int, int]]:
+        """
+        Свободные промежутки [from, to) календаря чата внутри [start, end)
+        длиной не меньше length секунд (занятое время - обычные события и
+        повторения серий).
+        """
+        index = await self._chat_intervals(chat_id)
+        busy = [(event_date, duration) for _, event_date, duration in index.overlapping(start, end)]
+        series = await self._read(_series_intervals, chat_id, start, end)
+        if series:
+            busy = sorted(busy + [(event_date, duration) for _, _, event_date, duration in series])
+        return free_slots(busy, start, end, length)
+    
+    async def get_event_by_id(self, event_id: int) -> Optional[Tuple]:
         """Получить событие по ID"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
+        def query(conn: sqlite3.Connection) -> Optional[Tuple]:
+            return conn.execute("""
                 SELECT id, title, description, event_date, created_by, created_at
                 FROM events
                 WHERE id = ?
-            """, (event_id,))
-            return cursor.fetchone()
+            """, (event_id,)).fetchone()
+        
+        return await self._read(query)
     
-    def delete_event(self, event_id: int, user_id: int) -> bool:
+    async def delete_event(self, event_id: int, user_id: int) -> bool:
         """Удалить событие (только создатель может удалить)"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                DELETE FROM events
-                WHERE id = ? AND created_by = ?
-            """, (event_id, user_id))
-            conn.commit()
-            return cursor.rowcount > 0
+        def query(conn: sqlite3.Connection) -> Tuple[bool, bool, int, int, int]:
+            row = conn.execute("""
+                SELECT rrule, event_date, chat_id, duration FROM events WHERE id = ? AND created_by = ?
+            """, (event_id, user_id)).fetchone()
+            if row is None:
+                return False, False, 0, 0, 0
+            conn.execute("DELETE FROM events WHERE id = ?", (event_id,))
+            return True, row[0] is not None, row[1], row[2], row[3]
+        
+        deleted, series, event_date, chat_id, duration = await self._write_batched(query)
+        if deleted and not series:
+            self._update_intervals(chat_id, event_id, event_date, duration, added=False)
+        if series:
+            self.cache.invalidate(EVENTS_TAG, SERIES_TAG, ("chat", chat_id), ("user", user_id))
+        elif deleted:
+            self.cache.invalidate(EVENTS_TAG, ("chat", chat_id), ("user", user_id))
+        return deleted
     
-    def get_upcoming_events(self, hours_ahead: int = 24) -> List[Tuple]:
-        """Получить события, которые начнутся в ближайшие часы"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            future_time = (datetime.now() + timedelta(hours=hours_ahead)).isoformat()
-            cursor.execute("""
+    async def get_upcoming_events(self, hours_ahead: int = 24, chat_id: Optional[int] = None) -> List[Tuple]:
+        """Получить события и повторения серий (всех или календаря чата), которые начнутся в ближайшие часы"""
+        chat_filter, chat_params = _chat_filter(chat_id)
+        
+        def query(conn: sqlite3.Connection) -> List[Tuple]:
+            now = int(time.time())
+            end = now + hours_ahead * 3600
+            rows = conn.execute(f"""
                 SELECT id, title, description, event_date, created_by
                 FROM events
-                WHERE event_date BETWEEN datetime('now') AND ?
-                AND notification_sent = FALSE
+                WHERE rrule IS NULL {chat_filter} AND event_date BETWEEN ? AND ?
                 ORDER BY event_date ASC
-            """, (future_time,))
-            return cursor.fetchall()
-    
-    def mark_notification_sent(self, event_id: int):
-        """Отметить, что уведомление о событии отправлено"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                UPDATE events
-                SET notification_sent = TRUE
-                WHERE id = ?
+            """, (*chat_params, now, end)).fetchall()
+            occurrences = _expand_series(conn, now, end + 1, chat_id).rows
+            return _merge(rows, [row[:5] for row in occurrences])
+        
+        return await self._read(query)
+    
+    async def set_reminders(self, event_id: int, user_id: int, offsets: Sequence[int]) -> bool:
+        """Заменить напоминания о событии (только создатель может изменить)"""
+        def query(conn: sqlite3.Connection) -> bool:
+            row = conn.execute("""
+                SELECT event_date, rrule, tz FROM events WHERE id = ? AND created_by = ?
+            """, (event_id, user_id)).fetchone()
+            if row is None:
+                return False
+            event_date, rrule, tz = row
+            if rrule is None:
+                conn.execute("""
+                    DELETE FROM reminders WHERE event_id = ? AND status = 'pending'
+                """, (event_id,))
+                _insert_reminders(conn, event_id, event_date, offsets, user_id)
+            else:
+                # У серии строка напоминания переиспользуется для каждого повторения
+                conn.execute("""
+                    DELETE FROM reminders WHERE event_id = ? AND status != 'claimed'
+                """, (event_id,))
+                _insert_series_reminders(conn, event_id, event_date, rrule, offsets, user_id, tz)
+            return True
+        
+        return await self._write(query)
+    
+    async def set_recurrence(self, event_id: int, user_id: int, rrule: Optional[str]) -> bool:
+        """
+        Сделать событие серией с правилом rrule (None - снова обычным событием).
+        
+        Только создатель может изменить. Напоминания пересоздаются с теми же
+        смещениями для ближайшего повторения; исключенные даты сохраняются,
+        пока событие остается серией.
+        """
+        rule = None if rrule is None else parse_rule(rrule)
+        
+        def query(conn: sqlite3.Connection) -> Optional[Tuple]:
+            row = conn.execute("""
+                SELECT event_date, tz, chat_id, duration FROM events WHERE id = ? AND created_by = ?
+            """, (event_id, user_id)).fetchone()
+            if row is None:
+                return None
+            event_date, tz = row[:2]
+            offsets = [offset for offset, in conn.execute("""
+                SELECT DISTINCT offset FROM reminders WHERE event_id = ? ORDER BY offset DESC
+            """, (event_id,))] or DEFAULT_REMINDER_OFFSETS
+            
+            conn.execute("""
+                UPDATE events SET rrule = ?, until = ? WHERE id = ?
+            """, (
+                None if rule is None else format_rule(rule),
+                None if rule is None else last_occurrence(event_date, rule, get_zone(tz)),
+                event_id,
+            ))
+            conn.execute("""
+                DELETE FROM reminders WHERE event_id = ? AND status != 'claimed'
             """, (event_id,))
-            conn.commit()
-    
-    def get_events_by_user(self, user_id: int) -> List[Tuple]:
-        """Получить события, созданные пользователем"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT id, title, description, event_date, created_at
+            if rule is None:
+                conn.execute("DELETE FROM event_exceptions WHERE event_id = ?", (event_id,))
+                _insert_reminders(conn, event_id, event_date, offsets, user_id)
+            else:
+                _insert_series_reminders(conn, event_id, event_date, format_rule(rule), offsets, user_id, tz)
+            return row
+        
+        row = await self._write(query)
+        updated = row is not None
+        if updated:
+            self._update_intervals(row[2], event_id, row[0], row[3], added=rule is None)
+            self.cache.invalidate(EVENTS_TAG, SERIES_TAG, ("chat", row[2]), ("user", user_id))
+        return updated
+    
+    async def skip_occurrences(self, event_id: int, user_id: int, start: int, end: int) -> Optional[int]:
+        """
+        Исключить повторения серии в промежутке [start, end) (например, за день).
+        
+        Напоминания об исключенных повторениях переходят на следующее.
+        Возвращает число исключенных повторений или None, если серии нет или
+        она чужая.
+        """
+        def query(conn: sqlite3.Connection) -> Tuple[Optional[int], int]:
+            row = conn.execute("""
+                SELECT event_date, rrule, tz, chat_id FROM events WHERE id = ? AND created_by = ? AND rrule IS NOT NULL
+            """, (event_id, user_id)).fetchone()
+            if row is None:
+                return None, 0
+            occurrences = []
+            for occurrence in iter_occurrences(row[0], parse_rule(row[1]), start, zone=get_zone(row[2])):
+                if occurrence >= end:
+                    break
+                occurrences.append((event_id, occurrence))
+            if not occurrences:
+                return 0, row[3]
+            conn.executemany("""
+                INSERT OR IGNORE INTO event_exceptions (event_id, occurrence) VALUES (?, ?)
+            """, occurrences)
+            
+            reminder_ids = [reminder_id for reminder_id, in conn.execute(f"""
+                SELECT id FROM reminders
+                WHERE event_id = ? AND status = 'pending' AND occurrence IN ({",".join("?" * len(occurrences))})
+            """, (event_id, *(occurrence for _, occurrence in occurrences)))]
+            # Напоминание без следующего повторения больше не нужно
+            conn.executemany("""
+                UPDATE reminders SET status = 'missed' WHERE id = ?
+            """, [(reminder_id,) for reminder_id in reminder_ids])
+            _advance_reminders(conn, reminder_ids)
+            return len(occurrences), row[3]
+        
+        skipped, chat_id = await self._write(query)
+        if skipped:
+            self.cache.invalidate(EVENTS_TAG, SERIES_TAG, ("chat", chat_id), ("user", user_id))
+        return skipped
+    
+    async def get_pending_reminders(self, first_event_id: int = 0, last_event_id: int = MAX_ROWID) -> List[Tuple[int, int]]:
+        """Получить (due_at, event_id) ожидающих напоминаний событий с id от first_event_id до last_event_id"""
+        def query(conn: sqlite3.Connection) -> List[Tuple[int, int]]:
+            return conn.execute("""
+                SELECT due_at, event_id
+                FROM reminders
+                WHERE status = 'pending' AND event_id BETWEEN ? AND ?
+            """, (first_event_id, last_event_id)).fetchall()
+        
+        return await self._read(query)
+    
+    async def get_new_reminders(
+        self,
+        after_id: int,
+        shards: Optional[Iterable[int]] = None,
+    ) -> Tuple[int, List[Tuple[int, int]]]:
+        """
+        Ожидающие напоминания с id больше after_id: (наибольший id, [(due_at, event_id)]).
+        
+        Так воркер подхватывает напоминания, созданные другими процессами бота.
+        shards - только напоминания этих шардов (None - всех).
+        """
+        shard_filter = _shard_filter(shards)
+        
+        def query(conn: sqlite3.Connection) -> Tuple[int, List[Tuple[int, int]]]:
+            # NOT INDEXED: с фильтром шардов SQLite выбрал бы idx_reminders_shard и читал
+            # все ожидающие напоминания своих шардов на каждом продлении аренды, а нужен
+            # только хвост таблицы после after_id - поиск по первичному ключу
+            rows = conn.execute(f"""
+                SELECT id, due_at, event_id FROM reminders NOT INDEXED
+                WHERE id > ? AND status = 'pending' {shard_filter}
+                ORDER BY id
+            """, (after_id,)).fetchall()
+            last_id = conn.execute("SELECT MAX(id) FROM reminders").fetchone()[0] or 0
+            return max(after_id, last_id), [(due_at, event_id) for _, due_at, event_id in rows]
+        
+        return await self._read(query)
+    
+    async def release_claimed_reminders(self) -> int:
+        """Вернуть в очередь напоминания, захваченные до перезапуска"""
+        def query(conn: sqlite3.Connection) -> int:
+            return conn.execute("""
+                UPDATE reminders SET status = 'pending' WHERE status = 'claimed'
+            """).rowcount
+        
+        return await self._write(query)
+    
+    async def claim_due_reminders(
+        self,
+        grace: int = 120,
+        limit: int = 1000,
+        lease: Optional[Tuple[str, str]] = None,
+    ) -> List[Tuple]:
+        """
+        Захватить наступившие напоминания одной транзакцией.
+        
+        Напоминания, опоздавшие больше чем на grace секунд, помечаются как
+        missed. Опоздавшие напоминания серий возвращаются вместе с остальными:
+        их нужно отметить через complete_reminders(missed=...), чтобы они
+        перешли на следующее повторение. Возвращает строки (id, event_id,
+        offset, due_at, attempts, title, event_date, created_by, chat_id), где
+        event_date - дата повторения, attempts уже с учетом этой попытки,
+        chat_id - чат, в календаре которого событие.
+        
+        lease = (name, holder): захватывать только напоминания, аренда которых
+        принадлежит holder: аренда name - все шарды, аренды name:shard:N -
+        отдельные шарды. Проверка идет в той же транзакции, поэтому воркер,
+        потерявший аренду, не захватит напоминания ее нового владельца.
+        """
+        def query(conn: sqlite3.Connection) -> List[Tuple]:
+            now = int(time.time())
+            # BEGIN IMMEDIATE сразу берет блокировку записи: выборка и пометка атомарны
+            conn.execute("BEGIN IMMEDIATE")
+            shards = None
+            if lease is not None:
+                shards = _leased_shards(conn, *lease)
+                if shards == []:
+                    return []
+            conn.execute(f"""
+                UPDATE reminders SET status = 'missed'
+                WHERE status = 'pending' AND due_at < ? AND occurrence IS NULL {_shard_filter(shards)}
+            """, (now - grace,))
+            rows = conn.execute(f"""
+                SELECT r.id, r.event_id, r.offset, r.due_at, r.attempts + 1,
+                       e.title, COALESCE(r.occurrence, e.event_date), e.created_by, e.chat_id
+                FROM reminders r
+                JOIN events e ON e.id = r.event_id
+                WHERE r.status = 'pending' AND r.due_at <= ? {_shard_filter(shards, "r.shard")}
+                ORDER BY r.due_at
+                LIMIT ?
+            """, (now, limit)).fetchall()
+            conn.executemany("""
+                UPDATE reminders SET status = 'claimed', attempts = attempts + 1 WHERE id = ?
+            """, [(row[0],) for row in rows])
+            return rows
+        
+        return await self._write(query)
+    
+    async def complete_reminders(
+        self,
+        sent: Sequence[int],
+        failed: Sequence[int] = (),
+        retry: Sequence[Tuple[int, int]] = (),
+        missed: Sequence[int] = (),
+    ) -> List[Tuple[int, int]]:
+        """
+        Отметить результат отправки пачки напоминаний одной транзакцией.
+        
+        Отработавшие напоминания серий переходят на следующее повторение;
+        возвращает их новые (due_at, event_id) для планировщика.
+        """
+        def query(conn: sqlite3.Connection) -> List[Tuple[int, int]]:
+            conn.executemany("""
+                UPDATE reminders SET status = 'sent' WHERE id = ?
+            """, [(reminder_id,) for reminder_id in sent])
+            conn.executemany("""
+                UPDATE reminders SET status = 'failed' WHERE id = ?
+            """, [(reminder_id,) for reminder_id in failed])
+            conn.executemany("""
+                UPDATE reminders SET status = 'pending', due_at = ? WHERE id = ?
+            """, [(due_at, reminder_id) for reminder_id, due_at in retry])
+            conn.executemany("""
+                UPDATE reminders SET status = 'missed' WHERE id = ?
+            """, [(reminder_id,) for reminder_id in missed])
+            return _advance_reminders(conn, [*sent, *failed, *missed])
+        
+        return await self._write_batched(query)
+    
+    async def enqueue_outbox(self, messages: Sequence[Tuple[int, str, Optional[str], str, Optional[int]]]) -> int:
+        """
+        Поставить сообщения в очередь отправки одной транзакцией.
+        
+        messages - строки (chat_id, text, reply_markup в JSON, dedupe, due_at).
+        Сообщение с уже известным (chat_id, dedupe) пропускается: повторная
+        постановка после падения не создает дублей. Возвращает число новых строк.
+        """
+        def query(conn: sqlite3.Connection) -> int:
+            now = time.time()
+            before = conn.total_changes
+            conn.executemany("""
+                INSERT OR IGNORE INTO outbox (chat_id, text, reply_markup, dedupe, due_at, available_at, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, [(*message, now, int(now)) for message in messages])
+            return conn.total_changes - before
+        
+        return await self._write_batched(query)
+    
+    async def lease_outbox(self, holder: str, limit: int = 100, ttl: float = 60.0) -> List[Tuple]:
+        """
+        Арендовать готовые к отправке сообщения на ttl секунд.
+        
+        Готовы ожидающие сообщения, срок повтора которых наступил, и
+        арендованные, чья аренда истекла (их владелец упал посреди отправки).
+        Возвращает строки (id, chat_id, text, reply_markup, attempts, due_at),
+        attempts уже с учетом этой попытки.
+        """
+        def query(conn: sqlite3.Connection) -> List[Tuple]:
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute("""
+                SELECT id, chat_id, text, reply_markup, attempts + 1, due_at
+                FROM outbox
+                WHERE status IN ('pending', 'leased') AND available_at <= ?
+                ORDER BY available_at
+                LIMIT ?
+            """, (now, limit)).fetchall()
+            conn.executemany("""
+                UPDATE outbox SET status = 'leased', holder = ?, attempts = attempts + 1, available_at = ?
+                WHERE id = ?
+            """, [(holder, now + ttl, row[0]) for row in rows])
+            return rows
+        
+        return await self._write(query)
+    
+    async def extend_outbox_lease(self, holder: str, ttl: float) -> int:
+        """Продлить на ttl секунд от текущего момента аренду всех сообщений holder; вернуть их число"""
+        def query(conn: sqlite3.Connection) -> int:
+            return conn.execute("""
+                UPDATE outbox SET available_at = ? WHERE status = 'leased' AND holder = ?
+            """, (time.time() + ttl, holder)).rowcount
+        
+        return await self._write(query)
+    
+    async def complete_outbox(
+        self,
+        sent: Sequence[Tuple[int, Optional[int]]],
+        retry: Sequence[Tuple[int, float]] = (),
+        failed: Sequence[int] = (),
+    ):
+        """Отметить результат отправки: sent - (id, message_id), retry - (id, время повтора)"""
+        def query(conn: sqlite3.Connection):
+            now = int(time.time())
+            conn.executemany("""
+                UPDATE outbox SET status = 'sent', message_id = ?, sent_at = ?, holder = NULL WHERE id = ?
+            """, [(message_id, now, outbox_id) for outbox_id, message_id in sent])
+            conn.executemany("""
+                UPDATE outbox SET status = 'pending', available_at = ?, holder = NULL WHERE id = ?
+            """, [(available_at, outbox_id) for outbox_id, available_at in retry])
+            conn.executemany("""
+                UPDATE outbox SET status = 'failed', holder = NULL WHERE id = ?
+            """, [(outbox_id,) for outbox_id in failed])
+        
+        return await self._write_batched(query)
+    
+    async def release_outbox(self, holder: Optional[str] = None) -> int:
+        """Вернуть в очередь арендованные сообщения holder (без holder - все, после перезапуска)"""
+        def query(conn: sqlite3.Connection) -> int:
+            holder_filter = "" if holder is None else "AND holder = ?"
+            return conn.execute(f"""
+                UPDATE outbox SET status = 'pending', available_at = ?, holder = NULL
+                WHERE status = 'leased' {holder_filter}
+            """, (time.time(), *(() if holder is None else (holder,)))).rowcount
+        
+        return await self._write(query)
+    
+    async def prune_outbox(self, before: int) -> int:
+        """Удалить отправленные и отброшенные сообщения старше before"""
+        def query(conn: sqlite3.Connection) -> int:
+            return conn.execute("""
+                DELETE FROM outbox WHERE status IN ('sent', 'failed') AND created_at < ?
+            """, (before,)).rowcount
+        
+        return await self._write(query)
+    
+    async def subscribe(
+        self,
+        chat_id: int,
+        event_id: Optional[int] = None,
+        user_id: Optional[int] = None,
+    ) -> Optional[bool]:
+        """
+        Подписать чат на событие (или на весь свой календарь, если event_id не задан).
+        
+        Подписаться можно на событие календаря этого чата или на свое событие
+        (user_id - кто подписывает): календари других чатов закрыты. True -
+        подписка оформлена, False - уже была, None - такого события нет или
+        оно чужое.
+        """
+        def query(conn: sqlite3.Connection) -> Optional[bool]:
+            if event_id is None:
+                cursor = conn.execute("""
+                    INSERT OR IGNORE INTO calendar_subscriptions (chat_id, created_at) VALUES (?, ?)
+                """, (chat_id, int(time.time())))
+            else:
+                cursor = conn.execute("""
+                    INSERT OR IGNORE INTO subscriptions (event_id, chat_id)
+                    SELECT id, ? FROM events WHERE id = ? AND (chat_id = ? OR created_by = ?)
+                """, (chat_id, event_id, chat_id, user_id))
+                if cursor.rowcount == 0 and conn.execute("""
+                    SELECT 1 FROM subscriptions WHERE event_id = ? AND chat_id = ?
+                """, (event_id, chat_id)).fetchone() is None:
+                    return None
+            return cursor.rowcount > 0
+        
+        return await self._write(query)
+    
+    async def unsubscribe(self, chat_id: int, event_id: Optional[int] = None) -> bool:
+        """Отписать чат от события (или от всего своего календаря)"""
+        def query(conn: sqlite3.Connection) -> bool:
+            if event_id is None:
+                cursor = conn.execute("""
+                    DELETE FROM calendar_subscriptions WHERE chat_id = ?
+                """, (chat_id,))
+            else:
+                cursor = conn.execute("""
+                    DELETE FROM subscriptions WHERE event_id = ? AND chat_id = ?
+                """, (event_id, chat_id))
+            return cursor.rowcount > 0
+        
+        return await self._write(query)
+    
+    async def set_time_zone(self, owner_id: int, zone: Optional[str]):
+        """Задать пояс пользователя или чата (None - снова время сервера)"""
+        def query(conn: sqlite3.Connection):
+            if zone is None:
+                conn.execute("DELETE FROM time_zones WHERE owner_id = ?", (owner_id,))
+            else:
+                conn.execute("""
+                    INSERT INTO time_zones (owner_id, zone) VALUES (?, ?)
+                    ON CONFLICT(owner_id) DO UPDATE SET zone = excluded.zone
+                """, (owner_id, zone))
+        
+        await self._write(query)
+        self.cache.invalidate(("zone", owner_id))
+    
+    async def get_time_zone(self, chat_id: int, user_id: int) -> Optional[str]:
+        """Пояс для ответа в чате: пояс чата, иначе пользователя, иначе None (из кэша)"""
+        key = ("time_zone", chat_id, user_id)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached[0]
+        
+        def query(conn: sqlite3.Connection) -> Optional[str]:
+            row = conn.execute("""
+                SELECT zone FROM time_zones WHERE owner_id IN (?, ?)
+                ORDER BY owner_id != ?
+                LIMIT 1
+            """, (chat_id, user_id, chat_id)).fetchone()
+            return None if row is None else row[0]
+        
+        generation = self.cache.generation
+        zone = await self._read(query)
+        # Кортеж: None в кэше означает промах
+        self.cache.set(key, (zone,), tags=(("zone", chat_id), ("zone", user_id)), generation=generation)
+        return zone
+    
+    async def get_time_zones(self, owner_ids: Sequence[int]) -> Dict[int, str]:
+        """Пояса чатов получателей одной пачкой (чатов без пояса в ответе нет)"""
+        def query(conn: sqlite3.Connection) -> Dict[int, str]:
+            zones = {}
+            for start in range(0, len(owner_ids), 500):
+                chunk = owner_ids[start:start + 500]
+                zones.update(conn.execute(f"""
+                    SELECT owner_id, zone FROM time_zones WHERE owner_id IN ({",".join("?" * len(chunk))})
+                """, chunk).fetchall())
+            return zones
+        
+        return await self._read(query) if owner_ids else {}
+    
+    async def get_calendar_subscribers(self, chat_ids: Sequence[int]) -> List[int]:
+        """Те из чатов chat_ids, что подписаны на весь свой календарь (по возрастанию chat_id)"""
+        def query(conn: sqlite3.Connection) -> List[int]:
+            subscribers = []
+            for start in range(0, len(chat_ids), 500):
+                chunk = chat_ids[start:start + 500]
+                subscribers.extend(row[0] for row in conn.execute(f"""
+                    SELECT chat_id FROM calendar_subscriptions WHERE chat_id IN ({",".join("?" * len(chunk))})
+                """, chunk))
+            return sorted(subscribers)
+        
+        return await self._read(query) if chat_ids else []
+    
+    async def get_event_recipients(self, event_id: int, after: Optional[int] = None, limit: int = 1000) -> List[int]:
+        """
+        Страница получателей напоминаний о событии: создатель и подписчики.
+        
+        Чат события исключен, если он подписан на весь свой календарь: он
+        получает напоминание вместе с остальными событиями календаря одним
+        сообщением.
+        """
+        def query(conn: sqlite3.Connection) -> List[int]:
+            rows = conn.execute("""
+                SELECT chat_id FROM (
+                    SELECT created_by AS chat_id FROM events WHERE id = :event_id
+                    UNION
+                    SELECT chat_id FROM subscriptions WHERE event_id = :event_id
+                )
+                WHERE chat_id > :after
+                AND chat_id NOT IN (
+                    SELECT c.chat_id FROM calendar_subscriptions c
+                    JOIN events e ON e.chat_id = c.chat_id
+                    WHERE e.id = :event_id
+                )
+                ORDER BY chat_id
+                LIMIT :limit
+            """, {
+                "event_id": event_id,
+                "after": -2 ** 63 if after is None else after,
+                "limit": limit,
+            }).fetchall()
+            return [row[0] for row in rows]
+        
+        return await self._read(query)
+    
+    async def set_digest(self, chat_id: int, kind: str, minute: int = 0) -> int:
+        """Включить сводку kind (daily в minute минут местного времени) для чата; вернуть срок ближайшей"""
+        def query(conn: sqlite3.Connection) -> int:
+            row = conn.execute("SELECT zone FROM time_zones WHERE owner_id = ?", (chat_id,)).fetchone()
+            next_at = next_digest_at(kind, minute, int(time.time()), get_zone(row[0] if row else None))
+            conn.execute("""
+                INSERT INTO digests (chat_id, kind, minute, next_at, shard) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(chat_id, kind) DO UPDATE SET minute = excluded.minute, next_at = excluded.next_at
+            """, (chat_id, kind, minute, next_at, shard_of(chat_id)))
+            return next_at
+        
+        return await self._write(query)
+    
+    async def remove_digests(self, chat_id: int) -> bool:
+        """Выключить сводки чата: напоминания снова приходят по одному"""
+        def query(conn: sqlite3.Connection) -> bool:
+            return conn.execute("DELETE FROM digests WHERE chat_id = ?", (chat_id,)).rowcount > 0
+        
+        return await self._write(query)
+    
+    async def get_digests(self, chat_id: int) -> List[Tuple[str, int, int]]:
+        """Сводки чата: (kind, minute, next_at)"""
+        def query(conn: sqlite3.Connection) -> List[Tuple[str, int, int]]:
+            return conn.execute("""
+                SELECT kind, minute, next_at FROM digests WHERE chat_id = ? ORDER BY kind
+            """, (chat_id,)).fetchall()
+        
+        return await self._read(query)
+    
+    async def get_digest_chats(self, chat_ids: Sequence[int]) -> Set[int]:
+        """Те из чатов chat_ids, что получают сводки вместо отдельных напоминаний"""
+        def query(conn: sqlite3.Connection) -> Set[int]:
+            chats = set()
+            for start in range(0, len(chat_ids), 500):
+                chunk = chat_ids[start:start + 500]
+                chats.update(row[0] for row in conn.execute(f"""
+                    SELECT DISTINCT chat_id FROM digests WHERE chat_id IN ({",".join("?" * len(chunk))})
+                """, chunk))
+            return chats
+        
+        return await self._read(query) if chat_ids else set()
+    
+    async def get_due_digests(self, shards: Optional[Iterable[int]] = None, limit: int = 1000) -> List[Tuple[int, str, int]]:
+        """Наступившие сводки (всех или только шардов shards): (chat_id, kind, next_at)"""
+        def query(conn: sqlite3.Connection) -> List[Tuple[int, str, int]]:
+            return conn.execute(f"""
+                SELECT chat_id, kind, next_at FROM digests
+                WHERE next_at <= ? {_shard_filter(shards)}
+                ORDER BY next_at
+                LIMIT ?
+            """, (int(time.time()), limit)).fetchall()
+        
+        return await self._read(query)
+    
+    async def complete_digests(self, digests: Sequence[Tuple[int, str]]):
+        """Перевести отработавшие сводки (chat_id, kind) на следующий срок по текущему поясу чата"""
+        def query(conn: sqlite3.Connection):
+            now = int(time.time())
+            updates = []
+            for start in range(0, len(digests), 500):
+                chunk = digests[start:start + 500]
+                rows = conn.execute(f"""
+                    SELECT d.chat_id, d.kind, d.minute, z.zone FROM digests d
+                    LEFT JOIN time_zones z ON z.owner_id = d.chat_id
+                    WHERE (d.chat_id, d.kind) IN ({",".join("(?, ?)" for _ in chunk)})
+                """, [value for digest in chunk for value in digest]).fetchall()
+                updates.extend(
+                    (next_digest_at(kind, minute, now, get_zone(zone)), chat_id, kind)
+                    for chat_id, kind, minute, zone in rows
+                )
+            conn.executemany("UPDATE digests SET next_at = ? WHERE chat_id = ? AND kind = ?", updates)
+        
+        return await self._write_batched(query)
+    
+    async def get_next_digest_at(self, shards: Optional[Iterable[int]] = None) -> Optional[int]:
+        """Срок ближайшей сводки (всех или только шардов shards)"""
+        def query(conn: sqlite3.Connection) -> Optional[int]:
+            return conn.execute(f"""
+                SELECT MIN(next_at) FROM digests WHERE 1 {_shard_filter(shards)}
+            """).fetchone()[0]
+        
+        return await self._read(query)
+    
+    async def get_digest_events(self, chat_ids: Sequence[int], start: int, end: int) -> Dict[int, List[Tuple]]:
+        """
+        События окна [start, end) для сводок чатов chat_ids одним проходом.
+        
+        Чат получает те же события, что получал бы в напоминаниях: созданные
+        им, на которые он подписан, и события его календаря, если он подписан
+        на весь календарь. Серии раскрываются один раз на окно, а не для
+        каждого чата. Возвращает {chat_id: [(id, title, event_date), ...]} по
+        возрастанию даты; чатов без событий в ответе нет.
+        """
+        def query(conn: sqlite3.Connection) -> Dict[int, List[Tuple]]:
+            found: Dict[int, Set[Tuple]] = {}
+            for first in range(0, len(chat_ids), 500):
+                chunk = list(chat_ids[first:first + 500])
+                marks = ",".join("?" * len(chunk))
+                window = "e.rrule IS NULL AND e.event_date >= ? AND e.event_date < ?"
+                for chat_id, event_id, title, event_date in conn.execute(f"""
+                    SELECT e.created_by, e.id, e.title, e.event_date FROM events e
+                    WHERE e.created_by IN ({marks}) AND {window}
+                    UNION
+                    SELECT s.chat_id, e.id, e.title, e.event_date FROM subscriptions s
+                    JOIN events e ON e.id = s.event_id
+                    WHERE s.chat_id IN ({marks}) AND {window}
+                    UNION
+                    SELECT c.chat_id, e.id, e.title, e.event_date FROM calendar_subscriptions c
+                    JOIN events e ON e.chat_id = c.chat_id
+                    WHERE c.chat_id IN ({marks}) AND {window}
+                """, (*chunk, start, end) * 3):
+                    found.setdefault(chat_id, set()).add((event_id, title, event_date))
+            
+            occurrences = _expand_series(conn, start, end).rows
+            if occurrences:
+                wanted = set(chat_ids)
+                series = sorted({row[0] for row in occurrences})
+                recipients: Dict[int, Set[int]] = {}
+                for row in occurrences:
+                    recipients.setdefault(row[0], set()).add(row[4])
+                for first in range(0, len(series), 500):
+                    chunk = series[first:first + 500]
+                    marks = ",".join("?" * len(chunk))
+                    for event_id, chat_id in conn.execute(f"""
+                        SELECT event_id, chat_id FROM subscriptions WHERE event_id IN ({marks})
+                        UNION
+                        SELECT e.id, e.chat_id FROM events e
+                        JOIN calendar_subscriptions c ON c.chat_id = e.chat_id
+                        WHERE e.id IN ({marks})
+                    """, chunk * 2):
+                        recipients[event_id].add(chat_id)
+                for event_id, title, _, occurrence, _, _ in occurrences:
+                    for chat_id in recipients[event_id] & wanted:
+                        found.setdefault(chat_id, set()).add((event_id, title, occurrence))
+            
+            return {chat_id: sorted(events, key=lambda event: (event[2], event[0])) for chat_id, events in found.items()}
+        
+        return await self._read(query) if chat_ids else {}
+    
+    async def import_events(
+        self,
+        events: Iterable[Tuple[str, str, int]],
+        user_id: int,
+        batch_size: int = 10_000,
+        reminder_offsets: Sequence[int] = DEFAULT_REMINDER_OFFSETS,
+        chat_id: Optional[int] = None,
+    ) -> ImportResult:
+        """
+        Массовая вставка событий (title, description, event_date) из итератора.
+        
+        Итератор читается пачками по batch_size прямо в потоке писателя: каждая
+        пачка - одна транзакция с executemany, в памяти не больше одной пачки.
+        Между пачками успевают выполниться записи обработчиков. События
+        попадают в календарь чата chat_id (None - личного чата user_id).
+        """
+        now = int(time.time())
+        chat_id = user_id if chat_id is None else chat_id
+        
+        def insert_batch(conn: sqlite3.Connection) -> Tuple[int, int]:
+            rows = [(title, description, event_date, user_id, now) for title, description, event_date in islice(events, batch_size)]
+            if not rows:
+                return 0, 0
+            conn.executemany("""
+                INSERT INTO events (title, description, event_date, created_by, created_at, chat_id)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, [(*row, chat_id) for row in rows])
+            # Единственный писатель и AUTOINCREMENT: id пачки идут подряд
+            last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+            first_id = last_id - len(rows) + 1
+            conn.executemany("""
+                INSERT OR IGNORE INTO reminders (event_id, offset, due_at, shard)
+                SELECT id, ?, event_date - ?, ? FROM events
+                WHERE id BETWEEN ? AND ? AND event_date - ? > ?
+            """, [
+                (offset, offset, shard_of(user_id), first_id, last_id, offset, int(time.time()))
+                for offset in reminder_offsets
+            ])
+            return len(rows), first_id
+        
+        imported, first_event_id = 0, 0
+        try:
+            while True:
+                count, first_id = await self._write(insert_batch)
+                if not count:
+                    break
+                imported += count
+                first_event_id = first_event_id or first_id
+        finally:
+            if imported:
+                # Индекс интервалов чата проще построить заново, чем вливать в него пачки
+                self.intervals.invalidate(chat_id)
+                self.cache.invalidate(EVENTS_TAG, ("chat", chat_id), ("user", user_id))
+        return ImportResult(imported, first_event_id)
+    
+    async def iter_events(
+        self,
+        user_id: Optional[int] = None,
+        batch_size: int = 1000,
+        chat_id: Optional[int] = None,
+    ) -> AsyncIterator[List[Tuple]]:
+        """
+        Все события (или события пользователя, или календаря чата) пачками по id для экспорта.
+        
+        Строки (id, title, description, event_date, created_by, created_at);
+        каждая пачка - отдельный запрос с курсором по id, таблица целиком в
+        память не читается.
+        """
+        def query(conn: sqlite3.Connection, after: int) -> List[Tuple]:
+            return conn.execute("""
+                SELECT id, title, description, event_date, created_by, created_at
                 FROM events
-                WHERE created_by = ?
-                ORDER BY event_date ASC
-            """, (user_id,))
-            return cursor.fetchall()
+                WHERE id > ? AND (? IS NULL OR created_by = ?) AND (? IS NULL OR chat_id = ?)
+                ORDER BY id
+                LIMIT ?
+            """, (after, user_id, user_id, chat_id, chat_id, batch_size)).fetchall()
+        
+        after = 0
+        while True:
+            rows = await self._read(query, after)
+            if not rows:
+                return
+            yield rows
+            after = rows[-1][0]
+    
+    async def acquire_lease(self, name: str, holder: str, ttl: float) -> Optional[int]:
+        """
+        Взять или продлить аренду name на ttl секунд.
+        
+        Аренду получает holder, если она свободна, истекла или уже его.
+        Возвращает token аренды (растет при каждой смене владельца) или None,
+        если аренда у другого процесса.
+        """
+        def query(conn: sqlite3.Connection) -> Optional[int]:
+            now = time.time()
+            conn.execute("""
+                INSERT INTO leases (name, holder, token, expires_at) VALUES (?, ?, 1, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                    token = token + (holder != excluded.holder),
+                    holder = excluded.holder,
+                    expires_at = excluded.expires_at
+                WHERE leases.holder = excluded.holder OR leases.expires_at <= ?
+            """, (name, holder, now + ttl, now))
+            row = conn.execute("SELECT holder, token FROM leases WHERE name = ?", (name,)).fetchone()
+            return row[1] if row[0] == holder else None
+        
+        return await self._write(query)
+    
+    async def release_lease(self, name: str, holder: str) -> bool:
+        """Отдать аренду (и аренды шардов name:...), чтобы другой процесс взял их, не дожидаясь истечения"""
+        def query(conn: sqlite3.Connection) -> bool:
+            return conn.execute("""
+                UPDATE leases SET expires_at = 0 WHERE holder = ? AND (name = ? OR name LIKE ? || ':%')
+            """, (holder, name, name)).rowcount > 0
+        
+        return await self._write(query)
+    
+    async def balance_shards(
+        self,
+        name: str,
+        holder: str,
+        ttl: float,
+        shards: int = REMINDER_SHARDS,
+    ) -> Tuple[List[int], List[int]]:
+        """
+        Продлить участие holder в группе name и перераспределить шарды.
+        
+        Участник держит аренду name:member:holder, каждый шард - аренду
+        name:shard:N. Каждому живому участнику положено не больше
+        ceil(shards / участники) шардов: лишние отдаются (их заберут новые
+        участники при своей балансировке), недостающие берутся из свободных
+        и истекших. Все в одной транзакции, поэтому два участника не получат
+        один шард.
+        
+        Захваченные напоминания шардов, взятых у упавшего участника (аренда
+        истекла, а не отдана), возвращаются в очередь. Возвращает (шарды
+        участника, шарды, взятые у упавших).
+        """
+        def query(conn: sqlite3.Connection) -> Tuple[List[int], List[int]]:
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("""
+                INSERT INTO leases (name, holder, token, expires_at) VALUES (?, ?, 1, ?)
+                ON CONFLICT(name) DO UPDATE SET expires_at = excluded.expires_at
+            """, (f"{name}:member:{holder}", holder, now + ttl))
+            # Истекшие участники больше не нужны: их шарды свободны по своим арендам
+            conn.execute("""
+                DELETE FROM leases WHERE name LIKE ? || ':member:%' AND expires_at <= ?
+            """, (name, now))
+            members = conn.execute("""
+                SELECT COUNT(*) FROM leases WHERE name LIKE ? || ':member:%' AND expires_at > ?
+            """, (name, now)).fetchone()[0]
+            share = -(-shards // members)
+            
+            leases = {
+                int(lease_name.rsplit(":", 1)[1]): (lease_holder, expires_at)
+                for lease_name, lease_holder, expires_at in conn.execute("""
+                    SELECT name, holder, expires_at FROM leases WHERE name LIKE ? || ':shard:%'
+                """, (name,))
+            }
+            owned = sorted(shard for shard, (lease_holder, expires_at) in leases.items()
+                           if lease_holder == holder and expires_at > now)
+            released = owned[share:]
+            owned = owned[:share]
+            taken, recovered = [], []
+            for shard in range(shards):
+                if len(owned) + len(taken) >= share:
+                    break
+                lease_holder, expires_at = leases.get(shard, (None, 0))
+                if expires_at > now or shard in released:
+                    continue
+                taken.append(shard)
+                # Истекшая, а не отданная аренда: владелец упал посреди отправки
+                if expires_at > 0 and lease_holder != holder:
+                    recovered.append(shard)
+            
+            conn.executemany("""
+                UPDATE leases SET expires_at = 0 WHERE name = ? AND holder = ?
+            """, [(f"{name}:shard:{shard}", holder) for shard in released])
+            conn.executemany("""
+                INSERT INTO leases (name, holder, token, expires_at) VALUES (?, ?, 1, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                    token = token + (holder != excluded.holder),
+                    holder = excluded.holder,
+                    expires_at = excluded.expires_at
+            """, [(f"{name}:shard:{shard}", holder, now + ttl) for shard in owned + taken])
+            if recovered:
+                conn.execute(f"""
+                    UPDATE reminders SET status = 'pending' WHERE status = 'claimed' {_shard_filter(recovered)}
+                """)
+            return sorted(owned + taken), recovered
+        
+        return await self._write(query)
+    
+    async def get_fsm_state(self, key: FSMKey) -> Optional[str]:
+        """Состояние FSM для ключа"""
+        def query(conn: sqlite3.Connection) -> Optional[str]:
+            row = conn.execute("""
+                SELECT state FROM fsm_states
+                WHERE bot_id = ? AND chat_id = ? AND user_id = ? AND thread_id = ? AND destiny = ?
+            """, key).fetchone()
+            return row[0] if row else None
+        
+        return await self._read(query)
+    
+    async def get_fsm_data(self, key: FSMKey) -> Dict[str, Any]:
+        """Данные FSM для ключа"""
+        def query(conn: sqlite3.Connection) -> Dict[str, Any]:
+            row = conn.execute("""
+                SELECT data FROM fsm_states
+                WHERE bot_id = ? AND chat_id = ? AND user_id = ? AND thread_id = ? AND destiny = ?
+            """, key).fetchone()
+            return json.loads(row[0]) if row else {}
+        
+        return await self._read(query)
+    
+    async def set_fsm_state(self, key: FSMKey, state: Optional[str]):
+        """Записать состояние FSM (данные не меняются)"""
+        def query(conn: sqlite3.Connection):
+            conn.execute("""
+                INSERT INTO fsm_states (bot_id, chat_id, user_id, thread_id, destiny, state) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(bot_id, chat_id, user_id, thread_id, destiny) DO UPDATE SET state = excluded.state
+            """, (*key, state))
+            _drop_empty_fsm(conn, key)
+        
+        await self._write(query)
+    
+    async def update_fsm_data(self, key: FSMKey, data: Dict[str, Any], replace: bool = False) -> Dict[str, Any]:
+        """
+        Дополнить (или при replace=True заменить) данные FSM; вернуть новые данные.
+        
+        Чтение и запись идут в одной транзакции с блокировкой записи, поэтому
+        одновременные обновления из разных процессов не теряются.
+        """
+        def query(conn: sqlite3.Connection) -> Dict[str, Any]:
+            conn.execute("BEGIN IMMEDIATE")
+            current = {}
+            if not replace:
+                row = conn.execute("""
+                    SELECT data FROM fsm_states
+                    WHERE bot_id = ? AND chat_id = ? AND user_id = ? AND thread_id = ? AND destiny = ?
+                """, key).fetchone()
+                current = json.loads(row[0]) if row else {}
+            current.update(data)
+            conn.execute("""
+                INSERT INTO fsm_states (bot_id, chat_id, user_id, thread_id, destiny, data) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(bot_id, chat_id, user_id, thread_id, destiny) DO UPDATE SET data = excluded.data
+            """, (*key, json.dumps(current, ensure_ascii=False)))
+            _drop_empty_fsm(conn, key)
+            return current
+        
+        return await self._write(query)
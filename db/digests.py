@@ -0,0 +1,41 @@
+"""
+Сводки напоминаний по чатам.
+
+Чат в режиме сводок не получает отдельное напоминание о каждом событии:
+вместо них приходит одно сообщение со всеми его событиями окна. Сводка
+daily приходит раз в сутки в заданное местное время и перечисляет события
+на сутки вперед, hourly - в начале каждого часа, с событиями этого часа.
+Сроки сводок считаются по поясу чата в момент перехода к следующей.
+"""
+
+from datetime import datetime, timedelta, timezone, tzinfo
+from typing import Optional
+
+DAILY = "daily"
+HOURLY = "hourly"
+
+# Длина окна событий сводки, начиная с ее срока
+DIGEST_WINDOWS = {DAILY: 24 * 60 * 60, HOURLY: 60 * 60}
+
+# Сводка, опоздавшая больше чем на столько секунд (бот был остановлен), не отправляется
+DIGEST_GRACE = 15 * 60
+
+
+def next_digest_at(kind: str, minute: int, after: int, zone: Optional[tzinfo]) -> int:
+    """
+    Ближайший срок сводки строго после after.
+
+    minute - местное время сводки daily в минутах от полуночи; hourly
+    приходит в начале каждого местного часа (у поясов со смещением +05:30
+    или -03:30 это не начало часа UTC).
+    """
+    if kind == HOURLY:
+        # Смещение в момент after; zone None - местное время сервера
+        offset = int(datetime.fromtimestamp(after, timezone.utc).astimezone(zone).utcoffset().total_seconds())
+        return ((after + offset) // 3600 + 1) * 3600 - offset
+    local = datetime.fromtimestamp(after, zone)
+    at = local.replace(hour=minute // 60, minute=minute % 60, second=0, microsecond=0)
+    if at.timestamp() <= after:
+        # Сложение у дат с поясом идет по местным часам: переход на летнее время не сдвигает сводку
+        at += timedelta(days=1)
+    return int(at.timestamp())
@@ -0,0 +1,45 @@
+"""
+Хранилище состояний FSM aiogram в SQLite.
+
+В отличие от MemoryStorage состояние диалога лежит в общей базе, поэтому
+несколько процессов бота (реплики за webhook) продолжают диалоги друг
+друга. Данные сериализуются в JSON, как в RedisStorage aiogram.
+"""
+
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from db.database import Database, FSMKey
+
+
+def _key(key: StorageKey) -> FSMKey:
+    return key.bot_id, key.chat_id, key.user_id, key.thread_id or 0, key.destiny
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище поверх Database: запросы идут через ее пул соединений"""
+    
+    def __init__(self, db: Database):
+        self.db = db
+    
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self.db.set_fsm_state(_key(key), state.state if isinstance(state, State) else state)
+    
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self.db.get_fsm_state(_key(key))
+    
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self.db.update_fsm_data(_key(key), data, replace=True)
+    
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return await self.db.get_fsm_data(_key(key))
+    
+    async def update_data(self, key: StorageKey, data: Dict[str, Any]) -> Dict[str, Any]:
+        # Одна транзакция вместо чтения и записи из базового класса
+        return await self.db.update_fsm_data(_key(key), data)
+    
+    async def close(self) -> None:
+        # Базу закрывает владелец (CalendarBot.stop)
+        pass
@@ -0,0 +1,127 @@
+"""
+Индекс интервалов событий календаря чата в памяти.
+
+Событие занимает [event_date, event_date + duration), событие без
+длительности - момент event_date. События разложены по классам
+длительности: в классе c лежат длительности от 2 ** (c - 1) до 2 ** c
+секунд (в классе 0 - моменты), внутри класса - массивы array('q') по
+возрастанию начала. Событие класса c, пересекающее [start, end), начинается
+в (start - 2 ** c, end): поиск - bisect в каждом непустом классе и просмотр
+кандидатов, из которых отбрасываются только закончившиеся до start - а
+это лишь события класса, начавшиеся за 2 ** (c - 1) .. 2 ** c секунд до start.
+Так поиск не зависит ни от размера календаря, ни от одного очень длинного
+события, которое в обычном отсортированном списке пришлось бы учитывать
+при каждом запросе.
+
+Серии в индекс не входят: их повторения раскрываются отдельно. Не
+потокобезопасен: читается и меняется только из цикла событий.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Tuple
+
+
+class _DurationClass:
+    """События одного класса длительности по возрастанию (начало, id)"""
+    
+    __slots__ = ("starts", "ids", "durations")
+    
+    def __init__(self):
+        self.starts = array("q")
+        self.ids = array("q")
+        self.durations = array("q")
+    
+    def find(self, start: int, event_id: int) -> Tuple[int, bool]:
+        """Позиция ключа и признак того, что он уже есть"""
+        low = bisect_left(self.starts, start)
+        high = bisect_right(self.starts, start, low)
+        position = bisect_left(self.ids, event_id, low, high)
+        return position, position < high and self.ids[position] == event_id
+
+
+class IntervalIndex:
+    """
+    Интервалы обычных событий одного календаря.
+
+    Строки - (id, event_date, duration).
+    """
+    
+    def __init__(self, rows: Iterable[Tuple[int, int, int]] = ()):
+        self.classes: Dict[int, _DurationClass] = {}
+        for event_id, start, duration in sorted(rows, key=lambda row: (row[1], row[0])):
+            # После сортировки - добавление в конец массивов своего класса
+            group = self._class(duration)
+            group.starts.append(start)
+            group.ids.append(event_id)
+            group.durations.append(duration)
+    
+    def __len__(self) -> int:
+        return sum(len(group.ids) for group in self.classes.values())
+    
+    def _class(self, duration: int) -> _DurationClass:
+        group = self.classes.get(duration.bit_length())
+        if group is None:
+            group = self.classes[duration.bit_length()] = _DurationClass()
+        return group
+    
+    def add(self, event_id: int, start: int, duration: int):
+        """Добавить событие (повторное добавление того же id ничего не меняет)"""
+        group = self._class(duration)
+        position, found = group.find(start, event_id)
+        if found:
+            return
+        group.starts.insert(position, start)
+        group.ids.insert(position, event_id)
+        group.durations.insert(position, duration)
+    
+    def remove(self, event_id: int, start: int, duration: int) -> bool:
+        """Удалить событие; False, если его нет в индексе"""
+        group = self.classes.get(duration.bit_length())
+        if group is None:
+            return False
+        position, found = group.find(start, event_id)
+        if not found:
+            return False
+        for column in (group.starts, group.ids, group.durations):
+            del column[position]
+        return True
+    
+    def overlapping(self, start: int, end: int) -> List[Tuple[int, int, int]]:
+        """События, пересекающие [start, end), по возрастанию начала: (id, event_date, duration)"""
+        found = []
+        for number, group in self.classes.items():
+            starts, durations = group.starts, group.durations
+            first = bisect_right(starts, start - (1 << number))
+            last = bisect_left(starts, end, first)
+            for position in range(first, last):
+                # Момент внутри промежутка тоже пересекает его
+                if starts[position] + durations[position] > start or starts[position] >= start:
+                    found.append((group.ids[position], starts[position], durations[position]))
+        found.sort(key=lambda row: (row[1], row[0]))
+        return found
+
+
+def overlaps(event_date: int, duration: int, start: int, end: int) -> bool:
+    """Пересекает ли событие промежуток [start, end) (условие то же, что в IntervalIndex)"""
+    return event_date < end and (event_date + duration > start or event_date >= start)
+
+
+def free_slots(busy: Iterable[Tuple[int, int]], start: int, end: int, length: int) -> List[Tuple[int, int]]:
+    """
+    Свободные промежутки [from, to) внутри [start, end) длиной не меньше length.
+
+    busy - занятые промежутки (начало, длительность) по возрастанию начала;
+    момент делит свободное время, но сам его не занимает.
+    """
+    slots = []
+    cursor = start
+    for event_date, duration in busy:
+        if min(event_date, end) - cursor >= length:
+            slots.append((cursor, min(event_date, end)))
+        cursor = max(cursor, event_date + duration)
+        if cursor >= end:
+            return slots
+    if end - cursor >= length:
+        slots.append((cursor, end))
+    return slots
@@ -0,0 +1,240 @@
+"""
+Метрики в текстовом формате Prometheus.
+
+Счетчики, гистограммы и показатели без внешних зависимостей: горячие пути
+(обработчики, запросы к базе, отправка) только увеличивают числа под
+блокировкой, а текст для /metrics и сводка для /stats собираются при
+запросе. Гистограмма хранит счетчики по корзинам, квантили для /stats
+оцениваются по ним так же, как histogram_quantile в Prometheus.
+
+Метрики регистрируются в общем REGISTRY при импорте модулей, которые их
+пишут; REGISTRY.enabled = False выключает запись (для замера накладных
+расходов).
+"""
+
+import math
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Границы корзин по умолчанию, секунды: от 0.5 мс до 10 с
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[str, ...]
+
+
+class Registry:
+    """Набор метрик процесса"""
+    
+    def __init__(self):
+        self.enabled = True
+        self._metrics: Dict[str, "Metric"] = {}
+    
+    def register(self, metric: "Metric") -> "Metric":
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+    
+    def get(self, name: str) -> Optional["Metric"]:
+        return self._metrics.get(name)
+    
+    def expose(self) -> str:
+        """Все метрики в текстовом формате Prometheus 0.0.4"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+    
+    def reset(self):
+        """Обнулить все метрики (для тестов и бенчмарков)"""
+        for metric in self._metrics.values():
+            metric.reset()
+
+
+REGISTRY = Registry()
+
+
+def _format_labels(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """Общая часть метрик: имя, описание, метки и блокировка"""
+    
+    kind = "untyped"
+    
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), registry: Optional[Registry] = REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.registry = registry or Registry()
+        # Запросы к базе пишут метрики из потоков пула
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+    
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+    
+    def reset(self):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Монотонный счетчик"""
+    
+    kind = "counter"
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Labels, float] = {}
+    
+    def inc(self, *labels: str, amount: float = 1):
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+    
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+    
+    def samples(self) -> Iterator[str]:
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+    
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Gauge(Metric):
+    """Текущее значение; с function значение читается при каждом сборе"""
+    
+    kind = "gauge"
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Labels, float] = {}
+        self._functions: Dict[Labels, Callable[[], float]] = {}
+    
+    def set(self, value: float, *labels: str):
+        self._values[labels] = value
+    
+    def set_function(self, function: Callable[[], float], *labels: str):
+        """Брать значение из function при сборе (например, длину очереди)"""
+        self._functions[labels] = function
+    
+    def value(self, *labels: str) -> float:
+        function = self._functions.get(labels)
+        return function() if function is not None else self._values.get(labels, 0)
+    
+    def samples(self) -> Iterator[str]:
+        for labels in sorted({*self._values, *self._functions}):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(self.value(*labels))}"
+    
+    def reset(self):
+        self._values.clear()
+
+
+class Histogram(Metric):
+    """Распределение значений по корзинам с суммой и количеством"""
+    
+    kind = "histogram"
+    
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(buckets)
+        # labels -> [счетчики корзин (последняя - +Inf), сумма]
+        self._values: Dict[Labels, List[float]] = {}
+    
+    def observe(self, value: float, *labels: str):
+        if not self.registry.enabled:
+            return
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+    
+    def label_values(self) -> List[Labels]:
+        return sorted(self._values)
+    
+    def count(self, *labels: str) -> int:
+        counts = self._values.get(labels)
+        return int(sum(counts[:-1])) if counts else 0
+    
+    def total(self, *labels: str) -> float:
+        counts = self._values.get(labels)
+        return counts[-1] if counts else 0.0
+    
+    def quantile(self, q: float, *labels: str) -> float:
+        """Оценка квантиля q (0..1) линейной интерполяцией внутри корзины"""
+        counts = self._values.get(labels)
+        if not counts:
+            return 0.0
+        counts = counts[:-1]
+        rank = q * sum(counts)
+        seen = 0
+        for index, count in enumerate(counts):
+            if count and seen + count >= rank:
+                if index == len(self.buckets):
+                    # Выше последней границы оценки нет, как и в Prometheus
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+    
+    def samples(self) -> Iterator[str]:
+        for labels, counts in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(counts[-1])}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}"
+    
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+# Метрики, общие для модулей бота
+HANDLER_SECONDS = Histogram(
+    "calendar_handler_seconds", "Время обработки команд и кнопок", ("handler",),
+)
+DB_QUERY_SECONDS = Histogram(
+    "calendar_db_query_seconds", "Время запросов к SQLite по методам Database", ("method",),
+)
+NOTIFIER_TICK_SECONDS = Histogram(
+    "calendar_notifier_tick_seconds", "Длительность одного прохода отправки наступивших напоминаний",
+)
+REMINDER_LATENESS_SECONDS = Histogram(
+    "calendar_reminder_lateness_seconds", "Опоздание напоминания: время отправки минус срок",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0),
+)
+MESSAGES_TOTAL = Counter(
+    "calendar_messages_total", "Исходящие сообщения по результату (sent, failed, retried, rate_limited)", ("result",),
+)
+QUEUE_DEPTH = Gauge(
+    "calendar_queue_depth", "Длина очередей: отправки сообщений (send) и обновлений webhook (webhook)", ("queue",),
+)
@@ -0,0 +1,361 @@
+"""
+Миграции схемы базы данных
+
+Версия схемы хранится в PRAGMA user_version. Каждая миграция - функция,
+получающая соединение; migrate() применяет недостающие по порядку, каждую
+в своей транзакции вместе с обновлением версии.
+"""
+
+import logging
+import sqlite3
+from typing import Callable, List
+
+logger = logging.getLogger(__name__)
+
+
+def _create_events(conn: sqlite3.Connection):
+    """Исходная схема (файлы calendar.db до введения миграций имеют версию 0)"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            description TEXT,
+            event_date TEXT NOT NULL,
+            created_by INTEGER NOT NULL,
+            created_at TEXT NOT NULL,
+            notification_sent BOOLEAN DEFAULT FALSE
+        )
+    """)
+
+
+def _epoch_event_dates(conn: sqlite3.Connection):
+    """Хранение дат как UTC epoch (INTEGER) и индексы под выборки по времени"""
+    conn.execute("""
+        CREATE TABLE events_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            description TEXT,
+            event_date INTEGER NOT NULL,
+            created_by INTEGER NOT NULL,
+            created_at INTEGER NOT NULL,
+            notification_sent INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    # Старые даты записаны isoformat() в локальном времени сервера;
+    # модификатор 'utc' переводит их из локального времени в UTC
+    conn.execute("""
+        INSERT INTO events_new (id, title, description, event_date, created_by, created_at, notification_sent)
+        SELECT id, title, description,
+               CAST(strftime('%s', event_date, 'utc') AS INTEGER),
+               created_by,
+               COALESCE(CAST(strftime('%s', created_at, 'utc') AS INTEGER), 0),
+               COALESCE(notification_sent, 0)
+        FROM events
+        WHERE strftime('%s', event_date, 'utc') IS NOT NULL
+    """)
+    skipped = conn.execute("SELECT COUNT(*) FROM events").fetchone()[0] - conn.execute(
+        "SELECT COUNT(*) FROM events_new"
+    ).fetchone()[0]
+    if skipped:
+        logger.warning(f"Skipped {skipped} events with unparseable event_date during migration")
+    conn.execute("DROP TABLE events")
+    conn.execute("ALTER TABLE events_new RENAME TO events")
+    conn.execute("CREATE INDEX idx_events_date ON events(event_date)")
+    conn.execute("CREATE INDEX idx_events_user_date ON events(created_by, event_date)")
+    conn.execute("CREATE INDEX idx_events_unsent ON events(event_date) WHERE notification_sent = 0")
+
+
+def _reminders_table(conn: sqlite3.Connection):
+    """Отдельная строка на каждое напоминание вместо флага notification_sent"""
+    conn.execute("""
+        CREATE TABLE reminders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_id INTEGER NOT NULL REFERENCES events(id) ON DELETE CASCADE,
+            offset INTEGER NOT NULL,
+            due_at INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            UNIQUE (event_id, offset)
+        )
+    """)
+    # Выборка наступивших напоминаний - диапазон по частичному индексу
+    conn.execute("CREATE INDEX idx_reminders_pending ON reminders(due_at, event_id) WHERE status = 'pending'")
+    # Напоминания за час и за 15 минут для будущих событий без отправленных уведомлений
+    conn.execute("""
+        INSERT INTO reminders (event_id, offset, due_at)
+        SELECT events.id, offsets.value, events.event_date - offsets.value
+        FROM events, (SELECT 3600 AS value UNION ALL SELECT 900) AS offsets
+        WHERE events.notification_sent = 0
+        AND events.event_date > CAST(strftime('%s', 'now') AS INTEGER)
+    """)
+    conn.execute("DROP INDEX idx_events_unsent")
+    conn.execute("ALTER TABLE events DROP COLUMN notification_sent")
+
+
+def _subscriptions(conn: sqlite3.Connection):
+    """Подписки чатов на напоминания: об отдельном событии и обо всем календаре"""
+    conn.execute("""
+        CREATE TABLE subscriptions (
+            event_id INTEGER NOT NULL REFERENCES events(id) ON DELETE CASCADE,
+            chat_id INTEGER NOT NULL,
+            PRIMARY KEY (event_id, chat_id)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX idx_subscriptions_chat ON subscriptions(chat_id)")
+    conn.execute("""
+        CREATE TABLE calendar_subscriptions (
+            chat_id INTEGER PRIMARY KEY,
+            created_at INTEGER NOT NULL
+        )
+    """)
+
+
+def _recurrence(conn: sqlite3.Connection):
+    """Повторяющиеся события: правило серии, исключенные даты и повторение в напоминании"""
+    # rrule - правило повторения (NULL у обычного события), until - время
+    # последнего повторения конечной серии
+    conn.execute("ALTER TABLE events ADD COLUMN rrule TEXT")
+    conn.execute("ALTER TABLE events ADD COLUMN until INTEGER")
+    conn.execute("CREATE INDEX idx_events_series ON events(event_date) WHERE rrule IS NOT NULL")
+    conn.execute("CREATE INDEX idx_events_series_until ON events(until) WHERE rrule IS NOT NULL")
+    conn.execute("""
+        CREATE TABLE event_exceptions (
+            event_id INTEGER NOT NULL REFERENCES events(id) ON DELETE CASCADE,
+            occurrence INTEGER NOT NULL,
+            PRIMARY KEY (event_id, occurrence)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX idx_event_exceptions_occurrence ON event_exceptions(occurrence)")
+    # Повторение серии, к которому относится напоминание (NULL у обычного события)
+    conn.execute("ALTER TABLE reminders ADD COLUMN occurrence INTEGER")
+
+
+def _shared_state(conn: sqlite3.Connection):
+    """Состояние, общее для нескольких процессов бота: FSM и аренды лидерства"""
+    # thread_id = 0 вместо NULL: NULL в первичном ключе не совпадает сам с собой
+    conn.execute("""
+        CREATE TABLE fsm_states (
+            bot_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            thread_id INTEGER NOT NULL,
+            destiny TEXT NOT NULL,
+            state TEXT,
+            data TEXT NOT NULL DEFAULT '{}',
+            PRIMARY KEY (bot_id, chat_id, user_id, thread_id, destiny)
+        ) WITHOUT ROWID
+    """)
+    # token растет при каждой смене владельца и отличает одно лидерство от другого
+    conn.execute("""
+        CREATE TABLE leases (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            token INTEGER NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    """)
+
+
+def _reminder_shards(conn: sqlite3.Connection):
+    """Шард напоминания (создатель события по модулю 64) и индекс для захвата по шардам"""
+    conn.execute("ALTER TABLE reminders ADD COLUMN shard INTEGER NOT NULL DEFAULT 0")
+    # Остаток в SQLite сохраняет знак делимого, а в Python - нет: выравниваем
+    conn.execute("""
+        UPDATE reminders SET shard = (
+            SELECT (created_by % 64 + 64) % 64 FROM events WHERE events.id = reminders.event_id
+        )
+    """)
+    conn.execute("CREATE INDEX idx_reminders_shard ON reminders(shard, due_at) WHERE status = 'pending'")
+
+
+def _time_zones(conn: sqlite3.Connection):
+    """Часовые пояса пользователей и чатов и пояс, по которому повторяется серия"""
+    # owner_id - id пользователя или чата (у личного чата они совпадают)
+    conn.execute("""
+        CREATE TABLE time_zones (
+            owner_id INTEGER PRIMARY KEY,
+            zone TEXT NOT NULL
+        )
+    """)
+    # NULL - местное время сервера
+    conn.execute("ALTER TABLE events ADD COLUMN tz TEXT")
+
+
+def _event_search(conn: sqlite3.Connection):
+    """Полнотекстовый индекс FTS5 по названиям и описаниям событий"""
+    # Индекс без копии текста (content='events'): строки читаются из events по rowid
+    try:
+        conn.execute("""
+            CREATE VIRTUAL TABLE events_fts USING fts5(
+                title, description,
+                content='events', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        """)
+    except sqlite3.OperationalError as e:
+        # SQLite без FTS5: /search работает медленным LIKE
+        logger.warning(f"FTS5 is not available, search falls back to LIKE: {e}")
+        return
+    conn.execute("""
+        CREATE TRIGGER events_fts_insert AFTER INSERT ON events BEGIN
+            INSERT INTO events_fts (rowid, title, description) VALUES (new.id, new.title, new.description);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER events_fts_delete AFTER DELETE ON events BEGIN
+            INSERT INTO events_fts (events_fts, rowid, title, description)
+            VALUES ('delete', old.id, old.title, old.description);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER events_fts_update AFTER UPDATE OF title, description ON events BEGIN
+            INSERT INTO events_fts (events_fts, rowid, title, description)
+            VALUES ('delete', old.id, old.title, old.description);
+            INSERT INTO events_fts (rowid, title, description) VALUES (new.id, new.title, new.description);
+        END
+    """)
+    # Совпадение в названии весит в 10 раз больше, чем в описании
+    conn.execute("INSERT INTO events_fts (events_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')")
+    conn.execute("INSERT INTO events_fts (events_fts) VALUES ('rebuild')")
+
+
+def _chat_calendars(conn: sqlite3.Connection):
+    """Календарь у каждого чата: событие принадлежит чату, в котором его создали"""
+    # До календарей по чатам все события были общими; старые события
+    # достаются личному чату создателя (его id совпадает с id пользователя)
+    conn.execute("ALTER TABLE events ADD COLUMN chat_id INTEGER NOT NULL DEFAULT 0")
+    conn.execute("UPDATE events SET chat_id = created_by")
+    # Страница /events чата и раскрытие его серий - поиск по индексу внутри чата,
+    # сколько бы чатов ни было в базе
+    conn.execute("CREATE INDEX idx_events_chat_date ON events(chat_id, event_date) WHERE rrule IS NULL")
+    conn.execute("CREATE INDEX idx_events_chat_series ON events(chat_id, event_date) WHERE rrule IS NOT NULL")
+
+
+def _outbox(conn: sqlite3.Connection):
+    """Очередь исходящих сообщений: напоминания доставляются из нее, а не сразу после захвата"""
+    # dedupe - ключ сообщения в чате: повторная постановка того же напоминания
+    # (после падения между постановкой и отметкой) не создает второе сообщение.
+    # available_at у арендованной строки - конец аренды
+    conn.execute("""
+        CREATE TABLE outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            reply_markup TEXT,
+            dedupe TEXT NOT NULL,
+            due_at INTEGER,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            available_at REAL NOT NULL,
+            holder TEXT,
+            message_id INTEGER,
+            created_at INTEGER NOT NULL,
+            sent_at INTEGER,
+            UNIQUE (chat_id, dedupe)
+        )
+    """)
+    conn.execute("""
+        CREATE INDEX idx_outbox_ready ON outbox(available_at) WHERE status IN ('pending', 'leased')
+    """)
+
+
+def _digests(conn: sqlite3.Connection):
+    """Сводки напоминаний: чат получает события окна одним сообщением вместо отдельных напоминаний"""
+    # kind - daily или hourly, minute - местное время сводки daily в минутах от полуночи.
+    # Шард - как у напоминаний, по чату: сводки отправляет владелец шарда
+    conn.execute("""
+        CREATE TABLE digests (
+            chat_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            minute INTEGER NOT NULL DEFAULT 0,
+            next_at INTEGER NOT NULL,
+            shard INTEGER NOT NULL,
+            PRIMARY KEY (chat_id, kind)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX idx_digests_due ON digests(next_at)")
+
+
+def _day_buckets(conn: sqlite3.Connection):
+    """Счетчики событий календаря чата по суткам UTC и по 15 минутам для /week и /month"""
+    # event_days - число событий за сутки UTC (event_date / 86400), event_buckets -
+    # за 15 минут (event_date / 900). Смещения всех часовых поясов кратны 15
+    # минутам: местные сутки - целые сутки UTC плюс край из целых корзин, и
+    # вид месяца читает десятки строк, а не события. Считаются только обычные
+    # события: повторения серий раскрываются при чтении
+    for table, column in (("event_days", "day"), ("event_buckets", "slot")):
+        conn.execute(f"""
+            CREATE TABLE {table} (
+                chat_id INTEGER NOT NULL,
+                {column} INTEGER NOT NULL,
+                events INTEGER NOT NULL,
+                PRIMARY KEY (chat_id, {column})
+            ) WITHOUT ROWID
+        """)
+    # Счетчики поддерживают триггеры: их не обойдет ни одна запись в events
+    # (добавление, удаление, импорт, /repeat)
+    increment = decrement = ""
+    for table, column, size in (("event_days", "day", 86400), ("event_buckets", "slot", 900)):
+        increment += f"""
+            INSERT INTO {table} (chat_id, {column}, events) VALUES (new.chat_id, new.event_date / {size}, 1)
+            ON CONFLICT (chat_id, {column}) DO UPDATE SET events = events + 1;
+        """
+        decrement += f"""
+            UPDATE {table} SET events = events - 1 WHERE chat_id = old.chat_id AND {column} = old.event_date / {size};
+            DELETE FROM {table} WHERE chat_id = old.chat_id AND {column} = old.event_date / {size} AND events = 0;
+        """
+    conn.execute(f"CREATE TRIGGER event_buckets_insert AFTER INSERT ON events WHEN new.rrule IS NULL BEGIN {increment} END")
+    conn.execute(f"CREATE TRIGGER event_buckets_delete AFTER DELETE ON events WHEN old.rrule IS NULL BEGIN {decrement} END")
+    conn.execute(f"""
+        CREATE TRIGGER event_buckets_update_old AFTER UPDATE OF event_date, rrule, chat_id ON events
+        WHEN old.rrule IS NULL BEGIN {decrement} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER event_buckets_update_new AFTER UPDATE OF event_date, rrule, chat_id ON events
+        WHEN new.rrule IS NULL BEGIN {increment} END
+    """)
+    for table, size in (("event_days", 86400), ("event_buckets", 900)):
+        conn.execute(f"""
+            INSERT INTO {table}
+            SELECT chat_id, event_date / {size}, COUNT(*) FROM events WHERE rrule IS NULL GROUP BY 1, 2
+        """)
+
+
+def _event_durations(conn: sqlite3.Connection):
+    """Длительность события в секундах (0 - событие без длительности, момент времени)"""
+    conn.execute("ALTER TABLE events ADD COLUMN duration INTEGER NOT NULL DEFAULT 0")
+
+
+MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _create_events,
+    _epoch_event_dates,
+    _reminders_table,
+    _subscriptions,
+    _recurrence,
+    _shared_state,
+    _reminder_shards,
+    _time_zones,
+    _event_search,
+    _chat_calendars,
+    _outbox,
+    _digests,
+    _day_buckets,
+    _event_durations,
+]
+
+
+def migrate(conn: sqlite3.Connection):
+    """Применить недостающие миграции"""
+    while True:
+        with conn:
+            # DDL в sqlite3 не открывает транзакцию сам, начинаем ее явно. Версию
+            # читаем под блокировкой записи: процессы, запущенные одновременно,
+            # применяют каждую миграцию ровно один раз
+            conn.execute("BEGIN IMMEDIATE")
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version >= len(MIGRATIONS):
+                return
+            migration = MIGRATIONS[version]
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {version + 1}")
+        logger.info(f"Applied migration {version + 1}: {migration.__name__}")
@@ -0,0 +1,284 @@
+"""
+Повторяющиеся события: правила в духе RRULE (RFC 5545) и ленивое раскрытие.
+
+Серия хранится одной строкой events с правилом; повторения не записываются
+в базу, а вычисляются генератором только для запрошенного окна времени.
+Поддерживается подмножество RRULE: FREQ=DAILY|WEEKLY|MONTHLY|YEARLY,
+INTERVAL, COUNT, UNTIL и BYDAY (для WEEKLY). Повторения идут по часовому
+поясу серии (zone, по умолчанию - местное время сервера): встреча в 15:00
+остается в 15:00 после перехода на летнее время.
+"""
+
+import calendar
+from datetime import datetime, timedelta, timezone, tzinfo
+from functools import lru_cache
+from typing import AbstractSet, Iterator, List, NamedTuple, Optional, Tuple
+
+FREQUENCIES = ("DAILY", "WEEKLY", "MONTHLY", "YEARLY")
+WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+
+# Сокращения для /repeat
+SHORTCUTS = {"daily": "FREQ=DAILY", "weekly": "FREQ=WEEKLY", "monthly": "FREQ=MONTHLY", "yearly": "FREQ=YEARLY"}
+
+DAY = 86400
+# Сколько периодов подряд может не быть повторения (31 число, 29 февраля)
+MAX_EMPTY_PERIODS = 1000
+
+
+class Rule(NamedTuple):
+    """Разобранное правило повторения"""
+    freq: str
+    interval: int = 1
+    count: Optional[int] = None
+    # Последний допустимый момент (UTC epoch)
+    until: Optional[int] = None
+    # Дни недели для WEEKLY: 0 - понедельник
+    byday: Tuple[int, ...] = ()
+    
+    def span(self) -> int:
+        """Наибольший промежуток между соседними повторениями, секунды"""
+        if self.freq == "DAILY":
+            return self.interval * DAY
+        if self.freq == "WEEKLY":
+            return self.interval * 7 * DAY
+        if self.freq == "MONTHLY":
+            # 31 число бывает не в каждом месяце
+            return self.interval * 62 * DAY
+        # 29 февраля - раз в 4 (изредка в 8) лет
+        return self.interval * 8 * 366 * DAY
+
+
+@lru_cache(maxsize=4096)
+def parse_rule(text: str) -> Rule:
+    """Разобрать RRULE ("FREQ=WEEKLY;BYDAY=MO,WE;COUNT=10") или сокращение daily/weekly/..."""
+    text = SHORTCUTS.get(text.strip().lower(), text.strip())
+    if text.upper().startswith("RRULE:"):
+        text = text[6:]
+    
+    parts = {}
+    for part in text.split(";"):
+        name, sep, value = part.partition("=")
+        if not sep or not value:
+            raise ValueError(f"Неверная часть правила: {part}")
+        parts[name.strip().upper()] = value.strip().upper()
+    
+    freq = parts.pop("FREQ", None)
+    if freq not in FREQUENCIES:
+        raise ValueError(f"Неизвестная частота: {freq}")
+    interval = int(parts.pop("INTERVAL", 1))
+    count = int(parts["COUNT"]) if "COUNT" in parts else None
+    parts.pop("COUNT", None)
+    until = _parse_until(parts.pop("UNTIL")) if "UNTIL" in parts else None
+    byday = ()
+    if "BYDAY" in parts:
+        if freq != "WEEKLY":
+            raise ValueError("BYDAY поддерживается только для FREQ=WEEKLY")
+        byday = tuple(sorted({WEEKDAYS.index(day) for day in parts.pop("BYDAY").split(",")}))
+    if parts:
+        raise ValueError(f"Неподдерживаемые части правила: {', '.join(parts)}")
+    if interval < 1 or count is not None and count < 1:
+        raise ValueError("INTERVAL и COUNT должны быть положительными")
+    return Rule(freq, interval, count, until, byday)
+
+
+def format_rule(rule: Rule) -> str:
+    """Каноническая строка RRULE для хранения в базе"""
+    parts = [f"FREQ={rule.freq}"]
+    if rule.interval != 1:
+        parts.append(f"INTERVAL={rule.interval}")
+    if rule.byday:
+        parts.append("BYDAY=" + ",".join(WEEKDAYS[day] for day in rule.byday))
+    if rule.count is not None:
+        parts.append(f"COUNT={rule.count}")
+    if rule.until is not None:
+        parts.append(f"UNTIL={datetime.fromtimestamp(rule.until, timezone.utc).strftime('%Y%m%dT%H%M%SZ')}")
+    return ";".join(parts)
+
+
+def describe_rule(text: str) -> str:
+    """Правило по-русски для списков: "каждую неделю (пн, ср), 10 раз" """
+    rule = parse_rule(text)
+    every, one, few, many = {
+        "DAILY": ("каждый день", "день", "дня", "дней"),
+        "WEEKLY": ("каждую неделю", "неделю", "недели", "недель"),
+        "MONTHLY": ("каждый месяц", "месяц", "месяца", "месяцев"),
+        "YEARLY": ("каждый год", "год", "года", "лет"),
+    }[rule.freq]
+    if rule.interval == 1:
+        result = every
+    else:
+        result = f"раз в {rule.interval} {_plural(rule.interval, one, few, many)}"
+    if rule.byday:
+        names = ("пн", "вт", "ср", "чт", "пт", "сб", "вс")
+        result += " (" + ", ".join(names[day] for day in rule.byday) + ")"
+    if rule.count is not None:
+        result += f", {rule.count} {_plural(rule.count, 'раз', 'раза', 'раз')}"
+    if rule.until is not None:
+        result += f", до {datetime.fromtimestamp(rule.until).strftime('%d.%m.%Y')}"
+    return result
+
+
+def iter_occurrences(
+    dtstart: int,
+    rule: Rule,
+    start: Optional[int] = None,
+    exdates: AbstractSet[int] = frozenset(),
+    zone: Optional[tzinfo] = None,
+) -> Iterator[int]:
+    """
+    Повторения серии (UTC epoch) не раньше start по возрастанию.
+
+    Генератор сразу переходит к периоду, содержащему start, поэтому
+    стоимость не зависит от того, сколько повторений было до окна.
+    Без COUNT и UNTIL генератор бесконечен.
+    """
+    start = dtstart if start is None else max(start, dtstart)
+    for number, occurrence in _candidates(dtstart, rule, start, zone):
+        if rule.count is not None and number >= rule.count:
+            return
+        if rule.until is not None and occurrence > rule.until:
+            return
+        if occurrence >= start and occurrence not in exdates:
+            yield occurrence
+
+
+def occurrences_between(
+    dtstart: int,
+    rule: Rule,
+    start: int,
+    end: int,
+    exdates: AbstractSet[int] = frozenset(),
+    zone: Optional[tzinfo] = None,
+) -> Tuple[List[int], Optional[int]]:
+    """
+    Повторения в окне [start, end) и оценка снизу первого повторения после окна.
+
+    Ежедневные и еженедельные серии без COUNT проверяются арифметикой по
+    epoch (с запасом на переход на летнее время): окно без повторений
+    отбрасывается без вычислений с датами. Оценка None - повторений больше нет.
+    """
+    if rule.count is None and rule.freq in ("DAILY", "WEEKLY"):
+        period = rule.interval * (7 if rule.freq == "WEEKLY" else 1) * DAY
+        if rule.byday:
+            weekday = datetime.fromtimestamp(dtstart, zone).weekday()
+            firsts = [dtstart + (day - weekday) * DAY + (period if day < weekday else 0) for day in rule.byday]
+        else:
+            firsts = [dtstart]
+        nearest = None
+        for first in firsts:
+            candidate = first + max(0, -(-(start - 3600 - first) // period)) * period
+            nearest = candidate if nearest is None else min(nearest, candidate)
+        if nearest >= end + 3600:
+            return [], nearest - 3600
+    
+    found = []
+    for occurrence in iter_occurrences(dtstart, rule, start, exdates, zone):
+        if occurrence >= end:
+            return found, occurrence
+        found.append(occurrence)
+    return found, None
+
+
+def next_occurrence(
+    dtstart: int,
+    rule: Rule,
+    after: int,
+    exdates: AbstractSet[int] = frozenset(),
+    zone: Optional[tzinfo] = None,
+) -> Optional[int]:
+    """Первое повторение строго позже after"""
+    return next(iter_occurrences(dtstart, rule, after + 1, exdates, zone), None)
+
+
+def last_occurrence(dtstart: int, rule: Rule, zone: Optional[tzinfo] = None) -> Optional[int]:
+    """Последнее повторение конечной серии (None для бесконечной)"""
+    if rule.count is None and rule.until is None:
+        return None
+    if rule.count is not None and rule.until is None and not rule.byday and rule.freq in ("DAILY", "WEEKLY"):
+        days = rule.interval * (7 if rule.freq == "WEEKLY" else 1)
+        return _timestamp(datetime.fromtimestamp(dtstart, zone) + timedelta(days=days * (rule.count - 1)))
+    last = None
+    for last in iter_occurrences(dtstart, rule, zone=zone):
+        pass
+    return last
+
+
+def _parse_until(value: str) -> int:
+    if len(value) == 8:
+        return int((datetime.strptime(value, "%Y%m%d") + timedelta(days=1)).timestamp()) - 1
+    if value.endswith("Z"):
+        return calendar.timegm(datetime.strptime(value[:-1], "%Y%m%dT%H%M%S").timetuple())
+    return int(datetime.strptime(value, "%Y%m%dT%H%M%S").timestamp())
+
+
+def _plural(number: int, one: str, few: str, many: str) -> str:
+    if number % 10 == 1 and number % 100 != 11:
+        return one
+    if 2 <= number % 10 <= 4 and not 12 <= number % 100 <= 14:
+        return few
+    return many
+
+
+def _timestamp(value: datetime) -> int:
+    return int(value.timestamp())
+
+
+def _candidates(dtstart: int, rule: Rule, start: int, zone: Optional[tzinfo] = None) -> Iterator[Tuple[int, int]]:
+    """
+    Пары (номер повторения, время) по возрастанию, начиная с периода до start.
+
+    Номер нужен для COUNT: исключенные даты его не сдвигают (как EXDATE в RFC 5545).
+    Арифметика идет по местному времени zone: timedelta к дате с tzinfo
+    сдвигает время на часах, а смещение от UTC берется уже для результата.
+    """
+    base = datetime.fromtimestamp(dtstart, zone)
+    # Час запаса на переход на летнее время: начинаем не позже нужного периода
+    elapsed = max(0, start - dtstart - 3600)
+    
+    if rule.freq in ("DAILY", "WEEKLY") and not rule.byday:
+        days = rule.interval * (7 if rule.freq == "WEEKLY" else 1)
+        number = elapsed // (days * DAY)
+        while True:
+            yield number, _timestamp(base + timedelta(days=days * number))
+            number += 1
+            
+    elif rule.freq == "WEEKLY":
+        monday = base - timedelta(days=base.weekday())
+        first_week = tuple(day for day in rule.byday if day >= base.weekday())
+        week = elapsed // (rule.interval * 7 * DAY)
+        number = len(first_week) + (week - 1) * len(rule.byday) if week else 0
+        while True:
+            for day in first_week if week == 0 else rule.byday:
+                yield number, _timestamp(monday + timedelta(days=rule.interval * 7 * week + day))
+                number += 1
+            week += 1
+            
+    else:
+        step = rule.interval * (12 if rule.freq == "YEARLY" else 1)
+        target = datetime.fromtimestamp(start, zone)
+        months = (target.year - base.year) * 12 + target.month - base.month
+        period = max(0, months // step - 1)
+        # До 29 числа повторение есть в каждом периоде, иначе считаем пропуски
+        if base.day <= 28:
+            number = period
+        else:
+            number = sum(_add_months(base, k * step) is not None for k in range(period))
+        empty = 0
+        while empty < MAX_EMPTY_PERIODS:
+            occurrence = _add_months(base, period * step)
+            if occurrence is None:
+                empty += 1
+            else:
+                empty = 0
+                yield number, _timestamp(occurrence)
+                number += 1
+            period += 1
+
+
+def _add_months(value: datetime, months: int) -> Optional[datetime]:
+    """Та же дата через months месяцев или None, если такого дня в месяце нет"""
+    year, month = divmod(value.month - 1 + months, 12)
+    year += value.year
+    if value.day > calendar.monthrange(year, month + 1)[1]:
+        return None
+    return value.replace(year=year, month=month + 1)
@@ -0,0 +1,88 @@
+"""
+Часовые пояса пользователей и чатов.
+
+События хранятся в UTC epoch, а пояс нужен только на границах: при разборе
+даты из команды и при выводе. Объекты ZoneInfo создаются один раз на пояс и
+кэшируются, поэтому перевод времени при выводе - один fromtimestamp.
+Пояс None - местное время сервера, как до появления поясов.
+"""
+
+import re
+from datetime import datetime, tzinfo
+from functools import lru_cache
+from typing import Dict, Optional
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError, available_timezones
+except ImportError:  # Python 3.8: пояса не поддерживаются, время считается локальным
+    ZoneInfo = None
+
+# UTC+3, GMT-5, +03:00
+UTC_OFFSET = re.compile(r"(?:utc|gmt)?([+-])(\d{1,2})(?::?00)?")
+
+
+@lru_cache(maxsize=None)
+def get_zone(name: Optional[str]) -> Optional[tzinfo]:
+    """Объект пояса по имени IANA (None - местное время сервера)"""
+    if not name or ZoneInfo is None:
+        return None
+    return ZoneInfo(name)
+
+
+@lru_cache(maxsize=1)
+def _zone_names() -> Dict[str, str]:
+    """Имена поясов без учета регистра -> каноническое имя"""
+    return {name.lower(): name for name in available_timezones()}
+
+
+def normalize_zone(text: str) -> Optional[str]:
+    """
+    Имя пояса из ввода пользователя или None, если пояс неизвестен.
+
+    Принимает имена IANA без учета регистра (europe/moscow) и смещения
+    UTC+3 / -05:00, которые переводятся в Etc/GMT-3 / Etc/GMT+5 (у Etc знак
+    обратный).
+    """
+    if ZoneInfo is None:
+        return None
+    text = text.strip().lower()
+    if text in ("utc", "gmt", "z"):
+        return "UTC"
+    match = UTC_OFFSET.fullmatch(text)
+    if match is not None:
+        hours = int(match.group(2))
+        if hours == 0:
+            return "UTC"
+        if hours > 14:
+            return None
+        return f"Etc/GMT{'-' if match.group(1) == '+' else '+'}{hours}"
+    name = _zone_names().get(text)
+    if name is None:
+        return None
+    try:
+        get_zone(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+    return name
+
+
+def local_now(zone: Optional[tzinfo]) -> datetime:
+    """Текущее время на часах пояса (наивное, как даты из parse_date)"""
+    return datetime.now(zone).replace(tzinfo=None)
+
+
+def localize(value: datetime, zone: Optional[tzinfo]) -> datetime:
+    """Приписать наивной дате из команды пояс пользователя"""
+    if zone is None or value.tzinfo is not None:
+        return value
+    return value.replace(tzinfo=zone)
+
+
+def format_local(timestamp: int, zone: Optional[tzinfo], fmt: str = "%d.%m.%Y %H:%M") -> str:
+    """UTC epoch в текст по времени пояса"""
+    return datetime.fromtimestamp(timestamp, zone).strftime(fmt)
+
+
+def zone_label(name: Optional[str]) -> str:
+    """Название пояса для ответов бота"""
+    return name or "время сервера"
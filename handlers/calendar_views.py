@@ -0,0 +1,151 @@
+"""
+Виды календаря /week и /month: сетка дней с числом событий.
+
+Числа берутся из счетчиков событий по дням (Database.get_day_counts), и вид
+строится за O(дней), сколько бы событий ни было в календаре чата. Дни -
+местные сутки пояса пользователя или чата. Сетка - инлайн-клавиатура: кнопка
+дня открывает его события, стрелки листают недели и месяцы.
+"""
+
+import calendar
+import re
+from datetime import date, datetime, time, timedelta, tzinfo
+from typing import List, Optional, Sequence, Tuple
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from db.database import Database
+from db.timezones import format_local
+
+WEEK = "w"
+MONTH = "m"
+
+WEEKDAYS = ("Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс")
+MONTHS = (
+    "Январь", "Февраль", "Март", "Апрель", "Май", "Июнь",
+    "Июль", "Август", "Сентябрь", "Октябрь", "Ноябрь", "Декабрь",
+)
+
+# Кнопка без действия: пустые клетки сетки и заголовок дней недели
+NOOP = "cal:noop"
+
+MONTH_ARG = re.compile(r"(?:(?P<y>\d{4})-(?P<m>\d{1,2})|(?P<mm>\d{1,2})\.(?P<yy>\d{4}))")
+
+
+def view_start(kind: str, day: date) -> date:
+    """Первый день недели (понедельник) или месяца, в который попадает day"""
+    if kind == WEEK:
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def view_days(kind: str, first: date) -> int:
+    """Число дней в виде, начинающемся с first"""
+    return 7 if kind == WEEK else calendar.monthrange(first.year, first.month)[1]
+
+
+def shift_view(kind: str, first: date, step: int) -> date:
+    """Начало соседнего вида: step недель или месяцев вперед (назад при step < 0)"""
+    if kind == WEEK:
+        return first + timedelta(weeks=step)
+    month = first.month - 1 + step
+    return date(first.year + month // 12, month % 12 + 1, 1)
+
+
+def day_bounds(first: date, days: int, zone: Optional[tzinfo]) -> List[int]:
+    """Местные полуночи дней first .. first + days в UTC epoch (days + 1 границ)"""
+    return [
+        int(datetime.combine(first + timedelta(days=offset), time(), zone).timestamp())
+        for offset in range(days + 1)
+    ]
+
+
+def parse_month(text: str) -> date:
+    """Первый день месяца из аргумента /month: 2024-03 или 03.2024 (ValueError - неверный формат)"""
+    match = MONTH_ARG.fullmatch(text.strip())
+    if match is None:
+        raise ValueError(f"invalid month: {text}")
+    year, month = (match["y"], match["m"]) if match["y"] else (match["yy"], match["mm"])
+    return date(int(year), int(month), 1)
+
+
+def plural_events(count: int) -> str:
+    """'3 события', '5 событий', '21 событие'"""
+    if count % 10 == 1 and count % 100 != 11:
+        return f"{count} событие"
+    if 2 <= count % 10 <= 4 and not 12 <= count % 100 <= 14:
+        return f"{count} события"
+    return f"{count} событий"
+
+
+def format_view(kind: str, first: date, counts: Sequence[int]) -> str:
+    """Текст /week или /month: заголовок и итог; сетка дней - в клавиатуре"""
+    busy = sum(1 for count in counts if count)
+    if kind == WEEK:
+        last = first + timedelta(days=len(counts) - 1)
+        lines = [f"🗓 Неделя {first.strftime('%d.%m')}–{last.strftime('%d.%m.%Y')}", ""]
+        for offset, count in enumerate(counts):
+            day = first + timedelta(days=offset)
+            lines.append(f"{WEEKDAYS[offset]} {day.strftime('%d.%m')} — {plural_events(count) if count else 'нет событий'}")
+    else:
+        lines = [f"🗓 {MONTHS[first.month - 1]} {first.year}", ""]
+        if busy:
+            lines.append(f"📅 {plural_events(sum(counts))}, дней с событиями: {busy}")
+        else:
+            lines.append("📅 Событий нет")
+    if busy:
+        lines += ["", "Нажмите на день, чтобы увидеть его события"]
+    return "\n".join(lines)
+
+
+def view_keyboard(kind: str, first: date, counts: Sequence[int]) -> InlineKeyboardMarkup:
+    """
+    Сетка дней и стрелки листания.
+
+    callback_data дня - "day:<YYYY-MM-DD>", листания - "cal:<w|m>:<YYYY-MM-DD>"
+    с первым днем соседнего вида.
+    """
+    def day_button(offset: int) -> InlineKeyboardButton:
+        day = first + timedelta(days=offset)
+        count = counts[offset]
+        text = f"{day.day}·{count}" if count else str(day.day)
+        return InlineKeyboardButton(text=text, callback_data=f"day:{day.isoformat()}")
+    
+    blank = InlineKeyboardButton(text=" ", callback_data=NOOP)
+    rows = [[InlineKeyboardButton(text=name, callback_data=NOOP) for name in WEEKDAYS]]
+    # Месяц начинается не с понедельника: первая неделя дополняется пустыми клетками
+    cells = [blank] * first.weekday() + [day_button(offset) for offset in range(len(counts))]
+    cells += [blank] * (-len(cells) % 7)
+    rows += [cells[row:row + 7] for row in range(0, len(cells), 7)]
+    
+    previous, following = shift_view(kind, first, -1), shift_view(kind, first, 1)
+    label = "неделя" if kind == WEEK else "месяц"
+    rows.append([
+        InlineKeyboardButton(text=f"⬅️ Пред. {label}", callback_data=f"cal:{kind}:{previous.isoformat()}"),
+        InlineKeyboardButton(text=f"След. {label} ➡️", callback_data=f"cal:{kind}:{following.isoformat()}"),
+    ])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+async def render_view(
+    db: Database,
+    chat_id: int,
+    zone: Optional[tzinfo],
+    kind: str,
+    first: date,
+) -> Tuple[str, InlineKeyboardMarkup]:
+    """Текст и клавиатура вида календаря чата, начинающегося с first"""
+    counts = await db.get_day_counts(chat_id, day_bounds(first, view_days(kind, first), zone))
+    return format_view(kind, first, counts), view_keyboard(kind, first, counts)
+
+
+def format_day(day: date, events: List[Tuple], total: int, zone: Optional[tzinfo] = None) -> str:
+    """События дня (время - по поясу zone); total - сколько их всего за день"""
+    if not total:
+        return f"📅 {day.strftime('%d.%m.%Y')}: событий нет"
+    response = f"📅 {WEEKDAYS[day.weekday()]} {day.strftime('%d.%m.%Y')} — {plural_events(total)}\n\n"
+    for event_id, title, description, event_date, created_by, created_at in events:
+        response += f"🕐 {format_local(event_date, zone, '%H:%M')} 📝 {title} (🆔 {event_id})\n"
+    if total > len(events):
+        response += f"\n…и еще {plural_events(total - len(events))}"
+    return response
@@ -0,0 +1,168 @@
+import logging
+from datetime import date
+from aiogram import Router, F
+from aiogram.fsm.context import FSMContext
+from aiogram.types import CallbackQuery
+
+from db.database import Database
+from db.timezones import get_zone
+from handlers.calendar_views import MONTH, NOOP, WEEK, day_bounds, format_day, render_view
+from handlers.commands import (
+    PAGE_SIZE,
+    format_events,
+    format_search_results,
+    format_user_events,
+    page_keyboard,
+    render_cached,
+    search_keyboard,
+)
+
+logger = logging.getLogger(__name__)
+router = Router()
+
+
+@router.callback_query(F.data.startswith("ev:") | F.data.startswith("my:"))
+async def cb_events_page(callback: CallbackQuery, db: Database):
+    """Листание /events и /myevents кнопками"""
+    try:
+        kind, owner, direction, event_date, event_id = callback.data.split(":")
+        owner = int(owner)
+        cursor = (int(event_date), int(event_id))
+    except ValueError:
+        await callback.answer()
+        return
+    
+    if kind == "my" and callback.from_user.id != owner:
+        await callback.answer("❌ Это список событий другого пользователя", show_alert=True)
+        return
+    
+    try:
+        page = await db.get_events_page(
+            user_id=owner if kind == "my" else None,
+            after=cursor if direction == "next" else None,
+            before=cursor if direction == "prev" else None,
+            limit=PAGE_SIZE,
+            chat_id=callback.message.chat.id if kind == "ev" else None,
+        )
+        
+        if not page.rows:
+            await callback.answer("📅 Больше событий нет")
+            return
+        
+        render = format_user_events if kind == "my" else format_events
+        tz = await db.get_time_zone(callback.message.chat.id, callback.from_user.id)
+        await callback.message.edit_text(
+            render_cached(page.rows, render, tz),
+            reply_markup=page_keyboard(kind, page, owner),
+        )
+        await callback.answer()
+        
+    except Exception as e:
+        logger.error(f"Error paging events: {e}")
+        await callback.answer("❌ Произошла ошибка при получении событий")
+
+
+@router.callback_query(F.data.startswith("sr:"))
+async def cb_search_page(callback: CallbackQuery, state: FSMContext, db: Database):
+    """Листание результатов /search кнопками"""
+    try:
+        _, owner, offset = callback.data.split(":")
+        owner, offset = int(owner), int(offset)
+    except ValueError:
+        await callback.answer()
+        return
+    
+    if callback.from_user.id != owner:
+        await callback.answer("❌ Это поиск другого пользователя", show_alert=True)
+        return
+    
+    try:
+        search = (await state.get_data()).get("search")
+        if search is None:
+            await callback.answer("🔍 Поиск устарел, повторите /search", show_alert=True)
+            return
+        
+        page = await db.search_events(
+            search["text"], search["start"], search["end"], limit=PAGE_SIZE, offset=offset, chat_id=callback.message.chat.id,
+        )
+        if not page.rows:
+            await callback.answer("🔍 Больше ничего не найдено")
+            return
+        
+        tz = await db.get_time_zone(callback.message.chat.id, callback.from_user.id)
+        await callback.message.edit_text(
+            render_cached(page.rows, format_search_results, tz),
+            reply_markup=search_keyboard(page, owner, offset),
+        )
+        await callback.answer()
+        
+    except Exception as e:
+        logger.error(f"Error paging search results: {e}")
+        await callback.answer("❌ Произошла ошибка при поиске событий")
+
+
+@router.callback_query(F.data.startswith("cal:"))
+async def cb_calendar_view(callback: CallbackQuery, db: Database):
+    """Стрелки /week и /month: соседняя неделя или месяц"""
+    if callback.data == NOOP:
+        await callback.answer()
+        return
+    try:
+        _, kind, first = callback.data.split(":")
+        first = date.fromisoformat(first)
+        if kind not in (WEEK, MONTH):
+            raise ValueError(f"unknown view: {kind}")
+    except ValueError:
+        await callback.answer()
+        return
+    
+    try:
+        zone = get_zone(await db.get_time_zone(callback.message.chat.id, callback.from_user.id))
+        text, keyboard = await render_view(db, callback.message.chat.id, zone, kind, first)
+        await callback.message.edit_text(text, reply_markup=keyboard)
+        await callback.answer()
+        
+    except Exception as e:
+        logger.error(f"Error paging calendar view: {e}")
+        await callback.answer("❌ Произошла ошибка при получении событий")
+
+
+@router.callback_query(F.data.startswith("day:"))
+async def cb_calendar_day(callback: CallbackQuery, db: Database):
+    """Кнопка дня в /week и /month: события этого дня"""
+    try:
+        day = date.fromisoformat(callback.data.split(":", 1)[1])
+    except ValueError:
+        await callback.answer()
+        return
+    
+    try:
+        chat_id = callback.message.chat.id
+        zone = get_zone(await db.get_time_zone(chat_id, callback.from_user.id))
+        bounds = day_bounds(day, 1, zone)
+        events = await db.get_day_events(chat_id, bounds[0], bounds[1], limit=PAGE_SIZE)
+        total = (await db.get_day_counts(chat_id, bounds))[0]
+        await callback.message.answer(format_day(day, events, total, zone))
+        await callback.answer()
+        
+    except Exception as e:
+        logger.error(f"Error showing calendar day: {e}")
+        await callback.answer("❌ Произошла ошибка при получении событий")
+
+
+@router.callback_query(F.data == "show_events")
+async def cb_show_events(callback: CallbackQuery, db: Database):
+    """Кнопка "Посмотреть все события" в напоминании"""
+    try:
+        page = await db.get_events_page(limit=PAGE_SIZE, chat_id=callback.message.chat.id)
+        
+        if not page.rows:
+            await callback.message.answer("📅 Нет предстоящих событий")
+        else:
+            tz = await db.get_time_zone(callback.message.chat.id, callback.from_user.id)
+            await callback.message.answer(render_cached(page.rows, format_events, tz), reply_markup=page_keyboard("ev", page))
+        await callback.answer()
+        
+    except Exception as e:
+        logger.error(f"Error showing events: {e}")
+        await callback.answer("❌ Произошла ошибка при получении событий")
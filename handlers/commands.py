@@ -1,16 +1,63 @@
 import logging
-from datetime import datetime, timedelta
-from aiogram import Router, F
-from aiogram.types import Message
+import os
+import tempfile
+from datetime import date, datetime, time, timedelta, tzinfo
+from typing import Callable, FrozenSet, List, Optional, Tuple
+from aiogram import Bot, Router, F
+from aiogram.enums import ChatMemberStatus
+from aiogram.types import FSInputFile, InlineKeyboardButton, InlineKeyboardMarkup, Message
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-from db.database import Database
+from db.cache import TTLCache
+from db.calendar_files import ParseStats, iter_events_file, write_events
+from db.database import Database, EventPage, search_terms, to_timestamp
+from db.digests import DAILY, HOURLY
+from db.metrics import (
+    DB_QUERY_SECONDS,
+    HANDLER_SECONDS,
+    MESSAGES_TOTAL,
+    NOTIFIER_TICK_SECONDS,
+    QUEUE_DEPTH,
+    REMINDER_LATENESS_SECONDS,
+    Histogram,
+)
+from db.recurrence import describe_rule
+from db.timezones import format_local, get_zone, local_now, localize, normalize_zone, zone_label
+from handlers.calendar_views import MONTH, WEEK, parse_month, render_view, view_start
+from handlers.dates import parse_date, parse_date_prefix, parse_duration_prefix
+from handlers.notifications import NotificationService
 
 logger = logging.getLogger(__name__)
 router = Router()
-db = Database()
+
+# Ограничения на напоминания, которые пользователь задает командой /remind
+MAX_REMINDERS = 5
+MAX_REMINDER_OFFSET = 30 * 86400
+
+# Событий на одной странице /events и /myevents
+PAGE_SIZE = 10
+
+# Bot API отдает боту файлы не больше 20 МБ
+MAX_IMPORT_SIZE = 20 * 1024 * 1024
+
+# Сколько пересечений показывает /addevent и свободных промежутков - /free
+MAX_CONFLICTS = 5
+MAX_FREE_SLOTS = 10
+
+# Часть суток, в которой /free ищет свободное время (местные часы)
+FREE_FROM_HOUR = 8
+FREE_TO_HOUR = 22
+
+# Время утренней сводки по умолчанию, минут от полуночи
+DEFAULT_DIGEST_MINUTE = 8 * 60
+
+# Сколько самых долгих (по суммарному времени) методов базы показывает /stats
+STATS_TOP_QUERIES = 5
+
+# Готовые тексты /events и /myevents (см. render_cached)
+rendered_texts = TTLCache(maxsize=1024, ttl=60)
 
 
 class AddEventStates(StatesGroup):
@@ -27,7 +74,19 @@ async def cmd_start(message: Message):
         "/addevent - добавить событие\n"
         "/events - показать ближайшие события\n"
         "/myevents - показать мои события\n"
+        "/week, /month - календарь на неделю и месяц\n"
+        "/search - найти события\n"
+        "/free - свободное время\n"
         "/deleteevent - удалить событие\n"
+        "/remind - настроить напоминания\n"
+        "/repeat - сделать событие повторяющимся\n"
+        "/skip - пропустить повторение\n"
+        "/subscribe - подписаться на напоминания\n"
+        "/unsubscribe - отписаться от напоминаний\n"
+        "/timezone - часовой пояс\n"
+        "/digest - сводки вместо отдельных напоминаний\n"
+        "/import - загрузить события из .ics или .csv\n"
+        "/export - выгрузить события в .ics\n"
         "/help - помощь"
     )
 
@@ -39,95 +98,188 @@ async def cmd_help(message: Message):
 📅 Календарь событий - Справка
 
 🔹 /addevent - добавить новое событие
-   Формат: /addevent [дата] [описание]
+   Формат: /addevent [дата] [длительность] [описание]
    Пример: /addevent 2024-01-15 15:00 Встреча с командой
+   Пример: /addevent завтра 10:00 1h30m Планерка (или до 11:30)
+   Если событие пересекается с другими, бот предупредит
 
-🔹 /events - показать ближайшие события (до 10)
+🔹 /events - показать ближайшие события (по 10, кнопки для листания)
 
 🔹 /myevents - показать мои события
 
+🔹 /week [дата], /month [месяц] - календарь с числом событий по дням
+   Кнопка дня показывает его события, стрелки листают недели и месяцы
+   Пример: /week, /week 15.03, /month 2024-03
+
+🔹 /search [слова] [дата..дата] - найти события по названию и описанию
+   Слова можно сокращать: /search встр найдет «Встреча»
+   Пример: /search отчет 01.02..28.02
+
+🔹 /free [дата] [длительность] - свободные промежутки дня с 8:00 до 22:00
+   Пример: /free завтра 1h, /free 15.03 30m
+
 🔹 /deleteevent [id] - удалить событие по ID
    Пример: /deleteevent 5
 
+🔹 /remind [id] [минуты...] - за сколько минут напомнить о событии
+   Пример: /remind 5 1440 60 10 (за сутки, за час и за 10 минут)
+
+🔹 /repeat [id] [правило] - повторять событие
+   Правило: daily, weekly, monthly, yearly или RRULE, off - отменить
+   Пример: /repeat 5 weekly
+   Пример: /repeat 5 FREQ=WEEKLY;BYDAY=MO,WE;COUNT=10
+
+🔹 /skip [id] [дата] - пропустить повторение события в этот день
+   Пример: /skip 5 2024-01-22
+
+🔹 /timezone [пояс] - часовой пояс для дат (в группе - для всего чата)
+   Пример: /timezone Europe/Moscow, /timezone UTC+3, /timezone off
+
+🔹 /digest [daily ЧЧ:ММ | hourly | off] - сводки вместо отдельных напоминаний
+   daily - утром события на сутки, hourly - каждый час события этого часа
+   Пример: /digest daily 08:00, /digest hourly, /digest off
+
+🔹 /subscribe [id] - получать напоминания о событии
+   Без ID - обо всех событиях календаря этого чата
+
+🔹 /unsubscribe [id] - отписаться от события или от всего календаря
+
+🔹 /import - загрузить события из файла .ics или .csv
+   Отправьте файл с подписью /import или ответьте /import на сообщение с файлом.
+   CSV: колонки title, description, event_date
+
+🔹 /export [my] - выгрузить события этого чата (или все мои) в .ics
+
 🔹 /help - показать эту справку
 
 📝 Форматы даты:
-• YYYY-MM-DD HH:MM (2024-01-15 15:00)
-• YYYY-MM-DD (2024-01-15)
-• today, tomorrow
-• +N days (через N дней)
+• YYYY-MM-DD HH:MM (2024-01-15 15:00), DD.MM.YYYY (15.01.2024), DD.MM
+• today, tomorrow, сегодня, завтра, послезавтра
+• дни недели: monday, next monday 10:00, в пятницу в 18:00
+• +N (через N дней), +2 hours, in 2 hours, через 30 минут
     """
     await message.answer(help_text)
 
 
 @router.message(Command("addevent"))
-async def cmd_addevent(message: Message, state: FSMContext):
+async def cmd_addevent(
+    message: Message,
+    state: FSMContext,
+    db: Database,
+    notifier: Optional[NotificationService] = None,
+):
     """Обработчик команды /addevent"""
     args = message.text.split()[1:]  # Убираем команду
     
     if len(args) < 2:
         await message.answer(
             "❌ Неверный формат команды!\n\n"
-            "Используйте: /addevent [дата] [описание]\n"
-            "Пример: /addevent 2024-01-15 15:00 Встреча с командой"
+            "Используйте: /addevent [дата] [длительность] [описание]\n"
+            "Пример: /addevent 2024-01-15 15:00 1h Встреча с командой"
         )
         return
     
     # Парсим дату и описание
     try:
-        date_str = args[0]
-        description = " ".join(args[1:])
-        
-        # Парсим дату
-        event_date = parse_date(date_str)
+        # Дату пользователь пишет по своему поясу (или поясу чата)
+        tz = await db.get_time_zone(message.chat.id, message.from_user.id)
+        zone = get_zone(tz)
+        # Дата может занимать несколько слов: "2024-01-15 15:00", "завтра в 10:00"
+        event_date, used = parse_date_prefix(args, local_now(zone))
         if not event_date:
             await message.answer("❌ Неверный формат даты!")
             return
+        # Необязательная длительность: 1h30m, 2 часа, до 16:30
+        duration, duration_used = parse_duration_prefix(args[used:], event_date)
+        used += duration_used
+        duration = int(duration.total_seconds()) if duration else 0
+        description = " ".join(args[used:])
+        if not description:
+            await message.answer("❌ Укажите описание события после даты!")
+            return
+        
+        # Дата по поясу пользователя - один раз в UTC epoch: им пользуются база, таймер и пересечения
+        start = to_timestamp(localize(event_date, zone))
         
         # Добавляем событие
-        event_id = db.add_event(
+        event_id = await db.add_event(
             title=description[:50],  # Ограничиваем длину заголовка
             description=description,
-            event_date=event_date.isoformat(),
-            user_id=message.from_user.id
+            event_date=start,
+            user_id=message.from_user.id,
+            tz=tz,
+            chat_id=message.chat.id,
+            duration=duration,
         )
+        if notifier:
+            notifier.schedule_event(event_id, start)
         
-        await message.answer(
-            f"✅ Событие добавлено!\n\n"
-            f"📅 Дата: {event_date.strftime('%d.%m.%Y %H:%M')}\n"
-            f"📝 Описание: {description}\n"
-            f"🆔 ID: {event_id}"
-        )
+        # Событие добавляется в любом случае, пересечения - только предупреждение
+        conflicts = [
+            row for row in await db.find_overlapping(message.chat.id, start, start + max(duration, 1))
+            if row[0] != event_id
+        ]
+        
+        response = f"✅ Событие добавлено!\n\n📅 Дата: {event_date.strftime('%d.%m.%Y %H:%M')}\n"
+        if duration:
+            response += f"⏱ Длительность: {format_duration(duration)}\n"
+        response += f"📝 Описание: {description}\n🆔 ID: {event_id}"
+        if conflicts:
+            response += "\n\n" + format_conflicts(conflicts, zone)
+        await message.answer(response)
         
     except Exception as e:
         logger.error(f"Error adding event: {e}")
         await message.answer("❌ Произошла ошибка при добавлении события")
 
 
+@router.message(Command("free"))
+async def cmd_free(message: Message, db: Database):
+    """Обработчик команды /free: свободное время в календаре чата"""
+    args = message.text.split()[1:]
+    
+    try:
+        tz = await db.get_time_zone(message.chat.id, message.from_user.id)
+        zone = get_zone(tz)
+        now = local_now(zone)
+        # Без даты - сегодня
+        day, used = parse_date_prefix(args, now)
+        length, length_used = parse_duration_prefix(args[used:], day or now)
+        if length is None or used + length_used != len(args):
+            await message.answer(
+                "❌ Неверный формат команды!\n\n"
+                "Используйте: /free [дата] [длительность]\n"
+                "Пример: /free завтра 1h, /free 15.03 30m"
+            )
+            return
+        
+        day, length = (day or now).date(), int(length.total_seconds())
+        # Сегодня свободное время ищется только с текущего момента
+        start = max(now, datetime.combine(day, time(FREE_FROM_HOUR)))
+        end = datetime.combine(day, time(FREE_TO_HOUR))
+        slots = await db.find_free_slots(
+            message.chat.id, to_timestamp(localize(start, zone)), to_timestamp(localize(end, zone)), length,
+        )
+        await message.answer(format_free_slots(day, slots, length, zone))
+        
+    except Exception as e:
+        logger.error(f"Error finding free slots: {e}")
+        await message.answer("❌ Произошла ошибка при поиске свободного времени")
+
+
 @router.message(Command("events"))
-async def cmd_events(message: Message):
+async def cmd_events(message: Message, db: Database):
     """Обработчик команды /events"""
     try:
-        events = db.get_events(limit=10)
+        # У каждого чата свой календарь
+        page = await db.get_events_page(limit=PAGE_SIZE, chat_id=message.chat.id)
         
-        if not events:
+        if not page.rows:
             await message.answer("📅 Нет предстоящих событий")
             return
         
-        response = "📅 Ближайшие события:\n\n"
-        
-        for event in events:
-            event_id, title, description, event_date, created_by, created_at = event
-            event_datetime = datetime.fromisoformat(event_date)
-            
-            response += (
-                f"🆔 {event_id}\n"
-                f"📅 {event_datetime.strftime('%d.%m.%Y %H:%M')}\n"
-                f"📝 {title}\n"
-                f"👤 Создал: {created_by}\n\n"
-            )
-        
-        await message.answer(response)
+        tz = await db.get_time_zone(message.chat.id, message.from_user.id)
+        await message.answer(render_cached(page.rows, format_events, tz), reply_markup=page_keyboard("ev", page))
         
     except Exception as e:
         logger.error(f"Error getting events: {e}")
@@ -135,36 +287,125 @@ async def cmd_events(message: Message):
 
 
 @router.message(Command("myevents"))
-async def cmd_myevents(message: Message):
+async def cmd_myevents(message: Message, db: Database):
     """Обработчик команды /myevents"""
     try:
-        events = db.get_events_by_user(message.from_user.id)
+        user_id = message.from_user.id
+        page = await db.get_events_page(user_id=user_id, limit=PAGE_SIZE)
         
-        if not events:
+        if not page.rows:
             await message.answer("📅 У вас нет созданных событий")
             return
         
-        response = "📅 Ваши события:\n\n"
+        tz = await db.get_time_zone(message.chat.id, user_id)
+        await message.answer(
+            render_cached(page.rows, format_user_events, tz),
+            reply_markup=page_keyboard("my", page, user_id),
+        )
         
-        for event in events:
-            event_id, title, description, event_date, created_at = event
-            event_datetime = datetime.fromisoformat(event_date)
-            
-            response += (
-                f"🆔 {event_id}\n"
-                f"📅 {event_datetime.strftime('%d.%m.%Y %H:%M')}\n"
-                f"📝 {title}\n\n"
+    except Exception as e:
+        logger.error(f"Error getting user events: {e}")
+        await message.answer("❌ Произошла ошибка при получении ваших событий")
+
+
+@router.message(Command("week"))
+async def cmd_week(message: Message, db: Database):
+    """Обработчик команды /week: неделя календаря чата с числом событий по дням"""
+    args = message.text.split(maxsplit=1)[1:]
+    
+    try:
+        tz = await db.get_time_zone(message.chat.id, message.from_user.id)
+        zone = get_zone(tz)
+        day = parse_date(args[0], local_now(zone)) if args else local_now(zone)
+        if day is None:
+            await message.answer(
+                "❌ Неверный формат даты!\n\n"
+                "Используйте: /week или /week [дата], например /week 15.03"
             )
+            return
         
-        await message.answer(response)
+        text, keyboard = await render_view(db, message.chat.id, zone, WEEK, view_start(WEEK, day.date()))
+        await message.answer(text, reply_markup=keyboard)
         
     except Exception as e:
-        logger.error(f"Error getting user events: {e}")
-        await message.answer("❌ Произошла ошибка при получении ваших событий")
+        logger.error(f"Error showing week: {e}")
+        await message.answer("❌ Произошла ошибка при получении событий")
+
+
+@router.message(Command("month"))
+async def cmd_month(message: Message, db: Database):
+    """Обработчик команды /month: месяц календаря чата с числом событий по дням"""
+    args = message.text.split()[1:]
+    
+    try:
+        tz = await db.get_time_zone(message.chat.id, message.from_user.id)
+        zone = get_zone(tz)
+        if len(args) > 1:
+            raise ValueError("too many arguments")
+        first = parse_month(args[0]) if args else view_start(MONTH, local_now(zone).date())
+        
+        text, keyboard = await render_view(db, message.chat.id, zone, MONTH, first)
+        await message.answer(text, reply_markup=keyboard)
+        
+    except ValueError:
+        await message.answer(
+            "❌ Неверный формат месяца!\n\n"
+            "Используйте: /month или /month 2024-03"
+        )
+    except Exception as e:
+        logger.error(f"Error showing month: {e}")
+        await message.answer("❌ Произошла ошибка при получении событий")
+
+
+@router.message(Command("search"))
+async def cmd_search(message: Message, state: FSMContext, db: Database):
+    """Обработчик команды /search"""
+    args = message.text.split()[1:]
+    words = [arg for arg in args if ".." not in arg]
+    ranges = [arg for arg in args if ".." in arg]
+    
+    if not search_terms(" ".join(words)) or len(ranges) > 1:
+        await message.answer(
+            "❌ Неверный формат команды!\n\n"
+            "Используйте: /search [слова] [дата..дата]\n"
+            "Пример: /search встреча\n"
+            "Пример: /search отчет 01.02..28.02"
+        )
+        return
+    
+    try:
+        tz = await db.get_time_zone(message.chat.id, message.from_user.id)
+        start, end = parse_search_range(ranges[0], get_zone(tz)) if ranges else (None, None)
+        
+        page = await db.search_events(" ".join(words), start, end, limit=PAGE_SIZE, chat_id=message.chat.id)
+        if not page.rows:
+            await message.answer("🔍 Ничего не найдено")
+            return
+        
+        # Запрос не помещается в callback_data (64 байта), поэтому кнопки берут его из FSM
+        await state.update_data(search={"text": " ".join(words), "start": start, "end": end})
+        await message.answer(
+            render_cached(page.rows, format_search_results, tz),
+            reply_markup=search_keyboard(page, message.from_user.id, 0),
+        )
+        
+    except ValueError:
+        await message.answer(
+            "❌ Неверный промежуток дат!\n\n"
+            "Используйте: дата..дата, любую сторону можно опустить\n"
+            "Пример: 01.02..28.02, today..+7, ..2024-12-31"
+        )
+    except Exception as e:
+        logger.error(f"Error searching events: {e}")
+        await message.answer("❌ Произошла ошибка при поиске событий")
 
 
 @router.message(Command("deleteevent"))
-async def cmd_deleteevent(message: Message):
+async def cmd_deleteevent(
+    message: Message,
+    db: Database,
+    notifier: Optional[NotificationService] = None,
+):
     """Обработчик команды /deleteevent"""
     args = message.text.split()[1:]
     
@@ -180,15 +421,17 @@ async def cmd_deleteevent(message: Message):
         event_id = int(args[0])
         
         # Проверяем, существует ли событие
-        event = db.get_event_by_id(event_id)
+        event = await db.get_event_by_id(event_id)
         if not event:
             await message.answer("❌ Событие с таким ID не найдено")
             return
         
         # Удаляем событие
-        success = db.delete_event(event_id, message.from_user.id)
+        success = await db.delete_event(event_id, message.from_user.id)
         
         if success:
+            if notifier:
+                notifier.cancel_event(event_id)
             await message.answer(f"✅ Событие {event_id} удалено")
         else:
             await message.answer("❌ Вы можете удалять только свои события")
@@ -200,33 +443,634 @@ async def cmd_deleteevent(message: Message):
         await message.answer("❌ Произошла ошибка при удалении события")
 
 
-def parse_date(date_str: str) -> datetime:
-    """Парсинг даты из различных форматов"""
-    date_str = date_str.lower().strip()
+@router.message(Command("remind"))
+async def cmd_remind(
+    message: Message,
+    db: Database,
+    notifier: Optional[NotificationService] = None,
+):
+    """Обработчик команды /remind"""
+    args = message.text.split()[1:]
+    
+    if len(args) < 2:
+        await message.answer(
+            "❌ Неверный формат команды!\n\n"
+            "Используйте: /remind [id] [минуты...]\n"
+            "Пример: /remind 5 1440 60 10"
+        )
+        return
+    
+    try:
+        event_id = int(args[0])
+        offsets = sorted({int(minutes) * 60 for minutes in args[1:]}, reverse=True)
+        if len(offsets) > MAX_REMINDERS or not all(0 <= offset <= MAX_REMINDER_OFFSET for offset in offsets):
+            await message.answer(
+                f"❌ Можно задать до {MAX_REMINDERS} напоминаний, "
+                f"не раньше чем за {MAX_REMINDER_OFFSET // 86400} дней до события"
+            )
+            return
+        
+        event = await db.get_event_by_id(event_id)
+        if not event:
+            await message.answer("❌ Событие с таким ID не найдено")
+            return
+        
+        if not await db.set_reminders(event_id, message.from_user.id, offsets):
+            await message.answer("❌ Вы можете настраивать напоминания только своих событий")
+            return
+        
+        if notifier:
+            await notifier.reschedule_event(event_id)
+        minutes = ", ".join(str(offset // 60) for offset in offsets)
+        await message.answer(f"✅ Напоминания о событии {event_id}: за {minutes} мин.")
+        
+    except ValueError:
+        await message.answer("❌ ID события и минуты должны быть числами")
+    except Exception as e:
+        logger.error(f"Error setting reminders: {e}")
+        await message.answer("❌ Произошла ошибка при настройке напоминаний")
+
+
+@router.message(Command("repeat"))
+async def cmd_repeat(
+    message: Message,
+    db: Database,
+    notifier: Optional[NotificationService] = None,
+):
+    """Обработчик команды /repeat"""
+    args = message.text.split()[1:]
+    
+    if len(args) != 2:
+        await message.answer(
+            "❌ Неверный формат команды!\n\n"
+            "Используйте: /repeat [id] [daily|weekly|monthly|yearly|RRULE|off]\n"
+            "Пример: /repeat 5 weekly"
+        )
+        return
+    
+    try:
+        event_id = int(args[0])
+        rrule = None if args[1].lower() == "off" else args[1]
+        description = None if rrule is None else describe_rule(rrule)
+    except ValueError as e:
+        await message.answer(f"❌ Неверное правило повторения: {e}")
+        return
+    
+    try:
+        event = await db.get_event_by_id(event_id)
+        if not event:
+            await message.answer("❌ Событие с таким ID не найдено")
+            return
+        
+        if not await db.set_recurrence(event_id, message.from_user.id, rrule):
+            await message.answer("❌ Вы можете настраивать повторение только своих событий")
+            return
+        
+        if notifier:
+            await notifier.reschedule_event(event_id)
+        if description is None:
+            await message.answer(f"✅ Событие {event_id} больше не повторяется")
+        else:
+            await message.answer(f"✅ Событие {event_id} повторяется: {description}")
+            
+    except Exception as e:
+        logger.error(f"Error setting recurrence: {e}")
+        await message.answer("❌ Произошла ошибка при настройке повторения")
+
+
+@router.message(Command("skip"))
+async def cmd_skip(
+    message: Message,
+    db: Database,
+    notifier: Optional[NotificationService] = None,
+):
+    """Обработчик команды /skip"""
+    args = message.text.split()[1:]
+    
+    if len(args) < 2:
+        await message.answer(
+            "❌ Неверный формат команды!\n\n"
+            "Используйте: /skip [id] [дата]\n"
+            "Пример: /skip 5 2024-01-22"
+        )
+        return
+    
+    try:
+        event_id = int(args[0])
+        zone = get_zone(await db.get_time_zone(message.chat.id, message.from_user.id))
+        day = parse_date(" ".join(args[1:]), local_now(zone))
+        if not day:
+            await message.answer("❌ Неверный формат даты!")
+            return
+        
+        # Сутки по часам пользователя
+        start = day.replace(hour=0, minute=0, second=0, microsecond=0)
+        skipped = await db.skip_occurrences(
+            event_id,
+            message.from_user.id,
+            to_timestamp(localize(start, zone)),
+            to_timestamp(localize(start + timedelta(days=1), zone)),
+        )
+        
+        if skipped is None:
+            await message.answer("❌ Повторяющееся событие с таким ID не найдено среди ваших событий")
+        elif not skipped:
+            await message.answer(f"ℹ️ {start.strftime('%d.%m.%Y')} событие {event_id} не повторяется")
+        else:
+            if notifier:
+                await notifier.reschedule_event(event_id)
+            await message.answer(f"✅ Повторение события {event_id} {start.strftime('%d.%m.%Y')} пропущено")
+            
+    except ValueError:
+        await message.answer("❌ ID события должен быть числом")
+    except Exception as e:
+        logger.error(f"Error skipping occurrence: {e}")
+        await message.answer("❌ Произошла ошибка при пропуске повторения")
+
+
+async def can_change_chat_settings(message: Message, bot: Bot) -> bool:
+    """
+    Может ли автор сообщения менять настройки всего чата (пояс, сводки).
+    
+    В личном чате - да, в группе - только создатель и администраторы: от
+    настроек группы зависят напоминания и календарь всех ее участников.
+    Анонимный администратор пишет от имени самой группы.
+    """
+    if message.chat.id == message.from_user.id:
+        return True
+    sender_chat = getattr(message, "sender_chat", None)
+    if sender_chat is not None and sender_chat.id == message.chat.id:
+        return True
+    member = await bot.get_chat_member(message.chat.id, message.from_user.id)
+    return member.status in (ChatMemberStatus.CREATOR, ChatMemberStatus.ADMINISTRATOR)
+
+
+@router.message(Command("timezone"))
+async def cmd_timezone(message: Message, bot: Bot, db: Database):
+    """Обработчик команды /timezone: пояс пользователя (в личном чате) или чата (в группе)"""
+    args = message.text.split()[1:]
+    owner_id = message.chat.id
+    whose = "чата" if owner_id != message.from_user.id else "ваш"
+    
+    try:
+        if not args:
+            tz = await db.get_time_zone(owner_id, message.from_user.id)
+            await message.answer(
+                f"🕐 Часовой пояс {whose}: {zone_label(tz)}\n\n"
+                "Изменить: /timezone Europe/Moscow или /timezone UTC+3\n"
+                "Сбросить: /timezone off"
+            )
+            return
+        
+        if not await can_change_chat_settings(message, bot):
+            await message.answer("❌ Часовой пояс группы могут менять только ее администраторы")
+            return
+        
+        if args[0].lower() == "off":
+            await db.set_time_zone(owner_id, None)
+            await message.answer("✅ Часовой пояс сброшен, время показывается по времени сервера")
+            return
+        
+        tz = normalize_zone(args[0])
+        if tz is None:
+            await message.answer(
+                "❌ Неизвестный часовой пояс!\n\n"
+                "Используйте имя из базы IANA (Europe/Moscow, Asia/Yekaterinburg) или смещение (UTC+3)"
+            )
+            return
+        
+        await db.set_time_zone(owner_id, tz)
+        await message.answer(f"✅ Часовой пояс {whose}: {tz}\n🕐 Сейчас там {local_now(get_zone(tz)).strftime('%d.%m.%Y %H:%M')}")
+        
+    except Exception as e:
+        logger.error(f"Error setting time zone: {e}")
+        await message.answer("❌ Произошла ошибка при настройке часового пояса")
+
+
+@router.message(Command("import"))
+async def cmd_import(
+    message: Message,
+    bot: Bot,
+    db: Database,
+    notifier: Optional[NotificationService] = None,
+):
+    """Обработчик команды /import"""
+    document = message.document
+    if document is None and message.reply_to_message is not None:
+        document = message.reply_to_message.document
+    
+    if document is None:
+        await message.answer(
+            "❌ Нет файла для импорта!\n\n"
+            "Отправьте файл .ics или .csv с подписью /import\n"
+            "или ответьте /import на сообщение с файлом"
+        )
+        return
+    
+    if document.file_size and document.file_size > MAX_IMPORT_SIZE:
+        await message.answer("❌ Файл больше 20 МБ")
+        return
+    
+    try:
+        stats = ParseStats()
+        zone = get_zone(await db.get_time_zone(message.chat.id, message.from_user.id))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "import")
+            await bot.download(document, destination=path)
+            # Файл разбирается потоком: события читаются пачками прямо при вставке
+            with open(path, encoding="utf-8-sig", newline="") as file:
+                events = iter_events_file(file, document.file_name or "", stats, zone)
+                result = await db.import_events(events, message.from_user.id, chat_id=message.chat.id)
+        
+        if notifier and result.imported:
+            await notifier.schedule_imported(result.first_event_id)
+        
+        await message.answer(
+            f"✅ Импорт завершен!\n\n"
+            f"📥 Добавлено событий: {result.imported}\n"
+            f"⚠️ Пропущено записей: {stats.skipped}"
+        )
+        
+    except ValueError as e:
+        await message.answer(f"❌ {e}. Поддерживаются файлы .ics и .csv")
+    except Exception as e:
+        logger.error(f"Error importing events: {e}")
+        await message.answer("❌ Произошла ошибка при импорте событий")
+
+
+@router.message(Command("export"))
+async def cmd_export(message: Message, db: Database):
+    """Обработчик команды /export"""
+    args = message.text.split()[1:]
+    # my - мои события из всех чатов, иначе - календарь этого чата
+    user_id = message.from_user.id if args[:1] == ["my"] else None
+    chat_id = None if user_id is not None else message.chat.id
+    
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "calendar.ics")
+            # События читаются пачками и сразу пишутся в файл
+            with open(path, "w", encoding="utf-8", newline="") as file:
+                count = await write_events(db.iter_events(user_id=user_id, chat_id=chat_id), file, path)
+            
+            if not count:
+                await message.answer("📅 Нет событий для экспорта")
+                return
+            
+            await message.answer_document(
+                FSInputFile(path, filename="calendar.ics"),
+                caption=f"📤 Экспортировано событий: {count}",
+            )
+            
+    except Exception as e:
+        logger.error(f"Error exporting events: {e}")
+        await message.answer("❌ Произошла ошибка при экспорте событий")
+
+
+@router.message(Command("stats"))
+async def cmd_stats(message: Message, admins: FrozenSet[int] = frozenset()):
+    """Обработчик команды /stats (только для ADMIN_IDS)"""
+    if message.from_user.id not in admins:
+        await message.answer("❌ Команда доступна только администраторам")
+        return
+    await message.answer(format_stats())
+
+
+def format_stats() -> str:
+    """Сводка метрик процесса: задержки обработчиков и базы, напоминания, отправка"""
+    text = "📊 Статистика (p50 / p99, количество)\n\n⚙️ Обработчики:\n"
+    handlers = HANDLER_SECONDS.label_values()
+    text += "".join(_format_histogram(HANDLER_SECONDS, labels) for labels in handlers) or "  нет вызовов\n"
+    
+    queries = sorted(DB_QUERY_SECONDS.label_values(), key=lambda labels: -DB_QUERY_SECONDS.total(*labels))
+    text += "\n🗄 Запросы к базе (больше всего времени):\n"
+    text += "".join(_format_histogram(DB_QUERY_SECONDS, labels) for labels in queries[:STATS_TOP_QUERIES]) or "  нет запросов\n"
+    
+    text += (
+        f"\n🔔 Напоминания:\n"
+        f"{_format_histogram(NOTIFIER_TICK_SECONDS, (), 'проход')}"
+        f"{_format_histogram(REMINDER_LATENESS_SECONDS, (), 'опоздание', 'с')}"
+        f"\n✉️ Сообщения: отправлено {MESSAGES_TOTAL.value('sent'):.0f}, "
+        f"ошибок {MESSAGES_TOTAL.value('failed'):.0f}, повторов {MESSAGES_TOTAL.value('retried'):.0f}, "
+        f"429: {MESSAGES_TOTAL.value('rate_limited'):.0f}\n"
+        f"📥 Очереди: отправка {QUEUE_DEPTH.value('send'):.0f}, webhook {QUEUE_DEPTH.value('webhook'):.0f}"
+    )
+    return text
+
+
+def _format_histogram(histogram: Histogram, labels: Tuple[str, ...], name: Optional[str] = None, unit: str = "мс") -> str:
+    scale = 1000 if unit == "мс" else 1
+    return (
+        f"  {name or labels[0]}: {histogram.quantile(0.5, *labels) * scale:.1f} / "
+        f"{histogram.quantile(0.99, *labels) * scale:.1f} {unit}, {histogram.count(*labels)}\n"
+    )
+
+
+def format_events(events: List[Tuple], zone: Optional[tzinfo] = None) -> str:
+    """Текст ответа /events (время - по поясу zone)"""
+    response = "📅 Ближайшие события:\n\n"
+    
+    for event in events:
+        event_id, title, description, event_date, created_by, created_at = event
+        
+        response += (
+            f"🆔 {event_id}\n"
+            f"📅 {format_local(event_date, zone)}\n"
+            f"📝 {title}\n"
+            f"👤 Создал: {created_by}\n\n"
+        )
+    
+    return response
+
+
+def format_user_events(events: List[Tuple], zone: Optional[tzinfo] = None) -> str:
+    """Текст ответа /myevents (время - по поясу zone)"""
+    response = "📅 Ваши события:\n\n"
+    
+    for event in events:
+        event_id, title, description, event_date, created_at, rrule = event
+        
+        response += (
+            f"🆔 {event_id}\n"
+            f"📅 {format_local(event_date, zone)}\n"
+            f"📝 {title}\n"
+        )
+        if rrule:
+            response += f"🔁 {describe_rule(rrule)}\n"
+        response += "\n"
+    
+    return response
+
+
+def format_search_results(events: List[Tuple], zone: Optional[tzinfo] = None) -> str:
+    """Текст ответа /search (время - по поясу zone)"""
+    response = "🔍 Найденные события:\n\n"
+    
+    for event in events:
+        event_id, title, description, event_date, created_by, rrule = event
+        
+        response += (
+            f"🆔 {event_id}\n"
+            f"📅 {format_local(event_date, zone)}\n"
+            f"📝 {title}\n"
+        )
+        if rrule:
+            response += f"🔁 {describe_rule(rrule)}\n"
+        response += f"👤 Создал: {created_by}\n\n"
+    
+    return response
+
+
+def parse_search_range(text: str, zone: Optional[tzinfo] = None) -> Tuple[Optional[int], Optional[int]]:
+    """
+    Промежуток "дата..дата" из /search в UTC epoch [start, end).
+    
+    Обе даты берутся целыми днями по поясу zone: 01.02..28.02 - с начала
+    1 февраля до конца 28 февраля. Пустая сторона - без ограничения.
+    ValueError, если сторона не является датой.
+    """
+    now = local_now(zone)
+    bounds = []
+    for side, days in zip(text.split("..", 1), (0, 1)):
+        if not side:
+            bounds.append(None)
+            continue
+        value = parse_date(side, now)
+        if value is None:
+            raise ValueError(f"Invalid date: {side}")
+        day = value.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=days)
+        bounds.append(to_timestamp(localize(day, zone)))
+    return bounds[0], bounds[1]
+
+
+def search_keyboard(page: EventPage, owner: int, offset: int) -> Optional[InlineKeyboardMarkup]:
+    """
+    Кнопки листания результатов /search.
+    
+    callback_data: "sr:<owner>:<offset>" - чей поиск и смещение страницы;
+    сам запрос хранится в данных FSM пользователя.
+    """
+    buttons = []
+    if page.has_prev:
+        buttons.append(InlineKeyboardButton(
+            text="⬅️ Назад", callback_data=f"sr:{owner}:{max(offset - PAGE_SIZE, 0)}"
+        ))
+    if page.has_next:
+        buttons.append(InlineKeyboardButton(
+            text="Далее ➡️", callback_data=f"sr:{owner}:{offset + PAGE_SIZE}"
+        ))
+    return InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+
+
+def format_duration(seconds: int) -> str:
+    """Длительность для ответов бота: 1 ч 30 мин, 2 д 4 ч"""
+    days, rest = divmod(seconds // 60, 24 * 60)
+    hours, minutes = divmod(rest, 60)
+    parts = [f"{value} {unit}" for value, unit in ((days, "д"), (hours, "ч"), (minutes, "мин")) if value]
+    return " ".join(parts) or "меньше минуты"
+
+
+def format_conflicts(conflicts: List[Tuple], zone: Optional[tzinfo] = None) -> str:
+    """Предупреждение /addevent о пересечениях: (id, title, event_date, duration)"""
+    lines = ["⚠️ Пересекается с событиями:"]
+    for event_id, title, event_date, duration in conflicts[:MAX_CONFLICTS]:
+        when = format_local(event_date, zone, "%d.%m %H:%M")
+        if duration:
+            when += f"–{format_local(event_date + duration, zone, '%H:%M')}"
+        lines.append(f"• 🆔 {event_id} {when} {title}")
+    if len(conflicts) > MAX_CONFLICTS:
+        lines.append(f"…и еще {len(conflicts) - MAX_CONFLICTS}")
+    return "\n".join(lines)
+
+
+def format_free_slots(day: date, slots: List[Tuple[int, int]], length: int, zone: Optional[tzinfo] = None) -> str:
+    """Ответ /free: свободные промежутки дня day"""
+    header = f"🕐 Свободно {day.strftime('%d.%m.%Y')} (от {format_duration(length)}, {FREE_FROM_HOUR}:00–{FREE_TO_HOUR}:00)"
+    if not slots:
+        return f"{header}\n\nСвободного времени нет"
+    lines = [
+        f"• {format_local(start, zone, '%H:%M')}–{format_local(end, zone, '%H:%M')} ({format_duration(end - start)})"
+        for start, end in slots[:MAX_FREE_SLOTS]
+    ]
+    return f"{header}:\n\n" + "\n".join(lines)
+
+
+def page_keyboard(kind: str, page: EventPage, owner: int = 0) -> Optional[InlineKeyboardMarkup]:
+    """
+    Кнопки листания списка событий.
     
+    callback_data: "<kind>:<owner>:<prev|next>:<event_date>:<id>", где kind -
+    "ev" (/events) или "my" (/myevents), owner - чей список (0 для /events),
+    а дата и id - курсор крайнего события текущей страницы.
+    """
+    buttons = []
+    if page.has_prev:
+        first = page.rows[0]
+        buttons.append(InlineKeyboardButton(
+            text="⬅️ Назад", callback_data=f"{kind}:{owner}:prev:{first[3]}:{first[0]}"
+        ))
+    if page.has_next:
+        last = page.rows[-1]
+        buttons.append(InlineKeyboardButton(
+            text="Далее ➡️", callback_data=f"{kind}:{owner}:next:{last[3]}:{last[0]}"
+        ))
+    return InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+
+
+def render_cached(
+    events: List[Tuple],
+    render: Callable[[List[Tuple], Optional[tzinfo]], str],
+    tz: Optional[str] = None,
+) -> str:
+    """
+    Текст списка событий с кэшированием.
+    
+    Ключ - id списка и пояс: пока кэш базы отдает тот же объект, текст не
+    пересобирается, а после инвалидации база вернет новый список и текст
+    соберется заново. Список хранится рядом с текстом, чтобы его id не
+    достался другому объекту. Для каждого пояса текст свой, время
+    переводится один раз при сборке.
+    """
+    key = (render.__name__, tz, id(events))
+    cached = rendered_texts.get(key)
+    if cached is not None and cached[0] is events:
+        return cached[1]
+    text = render(events, get_zone(tz))
+    rendered_texts.set(key, (events, text))
+    return text
+
+
+def parse_digest_args(args: List[str]) -> Tuple[str, int]:
+    """Вид сводки и ее время в минутах от полуночи из аргументов /digest (ValueError - неверный формат)"""
+    kind = args[0].lower()
+    if kind == HOURLY and len(args) == 1:
+        return HOURLY, 0
+    if kind != DAILY or len(args) > 2:
+        raise ValueError(f"unknown digest: {' '.join(args)}")
+    if len(args) == 1:
+        return DAILY, DEFAULT_DIGEST_MINUTE
+    hours, _, minutes = args[1].partition(":")
+    hour, minute = int(hours), int(minutes or 0)
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError(f"invalid digest time: {args[1]}")
+    return DAILY, hour * 60 + minute
+
+
+@router.message(Command("digest"))
+async def cmd_digest(
+    message: Message,
+    bot: Bot,
+    db: Database,
+    notifier: Optional[NotificationService] = None,
+):
+    """Обработчик команды /digest: сводки чата вместо отдельных напоминаний"""
+    args = message.text.split()[1:]
+    chat_id = message.chat.id
+    
+    try:
+        zone = get_zone(await db.get_time_zone(chat_id, chat_id))
+        if not args:
+            digests = await db.get_digests(chat_id)
+            if not digests:
+                await message.answer(
+                    "🔔 Напоминания приходят по одному на событие\n\n"
+                    "Утренняя сводка: /digest daily 08:00\n"
+                    "Сводка каждый час: /digest hourly"
+                )
+                return
+            lines = [
+                f"• {'на сутки' if kind == DAILY else 'каждый час'}, следующая {format_local(next_at, zone)}"
+                for kind, _, next_at in digests
+            ]
+            await message.answer(
+                "🗞 Сводки этого чата:\n" + "\n".join(lines) + "\n\nВернуть отдельные напоминания: /digest off"
+            )
+            return
+        
+        if not await can_change_chat_settings(message, bot):
+            await message.answer("❌ Сводки группы могут менять только ее администраторы")
+            return
+        
+        if args[0].lower() == "off" and len(args) == 1:
+            if await db.remove_digests(chat_id):
+                await message.answer("✅ Сводки выключены, напоминания снова приходят по одному")
+            else:
+                await message.answer("ℹ️ Сводки не были включены")
+            return
+        
+        kind, minute = parse_digest_args(args)
+        next_at = await db.set_digest(chat_id, kind, minute)
+        if notifier:
+            notifier.schedule_digest(next_at)
+        what = f"сводка на сутки в {minute // 60:02d}:{minute % 60:02d}" if kind == DAILY else "сводка каждый час"
+        await message.answer(
+            f"✅ Включена {what}: вместо отдельных напоминаний события придут одним сообщением\n"
+            f"📅 Ближайшая: {format_local(next_at, zone)}"
+        )
+        
+    except ValueError:
+        await message.answer(
+            "❌ Неверный формат команды!\n\n"
+            "Используйте: /digest daily 08:00, /digest hourly или /digest off"
+        )
+    except Exception as e:
+        logger.error(f"Error setting digest: {e}")
+        await message.answer("❌ Произошла ошибка при настройке сводок")
+
+
+def parse_subscription_args(message: Message) -> Optional[int]:
+    """ID события из аргументов /subscribe и /unsubscribe (None - весь календарь)"""
+    args = message.text.split()[1:]
+    if len(args) > 1:
+        raise ValueError("too many arguments")
+    return int(args[0]) if args else None
+
+
+@router.message(Command("subscribe"))
+async def cmd_subscribe(message: Message, db: Database):
+    """Обработчик команды /subscribe"""
     try:
-        # Стандартные форматы
-        if " " in date_str:
-            return datetime.strptime(date_str, "%Y-%m-%d %H:%M")
+        event_id = parse_subscription_args(message)
+        
+        # Подписывается чат: в группе напоминания придут всем ее участникам.
+        # События других чатов (кроме своих) не видны - для них ответ тот же, что для несуществующих
+        subscribed = await db.subscribe(message.chat.id, event_id, user_id=message.from_user.id)
+        if subscribed:
+            if event_id is None:
+                await message.answer("✅ Этот чат будет получать напоминания обо всех событиях своего календаря")
+            else:
+                await message.answer(f"✅ Этот чат будет получать напоминания о событии {event_id}")
+        elif subscribed is None:
+            await message.answer("❌ Событие с таким ID не найдено")
         else:
-            return datetime.strptime(date_str, "%Y-%m-%d")
+            await message.answer("ℹ️ Чат уже подписан")
+            
     except ValueError:
-        pass
-    
-    # Специальные случаи
-    now = datetime.now()
-    
-    if date_str == "today":
-        return now.replace(hour=12, minute=0, second=0, microsecond=0)
-    elif date_str == "tomorrow":
-        tomorrow = now + timedelta(days=1)
-        return tomorrow.replace(hour=12, minute=0, second=0, microsecond=0)
-    elif date_str.startswith("+"):
-        try:
-            days = int(date_str[1:])
-            future_date = now + timedelta(days=days)
-            return future_date.replace(hour=12, minute=0, second=0, microsecond=0)
-        except ValueError:
-            pass
-    
-    return None
+        await message.answer(
+            "❌ Неверный формат команды!\n\n"
+            "Используйте: /subscribe [id] или /subscribe для всего календаря"
+        )
+    except Exception as e:
+        logger.error(f"Error subscribing chat: {e}")
+        await message.answer("❌ Произошла ошибка при оформлении подписки")
+
+
+@router.message(Command("unsubscribe"))
+async def cmd_unsubscribe(message: Message, db: Database):
+    """Обработчик команды /unsubscribe"""
+    try:
+        event_id = parse_subscription_args(message)
+        
+        if await db.unsubscribe(message.chat.id, event_id):
+            await message.answer("✅ Подписка отменена")
+        else:
+            await message.answer("ℹ️ Чат не был подписан")
+            
+    except ValueError:
+        await message.answer(
+            "❌ Неверный формат команды!\n\n"
+            "Используйте: /unsubscribe [id] или /unsubscribe для всего календаря"
+        )
+    except Exception as e:
+        logger.error(f"Error unsubscribing chat: {e}")
+        await message.answer("❌ Произошла ошибка при отмене подписки")
@@ -0,0 +1,280 @@
+"""
+Разбор дат и времени из аргументов команд.
+
+Аргументы разбиваются на слова, каждое слово один раз распознается
+скомпилированным регулярным выражением и превращается в токен, а
+грамматика (см. parse_date_prefix) разбирает самый длинный префикс,
+похожий на дату. Поддерживаются:
+
+- абсолютные даты: 2024-01-15, 2024/01/15, 15.01.2024, 15.01 и время 15:00;
+- дни: today, tomorrow, сегодня, завтра, послезавтра, дни недели
+  (monday, next monday, пн, в понедельник, в следующий вторник);
+- сдвиги: +3 (через 3 дня), +2 hours, in 2 hours, in an hour,
+  через 2 часа, через неделю.
+
+После дня можно указать время: tomorrow 10:00, завтра в 10:00. Дата без
+времени - полночь, день без времени - полдень, как раньше. Разбор форм без
+относительных слов зависит только от текста (и текущего года) и кэшируется.
+
+Длительность после даты (parse_duration_prefix): 1h, 90m, 1ч30м, 2 часа,
+или время окончания: до 16:30, -16:30.
+"""
+
+import re
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+# Время дня по умолчанию для today, tomorrow, дней недели и сдвигов на дни
+DEFAULT_HOUR = 12
+
+TOKEN = re.compile(
+    r"(?P<ymd>(?P<y>\d{4})[-/](?P<m>\d{1,2})[-/](?P<d>\d{1,2}))"
+    r"|(?P<dmy>(?P<dd>\d{1,2})\.(?P<mm>\d{1,2})(?:\.(?P<yy>\d{4}|\d{2}))?)"
+    r"|(?P<time>(?P<hour>\d{1,2}):(?P<minute>\d{2}))"
+    r"|(?P<plus>\+(?P<days>\d{1,4}))"
+    r"|(?P<number>\d{1,4})"
+    r"|(?P<word>[a-zа-яё]+)"
+)
+
+# Длительность одним словом: 2d, 1h30m, 1ч30м, 45мин
+COMPACT_DURATION = re.compile(
+    r"(?:(?P<days>\d{1,3})(?:d|д))?(?:(?P<hours>\d{1,3})(?:h|ч))?(?:(?P<minutes>\d{1,4})(?:m|м|мин))?"
+)
+END_TIME = re.compile(r"[-–—](?P<hour>\d{1,2}):(?P<minute>\d{2})")
+
+MINUTE = timedelta(minutes=1)
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+WEEK = timedelta(weeks=1)
+
+# Слово -> (вид токена, значение)
+WORDS: Dict[str, Tuple[str, object]] = {}
+
+
+def _words(kind: str, value: object, *words: str):
+    for word in words:
+        WORDS[word] = (kind, value)
+
+
+_words("day", 0, "today", "сегодня")
+_words("day", 1, "tomorrow", "завтра")
+_words("day", 2, "послезавтра")
+_words("in", None, "in", "через")
+_words("at", None, "at", "в", "во")
+_words("until", None, "until", "till", "до")
+_words("next", None, "next", "следующий", "следующую", "следующее", "следующая")
+_words("one", None, "a", "an")
+_words("unit", MINUTE, "min", "mins", "minute", "minutes", "мин", "минута", "минуту", "минуты", "минут")
+_words("unit", HOUR, "h", "hour", "hours", "ч", "час", "часа", "часов")
+_words("unit", DAY, "d", "day", "days", "д", "день", "дня", "дней")
+_words("unit", WEEK, "w", "week", "weeks", "неделя", "неделю", "недели", "недель")
+for _weekday, _names in enumerate((
+    ("monday", "mon", "понедельник", "пн"),
+    ("tuesday", "tue", "вторник", "вт"),
+    ("wednesday", "wed", "среда", "среду", "ср"),
+    ("thursday", "thu", "четверг", "чт"),
+    ("friday", "fri", "пятница", "пятницу", "пт"),
+    ("saturday", "sat", "суббота", "субботу", "сб"),
+    ("sunday", "sun", "воскресенье", "вс"),
+)):
+    _words("weekday", _weekday, *_names)
+
+
+class Token(NamedTuple):
+    kind: str
+    value: object
+
+
+@lru_cache(maxsize=4096)
+def tokenize(word: str) -> Optional[Token]:
+    """Распознать одно слово; None - слово не относится к дате"""
+    match = TOKEN.fullmatch(word.lower())
+    if match is None:
+        return None
+    kind = match.lastgroup
+    if kind == "ymd":
+        return Token("date", (int(match["y"]), int(match["m"]), int(match["d"])))
+    if kind == "dmy":
+        year = match["yy"]
+        if year is not None and len(year) == 2:
+            year = "20" + year
+        return Token("date", (int(year) if year else None, int(match["mm"]), int(match["dd"])))
+    if kind == "time":
+        hour, minute = int(match["hour"]), int(match["minute"])
+        return Token("time", (hour, minute)) if hour < 24 and minute < 60 else None
+    if kind == "plus":
+        return Token("plus", int(match["days"]))
+    if kind == "number":
+        return Token("number", int(match["number"]))
+    word_token = WORDS.get(match["word"])
+    return Token(*word_token) if word_token else None
+
+
+@lru_cache(maxsize=4096)
+def _absolute(day: Tuple[Optional[int], int, int], year: int, time: Optional[Tuple[int, int]]) -> Optional[datetime]:
+    """Дата без относительных слов: зависит только от текста и текущего года"""
+    try:
+        hour, minute = time or (0, 0)
+        return datetime(day[0] or year, day[1], day[2], hour, minute)
+    except ValueError:
+        return None
+
+
+class _Parser:
+    """Разбор одного префикса: позиция в списке токенов и момент now"""
+    
+    def __init__(self, tokens: List[Optional[Token]], now: datetime):
+        self.tokens = tokens
+        self.now = now
+        self.pos = 0
+    
+    def peek(self, offset: int = 0) -> Optional[Token]:
+        index = self.pos + offset
+        return self.tokens[index] if index < len(self.tokens) else None
+    
+    def kind(self, offset: int = 0) -> Optional[str]:
+        token = self.peek(offset)
+        return token.kind if token else None
+    
+    def parse(self) -> Optional[datetime]:
+        # через 2 часа / in an hour / +2 hours / +3
+        shift = self.shift()
+        if shift is not None:
+            delta, whole_days = shift
+            if not whole_days:
+                return (self.now + delta).replace(second=0, microsecond=0)
+            return self.with_time((self.now + delta).date(), DEFAULT_HOUR)
+        
+        token = self.peek()
+        if token is not None and token.kind == "date":
+            self.pos += 1
+            time = self.time()
+            return _absolute(token.value, self.now.year, time)
+        
+        day = self.day()
+        if day is not None:
+            return self.with_time(day, DEFAULT_HOUR)
+        
+        # Только время: сегодня, а если уже прошло - завтра
+        time = self.time()
+        if time is not None:
+            moment = self.now.replace(hour=time[0], minute=time[1], second=0, microsecond=0)
+            return moment if moment > self.now else moment + DAY
+        return None
+    
+    def shift(self) -> Optional[Tuple[timedelta, bool]]:
+        """Сдвиг от текущего момента и признак сдвига на целые дни"""
+        kind = self.kind()
+        if kind == "plus":
+            count = self.peek().value
+            unit = self.peek(1)
+            if unit is not None and unit.kind == "unit":
+                self.pos += 2
+                return count * unit.value, unit.value >= DAY
+            self.pos += 1
+            return count * DAY, True
+        if kind == "in":
+            count = self.peek(1)
+            if count is not None and count.kind in ("number", "one") and self.kind(2) == "unit":
+                unit = self.peek(2).value
+                self.pos += 3
+                return (count.value if count.kind == "number" else 1) * unit, unit >= DAY
+            if count is not None and count.kind == "unit":
+                # через час, через неделю
+                self.pos += 2
+                return count.value, count.value >= DAY
+        return None
+    
+    def day(self) -> Optional[date]:
+        """today/завтра/[в] [следующий] понедельник"""
+        start = self.pos
+        if self.kind() == "at":
+            self.pos += 1
+        if self.kind() == "next":
+            self.pos += 1
+        token = self.peek()
+        if token is not None and token.kind == "day" and self.pos == start:
+            self.pos += 1
+            return (self.now + token.value * DAY).date()
+        if token is not None and token.kind == "weekday":
+            self.pos += 1
+            # Ближайший такой день после сегодняшнего
+            ahead = (token.value - self.now.weekday() - 1) % 7 + 1
+            return (self.now + ahead * DAY).date()
+        self.pos = start
+        return None
+    
+    def time(self) -> Optional[Tuple[int, int]]:
+        """[в|at] ЧЧ:ММ"""
+        offset = 1 if self.kind() == "at" else 0
+        token = self.peek(offset)
+        if token is not None and token.kind == "time":
+            self.pos += offset + 1
+            return token.value
+        return None
+    
+    def with_time(self, day: date, default_hour: int) -> datetime:
+        hour, minute = self.time() or (default_hour, 0)
+        return datetime(day.year, day.month, day.day, hour, minute)
+
+
+def parse_date_prefix(words: Sequence[str], now: Optional[datetime] = None) -> Tuple[Optional[datetime], int]:
+    """
+    Разобрать дату в начале списка слов.
+
+    Возвращает дату и число слов, которые она заняла, или (None, 0), если
+    список не начинается с даты: /addevent завтра в 10:00 Встреча -> 3 слова.
+    """
+    # Токенизируем не больше слов, чем может занять дата
+    tokens = [tokenize(word) for word in words[:5]]
+    parser = _Parser(tokens, now or datetime.now())
+    result = parser.parse()
+    return (result, parser.pos) if result is not None else (None, 0)
+
+
+def parse_date(text: str, now: Optional[datetime] = None) -> Optional[datetime]:
+    """Разобрать строку целиком; None, если это не дата или после даты что-то осталось"""
+    words = text.split()
+    result, used = parse_date_prefix(words, now)
+    return result if words and used == len(words) else None
+
+
+def parse_duration_prefix(words: Sequence[str], start: datetime) -> Tuple[Optional[timedelta], int]:
+    """
+    Разобрать длительность события в начале списка слов (после его даты start).
+
+    Возвращает длительность и число слов, которые она заняла, или (None, 0):
+    /addevent 15:00 1h30m Встреча, 15:00 2 часа Встреча, 15:00 до 16:30
+    Встреча. Время окончания раньше начала - на следующий день.
+    """
+    if not words:
+        return None, 0
+    first = words[0].lower()
+    match = COMPACT_DURATION.fullmatch(first)
+    if match is not None:
+        delta = timedelta(
+            days=int(match["days"] or 0), hours=int(match["hours"] or 0), minutes=int(match["minutes"] or 0),
+        )
+        return (delta, 1) if delta else (None, 0)
+    
+    tokens = [tokenize(word) for word in words[:2]]
+    count, unit = tokens[0], tokens[1] if len(tokens) > 1 else None
+    # 2 часа, an hour
+    if count is not None and count.kind in ("number", "one") and unit is not None and unit.kind == "unit":
+        return (count.value if count.kind == "number" else 1) * unit.value, 2
+    
+    # до 16:30, -16:30
+    match = END_TIME.fullmatch(first)
+    if match is not None:
+        end, used = (int(match["hour"]), int(match["minute"])), 1
+    elif count is not None and count.kind == "until" and unit is not None and unit.kind == "time":
+        end, used = unit.value, 2
+    else:
+        return None, 0
+    if end[0] >= 24 or end[1] >= 60:
+        return None, 0
+    finish = start.replace(hour=end[0], minute=end[1], second=0, microsecond=0)
+    if finish <= start:
+        finish += DAY
+    return finish - start, used
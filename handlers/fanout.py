@@ -0,0 +1,71 @@
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from db.database import Database
+
+# (chat_id, напоминания) - одно сообщение одному чату
+Delivery = Tuple[int, Tuple[tuple, ...]]
+
+
+def latest_per_event(reminders: Sequence[tuple]) -> Dict[int, tuple]:
+    """
+    Оставить по одному напоминанию на событие.
+    
+    Если в пачку попали несколько напоминаний об одном событии (например,
+    за час и за 15 минут после простоя бота), отправляем только ближайшее к
+    событию: остальные устарели и считаются доставленными вместе с ним.
+    """
+    latest: Dict[int, tuple] = {}
+    for reminder in reminders:
+        event_id = reminder[1]
+        current = latest.get(event_id)
+        # Ближайшее к событию - с наименьшим смещением
+        if current is None or reminder[2] < current[2]:
+            latest[event_id] = reminder
+    return latest
+
+
+async def _pages(fetch: Callable[[Optional[int]], Awaitable[List[int]]]) -> AsyncIterator[List[int]]:
+    """Постранично читать chat_id по возрастанию (keyset: после последнего увиденного)"""
+    after = None
+    while True:
+        page = await fetch(after)
+        if not page:
+            return
+        yield page
+        after = page[-1]
+
+
+async def iter_deliveries(db: Database, reminders: Sequence[tuple], batch_size: int = 500) -> AsyncIterator[List[Delivery]]:
+    """
+    Разложить наступившие напоминания по получателям пачками по batch_size.
+    
+    Пары (событие, чат) не собираются в памяти целиком: получатели читаются
+    из базы страницами, а чат, подписанный на весь свой календарь, получает
+    напоминания о событиях календаря одним сообщением. Каждый чат получает
+    каждое событие не больше одного раза.
+    """
+    latest = latest_per_event(reminders)
+    everything = tuple(sorted(latest.values(), key=lambda reminder: reminder[6]))
+    calendars: Dict[int, List[tuple]] = {}
+    for reminder in everything:
+        calendars.setdefault(reminder[8], []).append(reminder)
+    batch: List[Delivery] = []
+    
+    for chat_id in await db.get_calendar_subscribers(list(calendars)):
+        batch.append((chat_id, tuple(calendars[chat_id])))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    
+    for reminder in everything:
+        single = (reminder,)
+        event_id = reminder[1]
+        async for page in _pages(lambda after: db.get_event_recipients(event_id, after, batch_size)):
+            for chat_id in page:
+                batch.append((chat_id, single))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+    
+    if batch:
+        yield batch
@@ -0,0 +1,122 @@
+import logging
+import os
+import socket
+import uuid
+from typing import List, Optional
+
+from db.database import REMINDER_SHARDS, Database
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLease:
+    """
+    Лидерство среди процессов бота через аренду в таблице leases.
+
+    Аренду держит один процесс: он продлевает ее каждые ttl / 3 секунды, а
+    остальные пытаются взять ее с тем же интервалом. Если лидер упал, аренда
+    истекает через ttl секунд и переходит к другому процессу; при штатной
+    остановке лидер отдает ее сразу.
+    """
+    
+    def __init__(self, db: Database, name: str = "notifications", ttl: float = 30.0, holder: Optional[str] = None):
+        self.db = db
+        self.name = name
+        self.ttl = ttl
+        # Уникален для процесса и запуска: перезапущенный процесс - новый владелец
+        self.holder = holder or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # Номер текущего лидерства или None, если процесс не лидер
+        self.token: Optional[int] = None
+    
+    @property
+    def renew_interval(self) -> float:
+        return self.ttl / 3
+    
+    @property
+    def is_leader(self) -> bool:
+        return self.token is not None
+    
+    @property
+    def shards(self) -> Optional[List[int]]:
+        """Лидер обслуживает все шарды напоминаний"""
+        return None
+    
+    async def acquire(self) -> bool:
+        """Взять или продлить аренду; True, если процесс - лидер"""
+        try:
+            token = await self.db.acquire_lease(self.name, self.holder, self.ttl)
+        except Exception as e:
+            # Не смогли продлить - считаем, что лидерство потеряно
+            logger.error(f"Error renewing lease {self.name}: {e}")
+            token = None
+        if token != self.token:
+            if token is None:
+                logger.warning(f"Lost lease {self.name} ({self.holder})")
+            else:
+                logger.info(f"Acquired lease {self.name} ({self.holder}, token {token})")
+        self.token = token
+        return token is not None
+    
+    async def release(self):
+        """Отдать аренду при остановке"""
+        if self.token is not None:
+            self.token = None
+            await self.db.release_lease(self.name, self.holder)
+
+
+class ShardLeases:
+    """
+    Шарды напоминаний, поделенные между воркерами уведомлений через аренды.
+
+    Воркер (процесс или задача asyncio) каждые ttl / 3 секунды продлевает
+    участие и свои шарды и получает справедливую долю: при появлении нового
+    воркера остальные отдают лишние шарды, при уходе или падении воркера его
+    шарды забирают оставшиеся. Один воркер получает все шарды.
+    """
+    
+    def __init__(
+        self,
+        db: Database,
+        name: str = "reminders",
+        ttl: float = 30.0,
+        holder: Optional[str] = None,
+        total: int = REMINDER_SHARDS,
+    ):
+        self.db = db
+        self.name = name
+        self.ttl = ttl
+        self.holder = holder or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.total = total
+        # Шарды, которыми воркер владеет после последней балансировки
+        self.owned: List[int] = []
+    
+    @property
+    def renew_interval(self) -> float:
+        return self.ttl / 3
+    
+    @property
+    def is_leader(self) -> bool:
+        return bool(self.owned)
+    
+    @property
+    def shards(self) -> Optional[List[int]]:
+        return self.owned
+    
+    async def acquire(self) -> bool:
+        """Продлить участие и перераспределить шарды; True, если у воркера есть шарды"""
+        try:
+            owned, recovered = await self.db.balance_shards(self.name, self.holder, self.ttl, self.total)
+        except Exception as e:
+            logger.error(f"Error balancing shards {self.name}: {e}")
+            owned, recovered = [], []
+        if owned != self.owned:
+            logger.info(f"Worker {self.holder} now owns {len(owned)} of {self.total} shards")
+        if recovered:
+            logger.warning(f"Worker {self.holder} took over shards {recovered} from a failed worker")
+        self.owned = owned
+        return bool(owned)
+    
+    async def release(self):
+        """Отдать шарды и выйти из группы при остановке"""
+        self.owned = []
+        await self.db.release_lease(self.name, self.holder)
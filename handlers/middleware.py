@@ -0,0 +1,33 @@
+"""
+Промежуточный слой aiogram для замера обработчиков.
+
+Подключается как inner-middleware роутера: к этому моменту фильтры уже
+выбрали обработчик, поэтому метка гистограммы - имя его функции
+(cmd_events, cb_search_page), а время не включает разбор обновления.
+"""
+
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from db.metrics import HANDLER_SECONDS
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Время обработчика в calendar_handler_seconds{handler=...}"""
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            handler_object = data.get("handler")
+            name = handler_object.callback.__name__ if handler_object is not None else "unknown"
+            HANDLER_SECONDS.observe(time.perf_counter() - started, name)
@@ -1,124 +1,362 @@
 import asyncio
 import logging
-from datetime import datetime, timedelta
-from typing import List
+import time
+from datetime import tzinfo
+from typing import List, Optional, Sequence, Union
 from aiogram import Bot
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
-from db.database import Database
+from db.database import DEFAULT_REMINDER_OFFSETS, Database
+from db.digests import DAILY, DIGEST_GRACE, DIGEST_WINDOWS
+from db.metrics import NOTIFIER_TICK_SECONDS
+from db.timezones import format_local, get_zone
+from handlers.fanout import iter_deliveries
+from handlers.leader import LeaderLease, ShardLeases
+from handlers.outbox import OutboxWorker, dedupe_key
+from handlers.scheduler import ReminderScheduler, Wakeup
+from handlers.sender import SendPipeline
 
 logger = logging.getLogger(__name__)
 
+# Сколько событий помещаем в одно сообщение (лимит Telegram - 4096 символов)
+MAX_EVENTS_PER_MESSAGE = 20
+
+# Клавиатура под напоминанием в виде, в котором она хранится в outbox
+REMINDER_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="📅 Посмотреть все события", callback_data="show_events")]
+]).model_dump_json(exclude_none=True)
+
 
 class NotificationService:
-    def __init__(self, bot: Bot, db: Database):
+    def __init__(
+        self,
+        bot: Bot,
+        db: Database,
+        grace: int = 120,
+        max_attempts: int = 3,
+        retry_delay: int = 30,
+        claim_batch: int = 1000,
+        fanout_batch: int = 500,
+        sender: Optional[SendPipeline] = None,
+        lease: Optional[Union[LeaderLease, ShardLeases]] = None,
+    ):
         self.bot = bot
         self.db = db
+        # Все исходящие сообщения идут через конвейер с лимитами Telegram
+        self.sender = sender or SendPipeline(bot)
+        self.scheduler = ReminderScheduler()
+        # Сколько секунд после срока напоминание еще имеет смысл отправлять
+        self.grace = grace
+        self.claim_batch = claim_batch
+        self.fanout_batch = fanout_batch
+        # Аренда при нескольких воркерах: LeaderLease - напоминания отправляет
+        # только лидер, ShardLeases - каждый воркер свои шарды. None - воркер один
+        self.lease = lease
+        # Напоминания доставляются через outbox: захват пачки только ставит сообщения
+        # в очередь, повторы (max_attempts, retry_delay) - на стороне доставки
+        self.outbox = OutboxWorker(
+            db,
+            self.sender,
+            max_attempts=max_attempts,
+            retry_delay=retry_delay,
+            holder=None if lease is None else lease.holder,
+        )
+        # Наибольший id напоминания, уже загруженного в планировщик
+        self.last_reminder_id = 0
+        # Срок ближайшей сводки, к которому уже запланировано пробуждение
+        self.digest_at: Optional[int] = None
         self.running = False
+        self._stopping = asyncio.Event()
+        self._stopped = asyncio.Event()
+        self._stopped.set()
     
     async def start_notification_service(self):
         """Запуск сервиса уведомлений"""
         self.running = True
-        logger.info("Notification service started")
-        
-        while self.running:
-            try:
-                await self.check_and_send_notifications()
-                await asyncio.sleep(60)  # Проверяем каждую минуту
-            except Exception as e:
-                logger.error(f"Error in notification service: {e}")
-                await asyncio.sleep(60)
+        self._stopping.clear()
+        self._stopped.clear()
+        self.sender.start()
+        if self.lease is None:
+            # Воркер один: арендованные до перезапуска сообщения ничьи
+            released = await self.db.release_outbox()
+            if released:
+                logger.warning(f"Returned {released} outbox messages leased before restart to the queue")
+        self.outbox.start()
+        try:
+            if self.lease is None:
+                await self._lead()
+                return
+            while self.running:
+                if not await self.lease.acquire():
+                    await self._sleep(self.lease.renew_interval)
+                    continue
+                keeper = asyncio.create_task(self._keep_lease())
+                try:
+                    await self._lead()
+                finally:
+                    keeper.cancel()
+                    await asyncio.gather(keeper, return_exceptions=True)
+        finally:
+            self._stopped.set()
     
-    async def stop_notification_service(self):
-        """Остановка сервиса уведомлений"""
+    async def stop_notification_service(self, timeout: float = 10.0):
+        """Остановка сервиса уведомлений: дождаться текущей пачки, доотправить outbox и отдать аренду"""
         self.running = False
+        self._stopping.set()
+        self.scheduler.stop()
+        try:
+            await asyncio.wait_for(self._stopped.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Notification service did not finish the current batch in time")
+        await self.outbox.stop(timeout)
+        await self.sender.stop()
+        if self.lease is not None:
+            await self.lease.release()
         logger.info("Notification service stopped")
     
-    async def check_and_send_notifications(self):
-        """Проверка и отправка уведомлений о предстоящих событиях"""
-        try:
-            # Получаем события, которые начнутся в ближайшие 2 часа
-            upcoming_events = self.db.get_upcoming_events(hours_ahead=2)
-            
-            for event in upcoming_events:
-                event_id, title, description, event_date, created_by = event
-                event_datetime = datetime.fromisoformat(event_date)
-                time_until_event = event_datetime - datetime.now()
-                
-                # Отправляем уведомления за 1 час и за 15 минут
-                if self._should_send_notification(time_until_event):
-                    await self._send_event_notification(event)
-                    self.db.mark_notification_sent(event_id)
-                    
-        except Exception as e:
-            logger.error(f"Error checking notifications: {e}")
-    
-    def _should_send_notification(self, time_until_event: timedelta) -> bool:
-        """Определяет, нужно ли отправить уведомление"""
-        total_minutes = time_until_event.total_seconds() / 60
+    async def _lead(self):
+        """Отправлять напоминания, пока сервис работает (и держит аренду)"""
+        self.scheduler.clear()
+        await self.load_scheduled_reminders()
+        logger.info(f"Notification service started, {len(self.scheduler)} reminders scheduled")
         
-        # Уведомляем за 60 минут или за 15 минут
-        return abs(total_minutes - 60) < 2 or abs(total_minutes - 15) < 2
+        # Планировщик спит до ближайшего напоминания, а не опрашивает базу
+        await self.scheduler.run(self.send_due_notifications)
+    
+    async def _keep_lease(self):
+        """Продлевать аренду и подхватывать напоминания других процессов; при потере - остановить планировщик"""
+        while True:
+            await asyncio.sleep(self.lease.renew_interval)
+            before = set(self.lease.shards or ())
+            if not await self.lease.acquire():
+                self.scheduler.stop()
+                return
+            try:
+                added = set(self.lease.shards or ()) - before
+                if added:
+                    # Напоминания шардов, полученных при балансировке
+                    self.scheduler.schedule_many((await self.db.get_new_reminders(0, added))[1])
+                await self.load_new_reminders()
+            except Exception as e:
+                logger.error(f"Error loading new reminders: {e}")
+            # Контрольный захват: сроки, сдвинутые другим воркером (повтор, следующее
+            # повторение серии в отданном шарде), в нашу кучу не попадали
+            self.scheduler.schedule(0, [int(time.time())])
+    
+    async def _sleep(self, delay: float):
+        """Подождать delay секунд или до остановки сервиса"""
+        try:
+            await asyncio.wait_for(self._stopping.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+    
+    async def load_scheduled_reminders(self):
+        """Загрузка ожидающих напоминаний из базы в планировщик (при старте или получении аренды)"""
+        shards = None if self.lease is None else self.lease.shards
+        if shards is None:
+            # Воркер обслуживает все напоминания: захваченные до него ничьи. Шарды
+            # упавших воркеров возвращает в очередь сама балансировка
+            released = await self.db.release_claimed_reminders()
+            if released:
+                logger.warning(f"Returned {released} reminders claimed before restart to the queue")
+        self.last_reminder_id, wakeups = await self.db.get_new_reminders(0, shards)
+        self.scheduler.schedule_many(wakeups)
+        self.digest_at = None
+        self.schedule_digest(await self.db.get_next_digest_at(shards))
+    
+    async def load_new_reminders(self):
+        """Добавить в планировщик напоминания, созданные после последней загрузки (в том числе другими процессами)"""
+        shards = None if self.lease is None else self.lease.shards
+        self.last_reminder_id, wakeups = await self.db.get_new_reminders(self.last_reminder_id, shards)
+        if wakeups:
+            self.scheduler.schedule_many(wakeups)
+    
+    def schedule_event(self, event_id: int, event_date: int, offsets: Sequence[int] = DEFAULT_REMINDER_OFFSETS):
+        """Добавить напоминания о новом событии"""
+        self.scheduler.schedule(event_id, [event_date - offset for offset in offsets])
     
-    async def _send_event_notification(self, event: tuple):
-        """Отправка уведомления о событии"""
+    async def schedule_imported(self, first_event_id: int):
+        """Добавить в планировщик напоминания событий, импортированных начиная с first_event_id"""
+        self.scheduler.schedule_many(await self.db.get_pending_reminders(first_event_id))
+    
+    async def reschedule_event(self, event_id: int):
+        """Добавить в планировщик текущие напоминания события (после смены правила серии)"""
+        self.scheduler.schedule(event_id, [due_at for due_at, _ in await self.db.get_pending_reminders(event_id, event_id)])
+    
+    def schedule_digest(self, next_at: Optional[int]):
+        """Проснуться к сроку сводки (событие 0 - пробуждение без своего напоминания)"""
+        if next_at is not None and next_at != self.digest_at:
+            self.digest_at = next_at
+            self.scheduler.schedule(0, [next_at])
+    
+    def cancel_event(self, event_id: int):
+        """Убрать напоминания об удаленном событии"""
+        self.scheduler.cancel(event_id)
+    
+    async def send_due_notifications(self, wakeups: Sequence[Wakeup] = ()):
+        """
+        Постановка наступивших напоминаний в outbox.
+        
+        Что отправлять, решает база: за одну итерацию - один захват пачки
+        напоминаний и одна запись результатов. Получатели (создатель, подписчики
+        события и чаты, подписанные на весь календарь) читаются потоком пачками
+        по fanout_batch, и сообщения каждой пачки одной транзакцией ставятся в
+        outbox; отправляет, повторяет и записывает message_id OutboxWorker.
+        Напоминания серий переходят на следующее повторение и снова попадают
+        в планировщик. Чаты в режиме сводок отдельных напоминаний не получают:
+        их события приходят в наступивших сводках. Длительность прохода
+        пишется в calendar_notifier_tick_seconds.
+        """
+        started = time.perf_counter()
         try:
-            event_id, title, description, event_date, created_by = event
-            event_datetime = datetime.fromisoformat(event_date)
-            time_until_event = event_datetime - datetime.now()
+            await self._send_due()
+            await self._send_digests()
+        finally:
+            NOTIFIER_TICK_SECONDS.observe(time.perf_counter() - started)
+    
+    async def _send_due(self):
+        while True:
+            claimed = await self.db.claim_due_reminders(
+                grace=self.grace,
+                limit=self.claim_batch,
+                lease=None if self.lease is None else (self.lease.name, self.lease.holder),
+            )
+            if not claimed:
+                return
             
-            # Определяем время до события
-            if time_until_event.total_seconds() / 60 < 20:
-                time_text = "15 минут"
-            else:
-                time_text = "1 час"
+            # Опоздавшие напоминания серий не отправляем, а переводим на следующее повторение
+            late = int(time.time()) - self.grace
+            missed = [reminder[0] for reminder in claimed if reminder[3] < late]
+            reminders = [reminder for reminder in claimed if reminder[3] >= late]
             
-            # Создаем клавиатуру с кнопкой "Посмотреть события"
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="📅 Посмотреть все события", callback_data="show_events")]
-            ])
+            # Получатели одного события (и все подписчики календаря) делят один
+            # кортеж напоминаний: тексты для него формируем один раз. Кортеж хранится
+            # рядом с текстами, чтобы его id не достался другому объекту
+            rendered = {}
+            async for batch in iter_deliveries(self.db, reminders, self.fanout_batch):
+                # Время в тексте - по поясу чата получателя: текст один на пару (кортеж, пояс)
+                chat_ids = [chat_id for chat_id, _ in batch]
+                # Чаты со сводками получат эти события в ближайшей сводке
+                digest_chats = await self.db.get_digest_chats(chat_ids)
+                if digest_chats:
+                    batch = [delivery for delivery in batch if delivery[0] not in digest_chats]
+                zones = await self.db.get_time_zones(chat_ids)
+                messages = []
+                for chat_id, items in batch:
+                    key = (id(items), zones.get(chat_id))
+                    if key not in rendered:
+                        rendered[key] = (items, format_notifications(items, get_zone(key[1])))
+                    due_at = min(reminder[3] for reminder in items)
+                    messages.extend(
+                        (chat_id, text, REMINDER_KEYBOARD, dedupe_key(items, part), due_at)
+                        for part, text in enumerate(rendered[key][1])
+                    )
+                # Упади процесс дальше, пачка захватится заново после перезапуска,
+                # а уже поставленные сообщения отсеет ключ dedupe
+                await self.db.enqueue_outbox(messages)
+                self.outbox.wake()
             
-            notification_text = (
-                f"🔔 Напоминание о событии!\n\n"
-                f"📝 {title}\n"
-                f"📅 {event_datetime.strftime('%d.%m.%Y %H:%M')}\n"
-                f"⏰ До события осталось: {time_text}\n\n"
-                f"ID события: {event_id}"
-            )
+            # Все сообщения в outbox: напоминания отработали, доставка - дело воркера
+            sent = [reminder[0] for reminder in reminders]
+            for due_at, event_id in await self.db.complete_reminders(sent, missed=missed):
+                self.scheduler.schedule(event_id, [due_at])
             
-            # Отправляем уведомление создателю события
-            await self.bot.send_message(
-                chat_id=created_by,
-                text=notification_text,
-                reply_markup=keyboard
-            )
+            if len(claimed) < self.claim_batch:
+                return
+    
+    async def _send_digests(self):
+        """
+        Поставить наступившие сводки в outbox.
+        
+        Сводки с общим сроком и видом делят окно событий: для них события
+        читаются одним запросом на окно, а не по событию на чат. Сводка
+        отмечается отработавшей после постановки; упав раньше, процесс
+        поставит ее снова, а дубль отсеет ключ dedupe.
+        """
+        shards = None if self.lease is None else self.lease.shards
+        while True:
+            due = await self.db.get_due_digests(shards, self.claim_batch)
+            if not due:
+                break
             
-            logger.info(f"Notification sent for event {event_id} to user {created_by}")
+            late = int(time.time()) - DIGEST_GRACE
+            windows = {}
+            for chat_id, kind, due_at in due:
+                # Опоздавшая сводка (бот был остановлен) просто переходит на следующий срок
+                if due_at >= late:
+                    windows.setdefault((kind, due_at), []).append(chat_id)
+            for (kind, due_at), chat_ids in windows.items():
+                events = await self.db.get_digest_events(chat_ids, due_at, due_at + DIGEST_WINDOWS[kind])
+                zones = await self.db.get_time_zones(list(events))
+                messages = [
+                    (chat_id, text, REMINDER_KEYBOARD, f"digest:{kind}:{due_at}:{part}", due_at)
+                    for chat_id, chat_events in events.items()
+                    for part, text in enumerate(format_digest(kind, chat_events, get_zone(zones.get(chat_id))))
+                ]
+                if messages:
+                    await self.db.enqueue_outbox(messages)
+                    self.outbox.wake()
+            await self.db.complete_digests([(chat_id, kind) for chat_id, kind, _ in due])
             
-        except Exception as e:
-            logger.error(f"Error sending notification for event {event[0]}: {e}")
+            if len(due) < self.claim_batch:
+                break
+        self.schedule_digest(await self.db.get_next_digest_at(shards))
     
     async def send_manual_notification(self, chat_id: int, message: str):
         """Отправка ручного уведомления"""
-        try:
-            await self.bot.send_message(chat_id=chat_id, text=message)
-        except Exception as e:
-            logger.error(f"Error sending manual notification: {e}")
+        if not await self.sender.send(chat_id=chat_id, text=message):
+            logger.error(f"Error sending manual notification to chat {chat_id}")
+
+
+def format_notifications(reminders: Sequence[tuple], zone: Optional[tzinfo] = None) -> List[str]:
+    """Тексты напоминаний: одно событие - подробно, несколько - списком по MAX_EVENTS_PER_MESSAGE"""
+    if len(reminders) == 1:
+        _, event_id, offset, _, _, title, event_date, _, _ = reminders[0]
+        return [
+            f"🔔 Напоминание о событии!\n\n"
+            f"📝 {title}\n"
+            f"📅 {format_local(event_date, zone)}\n"
+            f"⏰ До события осталось: {format_offset(offset)}\n\n"
+            f"ID события: {event_id}"
+        ]
+    
+    texts = []
+    for start in range(0, len(reminders), MAX_EVENTS_PER_MESSAGE):
+        text = "🔔 Напоминание о событиях!\n\n"
+        for _, event_id, offset, _, _, title, event_date, _, _ in reminders[start:start + MAX_EVENTS_PER_MESSAGE]:
+            text += (
+                f"🆔 {event_id} 📝 {title}\n"
+                f"📅 {format_local(event_date, zone)}, через {format_offset(offset)}\n\n"
+            )
+        texts.append(text)
+    return texts
+
 
+def format_digest(kind: str, events: Sequence[tuple], zone: Optional[tzinfo] = None) -> List[str]:
+    """Тексты сводки: события (id, title, event_date) списком по MAX_EVENTS_PER_MESSAGE"""
+    header = "☀️ События на сутки\n\n" if kind == DAILY else "⏰ События ближайшего часа\n\n"
+    texts = []
+    for start in range(0, len(events), MAX_EVENTS_PER_MESSAGE):
+        text = header
+        for event_id, title, event_date in events[start:start + MAX_EVENTS_PER_MESSAGE]:
+            text += f"🆔 {event_id} 📝 {title}\n📅 {format_local(event_date, zone)}\n\n"
+        texts.append(text)
+    return texts
 
-# Глобальная переменная для сервиса уведомлений
-notification_service = None
 
+def format_offset(offset: int) -> str:
+    """Текст "до события осталось" для смещения в секундах"""
+    if offset % 3600 == 0:
+        return _plural(offset // 3600, "час", "часа", "часов")
+    return _plural(offset // 60, "минута", "минуты", "минут")
 
-async def start_notifications(bot: Bot, db: Database):
-    """Запуск сервиса уведомлений"""
-    global notification_service
-    notification_service = NotificationService(bot, db)
-    await notification_service.start_notification_service()
 
+def _plural(number: int, one: str, few: str, many: str) -> str:
+    if number % 10 == 1 and number % 100 != 11:
+        word = one
+    elif 2 <= number % 10 <= 4 and not 12 <= number % 100 <= 14:
+        word = few
+    else:
+        word = many
+    return f"{number} {word}"
 
-async def stop_notifications():
-    """Остановка сервиса уведомлений"""
-    global notification_service
-    if notification_service:
-        await notification_service.stop_notification_service()
@@ -0,0 +1,178 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Optional, Sequence
+
+from aiogram.types import InlineKeyboardMarkup
+
+from db.database import Database
+from db.metrics import REMINDER_LATENESS_SECONDS
+from handlers.sender import SendPipeline
+
+logger = logging.getLogger(__name__)
+
+# Отправленные сообщения хранятся сутки: по ним видно message_id и время отправки
+RETENTION = 24 * 60 * 60
+
+
+def dedupe_key(reminders: Sequence[tuple], part: int = 0) -> str:
+    """Ключ сообщения о наборе напоминаний: один и тот же для повторной постановки после падения"""
+    ids = ",".join(f"{reminder[0]}@{reminder[3]}" for reminder in sorted(reminders))
+    return f"{hashlib.sha1(ids.encode()).hexdigest()}:{part}"
+
+
+class OutboxWorker:
+    """
+    Доставка сообщений из таблицы outbox: хотя бы один раз, с переживанием падений.
+
+    Воркер арендует готовые строки на lease_ttl секунд, отправляет их через
+    конвейер и записывает message_id отправленных. Пока пачка отправляется,
+    аренда продлевается каждые lease_ttl / 3 секунд: сто сообщений одному
+    чату при лимите сообщение в секунду или пауза retry_after идут дольше
+    аренды, и без продления их арендовал бы и отправил второй раз другой
+    процесс. Неудачные отправки
+    повторяются с растущей задержкой, после max_attempts попыток строка
+    помечается failed. Если процесс упал посреди отправки, его строки
+    вернутся в очередь: при перезапуске единственного воркера сразу
+    (release_outbox), при нескольких процессах - по истечении аренды. Сообщение,
+    отправленное перед самым падением, может прийти повторно; потеряться - нет.
+    """
+    
+    def __init__(
+        self,
+        db: Database,
+        sender: SendPipeline,
+        batch: int = 100,
+        lease_ttl: float = 60.0,
+        max_attempts: int = 3,
+        retry_delay: float = 30.0,
+        poll_interval: float = 1.0,
+        holder: Optional[str] = None,
+    ):
+        self.db = db
+        self.sender = sender
+        self.batch = batch
+        self.lease_ttl = lease_ttl
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        # Строки других процессов и сроки повторов замечаем опросом раз в poll_interval секунд
+        self.poll_interval = poll_interval
+        self.holder = holder or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+        self._pruned_at = 0.0
+    
+    def start(self):
+        """Запустить доставку в фоне"""
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+    
+    def wake(self):
+        """В outbox появились новые сообщения"""
+        self._wakeup.set()
+    
+    async def stop(self, timeout: float = 10.0):
+        """Доотправить готовые сообщения (не дольше timeout) и вернуть в очередь недоставленные"""
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            try:
+                await asyncio.wait_for(asyncio.shield(self._task), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Outbox was not drained in time")
+                self._task.cancel()
+                await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        released = await self.db.release_outbox(self.holder)
+        if released:
+            logger.warning(f"Returned {released} leased outbox messages to the queue")
+    
+    async def drain(self) -> int:
+        """Отправить все готовые сообщения; вернуть их число"""
+        total = 0
+        while True:
+            delivered = await self.deliver_ready()
+            total += delivered
+            if delivered == 0:
+                return total
+    
+    async def _run(self):
+        while True:
+            try:
+                if self._stopping:
+                    await self.drain()
+                    return
+                delivered = await self.deliver_ready()
+                await self._prune()
+            except Exception as e:
+                logger.error(f"Error delivering outbox messages: {e}")
+                if self._stopping:
+                    return
+                delivered = 0
+            # Полная пачка - в очереди, скорее всего, есть еще
+            if delivered < self.batch:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+    
+    async def deliver_ready(self) -> int:
+        """Арендовать и отправить одну пачку готовых сообщений; вернуть ее размер"""
+        rows = await self.db.lease_outbox(self.holder, self.batch, self.lease_ttl)
+        if not rows:
+            return 0
+        keeper = asyncio.create_task(self._keep_lease())
+        try:
+            results = await asyncio.gather(*(
+                self.sender.submit_tracked(chat_id, text, **_markup(reply_markup))
+                for _, chat_id, text, reply_markup, _, _ in rows
+            ))
+        finally:
+            keeper.cancel()
+            await asyncio.gather(keeper, return_exceptions=True)
+        
+        sent, retry, failed = [], [], []
+        now = time.time()
+        for (outbox_id, chat_id, _, _, attempts, due_at), (ok, message_id) in zip(rows, results):
+            if ok:
+                sent.append((outbox_id, message_id))
+                if due_at is not None:
+                    REMINDER_LATENESS_SECONDS.observe(now - due_at)
+            elif attempts < self.max_attempts:
+                retry.append((outbox_id, now + self.retry_delay * 2 ** (attempts - 1)))
+            else:
+                logger.error(f"Giving up outbox message {outbox_id} to chat {chat_id} after {attempts} attempts")
+                failed.append(outbox_id)
+        await self.db.complete_outbox(sent, retry, failed)
+        return len(rows)
+    
+    async def _keep_lease(self):
+        """Продлевать аренду строк текущей пачки, пока она отправляется"""
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            try:
+                await self.db.extend_outbox_lease(self.holder, self.lease_ttl)
+            except Exception as e:
+                logger.error(f"Error extending outbox lease: {e}")
+    
+    async def _prune(self):
+        """Раз в час удалять отработавшие строки старше RETENTION"""
+        now = time.time()
+        if now - self._pruned_at >= 3600:
+            self._pruned_at = now
+            await self.db.prune_outbox(int(now) - RETENTION)
+
+
+def _markup(reply_markup: Optional[str]) -> dict:
+    """Аргументы send_message для клавиатуры, сохраненной в outbox в JSON"""
+    if reply_markup is None:
+        return {}
+    return {"reply_markup": InlineKeyboardMarkup.model_validate(json.loads(reply_markup))}
@@ -0,0 +1,113 @@
+import asyncio
+import heapq
+import logging
+import time
+from typing import Awaitable, Callable, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (due_at, event_id) - срок напоминания и событие, к которому оно относится
+Wakeup = Tuple[int, int]
+
+
+class ReminderScheduler:
+    """
+    Таймер напоминаний на двоичной куче, упорядоченной по времени срабатывания.
+
+    Источник истины - таблица reminders, а куча только подсказывает, когда
+    проснуться: лишнее пробуждение стоит одного пустого запроса, а пропущенное
+    означает опоздавшее напоминание. Поэтому отмена ленивая: записи удаленных
+    событий не ищутся в куче, а отбрасываются при извлечении.
+    """
+    
+    def __init__(self):
+        self._heap: List[Wakeup] = []
+        self._cancelled: Set[int] = set()
+        self._wakeup = asyncio.Event()
+        self.running = False
+    
+    def __len__(self) -> int:
+        return len(self._heap)
+    
+    def schedule(self, event_id: int, due_times: Iterable[int]):
+        """Запланировать напоминания о событии"""
+        self._cancelled.discard(event_id)
+        for due_at in due_times:
+            if not self._heap or due_at < self._heap[0][0]:
+                self.wake()
+            heapq.heappush(self._heap, (due_at, event_id))
+    
+    def schedule_many(self, wakeups: Iterable[Wakeup]):
+        """Запланировать много напоминаний разом (загрузка при старте): heapify за O(n)"""
+        wakeups = list(wakeups)
+        if len(wakeups) * 8 < len(self._heap):
+            # Немного новых в большую кучу дешевле добавить по одному
+            for due_at, event_id in wakeups:
+                self.schedule(event_id, [due_at])
+            return
+        self._heap.extend(wakeups)
+        heapq.heapify(self._heap)
+        self.wake()
+    
+    def clear(self):
+        """Забыть все напоминания (перед повторной загрузкой из базы)"""
+        self._heap = []
+        self._cancelled.clear()
+    
+    def cancel(self, event_id: int):
+        """Отменить напоминания об удаленном событии"""
+        self._cancelled.add(event_id)
+        # Пересобираем кучу, когда отмененных накопилось много, чтобы не держать их в памяти
+        if len(self._cancelled) > 1000 and len(self._cancelled) * 2 > len(self._heap):
+            self._heap = [entry for entry in self._heap if entry[1] not in self._cancelled]
+            heapq.heapify(self._heap)
+            self._cancelled.clear()
+    
+    def next_due(self) -> Optional[int]:
+        """Время ближайшего действительного напоминания"""
+        self._drop_cancelled()
+        return self._heap[0][0] if self._heap else None
+    
+    def pop_due(self, now: Optional[float] = None) -> List[Wakeup]:
+        """Извлечь все напоминания, срок которых наступил"""
+        now = time.time() if now is None else now
+        due = []
+        while True:
+            self._drop_cancelled()
+            if not self._heap or self._heap[0][0] > now:
+                return due
+            due.append(heapq.heappop(self._heap))
+    
+    def wake(self):
+        """Разбудить цикл run() (новое раннее напоминание или остановка)"""
+        self._wakeup.set()
+    
+    async def run(self, handler: Callable[[List[Wakeup]], Awaitable[None]]):
+        """Спать до ближайшего напоминания и передавать наступившие в handler"""
+        self.running = True
+        while self.running:
+            due = self.pop_due()
+            if due:
+                try:
+                    await handler(due)
+                except Exception as e:
+                    logger.error(f"Error handling reminders: {e}")
+                continue
+            
+            next_due = self.next_due()
+            timeout = None if next_due is None else max(0.0, next_due - time.time())
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+    
+    def stop(self):
+        """Остановить цикл run()"""
+        self.running = False
+        self.wake()
+    
+    def _drop_cancelled(self):
+        heap = self._heap
+        while heap and heap[0][1] in self._cancelled:
+            heapq.heappop(heap)
@@ -0,0 +1,266 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+from db.metrics import MESSAGES_TOTAL
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Telegram: около 30 сообщений в секунду всего и 1 в секунду в один чат
+GLOBAL_RATE = 30.0
+CHAT_RATE = 1.0
+
+
+class TokenBucket:
+    """
+    Корзина токенов: rate токенов в секунду, не больше capacity подряд.
+
+    Токены можно занимать вперед: баланс уходит в минус, а reserve()
+    возвращает, сколько ждать до своего слота. Так конкурентные отправители
+    получают разные слоты без блокировок.
+    """
+    
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        # Плановое время последнего фактического использования токена
+        self.last_used = float("-inf")
+    
+    def reserve(self, now: Optional[float] = None) -> float:
+        """Занять токен; вернуть задержку в секундах до отправки"""
+        self._refill(time.monotonic() if now is None else now)
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+    
+    def penalize(self, delay: float, now: Optional[float] = None):
+        """Не выдавать токены ближайшие delay секунд (ответ retry_after)"""
+        self._refill(time.monotonic() if now is None else now)
+        self.tokens = min(self.tokens, 1 - delay * self.rate)
+    
+    def is_idle(self, now: float) -> bool:
+        """Корзина полна, ее можно забыть без изменения поведения"""
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+    
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+@dataclass
+class SendMetrics:
+    """Счетчики конвейера отправки"""
+    sent: int = 0
+    failed: int = 0
+    retried: int = 0
+    rate_limited: int = 0
+    # Задержка от постановки в очередь до успешной отправки, последние значения
+    latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=10000))
+    
+    def latency_percentile(self, q: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+@dataclass
+class _Outgoing:
+    chat_id: int
+    text: str
+    kwargs: Dict[str, Any]
+    future: Optional[asyncio.Future]
+    enqueued_at: float
+    attempts: int = 0
+    # Слот в лимите чата уже занят при отложенной постановке в очередь
+    chat_slot_reserved: bool = False
+    # future завершится (успех, message_id) вместо успеха (submit_tracked)
+    tracked: bool = False
+    message_id: Optional[int] = None
+
+
+class SendPipeline:
+    """
+    Конвейер отправки сообщений: ограниченный пул воркеров, лимиты Telegram
+    (общий и на чат) и повторы с учетом retry_after.
+
+    Сообщение, чей чат исчерпал лимит, не держит воркер: оно занимает слот
+    в корзине чата и возвращается в очередь к своему времени.
+    """
+    
+    def __init__(
+        self,
+        bot: Bot,
+        workers: int = 8,
+        global_rate: float = GLOBAL_RATE,
+        chat_rate: float = CHAT_RATE,
+        max_retries: int = 3,
+        backoff: float = 1.0,
+    ):
+        self.bot = bot
+        self.workers = workers
+        self.chat_rate = chat_rate
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.metrics = SendMetrics()
+        self._global = TokenBucket(global_rate)
+        self._chats: Dict[int, TokenBucket] = {}
+        self._queue: "asyncio.Queue[_Outgoing]" = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        self._pending = 0
+        self._deferred = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+    
+    @property
+    def queue_depth(self) -> int:
+        """Сообщения, ожидающие отправки (в очереди и отложенные)"""
+        return self._queue.qsize() + self._deferred
+    
+    def stats(self) -> Dict[str, float]:
+        return {
+            "queue_depth": self.queue_depth,
+            "pending": self._pending,
+            "sent": self.metrics.sent,
+            "failed": self.metrics.failed,
+            "retried": self.metrics.retried,
+            "rate_limited": self.metrics.rate_limited,
+            "latency_p50": self.metrics.latency_percentile(50),
+            "latency_p99": self.metrics.latency_percentile(99),
+        }
+    
+    def start(self):
+        """Запустить воркеры (вызывается и автоматически при первой отправке)"""
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+    
+    async def stop(self, timeout: float = 10.0):
+        """Дождаться отправки очереди (не дольше timeout) и остановить воркеры"""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Send pipeline stopped with {self._pending} messages not sent")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+    
+    def submit(self, chat_id: int, text: str, **kwargs) -> asyncio.Future:
+        """Поставить сообщение в очередь; future завершится True/False"""
+        return self._enqueue(_Outgoing(chat_id, text, kwargs, None, time.monotonic()))
+    
+    def submit_tracked(self, chat_id: int, text: str, **kwargs) -> asyncio.Future:
+        """Поставить сообщение в очередь; future завершится (успех, message_id отправленного сообщения)"""
+        return self._enqueue(_Outgoing(chat_id, text, kwargs, None, time.monotonic(), tracked=True))
+    
+    async def send(self, chat_id: int, text: str, **kwargs) -> bool:
+        """Отправить сообщение через конвейер и дождаться результата"""
+        return await self.submit(chat_id, text, **kwargs)
+    
+    def _enqueue(self, item: _Outgoing) -> asyncio.Future:
+        self.start()
+        item.future = asyncio.get_running_loop().create_future()
+        self._pending += 1
+        self._idle.clear()
+        self._queue.put_nowait(item)
+        return item.future
+    
+    async def _worker(self):
+        while True:
+            item = await self._queue.get()
+            try:
+                await self._process(item)
+            except Exception as e:
+                logger.error(f"Unexpected error in send pipeline: {e}")
+                self._finish(item, False)
+            finally:
+                self._queue.task_done()
+    
+    async def _process(self, item: _Outgoing):
+        if not item.chat_slot_reserved:
+            delay = self._chat_bucket(item.chat_id).reserve()
+            if delay > 0:
+                item.chat_slot_reserved = True
+                self._defer(item, delay)
+                return
+        item.chat_slot_reserved = False
+        
+        # Ожидание общего лимита сдвигает отправку; не даем ему сблизить
+        # два сообщения в один чат, уже получившие свои слоты
+        now = time.monotonic()
+        chat = self._chat_bucket(item.chat_id)
+        send_at = max(now + self._global.reserve(now), chat.last_used + 1 / self.chat_rate)
+        chat.last_used = send_at
+        if send_at > now:
+            await asyncio.sleep(send_at - now)
+        
+        try:
+            result = await self.bot.send_message(chat_id=item.chat_id, text=item.text, **item.kwargs)
+        except TelegramRetryAfter as e:
+            self.metrics.rate_limited += 1
+            MESSAGES_TOTAL.inc("rate_limited")
+            # Telegram сам говорит, когда можно повторить: блокируем чат до этого времени
+            self._chat_bucket(item.chat_id).penalize(e.retry_after)
+            self._retry(item, 0.0, e)
+        except (TelegramNetworkError, TelegramServerError) as e:
+            delay = self.backoff * 2 ** item.attempts * random.uniform(1.0, 1.5)
+            self._retry(item, delay, e)
+        except Exception as e:
+            logger.error(f"Error sending message to chat {item.chat_id}: {e}")
+            self._finish(item, False)
+        else:
+            self.metrics.latencies.append(time.monotonic() - item.enqueued_at)
+            item.message_id = getattr(result, "message_id", None)
+            self._finish(item, True)
+    
+    def _retry(self, item: _Outgoing, delay: float, error: Exception):
+        if item.attempts >= self.max_retries:
+            logger.error(f"Giving up sending message to chat {item.chat_id} after {item.attempts + 1} attempts: {error}")
+            self._finish(item, False)
+            return
+        item.attempts += 1
+        self.metrics.retried += 1
+        MESSAGES_TOTAL.inc("retried")
+        self._defer(item, delay)
+    
+    def _defer(self, item: _Outgoing, delay: float):
+        self._deferred += 1
+        asyncio.get_running_loop().call_later(delay, self._requeue, item)
+    
+    def _requeue(self, item: _Outgoing):
+        self._deferred -= 1
+        self._queue.put_nowait(item)
+    
+    def _finish(self, item: _Outgoing, success: bool):
+        if item.future.done():
+            return
+        item.future.set_result((success, item.message_id) if item.tracked else success)
+        if success:
+            self.metrics.sent += 1
+            MESSAGES_TOTAL.inc("sent")
+        else:
+            self.metrics.failed += 1
+            MESSAGES_TOTAL.inc("failed")
+        self._pending -= 1
+        if self._pending == 0:
+            self._idle.set()
+    
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= 10000:
+                self._forget_idle_chats()
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate)
+        return bucket
+    
+    def _forget_idle_chats(self):
+        now = time.monotonic()
+        self._chats = {chat_id: bucket for chat_id, bucket in self._chats.items() if not bucket.is_idle(now)}
@@ -1,13 +1,23 @@
 import asyncio
 import logging
 import os
+from typing import Optional
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from dotenv import load_dotenv
 
+from handlers.callbacks import router as callbacks_router
 from handlers.commands import router as commands_router
-from handlers.notifications import start_notifications, stop_notifications
+from handlers.leader import ShardLeases
+from handlers.middleware import MetricsMiddleware
+from handlers.notifications import NotificationService
+from handlers.sender import GLOBAL_RATE, SendPipeline
 from db.database import Database
+from db.fsm_storage import SQLiteStorage
+from db.metrics import QUEUE_DEPTH
+from main.metrics import MetricsServer
+from main.webhook import WebhookServer
 
 # Загружаем переменные окружения
 load_dotenv()
@@ -26,39 +36,116 @@ class CalendarBot:
         if not self.bot_token:
             raise ValueError("BOT_TOKEN не найден в переменных окружения!")
         
-        self.bot = Bot(token=self.bot_token)
-        self.dp = Dispatcher(storage=MemoryStorage())
-        self.db = Database()
+        # Свой сервер Bot API: telegram-bot-api в локальном режиме или тестовый (benchmarks/bench_e2e.py)
+        api_url = os.getenv('TELEGRAM_API_URL')
+        session = AiohttpSession(api=TelegramAPIServer.from_base(api_url)) if api_url else None
+        self.bot = Bot(token=self.bot_token, session=session)
+        self.db = Database(os.getenv('DB_PATH', 'calendar.db'))
+        # Несколько процессов бота могут работать с одной базой: шарды напоминаний
+        # делятся между ними через аренды, состояния диалогов хранятся в базе
+        self.lease = ShardLeases(self.db, ttl=float(os.getenv('NOTIFIER_LEASE_TTL', '30')))
+        # Лимит Telegram общий на токен: при N процессах задайте SEND_GLOBAL_RATE=30/N
+        sender = SendPipeline(self.bot, global_rate=float(os.getenv('SEND_GLOBAL_RATE', str(GLOBAL_RATE))))
+        self.notifier = NotificationService(self.bot, self.db, sender=sender, lease=self.lease)
+        # Пользователи Telegram через запятую, которым доступна /stats
+        admins = frozenset(int(user_id) for user_id in os.getenv('ADMIN_IDS', '').split(',') if user_id.strip())
+        # db, notifier и admins передаются в обработчики через workflow_data диспетчера
+        self.dp = Dispatcher(storage=SQLiteStorage(self.db), db=self.db, notifier=self.notifier, admins=admins)
+        
+        # Время обработчиков пишется в метрики (inner-middleware действует и во вложенных роутерах)
+        self.dp.message.middleware(MetricsMiddleware())
+        self.dp.callback_query.middleware(MetricsMiddleware())
         
         # Регистрируем роутеры
         self.dp.include_router(commands_router)
+        self.dp.include_router(callbacks_router)
+        
+        # Режим получения обновлений: polling (по умолчанию) или webhook
+        self.mode = os.getenv('BOT_MODE', 'polling').lower()
+        if self.mode not in ('polling', 'webhook'):
+            raise ValueError(f"Неизвестный BOT_MODE: {self.mode}")
+        self.webhook_url = os.getenv('WEBHOOK_URL')
+        self.webhook_host = os.getenv('WEBHOOK_HOST', '127.0.0.1')
+        self.webhook_port = int(os.getenv('WEBHOOK_PORT', '8080'))
+        self.webhook = WebhookServer(
+            self.dp,
+            self.bot,
+            path=os.getenv('WEBHOOK_PATH', '/webhook'),
+            secret_token=os.getenv('WEBHOOK_SECRET') or None,
+            concurrency=int(os.getenv('WEBHOOK_CONCURRENCY', '64')),
+        )
+        QUEUE_DEPTH.set_function(lambda: sender.queue_depth, "send")
+        QUEUE_DEPTH.set_function(lambda: self.webhook.stats()["queue_depth"], "webhook")
+        
+        # /metrics для Prometheus: без METRICS_PORT сервер не запускается
+        self.metrics_port = int(os.getenv('METRICS_PORT', '0'))
+        self.metrics_host = os.getenv('METRICS_HOST', '127.0.0.1')
+        self.metrics = MetricsServer()
+        self.notification_task: Optional[asyncio.Task] = None
     
     async def start(self):
         """Запуск бота"""
         try:
             logger.info("Starting calendar bot...")
             
-            # Запускаем сервис уведомлений в фоне
-            notification_task = asyncio.create_task(
-                start_notifications(self.bot, self.db)
+            if self.metrics_port:
+                await self.metrics.start(self.metrics_host, self.metrics_port)
+            
+            # Запускаем сервис уведомлений в фоне; stop() дожидается его завершения
+            self.notification_task = asyncio.create_task(
+                self.notifier.start_notification_service()
             )
             
             # Запускаем бота
-            await self.dp.start_polling(self.bot)
-            
+            if self.mode == 'webhook':
+                await self.serve_webhook()
+            else:
+                # getUpdates не работает, пока у бота установлен webhook
+                await self.bot.delete_webhook()
+                await self.dp.start_polling(self.bot)
+                
         except Exception as e:
             logger.error(f"Error starting bot: {e}")
         finally:
             await self.stop()
     
+    async def serve_webhook(self):
+        """Принимать обновления через webhook до отмены задачи"""
+        await self.webhook.start(self.webhook_host, self.webhook_port)
+        if self.webhook_url:
+            # Несколько реплик за балансировщиком регистрируют один и тот же адрес
+            await self.bot.set_webhook(
+                self.webhook_url,
+                secret_token=self.webhook.secret_token,
+                allowed_updates=self.dp.resolve_used_update_types(),
+            )
+        await asyncio.Event().wait()
+    
     async def stop(self):
         """Остановка бота"""
         try:
             logger.info("Stopping calendar bot...")
-            await stop_notifications()
+            # Сначала дообрабатываем принятые обновления: им могут понадобиться база и бот
+            await self.webhook.stop()
+            # Сервис дожидается текущей пачки и доотправляет outbox, пока сессия бота открыта
+            await self.notifier.stop_notification_service()
+            await self._finish_notification_task()
             await self.bot.session.close()
+            await self.metrics.stop()
+            self.db.close()
         except Exception as e:
             logger.error(f"Error stopping bot: {e}")
+    
+    async def _finish_notification_task(self):
+        """Дождаться задачи сервиса уведомлений (после остановки сервиса она завершается сама)"""
+        task, self.notification_task = self.notification_task, None
+        if task is None:
+            return
+        if not task.done():
+            task.cancel()
+        for result in await asyncio.gather(task, return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.error(f"Notification service failed: {result}")
 
 
 async def main():
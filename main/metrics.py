@@ -0,0 +1,46 @@
+"""
+HTTP-эндпоинт /metrics для Prometheus (aiohttp).
+
+Отдает REGISTRY в текстовом формате; по умолчанию слушает только
+127.0.0.1, наружу метрики выставляет агент сбора или обратный прокси.
+"""
+
+import logging
+from typing import Optional
+
+from aiohttp import web
+
+from db.metrics import REGISTRY, Registry
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MetricsServer:
+    """Отдельный от webhook HTTP-сервер с одним маршрутом GET /metrics"""
+    
+    def __init__(self, registry: Registry = REGISTRY, path: str = "/metrics"):
+        self.registry = registry
+        self.path = path
+        self._runner: Optional[web.AppRunner] = None
+    
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get(self.path, self.handle)
+        return app
+    
+    async def start(self, host: str = "127.0.0.1", port: int = 9100):
+        self._runner = web.AppRunner(self.make_app(), handle_signals=False, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info(f"Metrics server listening on {host}:{port}{self.path}")
+    
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+    
+    async def handle(self, request: web.Request) -> web.Response:
+        # content_type в aiohttp не принимает параметры, поэтому заголовок целиком
+        return web.Response(body=self.registry.expose().encode(), headers={"Content-Type": CONTENT_TYPE})
@@ -0,0 +1,131 @@
+"""
+Прием обновлений Telegram через webhook (aiohttp) вместо long polling.
+
+Запрос с обновлением только кладется в ограниченную очередь, и Telegram
+сразу получает ответ 200; обновления обрабатывают concurrency воркеров.
+Переполненная очередь задерживает ответ, и Telegram сам снижает темп
+доставки. При остановке сервер перестает принимать запросы, дожидается
+обработки очереди и только потом останавливает воркеры.
+"""
+
+import asyncio
+import logging
+import secrets
+import time
+from typing import Dict, List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """HTTP-эндпоинт для обновлений с пулом обработчиков и плавной остановкой"""
+    
+    def __init__(
+        self,
+        dp: Dispatcher,
+        bot: Bot,
+        path: str = "/webhook",
+        secret_token: Optional[str] = None,
+        concurrency: int = 64,
+        queue_size: int = 1000,
+        drain_timeout: float = 30.0,
+    ):
+        self.dp = dp
+        self.bot = bot
+        self.path = path
+        self.secret_token = secret_token
+        self.concurrency = concurrency
+        self.drain_timeout = drain_timeout
+        self.received = 0
+        self.processed = 0
+        self.failed = 0
+        self._queue: "asyncio.Queue[Update]" = asyncio.Queue(maxsize=queue_size)
+        self._tasks: List[asyncio.Task] = []
+        self._runner: Optional[web.AppRunner] = None
+        self._closing = False
+    
+    def stats(self) -> Dict[str, int]:
+        return {
+            "received": self.received,
+            "processed": self.processed,
+            "failed": self.failed,
+            "queue_depth": self._queue.qsize(),
+        }
+    
+    def make_app(self) -> web.Application:
+        """Приложение aiohttp: воркеры запускаются при старте и останавливаются при очистке"""
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        app.on_startup.append(self._on_startup)
+        app.on_shutdown.append(self._on_shutdown)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+    
+    async def start(self, host: str = "127.0.0.1", port: int = 8080):
+        """Начать принимать обновления на host:port"""
+        self._runner = web.AppRunner(self.make_app(), handle_signals=False, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info(f"Webhook server listening on {host}:{port}{self.path} with {self.concurrency} workers")
+    
+    async def stop(self):
+        """Перестать принимать запросы и дообработать принятые обновления"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+    
+    async def handle(self, request: web.Request) -> web.Response:
+        if self._closing:
+            # Telegram повторит доставку на другую реплику или после перезапуска
+            return web.Response(status=503)
+        if self.secret_token is not None and not secrets.compare_digest(
+            request.headers.get(SECRET_HEADER, ""), self.secret_token
+        ):
+            return web.Response(status=401)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception as e:
+            logger.warning(f"Rejected webhook request: {e}")
+            return web.Response(status=400)
+        self.received += 1
+        await self._queue.put(update)
+        return web.Response()
+    
+    async def _worker(self):
+        while True:
+            update = await self._queue.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Error processing update {update.update_id}: {e}")
+            finally:
+                self._queue.task_done()
+    
+    async def _on_startup(self, app: web.Application):
+        self._closing = False
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+    
+    async def _on_shutdown(self, app: web.Application):
+        # Сокет уже закрыт, но по открытым keep-alive соединениям еще могут прийти запросы
+        self._closing = True
+    
+    async def _on_cleanup(self, app: web.Application):
+        # Сюда aiohttp приходит, когда текущие запросы отвечены
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self._queue.join(), self.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Webhook server stopped with {self._queue.qsize()} updates not processed")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info(f"Webhook server drained in {time.monotonic() - started:.2f}s")
@@ -0,0 +1,69 @@
+import pytest
+
+from db.cache import TTLCache
+
+
+class TestTTLCache:
+    def test_hit_and_miss_counters(self):
+        """Тест счетчиков попаданий и промахов"""
+        cache = TTLCache()
+        assert cache.get("a") is None
+        cache.set("a", 1)
+        assert cache.get("a") == 1
+        
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+        assert cache.stats()["hit_rate"] == pytest.approx(0.5)
+    
+    def test_ttl_expiry(self):
+        """Тест истечения записи по ttl и по expires_at"""
+        cache = TTLCache(ttl=10)
+        cache.set("a", 1)
+        cache.set("b", 2, expires_at=0)
+        
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("a", now=10 ** 12) is None
+        assert len(cache) == 0
+    
+    def test_lru_eviction(self):
+        """Тест вытеснения давно не использованной записи"""
+        cache = TTLCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+        assert cache.evictions == 1
+    
+    def test_invalidate_by_tag(self):
+        """Тест сброса записей по тегу"""
+        cache = TTLCache()
+        cache.set("all", 1, tags=("events",))
+        cache.set("user", 2, tags=("events", ("user", 1)))
+        cache.set("other", 3, tags=(("user", 2),))
+        cache.invalidate(("user", 1))
+        
+        assert cache.get("user") is None
+        assert cache.get("all") == 1
+        cache.invalidate("events")
+        assert cache.get("all") is None
+        assert cache.get("other") == 3
+    
+    def test_stale_read_is_not_cached(self):
+        """Тест того, что результат чтения, начатого до инвалидации, не попадает в кэш"""
+        cache = TTLCache()
+        generation = cache.generation
+        cache.invalidate("events")
+        cache.set("all", 1, tags=("events",), generation=generation)
+        
+        assert cache.get("all") is None
+    
+    def test_zero_ttl_disables_cache(self):
+        """Тест отключения кэша через ttl=0"""
+        cache = TTLCache(ttl=0)
+        cache.set("a", 1)
+        assert cache.get("a") is None
@@ -0,0 +1,68 @@
+import io
+from datetime import datetime, timezone
+
+from db.calendar_files import (
+    ICS_FOOTER,
+    ICS_HEADER,
+    ParseStats,
+    iter_csv,
+    iter_ics,
+    iter_ics_events,
+    parse_ics_datetime,
+)
+
+
+class TestIcs:
+    def test_round_trip(self):
+        """Тест выгрузки в .ics и обратного разбора, включая экранирование и переносы"""
+        description = "Повестка; пункты, по порядку\nвторая строка " + "ж" * 80
+        rows = [(1, "Встреча, важная", description, 1_900_000_000, 7, 1_800_000_000)]
+        text = ICS_HEADER + "".join(iter_ics_events(rows)) + ICS_FOOTER
+        
+        assert all(len(line.encode()) <= 75 for line in text.split("\r\n"))
+        assert list(iter_ics(io.StringIO(text, newline=""))) == [("Встреча, важная", description, 1_900_000_000)]
+    
+    def test_dtstart_formats(self):
+        """Тест форматов DTSTART: UTC, часовой пояс, локальное время и дата"""
+        utc = int(datetime(2030, 1, 15, 12, 0, tzinfo=timezone.utc).timestamp())
+        assert parse_ics_datetime("20300115T120000Z") == utc
+        assert parse_ics_datetime("20300115T150000", "Europe/Moscow") == utc
+        assert parse_ics_datetime("20300115T150000") == int(datetime(2030, 1, 15, 15, 0).timestamp())
+        assert parse_ics_datetime("20300115") == int(datetime(2030, 1, 15).timestamp())
+    
+    def test_invalid_events_are_skipped(self):
+        """Тест пропуска событий без даты и с неверной датой"""
+        text = "\n".join([
+            "BEGIN:VCALENDAR",
+            "BEGIN:VEVENT", "SUMMARY:Без даты", "END:VEVENT",
+            "BEGIN:VEVENT", "SUMMARY:Плохая дата", "DTSTART:2030-01-15", "END:VEVENT",
+            "BEGIN:VEVENT", "SUMMARY:Хорошее", "DTSTART;VALUE=DATE-TIME:20300115T120000Z", "END:VEVENT",
+            "END:VCALENDAR",
+        ])
+        stats = ParseStats()
+        events = list(iter_ics(io.StringIO(text), stats))
+        
+        assert [event[0] for event in events] == ["Хорошее"]
+        assert (stats.parsed, stats.skipped) == (1, 2)
+
+
+class TestCsv:
+    def test_parse(self):
+        """Тест разбора CSV с разными форматами даты"""
+        text = (
+            "title,description,event_date\n"
+            "Встреча,Обсуждение,2030-01-15 15:00\n"
+            "UTC,,2030-01-15T12:00:00Z\n"
+            "Epoch,Описание,1900000000\n"
+            ",Без названия,2030-01-15\n"
+            "Плохая дата,,завтра\n"
+        )
+        stats = ParseStats()
+        events = list(iter_csv(io.StringIO(text), stats))
+        
+        assert events == [
+            ("Встреча", "Обсуждение", int(datetime(2030, 1, 15, 15, 0).timestamp())),
+            ("UTC", "UTC", int(datetime(2030, 1, 15, 12, 0, tzinfo=timezone.utc).timestamp())),
+            ("Epoch", "Описание", 1_900_000_000),
+        ]
+        assert stats.skipped == 2
@@ -0,0 +1,112 @@
+import sqlite3
+from datetime import date, datetime
+import pytest
+
+from db.database import Database
+from db.timezones import get_zone
+from handlers.calendar_views import (
+    MONTH,
+    NOOP,
+    WEEK,
+    day_bounds,
+    format_day,
+    parse_month,
+    plural_events,
+    shift_view,
+    view_keyboard,
+    view_start,
+)
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / "calendar.db"))
+    yield database
+    database.close()
+
+
+def at(day: int, hour: int, minute: int = 0, zone=None) -> int:
+    return int(datetime(2030, 3, day, hour, minute, tzinfo=zone).timestamp())
+
+
+def brute_counts(db: Database, chat_id: int, bounds) -> list:
+    """Число обычных событий по дням прямым подсчетом по таблице events"""
+    with sqlite3.connect(db.db_path) as conn:
+        return [
+            conn.execute("""
+                SELECT COUNT(*) FROM events WHERE chat_id = ? AND rrule IS NULL AND event_date >= ? AND event_date < ?
+            """, (chat_id, start, end)).fetchone()[0]
+            for start, end in zip(bounds, bounds[1:])
+        ]
+
+
+@pytest.mark.asyncio
+class TestDayCounts:
+    async def test_counts_follow_every_write(self, db):
+        """Тест счетчиков по дням: добавление, удаление, импорт и /repeat, другие чаты не видны"""
+        zone = get_zone("Asia/Kolkata")
+        bounds = day_bounds(date(2030, 3, 1), 31, zone)
+        # У Калькутты смещение +5:30: 00:10 по местному времени - еще предыдущие сутки UTC
+        first = await db.add_event("Ночное", "", at(2, 0, 10, zone), 1, chat_id=-100)
+        await db.add_event("Ночное", "", at(2, 23, 50, zone), 2, chat_id=-100)
+        doomed = await db.add_event("Удалим", "", at(5, 12, 0, zone), 1, chat_id=-100)
+        await db.add_event("Другой чат", "", at(2, 12, 0, zone), 1, chat_id=-200)
+        imported = [("Импорт", "", at(31, 23, 59, zone)), ("Импорт", "", at(7, 9, 0, zone))]
+        await db.import_events(iter(imported), 1, chat_id=-100)
+        
+        counts = await db.get_day_counts(-100, bounds)
+        assert counts[1] == 2 and counts[4] == 1 and counts[30] == 1 and sum(counts) == 5
+        
+        assert await db.delete_event(doomed, 1)
+        # Событие становится серией: вместо одного дня оно теперь в каждом дне после него
+        assert await db.set_recurrence(first, 1, "daily")
+        counts = await db.get_day_counts(-100, bounds)
+        assert counts[:5] == [0, 2, 1, 1, 1]
+        assert [count - (day >= 1) for day, count in enumerate(counts)] == brute_counts(db, -100, bounds)
+        assert await db.set_recurrence(first, 1, None)
+        assert await db.get_day_counts(-100, bounds) == brute_counts(db, -100, bounds)
+    
+    async def test_day_events(self, db):
+        """Тест событий дня: обычные и повторения серий по времени, лимит"""
+        series = await db.add_event("Планерка", "", at(1, 10), 1, rrule="daily", chat_id=-100)
+        early = await db.add_event("Завтрак", "", at(3, 8), 1, chat_id=-100)
+        await db.add_event("Ужин", "", at(3, 19), 1, chat_id=-100)
+        
+        bounds = day_bounds(date(2030, 3, 3), 1, None)
+        events = await db.get_day_events(-100, bounds[0], bounds[1], limit=2)
+        
+        assert [(row[0], row[3]) for row in events] == [(early, at(3, 8)), (series, at(3, 10))]
+        assert (await db.get_day_counts(-100, bounds))[0] == 3
+        text = format_day(date(2030, 3, 3), events, 3)
+        assert "3 события" in text and "🕐 08:00 📝 Завтрак" in text and "еще 1 событие" in text
+
+
+class TestViews:
+    def test_month_grid(self):
+        """Тест сетки месяца: пустые клетки до первого числа, счетчики, лимит callback_data"""
+        first = parse_month("2030-03")
+        assert first == parse_month("03.2030") == view_start(MONTH, date(2030, 3, 17))
+        counts = [0] * 31
+        counts[14] = 3
+        keyboard = view_keyboard(MONTH, first, counts).inline_keyboard
+        
+        # 1 марта 2030 - пятница: четыре пустые клетки и 31 день - ровно пять недель
+        assert [button.text for button in keyboard[0]] == ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+        assert [button.callback_data for button in keyboard[1][:5]] == [NOOP] * 4 + ["day:2030-03-01"]
+        assert keyboard[3][4].text == "15·3"
+        assert all(len(row) == 7 for row in keyboard[1:-1]) and len(keyboard) == 7
+        previous, following = keyboard[-1]
+        assert (previous.callback_data, following.callback_data) == ("cal:m:2030-02-01", "cal:m:2030-04-01")
+        assert shift_view(MONTH, date(2030, 12, 1), 1) == date(2031, 1, 1)
+        
+        week = view_keyboard(WEEK, view_start(WEEK, date(2030, 3, 17)), [0] * 7).inline_keyboard
+        assert week[1][0].callback_data == "day:2030-03-11"
+        assert len(week[-1][1].callback_data.encode()) <= 64
+        with pytest.raises(ValueError):
+            parse_month("2030-13")
+    
+    def test_plural_events(self):
+        """Тест склонения числа событий"""
+        assert [plural_events(n) for n in (1, 3, 5, 11, 21, 112)] == [
+            "1 событие", "3 события", "5 событий", "11 событий", "21 событие", "112 событий",
+        ]
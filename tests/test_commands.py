@@ -1,6 +1,17 @@
 import pytest
 from datetime import datetime, timedelta
-from handlers.commands import parse_date
+from db.database import EventPage
+from db.timezones import get_zone
+from db.digests import DAILY, HOURLY
+from handlers.commands import (
+    format_conflicts,
+    format_duration,
+    page_keyboard,
+    parse_date,
+    parse_digest_args,
+    parse_search_range,
+    search_keyboard,
+)
 
 
 class TestParseDate:
@@ -89,3 +100,62 @@ class TestParseDate:
         assert result.day == 31
         assert result.hour == 23
         assert result.minute == 59
+
+
+class TestPageKeyboard:
+    def test_buttons_carry_cursors(self):
+        """Тест кнопок листания: курсоры крайних событий и лимит callback_data"""
+        rows = [(7, "Первое", "", 1_900_000_000, 123), (2 ** 40, "Последнее", "", 1_900_000_600, 123)]
+        keyboard = page_keyboard("my", EventPage(rows, True, True), owner=9_999_999_999)
+        prev_button, next_button = keyboard.inline_keyboard[0]
+        
+        assert prev_button.callback_data == "my:9999999999:prev:1900000000:7"
+        assert next_button.callback_data == f"my:9999999999:next:1900000600:{2 ** 40}"
+        # Telegram ограничивает callback_data 64 байтами
+        assert len(next_button.callback_data.encode()) <= 64
+    
+    def test_single_page_has_no_buttons(self):
+        """Тест того, что у единственной страницы нет кнопок"""
+        assert page_keyboard("ev", EventPage([(1, "", "", 0, 0, 0)], False, False)) is None
+
+
+class TestSearch:
+    def test_range_covers_whole_days_in_zone(self):
+        """Тест промежутка /search: целые дни по поясу, пустая сторона - без ограничения"""
+        zone = get_zone("Asia/Tokyo")
+        start, end = parse_search_range("2030-02-01..2030-02-28", zone)
+        assert start == int(datetime(2030, 2, 1, tzinfo=zone).timestamp())
+        assert end == int(datetime(2030, 3, 1, tzinfo=zone).timestamp())
+        assert parse_search_range("..2030-02-28", zone) == (None, end)
+        with pytest.raises(ValueError):
+            parse_search_range("вчера..2030-02-28", zone)
+    
+    def test_keyboard_pages_by_offset(self):
+        """Тест кнопок результатов поиска: смещения соседних страниц"""
+        keyboard = search_keyboard(EventPage([(1, "", "", 0, 0, None)], True, True), owner=5, offset=10)
+        prev_button, next_button = keyboard.inline_keyboard[0]
+        assert (prev_button.callback_data, next_button.callback_data) == ("sr:5:0", "sr:5:20")
+
+
+class TestDigest:
+    def test_parse_digest_args(self):
+        """Тест аргументов /digest: вид сводки и время в минутах от полуночи"""
+        assert parse_digest_args(["hourly"]) == (HOURLY, 0)
+        assert parse_digest_args(["daily"]) == (DAILY, 8 * 60)
+        assert parse_digest_args(["Daily", "07:30"]) == (DAILY, 7 * 60 + 30)
+        assert parse_digest_args(["daily", "9"]) == (DAILY, 9 * 60)
+        for args in (["daily", "25:00"], ["daily", "утром"], ["weekly"], ["hourly", "10:00"]):
+            with pytest.raises(ValueError):
+                parse_digest_args(args)
+
+
+class TestDurations:
+    def test_format_duration_and_conflicts(self):
+        """Тест длительности в ответах и предупреждения о пересечениях"""
+        assert format_duration(90 * 60) == "1 ч 30 мин"
+        assert format_duration(2 * 86400 + 4 * 3600) == "2 д 4 ч"
+        zone = get_zone("UTC")
+        start = int(datetime(2030, 3, 1, 15, 0, tzinfo=zone).timestamp())
+        text = format_conflicts([(7, "Встреча", start, 3600), (8, "Звонок", start + 1800, 0)], zone)
+        assert "🆔 7 01.03 15:00–16:00 Встреча" in text and "🆔 8 01.03 15:30 Звонок" in text
+
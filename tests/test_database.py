@@ -1,8 +1,16 @@
+import asyncio
 import pytest
+import sqlite3
 import tempfile
+import time
 import os
 from datetime import datetime, timedelta
+from types import SimpleNamespace
+from aiogram.fsm.storage.base import StorageKey
 from db.database import Database
+from db.fsm_storage import SQLiteStorage
+from db.timezones import get_zone
+from handlers.commands import AddEventStates, cmd_subscribe
 
 
 @pytest.fixture
@@ -15,22 +23,26 @@ def temp_db():
     yield db
     
     # Очистка после тестов
-    os.unlink(db_path)
+    db.close()
+    for path in (db_path, db_path + "-wal", db_path + "-shm"):
+        if os.path.exists(path):
+            os.unlink(path)
 
 
+@pytest.mark.asyncio
 class TestDatabase:
-    def test_init_database(self, temp_db):
+    async def test_init_database(self, temp_db):
         """Тест инициализации базы данных"""
         # Проверяем, что таблица events создана
-        with temp_db.db_path as conn:
+        with sqlite3.connect(temp_db.db_path) as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='events'")
             result = cursor.fetchone()
             assert result is not None
     
-    def test_add_event(self, temp_db):
+    async def test_add_event(self, temp_db):
         """Тест добавления события"""
-        event_id = temp_db.add_event(
+        event_id = await temp_db.add_event(
             title="Тестовое событие",
             description="Описание тестового события",
             event_date="2024-01-15 15:00",
@@ -41,43 +53,44 @@ class TestDatabase:
         assert isinstance(event_id, int)
         
         # Проверяем, что событие действительно добавлено
-        event = temp_db.get_event_by_id(event_id)
+        event = await temp_db.get_event_by_id(event_id)
         assert event is not None
         assert event[1] == "Тестовое событие"  # title
         assert event[2] == "Описание тестового события"  # description
         assert event[4] == 12345  # created_by
     
-    def test_get_events(self, temp_db):
+    async def test_get_events(self, temp_db):
         """Тест получения списка событий"""
-        # Добавляем несколько событий
-        temp_db.add_event("Событие 1", "Описание 1", "2024-12-31 12:00", 12345)
-        temp_db.add_event("Событие 2", "Описание 2", "2024-12-31 13:00", 12346)
+        # Добавляем несколько событий в будущем
+        tomorrow = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+        await temp_db.add_event("Событие 1", "Описание 1", f"{tomorrow} 12:00", 12345)
+        await temp_db.add_event("Событие 2", "Описание 2", f"{tomorrow} 13:00", 12346)
         
-        events = temp_db.get_events(limit=5)
+        events = await temp_db.get_events(limit=5)
         assert len(events) == 2
         assert events[0][1] == "Событие 1"
         assert events[1][1] == "Событие 2"
     
-    def test_get_event_by_id(self, temp_db):
+    async def test_get_event_by_id(self, temp_db):
         """Тест получения события по ID"""
-        event_id = temp_db.add_event(
+        event_id = await temp_db.add_event(
             "Тестовое событие",
             "Описание",
             "2024-01-15 15:00",
             12345
         )
         
-        event = temp_db.get_event_by_id(event_id)
+        event = await temp_db.get_event_by_id(event_id)
         assert event is not None
         assert event[0] == event_id
         
         # Тест несуществующего события
-        non_existent = temp_db.get_event_by_id(99999)
+        non_existent = await temp_db.get_event_by_id(99999)
         assert non_existent is None
     
-    def test_delete_event(self, temp_db):
+    async def test_delete_event(self, temp_db):
         """Тест удаления события"""
-        event_id = temp_db.add_event(
+        event_id = await temp_db.add_event(
             "Событие для удаления",
             "Описание",
             "2024-01-15 15:00",
@@ -85,68 +98,732 @@ class TestDatabase:
         )
         
         # Удаляем событие
-        success = temp_db.delete_event(event_id, 12345)
+        success = await temp_db.delete_event(event_id, 12345)
         assert success is True
         
         # Проверяем, что событие удалено
-        event = temp_db.get_event_by_id(event_id)
+        event = await temp_db.get_event_by_id(event_id)
         assert event is None
         
         # Тест удаления чужого события
-        event_id2 = temp_db.add_event(
+        event_id2 = await temp_db.add_event(
             "Чужое событие",
             "Описание",
             "2024-01-15 15:00",
             12346
         )
         
-        success = temp_db.delete_event(event_id2, 12345)  # Пытаемся удалить чужое событие
+        success = await temp_db.delete_event(event_id2, 12345)  # Пытаемся удалить чужое событие
         assert success is False
     
-    def test_get_events_by_user(self, temp_db):
-        """Тест получения событий пользователя"""
+    async def test_concurrent_writes(self, temp_db):
+        """Тест параллельной записи через пул соединений"""
+        ids = await asyncio.gather(*(
+            temp_db.add_event(f"Событие {i}", "Описание", "2030-01-15 15:00", 12345)
+            for i in range(50)
+        ))
+        
+        assert len(set(ids)) == 50
+        assert len((await temp_db.get_events_page(user_id=12345, limit=100)).rows) == 50
+    
+    async def test_concurrent_writes_share_transaction(self, temp_db):
+        """Тест пакетной записи: одна транзакция на всплеск, ошибка одной записи не мешает остальным"""
+        transactions = []
+        run = temp_db._run
+        
+        def counting_run(func, args, write):
+            if write:
+                transactions.append(func)
+            return run(func, args, write)
+        
+        temp_db._run = counting_run
+        
+        def failing(conn):
+            conn.execute("INSERT INTO events (title, event_date, created_by, created_at) VALUES ('Черновик', 0, 1, 0)")
+            raise ValueError("broken")
+        
+        results = await asyncio.gather(
+            *(temp_db.add_event(f"Событие {i}", "", "2030-01-15 15:00", 12345) for i in range(20)),
+            temp_db._write_batched(failing),
+            temp_db.delete_event(10 ** 6, 12345),
+            return_exceptions=True,
+        )
+        
+        assert len(transactions) == 1
+        assert len(set(results[:20])) == 20
+        assert isinstance(results[20], ValueError) and results[21] is False
+        # Запись с ошибкой откатилась целиком, остальные сохранены
+        with sqlite3.connect(temp_db.db_path) as conn:
+            titles = [row[0] for row in conn.execute("SELECT title FROM events")]
+        assert len(titles) == 20 and "Черновик" not in titles
+        
+        # Обычная запись после накопленных выполняется после них
+        pending = asyncio.ensure_future(temp_db.add_event("Первое", "", "2030-01-15 15:00", 7))
+        await asyncio.sleep(0)
+        await temp_db.set_time_zone(7, "UTC")
+        assert len((await temp_db.get_events_page(user_id=7)).rows) == 1 and pending.done()
+    
+    async def test_wal_mode(self, temp_db):
+        """Тест включения режима WAL"""
+        with sqlite3.connect(temp_db.db_path) as conn:
+            mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+            assert mode == "wal"
+    
+    async def test_user_events_page(self, temp_db):
+        """Тест получения событий пользователя страницей"""
         # Добавляем события от разных пользователей
-        temp_db.add_event("Событие 1", "Описание", "2024-01-15 15:00", 12345)
-        temp_db.add_event("Событие 2", "Описание", "2024-01-16 15:00", 12345)
-        temp_db.add_event("Событие 3", "Описание", "2024-01-17 15:00", 12346)
+        await temp_db.add_event("Событие 1", "Описание", "2024-01-15 15:00", 12345)
+        await temp_db.add_event("Событие 2", "Описание", "2024-01-16 15:00", 12345)
+        await temp_db.add_event("Событие 3", "Описание", "2024-01-17 15:00", 12346)
         
-        user_events = temp_db.get_events_by_user(12345)
+        user_events = (await temp_db.get_events_page(user_id=12345)).rows
         assert len(user_events) == 2
         assert user_events[0][1] == "Событие 1"
         assert user_events[1][1] == "Событие 2"
     
-    def test_get_upcoming_events(self, temp_db):
+    async def test_get_upcoming_events(self, temp_db):
         """Тест получения предстоящих событий"""
         now = datetime.now()
         future_time = now + timedelta(hours=1)
         
         # Добавляем событие в будущем
-        event_id = temp_db.add_event(
+        event_id = await temp_db.add_event(
             "Будущее событие",
             "Описание",
             future_time.isoformat(),
             12345
         )
         
-        upcoming = temp_db.get_upcoming_events(hours_ahead=2)
+        upcoming = await temp_db.get_upcoming_events(hours_ahead=2)
         assert len(upcoming) == 1
         assert upcoming[0][0] == event_id
     
-    def test_mark_notification_sent(self, temp_db):
-        """Тест отметки уведомления как отправленного"""
-        event_id = temp_db.add_event(
-            "Событие",
-            "Описание",
-            "2024-01-15 15:00",
-            12345
+    async def test_add_event_creates_reminders(self, temp_db):
+        """Тест создания напоминаний вместе с событием"""
+        now = int(time.time())
+        event_id = await temp_db.add_event("Событие", "Описание", now + 7200, 12345)
+        soon_id = await temp_db.add_event("Скоро", "Описание", now + 1800, 12345, reminder_offsets=(3600, 900, 60))
+        
+        pending = sorted(await temp_db.get_pending_reminders())
+        assert pending == [
+            (now + 1800 - 900, soon_id),
+            (now + 1800 - 60, soon_id),
+            (now + 7200 - 3600, event_id),
+            (now + 7200 - 900, event_id),
+        ]
+    
+    async def test_set_reminders(self, temp_db):
+        """Тест замены напоминаний события"""
+        now = int(time.time())
+        event_id = await temp_db.add_event("Событие", "Описание", now + 86400 * 2, 12345)
+        
+        assert await temp_db.set_reminders(event_id, 12346, [600]) is False
+        assert await temp_db.set_reminders(event_id, 12345, [86400, 600]) is True
+        assert sorted(await temp_db.get_pending_reminders()) == [
+            (now + 86400, event_id),
+            (now + 86400 * 2 - 600, event_id),
+        ]
+    
+    async def test_claim_and_complete_reminders(self, temp_db):
+        """Тест захвата наступивших напоминаний и отметки результата"""
+        now = int(time.time())
+        event_id = await temp_db.add_event("Событие", "Описание", now + 600, 12345, reminder_offsets=())
+        with sqlite3.connect(temp_db.db_path) as conn:
+            conn.executemany(
+                "INSERT INTO reminders (event_id, offset, due_at) VALUES (?, ?, ?)",
+                [(event_id, 610, now - 10), (event_id, 700, now - 100), (event_id, 1600, now - 1000), (event_id, 60, now + 540)],
+            )
+        
+        claimed = await temp_db.claim_due_reminders(grace=120)
+        assert [(row[2], row[4], row[5], row[7]) for row in claimed] == [
+            (700, 1, "Событие", 12345),
+            (610, 1, "Событие", 12345),
+        ]
+        # Повторный захват не возвращает уже захваченные напоминания
+        assert await temp_db.claim_due_reminders(grace=120) == []
+        
+        await temp_db.complete_reminders(sent=[claimed[0][0]], retry=[(claimed[1][0], now + 30)])
+        with sqlite3.connect(temp_db.db_path) as conn:
+            statuses = dict(conn.execute("SELECT offset, status FROM reminders"))
+        assert statuses == {610: "pending", 700: "sent", 1600: "missed", 60: "pending"}
+    
+    async def test_release_claimed_reminders(self, temp_db):
+        """Тест возврата захваченных до перезапуска напоминаний в очередь"""
+        now = int(time.time())
+        event_id = await temp_db.add_event("Событие", "Описание", now + 600, 12345, reminder_offsets=())
+        with sqlite3.connect(temp_db.db_path) as conn:
+            conn.execute("INSERT INTO reminders (event_id, offset, due_at) VALUES (?, 610, ?)", (event_id, now - 10))
+        
+        assert len(await temp_db.claim_due_reminders()) == 1
+        assert await temp_db.release_claimed_reminders() == 1
+        assert len(await temp_db.claim_due_reminders()) == 1
+    
+    async def test_delete_event_removes_reminders(self, temp_db):
+        """Тест удаления напоминаний вместе с событием"""
+        event_id = await temp_db.add_event("Событие", "Описание", int(time.time()) + 7200, 12345)
+        await temp_db.delete_event(event_id, 12345)
+        
+        assert await temp_db.get_pending_reminders() == []
+    
+    async def test_event_date_stored_as_epoch(self, temp_db):
+        """Тест хранения даты события как UTC epoch"""
+        event_date = datetime(2030, 1, 15, 15, 0)
+        event_id = await temp_db.add_event("Событие", "Описание", event_date, 12345)
+        
+        event = await temp_db.get_event_by_id(event_id)
+        assert event[3] == int(event_date.timestamp())
+        assert datetime.fromtimestamp(event[3]) == event_date
+    
+    async def test_subscriptions(self, temp_db):
+        """Тест подписок на событие и на весь календарь"""
+        event_id = await temp_db.add_event("Событие", "Описание", int(time.time()) + 7200, 12345)
+        
+        # Свое событие создатель может подписать в любой чат
+        assert await temp_db.subscribe(-100, event_id, user_id=12345)
+        assert await temp_db.subscribe(-100, event_id, user_id=12345) is False
+        assert await temp_db.subscribe(-100, 999, user_id=12345) is None
+        assert await temp_db.subscribe(777)
+        assert await temp_db.subscribe(12345, event_id)
+        
+        # Создатель не дублируется
+        assert await temp_db.get_event_recipients(event_id) == [-100, 12345]
+        assert await temp_db.get_event_recipients(event_id, after=-100, limit=1) == [12345]
+        assert await temp_db.get_calendar_subscribers([12345, 777, -100]) == [777]
+        
+        # Подписка на свой календарь не касается событий других чатов
+        await temp_db.subscribe(-100)
+        assert await temp_db.get_event_recipients(event_id) == [-100, 12345]
+        # Чат события, подписанный на свой календарь, получает его вместе с календарем
+        await temp_db.subscribe(12345)
+        assert await temp_db.get_event_recipients(event_id) == [-100]
+        assert await temp_db.unsubscribe(12345)
+        assert await temp_db.unsubscribe(-100)
+        assert await temp_db.unsubscribe(-100, event_id)
+        assert not await temp_db.unsubscribe(-100, event_id)
+        assert await temp_db.get_event_recipients(event_id) == [12345]
+        
+        await temp_db.delete_event(event_id, 12345)
+        with sqlite3.connect(temp_db.db_path) as conn:
+            assert conn.execute("SELECT COUNT(*) FROM subscriptions").fetchone()[0] == 0
+    
+    async def test_subscribe_to_other_chat_event(self, temp_db):
+        """Тест закрытости календарей: чат B не подписывается на событие чата A"""
+        event_id = await temp_db.add_event("Секрет", "Описание", int(time.time()) + 7200, 1, chat_id=-100)
+        answers = []
+        
+        async def answer(text, **kwargs):
+            answers.append(text)
+        
+        message = SimpleNamespace(
+            text=f"/subscribe {event_id}", chat=SimpleNamespace(id=-200), from_user=SimpleNamespace(id=2), answer=answer,
         )
+        await cmd_subscribe(message, temp_db)
+        message.text = "/subscribe 999"
+        await cmd_subscribe(message, temp_db)
+        
+        # Чужое событие неотличимо от несуществующего
+        assert answers == ["❌ Событие с таким ID не найдено"] * 2
+        assert await temp_db.subscribe(-200, event_id) is None
+        assert await temp_db.get_event_recipients(event_id) == [1]
+        # В своем чате на событие календаря может подписаться любой участник
+        assert await temp_db.subscribe(-100, event_id, user_id=2)
+        assert await temp_db.get_event_recipients(event_id) == [-100, 1]
+    
+    async def test_event_lists_are_cached(self, temp_db):
+        """Тест кэша списков событий и его сброса при добавлении и удалении"""
+        now = int(time.time())
+        event_id = await temp_db.add_event("Первое", "Описание", now + 3600, 12345)
         
-        # Отмечаем уведомление как отправленное
-        temp_db.mark_notification_sent(event_id)
+        events = await temp_db.get_events()
+        assert await temp_db.get_events() is events
+        mine = await temp_db.get_events_page(user_id=12345)
+        assert await temp_db.get_events_page(user_id=12345) is mine
+        assert temp_db.cache.hits == 2
         
-        # Проверяем в базе данных
-        with temp_db.db_path as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT notification_sent FROM events WHERE id = ?", (event_id,))
-            result = cursor.fetchone()
-            assert result[0] is True
+        # Событие другого пользователя сбрасывает общий список, но не чужой /myevents
+        await temp_db.add_event("Второе", "Описание", now + 1800, 777)
+        assert [event[1] for event in await temp_db.get_events()] == ["Второе", "Первое"]
+        assert await temp_db.get_events_page(user_id=12345) is mine
+        
+        await temp_db.delete_event(event_id, 12345)
+        assert [event[1] for event in await temp_db.get_events()] == ["Второе"]
+        assert (await temp_db.get_events_page(user_id=12345)).rows == []
+    
+    async def test_events_cache_expires_when_first_event_passes(self, temp_db):
+        """Тест того, что прошедшее событие не остается в закэшированном списке"""
+        now = int(time.time())
+        await temp_db.add_event("Скоро", "Описание", now + 1, 12345)
+        assert len(await temp_db.get_events()) == 1
+        
+        await asyncio.sleep(2.1)
+        assert await temp_db.get_events() == []
+    
+    async def test_events_pages(self, temp_db):
+        """Тест листания страниц вперед и назад, в том числе по событиям с одинаковой датой"""
+        now = int(time.time())
+        with sqlite3.connect(temp_db.db_path) as conn:
+            conn.executemany("""
+                INSERT INTO events (id, title, description, event_date, created_by, created_at)
+                VALUES (?, ?, '', ?, ?, ?)
+            """, [(i, f"Событие {i}", now + 3600 + i // 3 * 60, 12345, now) for i in range(1, 26)])
+        ids, page = [], await temp_db.get_events_page(limit=10)
+        pages = [page]
+        while True:
+            ids.extend(row[0] for row in page.rows)
+            if not page.has_next:
+                break
+            last = page.rows[-1]
+            page = await temp_db.get_events_page(after=(last[3], last[0]), limit=10)
+            pages.append(page)
+        
+        assert ids == list(range(1, 26))
+        assert [len(page.rows) for page in pages] == [10, 10, 5]
+        assert not pages[0].has_prev and pages[2].has_prev
+        
+        first = pages[2].rows[0]
+        back = await temp_db.get_events_page(before=(first[3], first[0]), limit=10)
+        assert [row[0] for row in back.rows] == list(range(11, 21))
+        assert back.has_prev and back.has_next
+        
+        mine = await temp_db.get_events_page(user_id=12345, after=(first[3], first[0] - 1), limit=10)
+        assert [row[0] for row in mine.rows] == list(range(21, 26))
+        assert len(mine.rows[0]) == 6
+    
+    async def test_deep_page_cost_does_not_grow(self, temp_db):
+        """Тест того, что стоимость страницы не зависит от ее глубины (O(page), а не OFFSET)"""
+        now = int(time.time())
+        with sqlite3.connect(temp_db.db_path) as conn:
+            conn.executemany("""
+                INSERT INTO events (title, description, event_date, created_by, created_at)
+                VALUES ('Событие', '', ?, ?, ?)
+            """, [(now + 3600 + i, i % 2, now) for i in range(20_000)])
+        steps = 0
+        
+        def count_steps():
+            nonlocal steps
+            steps += 1
+        
+        # Считаем шаги виртуальной машины SQLite в том потоке, где выполняется запрос
+        run = temp_db._run
+        
+        def counting_run(func, args, write):
+            conn = temp_db._get_connection()
+            conn.set_progress_handler(count_steps, 10)
+            try:
+                return run(func, args, write)
+            finally:
+                conn.set_progress_handler(None, 0)
+        
+        temp_db._run = counting_run
+        
+        async def page_cost(**kwargs) -> int:
+            nonlocal steps
+            steps = 0
+            await temp_db.get_events_page(limit=10, **kwargs)
+            return steps
+        
+        shallow = await page_cost(after=(now + 3600 + 10, 11))
+        deep = await page_cost(after=(now + 3600 + 19_980, 19_981))
+        deep_back = await page_cost(before=(now + 3600 + 19_990, 19_991))
+        deep_user = await page_cost(user_id=1, before=(now + 3600 + 19_981, 19_982))
+        
+        # OFFSET 19980 прошел бы по всем пропущенным строкам индекса
+        with sqlite3.connect(temp_db.db_path) as conn:
+            conn.set_progress_handler(count_steps, 10)
+            steps = 0
+            conn.execute("SELECT * FROM events ORDER BY event_date LIMIT 10 OFFSET 19980").fetchall()
+            offset_cost = steps
+        
+        assert shallow > 0
+        assert max(deep, deep_back, deep_user) <= 2 * shallow
+        assert offset_cost > 20 * shallow
+    
+    async def test_upcoming_follows_writes(self, temp_db):
+        """Тест предстоящих событий: импорт, /repeat и удаление видны сразу, прошедшие не попадают"""
+        now = int(time.time())
+        first = await temp_db.add_event("Первое", "", now + 600, 1)
+        second = await temp_db.add_event("Второе", "", now + 1200, 1)
+        series = await temp_db.add_event("Серия", "", now + 900, 1, rrule="daily")
+        await temp_db.add_event("Прошедшее", "", now - 600, 1)
+        await temp_db.import_events(iter([("Импорт", "", now + 300)]), user_id=2)
+        await temp_db.set_recurrence(second, 1, "weekly")
+        await temp_db.delete_event(first, 1)
+        upcoming = await temp_db.get_upcoming_events(hours_ahead=1)
+        assert [row[1] for row in upcoming] == ["Импорт", "Серия", "Второе"]
+        
+        # Серии, ставшие обычными событиями, снова видны одной строкой
+        await temp_db.set_recurrence(second, 1, None)
+        await temp_db.set_recurrence(series, 1, None)
+        assert [row[0] for row in await temp_db.get_upcoming_events(hours_ahead=1)] == [series + 2, series, second]
+        assert [row[1] for row in await temp_db.get_events()] == ["Импорт", "Серия", "Второе"]
+    
+    async def test_import_and_export(self, temp_db):
+        """Тест массового импорта пачками и выгрузки событий пачками"""
+        now = int(time.time())
+        await temp_db.get_events()
+        events = ((f"Событие {i}", "Описание", now + 7000 - i * 3600) for i in range(25))
+        
+        result = await temp_db.import_events(events, user_id=12345, batch_size=10)
+        
+        assert result.imported == 25
+        assert len(await temp_db.get_events()) == 2
+        # Напоминания только для тех событий, до которых еще не прошли сроки
+        pending = await temp_db.get_pending_reminders(result.first_event_id)
+        assert sorted(pending) == sorted([
+            (now + 7000 - 3600, result.first_event_id),
+            (now + 7000 - 900, result.first_event_id),
+            (now + 3400 - 900, result.first_event_id + 1),
+        ])
+        
+        batches = [rows async for rows in temp_db.iter_events(batch_size=10)]
+        assert [len(rows) for rows in batches] == [10, 10, 5]
+        assert batches[0][0][1:4] == ("Событие 0", "Описание", now + 7000)
+        assert [rows async for rows in temp_db.iter_events(user_id=1)] == []
+    
+    async def test_series_occurrences_in_pages(self, temp_db):
+        """Тест листания серий: повторения вперемешку с событиями, в том числе через пустые дни"""
+        now = int(time.time())
+        daily = await temp_db.add_event("Планерка", "", now + 600, 12345, rrule="FREQ=DAILY;COUNT=12")
+        yearly = await temp_db.add_event("Годовщина", "", now + 30 * 86400, 12345, rrule="yearly")
+        single = await temp_db.add_event("Разовое", "", now + 86400 + 1200, 12345)
+        
+        rows, page = [], await temp_db.get_events_page(limit=5)
+        while True:
+            rows.extend(page.rows)
+            if not page.has_next or len(rows) > 15:
+                break
+            page = await temp_db.get_events_page(after=(page.rows[-1][3], page.rows[-1][0]), limit=5)
+        
+        assert [row[0] for row in rows[:4]] == [daily, daily, single, daily]
+        assert [row[3] for row in rows if row[0] == daily] == [now + 600 + day * 86400 for day in range(12)]
+        # После конца ежедневной серии листание перепрыгивает к годовщине через пустые дни
+        assert {row[0] for row in rows[13:]} == {yearly}
+        assert rows[14][3] > now + 365 * 86400
+        
+        back = await temp_db.get_events_page(before=(rows[13][3], rows[13][0]), limit=3)
+        assert back.rows == rows[10:13]
+        assert await temp_db.get_events() == rows[:10]
+        
+        mine = await temp_db.get_events_page(user_id=12345, limit=5)
+        assert [(row[0], row[5]) for row in mine.rows] == [(daily, "FREQ=DAILY;COUNT=12"), (single, None), (yearly, "FREQ=YEARLY")]
+        
+        upcoming = await temp_db.get_upcoming_events(hours_ahead=25)
+        assert [(row[0], row[3]) for row in upcoming] == [(daily, now + 600), (daily, now + 87000), (single, now + 87600)]
+    
+    async def test_series_changes_invalidate_pages(self, temp_db):
+        """Тест того, что /repeat и /skip сразу видны в списке, а обычные события не сбрасывают повторения"""
+        now = int(time.time())
+        event_id = await temp_db.add_event("Встреча", "", now + 600, 12345)
+        assert [row[3] for row in await temp_db.get_events()] == [now + 600]
+        
+        assert await temp_db.set_recurrence(event_id, 12346, "daily") is False
+        assert await temp_db.set_recurrence(event_id, 12345, "daily") is True
+        assert [row[3] for row in await temp_db.get_events(limit=3)] == [now + 600, now + 87000, now + 173400]
+        
+        windows = len(temp_db.cache)
+        await temp_db.add_event("Разовое", "", now + 700, 12345)
+        assert [row[3] for row in await temp_db.get_events(limit=3)] == [now + 600, now + 700, now + 87000]
+        # Раскрытые окна серий пережили добавление обычного события
+        assert temp_db.cache.hits > 0 and len(temp_db.cache) >= windows
+        
+        tomorrow = datetime.fromtimestamp(now + 87000).replace(hour=0, minute=0, second=0)
+        start = int(tomorrow.timestamp())
+        assert await temp_db.skip_occurrences(event_id, 12345, start, start + 86400) == 1
+        assert [row[3] for row in await temp_db.get_events(limit=3)] == [now + 600, now + 700, now + 173400]
+        
+        assert await temp_db.set_recurrence(event_id, 12345, None) is True
+        assert [row[3] for row in await temp_db.get_events(limit=3)] == [now + 600, now + 700]
+    
+    async def test_series_reminders_roll_forward(self, temp_db):
+        """Тест того, что напоминание серии после отправки переходит на следующее повторение"""
+        now = int(time.time())
+        event_id = await temp_db.add_event("Встреча", "", now - 86400 + 3000, 12345, rrule="daily")
+        
+        # Вчерашнее повторение прошло: напоминания о сегодняшнем
+        assert sorted(await temp_db.get_pending_reminders()) == [
+            (now + 3000 - 900, event_id),
+            (now + 3000 - 3600 + 86400, event_id),
+        ]
+        
+        with sqlite3.connect(temp_db.db_path) as conn:
+            conn.execute("UPDATE reminders SET due_at = ? WHERE offset = 900", (now - 1,))
+        claimed = await temp_db.claim_due_reminders()
+        assert [(row[2], row[6]) for row in claimed] == [(900, now + 3000)]
+        
+        wakeups = await temp_db.complete_reminders(sent=[claimed[0][0]])
+        assert wakeups == [(now + 3000 + 86400 - 900, event_id)]
+        assert len(await temp_db.get_pending_reminders()) == 2
+        
+        # Пропуск завтрашнего повторения переводит напоминания на послезавтра
+        start = int(datetime.fromtimestamp(now + 3000 + 86400).replace(hour=0, minute=0, second=0).timestamp())
+        await temp_db.skip_occurrences(event_id, 12345, start, start + 86400)
+        assert sorted(await temp_db.get_pending_reminders()) == [
+            (now + 3000 + 2 * 86400 - 3600, event_id),
+            (now + 3000 + 2 * 86400 - 900, event_id),
+        ]
+    
+    async def test_lease(self, temp_db):
+        """Тест аренды: один держатель, переход после истечения и при отдаче"""
+        token = await temp_db.acquire_lease("notifications", "a", ttl=0.2)
+        assert token is not None
+        assert await temp_db.acquire_lease("notifications", "b", ttl=0.2) is None
+        # Продление не меняет token
+        assert await temp_db.acquire_lease("notifications", "a", ttl=0.2) == token
+        
+        await asyncio.sleep(0.25)
+        assert await temp_db.acquire_lease("notifications", "b", ttl=10) == token + 1
+        # Захват под чужой арендой ничего не возвращает
+        event_id = await temp_db.add_event("Встреча", "", int(time.time()) + 7200, 12345)
+        with sqlite3.connect(temp_db.db_path) as conn:
+            conn.execute("UPDATE reminders SET due_at = ? WHERE event_id = ?", (int(time.time()) - 1, event_id))
+        assert await temp_db.claim_due_reminders(lease=("notifications", "a")) == []
+        
+        assert await temp_db.release_lease("notifications", "b") is True
+        assert await temp_db.acquire_lease("notifications", "a", ttl=10) == token + 2
+        assert len(await temp_db.claim_due_reminders(lease=("notifications", "a"))) == 2
+    
+    async def test_time_zones(self, temp_db):
+        """Тест поясов: пояс чата важнее пояса пользователя, сброс возвращает время сервера"""
+        assert await temp_db.get_time_zone(-100, 5) is None
+        await temp_db.set_time_zone(5, "Europe/Berlin")
+        assert await temp_db.get_time_zone(5, 5) == "Europe/Berlin"
+        assert await temp_db.get_time_zone(-100, 5) == "Europe/Berlin"
+        
+        await temp_db.set_time_zone(-100, "Asia/Tokyo")
+        assert await temp_db.get_time_zone(-100, 5) == "Asia/Tokyo"
+        assert await temp_db.get_time_zones([5, -100, 7]) == {5: "Europe/Berlin", -100: "Asia/Tokyo"}
+        
+        await temp_db.set_time_zone(-100, None)
+        assert await temp_db.get_time_zone(-100, 5) == "Europe/Berlin"
+    
+    async def test_series_repeats_in_creator_zone(self, temp_db):
+        """Тест серии с поясом создателя: конец серии и напоминания по его часам"""
+        zone = get_zone("Europe/Berlin")
+        # Последняя суббота октября - переход на зимнее время
+        year = datetime.now().year + 1
+        transition = max(day for day in range(25, 32) if datetime(year, 10, day).weekday() == 6)
+        dtstart = datetime(year, 10, transition - 2, 10, 0, tzinfo=zone)
+        event_id = await temp_db.add_event("Планерка", "", dtstart, 5, rrule="FREQ=DAILY;COUNT=4", tz="Europe/Berlin")
+        
+        with sqlite3.connect(temp_db.db_path) as conn:
+            until, tz = conn.execute("SELECT until, tz FROM events WHERE id = ?", (event_id,)).fetchone()
+        assert tz == "Europe/Berlin"
+        assert datetime.fromtimestamp(until, zone) == dtstart + timedelta(days=3)
+        assert until - int(dtstart.timestamp()) == 3 * 86400 + 3600
+    
+    async def test_search_events(self, temp_db):
+        """Тест поиска: префиксы слов, все слова обязательны, название важнее описания"""
+        now = int(time.time())
+        meeting = await temp_db.add_event("Встреча с командой", "Обсудить отчет", now + 3600, 1)
+        report = await temp_db.add_event("Квартальный отчет", "Сдать до встречи", now + 7200, 2)
+        movie = await temp_db.add_event("Кино", "", now + 600, 2, rrule="weekly")
+        
+        assert temp_db.full_text
+        page = await temp_db.search_events("встреч")
+        assert [row[0] for row in page.rows] == [meeting, report]
+        assert [row[0] for row in (await temp_db.search_events("ОТЧЕТ")).rows] == [report, meeting]
+        assert [row[0] for row in (await temp_db.search_events("отчет команд")).rows] == [meeting]
+        assert (await temp_db.search_events('"" * -')).rows == []
+        
+        # Серия попадает в промежуток через месяц, одиночные события - нет
+        page = await temp_db.search_events("кино встреча отчет")
+        assert page.rows == []
+        month = now + 30 * 86400
+        assert [row[0] for row in (await temp_db.search_events("кин", month, month + 7 * 86400)).rows] == [movie]
+        assert (await temp_db.search_events("отчет", month, month + 7 * 86400)).rows == []
+        
+        first = await temp_db.search_events("отчет", limit=1)
+        second = await temp_db.search_events("отчет", limit=1, offset=1)
+        assert (first.has_prev, first.has_next, second.has_prev, second.has_next) == (False, True, True, False)
+        
+        # Триггеры держат индекс в согласии с таблицей
+        await temp_db.delete_event(meeting, 1)
+        with sqlite3.connect(temp_db.db_path) as conn:
+            conn.execute("UPDATE events SET title = 'Премьера' WHERE id = ?", (movie,))
+        temp_db.cache.clear()
+        assert [row[0] for row in (await temp_db.search_events("встреч")).rows] == [report]
+        assert [row[0] for row in (await temp_db.search_events("прем")).rows] == [movie]
+        assert (await temp_db.search_events("кино")).rows == []
+    
+    async def test_balance_shards(self, temp_db):
+        """Тест распределения шардов: вход и уход воркеров, восстановление шардов упавшего"""
+        assert (await temp_db.balance_shards("reminders", "a", ttl=10, shards=8))[0] == list(range(8))
+        # Новый воркер получает шарды, только когда первый отдаст лишние
+        assert (await temp_db.balance_shards("reminders", "b", ttl=0.3, shards=8))[0] == []
+        assert (await temp_db.balance_shards("reminders", "a", ttl=10, shards=8))[0] == [0, 1, 2, 3]
+        assert (await temp_db.balance_shards("reminders", "b", ttl=0.3, shards=8))[0] == [4, 5, 6, 7]
+        
+        # Напоминание в шарде b захвачено, и b падает
+        event_id = await temp_db.add_event("Встреча", "", int(time.time()) + 7200, 5)
+        with sqlite3.connect(temp_db.db_path) as conn:
+            conn.execute("UPDATE reminders SET due_at = ?, shard = 5 WHERE event_id = ?", (int(time.time()) - 1, event_id))
+        assert await temp_db.claim_due_reminders(lease=("reminders", "a")) == []
+        assert len(await temp_db.claim_due_reminders(lease=("reminders", "b"))) == 2
+        await asyncio.sleep(0.35)
+        
+        owned, recovered = await temp_db.balance_shards("reminders", "a", ttl=10, shards=8)
+        assert owned == list(range(8)) and recovered == [4, 5, 6, 7]
+        assert len(await temp_db.claim_due_reminders(lease=("reminders", "a"))) == 2
+        
+        # Штатный уход: шарды свободны сразу и без возврата захваченных
+        await temp_db.balance_shards("reminders", "c", ttl=10, shards=8)
+        assert (await temp_db.balance_shards("reminders", "a", ttl=10, shards=8))[0] == [0, 1, 2, 3]
+        assert await temp_db.balance_shards("reminders", "c", ttl=10, shards=8) == ([4, 5, 6, 7], [])
+        await temp_db.release_lease("reminders", "c")
+        assert await temp_db.balance_shards("reminders", "a", ttl=10, shards=8) == (list(range(8)), [])
+    
+    async def test_new_reminders_seek_by_id(self, temp_db):
+        """Тест подхвата новых напоминаний: хвост после after_id по первичному ключу, а не все ожидающие шарды"""
+        now = int(time.time())
+        for user_id in range(1, 21):
+            await temp_db.add_event("Событие", "", now + 86400, user_id)
+        last_id, rows = await temp_db.get_new_reminders(0, shards=[1, 2])
+        assert len(rows) == 4 and last_id == 40
+        event_id = await temp_db.add_event("Новое", "", now + 86400, 2)
+        await temp_db.add_event("Чужой шард", "", now + 86400, 3)
+        
+        statements = []
+        read = temp_db._read
+        
+        async def traced_read(func, *args):
+            def traced(conn, *args):
+                conn.set_trace_callback(statements.append)
+                try:
+                    return func(conn, *args)
+                finally:
+                    conn.set_trace_callback(None)
+            return await read(traced, *args)
+        
+        temp_db._read = traced_read
+        last_id, rows = await temp_db.get_new_reminders(last_id, shards=[1, 2])
+        assert last_id == 44
+        assert sorted(event for _, event in rows) == [event_id, event_id]
+        
+        with sqlite3.connect(temp_db.db_path) as conn:
+            plan = conn.execute(f"EXPLAIN QUERY PLAN {statements[0]}").fetchall()
+        assert [row[3] for row in plan] == ["SEARCH reminders USING INTEGER PRIMARY KEY (rowid>?)"]
+    
+    async def test_fsm_storage(self, temp_db):
+        """Тест хранилища FSM в базе: состояние и данные видны второму экземпляру"""
+        key = StorageKey(bot_id=42, chat_id=-100, user_id=12345)
+        storage = SQLiteStorage(temp_db)
+        await storage.set_state(key, AddEventStates.waiting_for_date)
+        await storage.update_data(key, {"title": "Встреча"})
+        assert await storage.update_data(key, {"date": "2024-01-15"}) == {"title": "Встреча", "date": "2024-01-15"}
+        
+        other = SQLiteStorage(Database(temp_db.db_path))
+        assert await other.get_state(key) == AddEventStates.waiting_for_date.state
+        assert await other.get_data(key) == {"title": "Встреча", "date": "2024-01-15"}
+        assert await other.get_state(StorageKey(bot_id=42, chat_id=-100, user_id=1)) is None
+        other.db.close()
+        
+        # Завершенный диалог не оставляет строк в таблице
+        await storage.set_state(key, None)
+        await storage.set_data(key, {})
+        with sqlite3.connect(temp_db.db_path) as conn:
+            assert conn.execute("SELECT COUNT(*) FROM fsm_states").fetchone()[0] == 0
+    
+    async def test_chat_calendars(self, temp_db):
+        """Тест календарей чатов: списки, поиск и серии только своего чата, кэш сбрасывается по чату"""
+        now = int(time.time())
+        group = await temp_db.add_event("Созвон группы", "", now + 3600, 1, chat_id=-100)
+        series = await temp_db.add_event("Планерка группы", "", now + 1800, 2, rrule="daily", chat_id=-100)
+        private = await temp_db.add_event("Личный созвон", "", now + 600, 1)
+        await temp_db.import_events(iter([("Импорт группы", "", now + 7200)]), user_id=3, chat_id=-100)
+        
+        page = await temp_db.get_events_page(limit=3, chat_id=-100)
+        assert [row[1] for row in page.rows] == ["Планерка группы", "Созвон группы", "Импорт группы"]
+        assert [row[0] for row in await temp_db.get_events(chat_id=1)] == [private]
+        assert [row[0] for row in await temp_db.get_upcoming_events(hours_ahead=1, chat_id=1)] == [private]
+        assert [row[0] for row in (await temp_db.search_events("созвон", chat_id=-100)).rows] == [group]
+        assert [row[0] for row in (await temp_db.search_events("созвон")).rows] == [group, private]
+        # /myevents - события пользователя из всех чатов
+        assert {row[0] for row in (await temp_db.get_events_page(user_id=1)).rows} == {group, private}
+        assert [row[0] for rows in [batch async for batch in temp_db.iter_events(chat_id=1)] for row in rows] == [private]
+        
+        # Запись в календарь другого чата не сбрасывает страницу группы
+        await temp_db.add_event("Еще личное", "", now + 900, 1)
+        assert await temp_db.get_events_page(limit=3, chat_id=-100) is page
+        await temp_db.skip_occurrences(series, 2, now, now + 86400)
+        assert [row[1] for row in (await temp_db.get_events_page(limit=3, chat_id=-100)).rows] == [
+            "Созвон группы", "Импорт группы", "Планерка группы",
+        ]
+    
+    async def test_queries_use_indexes(self, temp_db):
+        """Тест того, что выборки по дате идут по индексам"""
+        with sqlite3.connect(temp_db.db_path) as conn:
+            plans = {
+                "date": "SELECT id FROM events WHERE event_date >= 0 ORDER BY event_date LIMIT 10",
+                "user": "SELECT id FROM events WHERE created_by = 1 ORDER BY event_date",
+                "chat": """
+                    SELECT id FROM events WHERE chat_id = -100 AND rrule IS NULL AND (event_date, id) > (0, 0)
+                    ORDER BY event_date, id LIMIT 10
+                """,
+                "chat_series": "SELECT id FROM events WHERE rrule IS NOT NULL AND chat_id = -100 AND event_date < 0",
+                "reminders": "SELECT id FROM reminders WHERE status = 'pending' AND due_at <= 0 ORDER BY due_at",
+            }
+            for name, sql in plans.items():
+                detail = " ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql))
+                assert "USING INDEX" in detail or "USING COVERING INDEX" in detail, name
+                assert "TEMP B-TREE" not in detail, name
+
+
+class TestMigrations:
+    def test_migrate_legacy_database(self, tmp_path):
+        """Тест миграции файла calendar.db со старой схемой (TEXT даты)"""
+        db_path = str(tmp_path / "legacy.db")
+        with sqlite3.connect(db_path) as conn:
+            conn.execute("""
+                CREATE TABLE events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    title TEXT NOT NULL,
+                    description TEXT,
+                    event_date TEXT NOT NULL,
+                    created_by INTEGER NOT NULL,
+                    created_at TEXT NOT NULL,
+                    notification_sent BOOLEAN DEFAULT FALSE
+                )
+            """)
+            conn.executemany("""
+                INSERT INTO events (title, description, event_date, created_by, created_at, notification_sent)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, [
+                ("С T", "Описание", "2030-01-15T15:00:00", 1, "2024-01-01T10:00:00.123456", False),
+                ("С пробелом", "Описание", "2030-01-15 16:30", 2, "2024-01-01T10:00:00", True),
+            ])
+        
+        db = Database(db_path)
+        try:
+            with sqlite3.connect(db_path) as conn:
+                rows = conn.execute(
+                    "SELECT title, event_date FROM events ORDER BY id"
+                ).fetchall()
+                chats = conn.execute("SELECT chat_id FROM events ORDER BY id").fetchall()
+                buckets = conn.execute("SELECT chat_id, slot, events FROM event_buckets ORDER BY chat_id").fetchall()
+                reminders = conn.execute("SELECT event_id, offset, status FROM reminders ORDER BY offset").fetchall()
+                indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+        finally:
+            db.close()
+        
+        assert rows == [
+            ("С T", int(datetime(2030, 1, 15, 15, 0).timestamp())),
+            ("С пробелом", int(datetime(2030, 1, 15, 16, 30).timestamp())),
+        ]
+        # Напоминания создаются только для событий без отправленного уведомления
+        assert reminders == [(1, 900, "pending"), (1, 3600, "pending")]
+        # Старые события попадают в календарь личного чата создателя
+        assert chats == [(1,), (2,)]
+        # Счетчики /week и /month заполняются по уже существующим событиям
+        assert buckets == [(chat, date // 900, 1) for (_, date), chat in zip(rows, (1, 2))]
+        assert {"idx_events_date", "idx_events_user_date", "idx_reminders_pending", "idx_events_chat_date"} <= indexes
+        assert version > 0
+    
+    def test_migrate_is_idempotent(self, tmp_path):
+        """Тест повторного открытия уже мигрированной базы"""
+        db_path = str(tmp_path / "calendar.db")
+        Database(db_path).close()
+        Database(db_path).close()
+        
+        with sqlite3.connect(db_path) as conn:
+            assert conn.execute("SELECT COUNT(*) FROM events").fetchone()[0] == 0
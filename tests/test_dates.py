@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+from handlers.dates import parse_date, parse_date_prefix, parse_duration_prefix
+
+# Среда, 14:30
+NOW = datetime(2024, 1, 10, 14, 30, 15)
+
+
+class TestParseDatePrefix:
+    def test_absolute_dates_consume_time(self):
+        """Тест абсолютных дат: время после даты входит в префикс"""
+        assert parse_date_prefix("2024-01-15 15:00 Встреча с командой".split(), NOW) == (datetime(2024, 1, 15, 15, 0), 2)
+        assert parse_date_prefix("15.01.2024 9:05 Врач".split(), NOW) == (datetime(2024, 1, 15, 9, 5), 2)
+        assert parse_date_prefix("15.02 Отпуск".split(), NOW) == (datetime(2024, 2, 15), 1)
+        assert parse_date_prefix("2024-02-30 Встреча".split(), NOW) == (None, 0)
+    
+    def test_relative_days_and_weekdays(self):
+        """Тест дней и дней недели с необязательным временем"""
+        assert parse_date_prefix("завтра в 10:00 Встреча".split(), NOW) == (datetime(2024, 1, 11, 10, 0), 3)
+        assert parse_date_prefix("next monday 10:00 Standup".split(), NOW) == (datetime(2024, 1, 15, 10, 0), 3)
+        assert parse_date_prefix("в пятницу в 18:00 Кино".split(), NOW) == (datetime(2024, 1, 12, 18, 0), 4)
+        # Сегодняшний день недели - это через неделю
+        assert parse_date_prefix(["ср"], NOW) == (datetime(2024, 1, 17, 12, 0), 1)
+        # "в" без времени остается в описании
+        assert parse_date_prefix("завтра в офисе".split(), NOW) == (datetime(2024, 1, 11, 12, 0), 1)
+        assert parse_date_prefix("в офисе".split(), NOW) == (None, 0)
+    
+    def test_shifts(self):
+        """Тест сдвигов от текущего момента"""
+        assert parse_date_prefix("in 2 hours Созвон".split(), NOW) == (datetime(2024, 1, 10, 16, 30), 3)
+        assert parse_date_prefix("in an hour".split(), NOW) == (datetime(2024, 1, 10, 15, 30), 3)
+        assert parse_date_prefix("через 30 минут Чай".split(), NOW) == (datetime(2024, 1, 10, 15, 0), 3)
+        assert parse_date_prefix("через неделю Отчет".split(), NOW) == (datetime(2024, 1, 17, 12, 0), 2)
+        assert parse_date_prefix("+3 Отчет".split(), NOW) == (datetime(2024, 1, 13, 12, 0), 1)
+        assert parse_date_prefix("+2 hours".split(), NOW) == (datetime(2024, 1, 10, 16, 30), 2)
+    
+    def test_time_only_rolls_over(self):
+        """Тест времени без дня: сегодня или завтра, если уже прошло"""
+        assert parse_date("16:00", NOW) == datetime(2024, 1, 10, 16, 0)
+        assert parse_date("10:00", NOW) == datetime(2024, 1, 11, 10, 0)
+        assert parse_date("25:00", NOW) is None
+    
+    def test_parse_date_requires_whole_string(self):
+        """Тест parse_date: после даты не должно оставаться слов"""
+        assert parse_date("tomorrow 10:00", NOW) == datetime(2024, 1, 11, 10, 0)
+        assert parse_date("tomorrow meeting", NOW) is None
+
+
+class TestParseDuration:
+    def test_durations_and_end_times(self):
+        """Тест длительности после даты: одним словом, числом с единицей и временем окончания"""
+        start = datetime(2024, 1, 15, 15, 0)
+        assert parse_duration_prefix("1h30m Встреча".split(), start) == (timedelta(minutes=90), 1)
+        assert parse_duration_prefix("45мин Чай".split(), start) == (timedelta(minutes=45), 1)
+        assert parse_duration_prefix("2 часа Встреча".split(), start) == (timedelta(hours=2), 2)
+        assert parse_duration_prefix("до 16:30 Встреча".split(), start) == (timedelta(minutes=90), 2)
+        # Окончание раньше начала - на следующий день
+        assert parse_duration_prefix("-01:00 Ночная смена".split(), start) == (timedelta(hours=10), 1)
+        assert parse_duration_prefix("Встреча в 16:30".split(), start) == (None, 0)
+        assert parse_duration_prefix("0m".split(), start) == (None, 0)
+
@@ -0,0 +1,157 @@
+import sqlite3
+import time
+from datetime import datetime
+from types import SimpleNamespace
+import pytest
+
+from db.database import Database
+from db.digests import DAILY, DIGEST_GRACE, HOURLY, next_digest_at
+from db.timezones import get_zone
+from handlers.commands import cmd_digest
+from handlers.notifications import NotificationService
+from handlers.sender import SendPipeline
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+    
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        self.sent.append((chat_id, text))
+        return SimpleNamespace(message_id=len(self.sent))
+    
+    async def get_chat_member(self, chat_id: int, user_id: int):
+        return SimpleNamespace(status="creator" if user_id == 1 else "member")
+
+
+def set_digest_due(db: Database, chat_id: int, due_at: int):
+    with sqlite3.connect(db.db_path) as conn:
+        conn.execute("UPDATE digests SET next_at = ? WHERE chat_id = ?", (due_at, chat_id))
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / "calendar.db"))
+    yield database
+    database.close()
+
+
+def test_next_digest_at():
+    """Тест сроков сводок: начало часа и местное время, в том числе при переходе на летнее время"""
+    assert next_digest_at(HOURLY, 0, 7200, None) == 10800
+    assert next_digest_at(HOURLY, 0, 7201, None) == 10800
+    # Калькутта (+05:30): начало местного часа - это :30 по UTC
+    kolkata = get_zone("Asia/Kolkata")
+    ten = int(datetime(2024, 1, 15, 10, 0, tzinfo=kolkata).timestamp())
+    assert next_digest_at(HOURLY, 0, ten - 1, kolkata) == ten
+    assert next_digest_at(HOURLY, 0, ten, kolkata) == ten + 3600
+    assert datetime.fromtimestamp(next_digest_at(HOURLY, 0, ten + 1799, kolkata), kolkata).minute == 0
+    
+    tokyo = get_zone("Asia/Tokyo")
+    morning = int(datetime(2024, 1, 15, 8, 0, tzinfo=tokyo).timestamp())
+    assert next_digest_at(DAILY, 8 * 60, morning - 60, tokyo) == morning
+    assert next_digest_at(DAILY, 8 * 60, morning, tokyo) == morning + 86400
+    
+    # 31 марта 2024 в Берлине сутки короче на час, а сводка остается в 08:00 по местным часам
+    berlin = get_zone("Europe/Berlin")
+    after = int(datetime(2024, 3, 30, 9, 0, tzinfo=berlin).timestamp())
+    assert next_digest_at(DAILY, 8 * 60, after, berlin) == int(datetime(2024, 3, 31, 8, 0, tzinfo=berlin).timestamp())
+
+
+@pytest.mark.asyncio
+class TestDigests:
+    async def test_digest_events(self, db):
+        """Тест событий окна: свои, по подписке, календаря чата и повторения серий"""
+        now = int(time.time())
+        own = await db.add_event("Свое", "", now + 600, 1)
+        await db.add_event("Позже окна", "", now + 7200, 1)
+        subscribed = await db.add_event("Чужое", "", now + 1200, 3)
+        await db.subscribe(2, subscribed, user_id=3)
+        group = await db.add_event("Групповое", "", now + 1800, 3, chat_id=-100)
+        await db.subscribe(-100)
+        series = await db.add_event("Планерка", "", now + 300 - 86400 * 3, 1, rrule="daily", chat_id=-100)
+        
+        events = await db.get_digest_events([1, 2, -100, 5], now, now + 3600)
+        
+        assert events == {
+            1: [(series, "Планерка", now + 300), (own, "Свое", now + 600)],
+            2: [(subscribed, "Чужое", now + 1200)],
+            -100: [(series, "Планерка", now + 300), (group, "Групповое", now + 1800)],
+        }
+    
+    async def test_digest_replaces_reminders(self, db):
+        """Тест режима сводок: отдельных напоминаний нет, события приходят одним сообщением"""
+        now = int(time.time())
+        first = await db.add_event("Первое", "", now + 600, 1, reminder_offsets=(300,))
+        second = await db.add_event("Второе", "", now + 1200, 1, reminder_offsets=(300,))
+        await db.subscribe(2, first, user_id=1)
+        next_at = await db.set_digest(1, HOURLY)
+        assert next_at == next_digest_at(HOURLY, 0, now, None)
+        with sqlite3.connect(db.db_path) as conn:
+            conn.execute("UPDATE reminders SET due_at = ?", (now - 1,))
+        bot = FakeBot()
+        service = NotificationService(bot, db, sender=SendPipeline(bot, chat_rate=1000))
+        
+        # Напоминания наступили: подписчик без сводок получает свое, чат со сводками - нет
+        await service.send_due_notifications()
+        await service.outbox.drain()
+        assert [chat_id for chat_id, _ in bot.sent] == [2]
+        assert service.digest_at == next_at
+        
+        # Наступила сводка: оба события одним сообщением, срок перешел на следующий час
+        set_digest_due(db, 1, now - 1)
+        await service.send_due_notifications()
+        await service.outbox.drain()
+        assert len(bot.sent) == 2
+        chat_id, text = bot.sent[1]
+        assert chat_id == 1 and f"🆔 {first} 📝 Первое" in text and f"🆔 {second} 📝 Второе" in text
+        assert (await db.get_digests(1))[0][2] > now
+        
+        # Та же сводка, поставленная повторно (падение до отметки), второй раз не приходит
+        set_digest_due(db, 1, now - 1)
+        await service.send_due_notifications()
+        assert await service.outbox.drain() == 0
+        await service.sender.stop()
+    
+    async def test_late_digest_is_skipped(self, db):
+        """Тест опоздавшей сводки: после долгого простоя она не отправляется, а переходит дальше"""
+        now = int(time.time())
+        await db.add_event("Встреча", "", now - DIGEST_GRACE + 600, 1)
+        await db.set_digest(1, DAILY, 8 * 60)
+        set_digest_due(db, 1, now - DIGEST_GRACE - 60)
+        bot = FakeBot()
+        service = NotificationService(bot, db, sender=SendPipeline(bot, chat_rate=1000))
+        
+        await service.send_due_notifications()
+        await service.outbox.drain()
+        
+        await service.sender.stop()
+        assert bot.sent == []
+        assert (await db.get_digests(1))[0][2] > now
+        assert await db.remove_digests(1)
+        assert await db.get_digests(1) == []
+    
+    async def test_group_digest_needs_admin(self, db):
+        """Тест /digest в группе: сводки чата включает и выключает только создатель или администратор"""
+        answers = []
+        
+        async def answer(text, **kwargs):
+            answers.append(text)
+        
+        def message(text: str, user_id: int):
+            return SimpleNamespace(
+                text=text, chat=SimpleNamespace(id=-100), from_user=SimpleNamespace(id=user_id),
+                sender_chat=None, answer=answer,
+            )
+        
+        await cmd_digest(message("/digest hourly", 2), FakeBot(), db)
+        assert "администраторы" in answers[-1]
+        assert await db.get_digests(-100) == []
+        
+        await cmd_digest(message("/digest daily 08:00", 1), FakeBot(), db)
+        assert [kind for kind, _, _ in await db.get_digests(-100)] == [DAILY]
+        
+        await cmd_digest(message("/digest off", 2), FakeBot(), db)
+        assert len(await db.get_digests(-100)) == 1
+        await cmd_digest(message("/digest", 2), FakeBot(), db)
+        assert "Сводки этого чата" in answers[-1]
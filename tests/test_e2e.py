@@ -0,0 +1,24 @@
+import pytest
+
+from benchmarks.bench_e2e import make_parser, run
+
+
+@pytest.mark.asyncio
+async def test_load_harness_smoke(monkeypatch):
+    """Тест сквозного прогона: все обновления обработаны, напоминания доставлены через Bot API"""
+    # run() настраивает CalendarBot через окружение; monkeypatch вернет его после теста
+    for name in ("BOT_TOKEN", "DB_PATH", "TELEGRAM_API_URL"):
+        monkeypatch.setenv(name, "")
+    args = make_parser().parse_args([
+        "--updates", "200", "--users", "20", "--events", "100",
+        "--reminders", "5", "--reminder-window", "1", "--api-latency", "0",
+    ])
+    results = await run(args)
+    
+    assert results["updates"]["count"] == 200
+    assert results["updates"]["failed"] == 0
+    assert sum(stats["count"] for stats in results["commands"].values()) == 200
+    assert results["commands"]["deleteevent"]["count"] > 0
+    assert results["reminders"]["delivered"] == 5
+    # Ответ на каждую команду и напоминания - настоящие HTTP-запросы sendMessage
+    assert results["api_calls"]["sendmessage"] >= 205
@@ -0,0 +1,98 @@
+import random
+import sqlite3
+import time
+import pytest
+
+from db.database import Database
+from db.intervals import IntervalIndex, free_slots, overlaps
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / "calendar.db"))
+    yield database
+    database.close()
+
+
+class TestIntervalIndex:
+    def test_matches_brute_force(self):
+        """Тест поиска пересечений против перебора: моменты, короткие и очень длинные события"""
+        rng = random.Random(7)
+        rows = [
+            (i, rng.randrange(100_000), rng.choice((0, 0, 60, 900, 3600, 5400, 86400 * 30)))
+            for i in range(1, 2001)
+        ]
+        index = IntervalIndex(rows[::-1])
+        for row in rows[:200]:
+            assert index.remove(*row)
+            assert not index.remove(*row)
+        live = rows[200:]
+        
+        for _ in range(300):
+            start = rng.randrange(-1000, 101_000)
+            end = start + rng.randrange(1, 20_000)
+            expected = sorted(
+                (row for row in live if overlaps(row[1], row[2], start, end)), key=lambda row: (row[1], row[0])
+            )
+            assert index.overlapping(start, end) == expected
+        
+        index.add(*rows[0])
+        index.add(*rows[0])
+        assert len(index) == len(live) + 1
+    
+    def test_free_slots(self):
+        """Тест свободных промежутков: пересекающиеся события, момент и края окна"""
+        busy = [(0, 100), (50, 100), (300, 0), (500, 1000)]
+        assert free_slots(busy, 10, 1000, 100) == [(150, 300), (300, 500)]
+        assert free_slots(busy, 10, 1000, 201) == []
+        assert free_slots([], 10, 1000, 100) == [(10, 1000)]
+        assert free_slots([(900, 10)], 0, 950, 50) == [(0, 900)]
+
+
+@pytest.mark.asyncio
+class TestOverlapQueries:
+    async def test_overlapping_follows_writes(self, db):
+        """Тест пересечений в календаре чата: добавление, удаление, серии, импорт и записи других процессов"""
+        base = int(time.time()) // 86400 * 86400 + 86400 * 10
+        meeting = await db.add_event("Встреча", "", base + 3600, 1, chat_id=-100, duration=3600)
+        moment = await db.add_event("Звонок", "", base + 5400, 1, chat_id=-100)
+        await db.add_event("Другой чат", "", base + 3600, 1, chat_id=-200, duration=3600)
+        standup = await db.add_event(
+            "Планерка", "", base - 86400 * 3 + 4800, 1, rrule="daily", chat_id=-100, duration=1800,
+        )
+        
+        rows = await db.find_overlapping(-100, base + 5000, base + 6000)
+        assert rows == [
+            (meeting, "Встреча", base + 3600, 3600),
+            (standup, "Планерка", base + 4800, 1800),
+            (moment, "Звонок", base + 5400, 0),
+        ]
+        
+        # Индекс построен; дальше его меняют записи, а не перестройка
+        assert await db.delete_event(meeting, 1)
+        assert await db.set_recurrence(standup, 1, None)
+        await db.import_events(iter([("Импорт", "", base + 5500)]), 1, chat_id=-100)
+        added = await db.add_event("Обед", "", base + 5900, 1, chat_id=-100, duration=600)
+        rows = await db.find_overlapping(-100, base + 5000, base + 6000)
+        assert [row[0] for row in rows] == [moment, moment + 3, added]
+        # Серия снова стала обычным событием в день своей первой даты
+        assert await db.find_overlapping(-100, base - 86400 * 3, base - 86400 * 2) == [
+            (standup, "Планерка", base - 86400 * 3 + 4800, 1800),
+        ]
+        
+        # Запись другого процесса видна после проверки data_version
+        with sqlite3.connect(db.db_path) as conn:
+            conn.execute("DELETE FROM events WHERE id = ?", (added,))
+        db._index_checked = 0
+        assert await db.find_free_slots(-100, base + 5000, base + 7000, 300) == [
+            (base + 5000, base + 5400), (base + 5500, base + 7000),
+        ]
+    
+    async def test_free_slots_in_calendar(self, db):
+        """Тест свободного времени с учетом повторений серий"""
+        base = int(time.time()) // 86400 * 86400 + 86400 * 10
+        await db.add_event("Встреча", "", base + 3600, 1, chat_id=-100, duration=3600)
+        await db.add_event("Планерка", "", base - 86400 + 9000, 1, rrule="daily", chat_id=-100, duration=900)
+        
+        slots = await db.find_free_slots(-100, base, base + 4 * 3600, 1800)
+        assert slots == [(base, base + 3600), (base + 7200, base + 9000), (base + 9900, base + 4 * 3600)]
@@ -0,0 +1,97 @@
+import pytest
+from aiogram import Bot, Dispatcher, Router
+from aiogram.filters import Command
+from aiogram.types import Update
+from aiohttp.test_utils import TestClient, TestServer
+
+from benchmarks.fakes import make_message, make_update
+from db.metrics import HANDLER_SECONDS, REGISTRY, Counter, Gauge, Histogram, Registry
+from handlers.commands import cmd_stats
+from handlers.middleware import MetricsMiddleware
+from main.metrics import MetricsServer
+
+
+class TestRegistry:
+    def test_exposition_format(self):
+        """Тест текстового формата Prometheus"""
+        registry = Registry()
+        requests = Counter("test_requests_total", "Запросы", ("result",), registry=registry)
+        depth = Gauge("test_depth", "Очередь", registry=registry)
+        latency = Histogram("test_seconds", "Задержка", ("method",), buckets=(0.1, 1.0), registry=registry)
+        requests.inc("ok")
+        requests.inc("ok")
+        depth.set_function(lambda: 7)
+        latency.observe(0.05, "get")
+        latency.observe(0.5, "get")
+        latency.observe(5.0, "get")
+        
+        lines = registry.expose().splitlines()
+        assert "# TYPE test_requests_total counter" in lines
+        assert 'test_requests_total{result="ok"} 2' in lines
+        assert "test_depth 7" in lines
+        assert 'test_seconds_bucket{method="get",le="0.1"} 1' in lines
+        assert 'test_seconds_bucket{method="get",le="1"} 2' in lines
+        assert 'test_seconds_bucket{method="get",le="+Inf"} 3' in lines
+        assert 'test_seconds_sum{method="get"} 5.55' in lines
+        assert 'test_seconds_count{method="get"} 3' in lines
+        
+        with pytest.raises(ValueError):
+            Counter("test_requests_total", "Повтор", registry=registry)
+    
+    def test_quantile_and_disabled(self):
+        """Тест оценки квантилей по корзинам и выключенного реестра"""
+        registry = Registry()
+        latency = Histogram("test_seconds", "Задержка", buckets=(0.01, 0.1, 1.0), registry=registry)
+        for _ in range(90):
+            latency.observe(0.005)
+        for _ in range(10):
+            latency.observe(0.5)
+        
+        assert latency.quantile(0.5) == pytest.approx(0.01 * 50 / 90)
+        assert 0.1 < latency.quantile(0.99) <= 1.0
+        assert latency.count() == 100
+        
+        registry.enabled = False
+        latency.observe(0.5)
+        assert latency.count() == 100
+        registry.reset()
+        assert latency.count() == 0
+
+
+class TestInstrumentation:
+    @pytest.mark.asyncio
+    async def test_handler_latency_and_endpoint(self):
+        """Тест замера обработчика по имени функции и отдачи /metrics"""
+        router = Router()
+        
+        @router.message(Command("events"))
+        async def cmd_probe(message):
+            pass
+        
+        dp = Dispatcher()
+        dp.message.middleware(MetricsMiddleware())
+        dp.include_router(router)
+        bot = Bot("42:TEST")
+        before = HANDLER_SECONDS.count("cmd_probe")
+        await dp.feed_update(bot, Update.model_validate(make_update(1, "/events", 1), context={"bot": bot}))
+        assert HANDLER_SECONDS.count("cmd_probe") == before + 1
+        
+        async with TestClient(TestServer(MetricsServer().make_app())) as client:
+            response = await client.get("/metrics")
+            assert response.status == 200
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert 'calendar_handler_seconds_count{handler="cmd_probe"}' in await response.text()
+        await bot.session.close()
+    
+    @pytest.mark.asyncio
+    async def test_stats_for_admins_only(self):
+        """Тест того, что /stats отвечает сводкой только администраторам"""
+        message = make_message("/stats", 1)
+        await cmd_stats(message, admins=frozenset({2}))
+        assert "администраторам" in message.answers[0]
+        
+        message = make_message("/stats", 2)
+        await cmd_stats(message, admins=frozenset({2}))
+        assert message.answers[0].startswith("📊 Статистика")
+        assert "Запросы к базе" in message.answers[0]
+        assert REGISTRY.enabled
@@ -0,0 +1,107 @@
+import asyncio
+import multiprocessing
+import re
+import sqlite3
+import time
+from collections import Counter
+
+from db.database import Database
+from handlers.leader import ShardLeases
+from handlers.notifications import NotificationService
+from handlers.sender import SendPipeline
+
+WORKERS = 4
+# Через сколько секунд после старта останавливается каждый процесс:
+# шарды перераспределяются, пока идут напоминания
+STOP_AFTER = (1.0, 1.8, 2.6, 4.5)
+EVENT_ID = re.compile(r"(?:ID события: |🆔 )(\d+)")
+
+
+class RecordingBot:
+    def __init__(self):
+        self.texts = []
+    
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        self.texts.append(text)
+
+
+async def _worker(db_path: str, number: int, ready, go, results):
+    db = Database(db_path)
+    bot = RecordingBot()
+    service = NotificationService(
+        bot,
+        db,
+        sender=SendPipeline(bot, global_rate=10000, chat_rate=10000),
+        lease=ShardLeases(db, ttl=0.6),
+    )
+    ready.put(number)
+    await asyncio.get_running_loop().run_in_executor(None, go.wait)
+    started = time.monotonic()
+    # Процесс 0 первым берет все шарды и первым останавливается
+    await asyncio.sleep(0 if number == 0 else 0.3)
+    task = asyncio.create_task(service.start_notification_service())
+    
+    # Каждый процесс создает свои события, как обработчик /addevent
+    now = int(time.time())
+    for i in range(10):
+        event_id = await db.add_event(f"Процесс {number}", "", now + 3600 + 2 + i % 2, 1000 * (number + 1) + i)
+        service.schedule_event(event_id, now + 3600 + 2 + i % 2)
+    
+    await asyncio.sleep(STOP_AFTER[number] - (time.monotonic() - started))
+    await service.stop_notification_service()
+    await task
+    db.close()
+    results.put((number, [int(event_id) for text in bot.texts for event_id in EVENT_ID.findall(text)]))
+
+
+def run_worker(db_path: str, number: int, ready, go, results):
+    asyncio.run(_worker(db_path, number, ready, go, results))
+
+
+def test_reminders_sent_once_across_processes(tmp_path):
+    """Тест 4 процессов с общей базой: каждое напоминание отправлено ровно один раз"""
+    db_path = str(tmp_path / "calendar.db")
+    Database(db_path).close()
+    
+    context = multiprocessing.get_context("spawn")
+    ready, go, results = context.Queue(), context.Event(), context.Queue()
+    processes = [
+        context.Process(target=run_worker, args=(db_path, number, ready, go, results))
+        for number in range(WORKERS)
+    ]
+    for process in processes:
+        process.start()
+    for _ in range(WORKERS):
+        ready.get(timeout=60)
+    
+    # Напоминания за час наступают в течение 3 секунд после старта
+    with sqlite3.connect(db_path) as conn:
+        now = int(time.time())
+        conn.executemany("""
+            INSERT INTO events (title, description, event_date, created_by, created_at) VALUES (?, '', ?, ?, ?)
+        """, [(f"Событие {i}", now + 3600 + 1 + i % 3, i, now) for i in range(100)])
+        conn.execute("""
+            INSERT INTO reminders (event_id, offset, due_at) SELECT id, 3600, event_date - 3600 FROM events
+        """)
+    go.set()
+    
+    sent = {}
+    for _ in range(WORKERS):
+        number, event_ids = results.get(timeout=60)
+        sent[number] = event_ids
+    for process in processes:
+        process.join(timeout=10)
+        assert process.exitcode == 0
+    
+    with sqlite3.connect(db_path) as conn:
+        expected = [row[0] for row in conn.execute("SELECT id FROM events")]
+        statuses = Counter(row[0] for row in conn.execute("SELECT status FROM reminders WHERE offset = 3600"))
+    counts = Counter(event_id for event_ids in sent.values() for event_id in event_ids)
+    
+    assert len(expected) == 100 + WORKERS * 10
+    # Ни одного дубля и ни одного пропуска
+    assert sorted(counts) == sorted(expected)
+    assert set(counts.values()) == {1}
+    assert statuses == {"sent": len(expected)}
+    # Напоминания отправляли несколько воркеров
+    assert sum(1 for event_ids in sent.values() if event_ids) >= 2
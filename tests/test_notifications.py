@@ -0,0 +1,245 @@
+import sqlite3
+import time
+from datetime import datetime
+from types import SimpleNamespace
+import pytest
+
+from db.database import Database
+from db.metrics import NOTIFIER_TICK_SECONDS, REMINDER_LATENESS_SECONDS
+from db.timezones import format_local, get_zone
+from handlers.commands import cmd_addevent
+from handlers.notifications import NotificationService, format_offset
+from handlers.sender import SendPipeline
+
+
+class FakeBot:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.sent = []
+    
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        if self.fail:
+            raise RuntimeError("Telegram недоступен")
+        self.sent.append((chat_id, text))
+        return SimpleNamespace(message_id=len(self.sent))
+
+
+def make_due(db: Database, event_id: int, offset: int):
+    """Сдвинуть срок напоминания в прошлое, чтобы оно считалось наступившим"""
+    with sqlite3.connect(db.db_path) as conn:
+        conn.execute(
+            "UPDATE reminders SET due_at = ? WHERE event_id = ? AND offset = ?",
+            (int(time.time()) - 1, event_id, offset),
+        )
+
+
+def reminder_status(db: Database, event_id: int, offset: int):
+    with sqlite3.connect(db.db_path) as conn:
+        return conn.execute(
+            "SELECT status, attempts FROM reminders WHERE event_id = ? AND offset = ?",
+            (event_id, offset),
+        ).fetchone()
+
+
+def outbox_rows(db: Database):
+    with sqlite3.connect(db.db_path) as conn:
+        return conn.execute("SELECT chat_id, status, attempts, message_id FROM outbox ORDER BY id").fetchall()
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / "calendar.db"))
+    yield database
+    database.close()
+
+
+@pytest.mark.asyncio
+class TestNotificationService:
+    async def test_load_and_send(self, db):
+        """Тест загрузки напоминаний из базы и отправки наступивших"""
+        now = int(time.time())
+        event_id = await db.add_event("Встреча", "Описание", now + 7200, 12345)
+        await db.add_event("Прошедшее", "Описание", now - 3600, 12345)
+        bot = FakeBot()
+        service = NotificationService(bot, db)
+        
+        await service.load_scheduled_reminders()
+        assert len(service.scheduler) == 2
+        assert service.scheduler.next_due() == now + 3600
+        
+        make_due(db, event_id, 3600)
+        ticks, late = NOTIFIER_TICK_SECONDS.count(), REMINDER_LATENESS_SECONDS.count()
+        await service.send_due_notifications()
+        # Проход только ставит сообщение в outbox, отправляет воркер доставки
+        assert bot.sent == [] and outbox_rows(db) == [(12345, "pending", 0, None)]
+        assert await service.outbox.drain() == 1
+        assert len(bot.sent) == 1
+        assert outbox_rows(db) == [(12345, "sent", 1, 1)]
+        # Проход и опоздание отправленного напоминания (срок - секунду назад) попали в метрики
+        assert NOTIFIER_TICK_SECONDS.count() == ticks + 1
+        assert REMINDER_LATENESS_SECONDS.count() == late + 1
+        chat_id, text = bot.sent[0]
+        assert chat_id == 12345
+        assert "Встреча" in text
+        assert "1 час" in text
+        # Напоминание за 15 минут остается в очереди
+        assert await db.get_pending_reminders() == [(now + 7200 - 900, event_id)]
+        await service.sender.stop()
+    
+    async def test_failed_send_is_retried(self, db):
+        """Тест повторной отправки из outbox после ошибки и отказа после max_attempts"""
+        event_id = await db.add_event("Встреча", "Описание", int(time.time()) + 7200, 12345)
+        bot = FakeBot(fail=True)
+        service = NotificationService(bot, db, max_attempts=2, retry_delay=0, sender=SendPipeline(bot, chat_rate=1000))
+        
+        make_due(db, event_id, 3600)
+        await service.send_due_notifications()
+        # Напоминание отработало, как только сообщение попало в outbox
+        assert reminder_status(db, event_id, 3600) == ("sent", 1)
+        
+        assert await service.outbox.deliver_ready() == 1
+        assert outbox_rows(db) == [(12345, "pending", 1, None)]
+        assert await service.outbox.deliver_ready() == 1
+        assert outbox_rows(db) == [(12345, "failed", 2, None)]
+        assert await service.outbox.deliver_ready() == 0
+        assert bot.sent == []
+        await service.sender.stop()
+    
+    async def test_deleted_event_is_not_sent(self, db):
+        """Тест того, что удаленное событие не приходит в напоминаниях"""
+        now = int(time.time())
+        event_id = await db.add_event("Встреча", "Описание", now + 3600, 12345)
+        bot = FakeBot()
+        service = NotificationService(bot, db)
+        service.schedule_event(event_id, now + 3600)
+        
+        await db.delete_event(event_id, 12345)
+        service.cancel_event(event_id)
+        assert service.scheduler.pop_due(now + 3600) == []
+        await service.send_due_notifications()
+        assert bot.sent == []
+    
+    async def test_series_reminder_is_rescheduled(self, db):
+        """Тест того, что после напоминания о повторении серии планируется следующее"""
+        now = int(time.time())
+        event_id = await db.add_event("Планерка", "Описание", now + 3000, 12345, rrule="daily")
+        bot = FakeBot()
+        service = NotificationService(bot, db)
+        
+        make_due(db, event_id, 900)
+        await service.send_due_notifications()
+        await service.outbox.drain()
+        await service.sender.stop()
+        
+        assert len(bot.sent) == 1 and "Планерка" in bot.sent[0][1]
+        assert reminder_status(db, event_id, 900) == ("pending", 0)
+        assert service.scheduler.pop_due(now + 3000 + 86400 - 900) == [(now + 3000 + 86400 - 900, event_id)]
+    
+    async def test_late_series_reminder_is_skipped(self, db):
+        """Тест того, что опоздавшее напоминание серии не отправляется, а переходит дальше"""
+        now = int(time.time())
+        event_id = await db.add_event("Планерка", "Описание", now + 3000, 12345, rrule="daily", reminder_offsets=(900,))
+        with sqlite3.connect(db.db_path) as conn:
+            conn.execute("UPDATE reminders SET due_at = ? WHERE event_id = ?", (now - 3600, event_id))
+        bot = FakeBot()
+        service = NotificationService(bot, db)
+        
+        await service.send_due_notifications()
+        
+        assert bot.sent == []
+        assert await db.get_pending_reminders() == [(now + 3000 + 86400 - 900, event_id)]
+    
+    async def test_fan_out_to_subscribers(self, db):
+        """Тест рассылки подписчикам: без дублей и одним сообщением на чат"""
+        now = int(time.time())
+        first = await db.add_event("Первое", "Описание", now + 7200, 1, chat_id=-100)
+        second = await db.add_event("Второе", "Описание", now + 7200, 2, chat_id=-100)
+        other = await db.add_event("Чужое", "Описание", now + 7200, 4)
+        await db.subscribe(3, first, user_id=1)
+        await db.subscribe(1, second, user_id=2)
+        await db.subscribe(-100)
+        await db.subscribe(-100, first)
+        for event_id in (first, second, other):
+            make_due(db, event_id, 3600)
+            make_due(db, event_id, 900)
+        bot = FakeBot()
+        service = NotificationService(bot, db, fanout_batch=2, sender=SendPipeline(bot, chat_rate=1000))
+        
+        await service.send_due_notifications()
+        await service.outbox.drain()
+        await service.sender.stop()
+        
+        texts = {}
+        for chat_id, text in bot.sent:
+            texts.setdefault(chat_id, []).append(text)
+        # Группа подписана на свой календарь: оба его события одним сообщением, без чужого
+        assert len(texts[-100]) == 1
+        assert "Первое" in texts[-100][0] and "Второе" in texts[-100][0] and "Чужое" not in texts[-100][0]
+        assert {chat_id: len(chat_texts) for chat_id, chat_texts in texts.items()} == {-100: 1, 1: 2, 2: 1, 3: 1, 4: 1}
+        # Из двух наступивших напоминаний об одном событии отправлено ближайшее
+        assert all("15 минут" in text and "1 час" not in text for _, text in bot.sent)
+        assert reminder_status(db, first, 3600) == ("sent", 1)
+        assert reminder_status(db, second, 900) == ("sent", 1)
+        
+        # Повторный захват тех же напоминаний (падение до их отметки) не ставит сообщения второй раз
+        with sqlite3.connect(db.db_path) as conn:
+            conn.execute("UPDATE reminders SET status = 'pending', attempts = 0 WHERE event_id IN (?, ?, ?)", (first, second, other))
+        queued = len(outbox_rows(db))
+        await service.send_due_notifications()
+        assert len(outbox_rows(db)) == queued
+        assert await service.outbox.drain() == 0
+    
+    async def test_text_in_recipient_zone(self, db):
+        """Тест времени в напоминании: у каждого чата - по его поясу"""
+        event_date = (int(time.time()) // 3600 + 2) * 3600
+        event_id = await db.add_event("Созвон", "Описание", event_date, 1)
+        await db.subscribe(2, event_id, user_id=1)
+        await db.set_time_zone(1, "Asia/Tokyo")
+        await db.set_time_zone(2, "America/New_York")
+        make_due(db, event_id, 3600)
+        bot = FakeBot()
+        service = NotificationService(bot, db, sender=SendPipeline(bot, chat_rate=1000))
+        
+        await service.send_due_notifications()
+        await service.outbox.drain()
+        await service.sender.stop()
+        
+        texts = dict(bot.sent)
+        assert format_local(event_date, get_zone("Asia/Tokyo")) in texts[1]
+        assert format_local(event_date, get_zone("America/New_York")) in texts[2]
+    
+    async def test_addevent_schedules_in_chat_zone(self, db, monkeypatch):
+        """Тест /addevent: таймер ждет тех же сроков, что записаны в reminders, при поясе чата не как у сервера"""
+        monkeypatch.setenv("TZ", "UTC")
+        time.tzset()
+        try:
+            await db.set_time_zone(-100, "Europe/Moscow")
+            service = NotificationService(FakeBot(), db)
+            answers = []
+            
+            async def answer(text, **kwargs):
+                answers.append(text)
+            
+            message = SimpleNamespace(
+                text="/addevent 2030-05-01 10:00 Встреча", chat=SimpleNamespace(id=-100),
+                from_user=SimpleNamespace(id=1), answer=answer,
+            )
+            await cmd_addevent(message, None, db, service)
+        finally:
+            monkeypatch.undo()
+            time.tzset()
+        
+        assert "Событие добавлено" in answers[0]
+        with sqlite3.connect(db.db_path) as conn:
+            due = sorted(row[0] for row in conn.execute("SELECT due_at FROM reminders"))
+        assert due == sorted(due_at for due_at, _ in service.scheduler._heap)
+        assert due[-1] == int(datetime(2030, 5, 1, 10, tzinfo=get_zone("Europe/Moscow")).timestamp()) - 900
+
+
+def test_format_offset():
+    """Тест текста времени до события"""
+    assert format_offset(3600) == "1 час"
+    assert format_offset(2 * 3600) == "2 часа"
+    assert format_offset(15 * 60) == "15 минут"
+    assert format_offset(60) == "1 минута"
+    assert format_offset(22 * 60) == "22 минуты"
@@ -0,0 +1,222 @@
+import asyncio
+import multiprocessing
+import random
+import re
+import sqlite3
+import time
+from collections import Counter
+from types import SimpleNamespace
+import pytest
+
+from db.database import Database
+from handlers.notifications import NotificationService
+from handlers.outbox import OutboxWorker, dedupe_key
+from handlers.sender import SendPipeline
+
+EVENT_ID = re.compile(r"(?:ID события: |🆔 )(\d+)")
+EVENTS = 300
+# Сколько раз процесс бота убивается посреди работы, прежде чем последнему дают доработать
+KILLS = 6
+
+
+class RecordingBot:
+    """Бот, который записывает каждое принятое сообщение в отдельную базу до ответа"""
+    
+    def __init__(self, sink_path: str):
+        self.sink = sqlite3.connect(sink_path, isolation_level=None)
+        self.sink.execute("CREATE TABLE IF NOT EXISTS sent (chat_id INTEGER, text TEXT)")
+    
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        await asyncio.sleep(0.001)
+        cursor = self.sink.execute("INSERT INTO sent (chat_id, text) VALUES (?, ?)", (chat_id, text))
+        return SimpleNamespace(message_id=cursor.lastrowid)
+
+
+class FlakyBot:
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.sent = []
+    
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("Telegram недоступен")
+        self.sent.append((chat_id, text, kwargs.get("reply_markup")))
+        return SimpleNamespace(message_id=100 + len(self.sent))
+
+
+def outbox_rows(db_path: str):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT status, attempts, message_id, holder FROM outbox ORDER BY id").fetchall()
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / "calendar.db"))
+    yield database
+    database.close()
+
+
+@pytest.mark.asyncio
+class TestOutbox:
+    async def test_enqueue_is_idempotent(self, db):
+        """Тест постановки: повтор того же (чат, ключ) не создает второе сообщение"""
+        reminders = [(1, 10, 3600, 1000, 1), (2, 11, 3600, 1000, 1)]
+        message = (5, "Текст", None, dedupe_key(reminders), 1000)
+        assert await db.enqueue_outbox([message]) == 1
+        # Тот же набор напоминаний в другом порядке - тот же ключ
+        assert await db.enqueue_outbox([(5, "Текст", None, dedupe_key(reminders[::-1]), 1000)]) == 0
+        assert await db.enqueue_outbox([(6, "Текст", None, dedupe_key(reminders), 1000)]) == 1
+        assert await db.enqueue_outbox([(5, "Текст", None, dedupe_key(reminders, 1), 1000)]) == 1
+    
+    async def test_expired_lease_is_taken_over(self, db):
+        """Тест аренды: строку упавшего воркера забирает другой после истечения аренды"""
+        await db.enqueue_outbox([(5, "Текст", None, "a", None)])
+        assert [row[0] for row in await db.lease_outbox("first", ttl=0.2)] == [1]
+        assert await db.lease_outbox("second", ttl=0.2) == []
+        await asyncio.sleep(0.3)
+        assert await db.lease_outbox("second", ttl=60) == [(1, 5, "Текст", None, 2, None)]
+        # Освобождение при остановке не трогает чужие строки
+        assert await db.release_outbox("first") == 0
+        assert await db.release_outbox("second") == 1
+        assert outbox_rows(db.db_path) == [("pending", 2, None, None)]
+    
+    async def test_worker_retries_and_records_message_id(self, db):
+        """Тест воркера: повтор после ошибки, message_id и клавиатура из outbox"""
+        bot = FlakyBot(failures=1)
+        worker = OutboxWorker(db, SendPipeline(bot, chat_rate=1000), retry_delay=0.2, poll_interval=0.05)
+        markup = '{"inline_keyboard":[[{"text":"📅","callback_data":"show_events"}]]}'
+        await db.enqueue_outbox([(5, "Текст", markup, "a", int(time.time()))])
+        worker.start()
+        worker.wake()
+        await asyncio.sleep(0.1)
+        assert outbox_rows(db.db_path) == [("pending", 1, None, None)]
+        await asyncio.sleep(0.3)
+        await worker.stop()
+        await worker.sender.stop()
+        
+        assert outbox_rows(db.db_path) == [("sent", 2, 101, None)]
+        assert bot.sent[0][2].inline_keyboard[0][0].callback_data == "show_events"
+    
+    async def test_stop_drains_outbox(self, db):
+        """Тест остановки: готовые сообщения доотправляются до выхода"""
+        bot = FlakyBot(failures=0)
+        worker = OutboxWorker(db, SendPipeline(bot, global_rate=10000, chat_rate=10000), batch=10, poll_interval=60)
+        worker.start()
+        await asyncio.sleep(0.05)
+        await db.enqueue_outbox([(chat_id, "Текст", None, "a", None) for chat_id in range(35)])
+        await worker.stop()
+        await worker.sender.stop()
+        
+        assert len(bot.sent) == 35
+        assert {row[0] for row in outbox_rows(db.db_path)} == {"sent"}
+    
+    async def test_lease_outlives_slow_batch(self, db):
+        """Тест продления аренды: пачка одному чату дольше аренды не достается другому процессу"""
+        bot = FlakyBot(failures=0)
+        # Шесть сообщений одному чату при 10 сообщениях в секунду - полсекунды при аренде на 0,2 с
+        worker = OutboxWorker(db, SendPipeline(bot, chat_rate=10), lease_ttl=0.2)
+        await db.enqueue_outbox([(5, f"Текст {i}", None, str(i), None) for i in range(6)])
+        delivery = asyncio.create_task(worker.deliver_ready())
+        
+        stolen = []
+        while not delivery.done():
+            await asyncio.sleep(0.05)
+            stolen.extend(await db.lease_outbox("other", ttl=60))
+        await worker.sender.stop()
+        
+        assert delivery.result() == 6 and stolen == []
+        assert len(bot.sent) == 6
+        assert {row[0] for row in outbox_rows(db.db_path)} == {"sent"}
+
+
+async def _serve(db_path: str, sink_path: str, ready, finish: bool):
+    db = Database(db_path)
+    bot = RecordingBot(sink_path)
+    service = NotificationService(
+        bot,
+        db,
+        claim_batch=50,
+        fanout_batch=50,
+        sender=SendPipeline(bot, global_rate=3000, chat_rate=10000),
+    )
+    task = asyncio.create_task(service.start_notification_service())
+    ready.put(True)
+    if not finish:
+        # Процесс работает, пока его не убьют
+        await task
+        return
+    while True:
+        await asyncio.sleep(0.2)
+        with sqlite3.connect(db_path) as conn:
+            left = conn.execute("""
+                SELECT (SELECT COUNT(*) FROM reminders WHERE status IN ('pending', 'claimed'))
+                     + (SELECT COUNT(*) FROM outbox WHERE status IN ('pending', 'leased'))
+            """).fetchone()[0]
+        if left == 0:
+            break
+    await service.stop_notification_service()
+    await task
+    db.close()
+
+
+def run_bot(db_path: str, sink_path: str, ready, finish: bool):
+    asyncio.run(_serve(db_path, sink_path, ready, finish))
+
+
+async def _fill(db_path: str) -> set:
+    """События с наступившими напоминаниями; вернуть ожидаемые пары (событие, чат)"""
+    db = Database(db_path)
+    now = int(time.time())
+    
+    async def add(i: int) -> set:
+        event_id = await db.add_event(f"Событие {i}", "", now + 3600 + 60, i + 1, reminder_offsets=(3600,))
+        # Общие подписчики получают несколько событий одним сообщением
+        await db.subscribe(10000 + i % 10, event_id, user_id=i + 1)
+        return {(event_id, i + 1), (event_id, 10000 + i % 10)}
+    
+    expected = set().union(*await asyncio.gather(*(add(i) for i in range(EVENTS))))
+    db.close()
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("UPDATE reminders SET due_at = ? - (id % 2)", (int(time.time()),))
+    return expected
+
+
+def test_killed_processes_deliver_everything(tmp_path):
+    """Тест падений: процесс бота убивается в случайные моменты под нагрузкой, но каждое напоминание доходит"""
+    db_path, sink_path = str(tmp_path / "calendar.db"), str(tmp_path / "sink.db")
+    expected = asyncio.run(_fill(db_path))
+    context = multiprocessing.get_context("spawn")
+    ready = context.Queue()
+    seed = random.randrange(10 ** 6)
+    rng = random.Random(seed)
+    
+    for finish in [False] * KILLS + [True]:
+        process = context.Process(target=run_bot, args=(db_path, sink_path, ready, finish))
+        process.start()
+        ready.get(timeout=60)
+        if finish:
+            process.join(timeout=60)
+            assert process.exitcode == 0
+        else:
+            time.sleep(rng.uniform(0.05, 0.5))
+            process.kill()
+            process.join(timeout=10)
+    
+    with sqlite3.connect(sink_path) as conn:
+        sent = conn.execute("SELECT rowid, chat_id, text FROM sent").fetchall()
+    with sqlite3.connect(db_path) as conn:
+        outbox = conn.execute("SELECT chat_id, status, message_id FROM outbox").fetchall()
+        reminders = Counter(row[0] for row in conn.execute("SELECT status FROM reminders"))
+    delivered = Counter(
+        (int(event_id), chat_id) for _, chat_id, text in sent for event_id in EVENT_ID.findall(text)
+    )
+    
+    # Хотя бы один раз: ни одного пропуска, ничего лишнего
+    assert set(delivered) == expected, f"seed {seed}"
+    assert reminders == {"sent": EVENTS}
+    # Каждая строка outbox отправлена, и ее message_id - ответ на нее
+    messages = {rowid: chat_id for rowid, chat_id, _ in sent}
+    assert all(status == "sent" and messages[message_id] == chat_id for chat_id, status, message_id in outbox)
+    # Дубли возможны только для сообщений, отправленных прямо перед падением
+    assert len(sent) - len(outbox) <= KILLS * 100, f"seed {seed}"
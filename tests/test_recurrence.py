@@ -0,0 +1,104 @@
+from datetime import datetime
+from itertools import islice
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from db.recurrence import describe_rule, format_rule, iter_occurrences, last_occurrence, next_occurrence, occurrences_between, parse_rule
+
+
+def ts(*args) -> int:
+    return int(datetime(*args).timestamp())
+
+
+class TestRules:
+    def test_parse_and_format(self):
+        """Тест разбора RRULE, сокращений и канонической записи"""
+        assert format_rule(parse_rule("weekly")) == "FREQ=WEEKLY"
+        assert format_rule(parse_rule("RRULE:FREQ=WEEKLY;BYDAY=WE,MO;COUNT=10")) == "FREQ=WEEKLY;BYDAY=MO,WE;COUNT=10"
+        assert parse_rule("FREQ=DAILY;INTERVAL=3").interval == 3
+        
+        for invalid in ("hourly", "FREQ=SECONDLY", "FREQ=DAILY;BYDAY=MO", "FREQ=DAILY;BYMONTH=1", "FREQ=DAILY;COUNT=0"):
+            with pytest.raises(ValueError):
+                parse_rule(invalid)
+    
+    def test_describe(self):
+        """Тест описания правила по-русски"""
+        assert describe_rule("weekly") == "каждую неделю"
+        assert describe_rule("FREQ=DAILY;INTERVAL=21;COUNT=3") == "раз в 21 день, 3 раза"
+        assert describe_rule("FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,FR") == "раз в 2 недели (пн, пт)"
+
+
+class TestOccurrences:
+    def test_weekly_by_day_with_count(self):
+        """Тест недельной серии по дням недели с COUNT"""
+        dtstart = ts(2024, 1, 3, 10, 0)  # среда
+        rule = parse_rule("FREQ=WEEKLY;BYDAY=MO,WE;COUNT=5")
+        
+        assert list(iter_occurrences(dtstart, rule)) == [
+            ts(2024, 1, 3, 10), ts(2024, 1, 8, 10), ts(2024, 1, 10, 10), ts(2024, 1, 15, 10), ts(2024, 1, 17, 10),
+        ]
+        assert last_occurrence(dtstart, rule) == ts(2024, 1, 17, 10)
+    
+    def test_monthly_skips_missing_days(self):
+        """Тест месячной серии на 31 число: месяцы без 31 числа пропускаются"""
+        dtstart = ts(2024, 1, 31, 15, 0)
+        occurrences = list(islice(iter_occurrences(dtstart, parse_rule("monthly")), 4))
+        assert occurrences == [ts(2024, 1, 31, 15), ts(2024, 3, 31, 15), ts(2024, 5, 31, 15), ts(2024, 7, 31, 15)]
+        
+        leap = ts(2024, 2, 29, 9, 0)
+        assert next_occurrence(leap, parse_rule("yearly"), ts(2025, 1, 1)) == ts(2028, 2, 29, 9)
+    
+    @pytest.mark.parametrize("rrule", [
+        "FREQ=DAILY;INTERVAL=3;COUNT=40",
+        "FREQ=WEEKLY;INTERVAL=2;BYDAY=TU,SA;COUNT=25",
+        "FREQ=WEEKLY;UNTIL=20250101T000000Z",
+        "FREQ=MONTHLY;INTERVAL=2;COUNT=12",
+        "FREQ=YEARLY;COUNT=5",
+    ])
+    def test_window_start_matches_full_expansion(self, rrule):
+        """Тест того, что переход сразу к окну дает те же повторения, что перебор с начала"""
+        dtstart = ts(2024, 1, 31, 23, 30)
+        rule = parse_rule(rrule)
+        everything = list(iter_occurrences(dtstart, rule))
+        for start in everything[::3] + [occurrence + 1 for occurrence in everything[::4]]:
+            assert list(iter_occurrences(dtstart, rule, start)) == [o for o in everything if o >= start]
+    
+    @pytest.mark.parametrize("rrule", ["FREQ=DAILY;INTERVAL=3", "FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,TH,SU", "FREQ=WEEKLY"])
+    def test_windows_match_full_expansion(self, rrule):
+        """Тест арифметической проверки окон: те же повторения и верная оценка следующего"""
+        dtstart = ts(2024, 1, 31, 23, 30)
+        rule = parse_rule(rrule)
+        everything = list(islice(iter_occurrences(dtstart, rule), 200))
+        for day in range(0, 400, 5):
+            start = ts(2024, 1, 25) + day * 86400
+            found, after = occurrences_between(dtstart, rule, start, start + 86400)
+            assert found == [o for o in everything if start <= o < start + 86400]
+            assert after <= min(o for o in everything if o >= start + 86400)
+    
+    def test_series_keeps_wall_clock_in_zone(self):
+        """Тест серии в поясе Берлина: 10:00 на часах до и после перехода на летнее время"""
+        zone = ZoneInfo("Europe/Berlin")
+        dtstart = int(datetime(2024, 3, 25, 10, 0, tzinfo=zone).timestamp())
+        weekly = parse_rule("FREQ=WEEKLY;BYDAY=MO,SA")
+        
+        occurrences = list(islice(iter_occurrences(dtstart, weekly, zone=zone), 4))
+        assert [datetime.fromtimestamp(o, zone).strftime("%a %H:%M") for o in occurrences] == [
+            "Mon 10:00", "Sat 10:00", "Mon 10:00", "Sat 10:00",
+        ]
+        # В UTC повторения после 31 марта на час раньше
+        assert occurrences[2] - occurrences[0] == 7 * 86400 - 3600
+        start, end = occurrences[1] + 1, occurrences[3] + 1
+        assert occurrences_between(dtstart, weekly, start, end, zone=zone)[0] == occurrences[2:]
+        assert last_occurrence(dtstart, parse_rule("FREQ=DAILY;COUNT=8"), zone) == int(
+            datetime(2024, 4, 1, 10, 0, tzinfo=zone).timestamp()
+        )
+    
+    def test_exdates_do_not_shift_count(self):
+        """Тест исключенных дат: повторение пропускается, COUNT не сдвигается"""
+        dtstart = ts(2024, 1, 1, 9, 0)
+        rule = parse_rule("FREQ=DAILY;COUNT=3")
+        
+        assert list(iter_occurrences(dtstart, rule, exdates={ts(2024, 1, 2, 9)})) == [ts(2024, 1, 1, 9), ts(2024, 1, 3, 9)]
+        assert next_occurrence(dtstart, rule, ts(2024, 1, 1, 9), {ts(2024, 1, 2, 9)}) == ts(2024, 1, 3, 9)
+        assert next_occurrence(dtstart, rule, ts(2024, 1, 3, 9)) is None
@@ -0,0 +1,85 @@
+import asyncio
+import time
+import pytest
+
+from handlers.scheduler import ReminderScheduler
+
+HOUR = 3600
+QUARTER = 15 * 60
+
+
+class TestReminderScheduler:
+    def test_reminders_fire_in_order(self):
+        """Тест порядка срабатывания напоминаний за час и за 15 минут"""
+        scheduler = ReminderScheduler()
+        now = 1_000_000
+        scheduler.schedule(1, [now + HOUR, now + 105 * 60])
+        scheduler.schedule(2, [now + 30 * 60, now + 75 * 60])
+        
+        assert scheduler.next_due() == now + 30 * 60
+        assert scheduler.pop_due(now + 30 * 60) == [(now + 30 * 60, 2)]
+        assert scheduler.pop_due(now + 80 * 60) == [(now + HOUR, 1), (now + 75 * 60, 2)]
+        assert scheduler.pop_due(now + 105 * 60) == [(now + 105 * 60, 1)]
+        assert scheduler.next_due() is None
+        assert len(scheduler) == 0
+    
+    def test_nothing_due_before_time(self):
+        """Тест того, что напоминания не срабатывают раньше срока"""
+        scheduler = ReminderScheduler()
+        scheduler.schedule(1, [10_000])
+        
+        assert scheduler.pop_due(9_999) == []
+        assert scheduler.pop_due(10_000) == [(10_000, 1)]
+    
+    def test_cancel(self):
+        """Тест отмены напоминаний удаленного события"""
+        scheduler = ReminderScheduler()
+        scheduler.schedule(1, [10_000 - HOUR, 10_000 - QUARTER])
+        scheduler.schedule(2, [20_000 - HOUR])
+        scheduler.cancel(1)
+        
+        assert scheduler.next_due() == 20_000 - HOUR
+        assert scheduler.pop_due(20_000) == [(20_000 - HOUR, 2)]
+    
+    def test_cancel_compacts_heap(self):
+        """Тест того, что отмененные записи не копятся в памяти"""
+        scheduler = ReminderScheduler()
+        scheduler.schedule_many((event_id, event_id) for event_id in range(3000))
+        for event_id in range(2000):
+            scheduler.cancel(event_id)
+        
+        assert len(scheduler) < 2000
+        assert scheduler.next_due() == 2000
+    
+    def test_schedule_many(self):
+        """Тест массовой загрузки напоминаний при старте"""
+        scheduler = ReminderScheduler()
+        scheduler.schedule_many([(30_000, 1), (20_000, 2), (25_000, 1)])
+        
+        assert len(scheduler) == 3
+        assert scheduler.next_due() == 20_000
+        assert scheduler.pop_due(25_000) == [(20_000, 2), (25_000, 1)]
+    
+    @pytest.mark.asyncio
+    async def test_run_wakes_on_time(self):
+        """Тест того, что цикл просыпается к сроку и при добавлении раннего напоминания"""
+        scheduler = ReminderScheduler()
+        fired = []
+        
+        async def handler(wakeups):
+            fired.extend((event_id, time.time()) for _, event_id in wakeups)
+            if len(fired) == 2:
+                scheduler.stop()
+        
+        now = time.time()
+        scheduler.schedule(1, [int(now) + 30])
+        task = asyncio.create_task(scheduler.run(handler))
+        await asyncio.sleep(0.05)
+        
+        # Новое напоминание раньше текущего должно разбудить спящий цикл
+        scheduler.schedule(2, [int(now) + 1])
+        scheduler.schedule(3, [int(now) + 2])
+        await asyncio.wait_for(task, timeout=5)
+        
+        assert [event_id for event_id, _ in fired] == [2, 3]
+        assert fired[0][1] - (int(now) + 1) < 0.5
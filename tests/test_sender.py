@@ -0,0 +1,117 @@
+import asyncio
+import time
+import pytest
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter, TelegramServerError
+from aiogram.methods import SendMessage
+
+from benchmarks.fakes import RateLimitedBot
+from handlers.sender import SendPipeline, TokenBucket
+
+
+class ScriptedBot:
+    """Бот, который отвечает заранее заданными ошибками, а потом успехом"""
+    
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = []
+    
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        self.calls.append(time.monotonic())
+        if self.errors:
+            raise self.errors.pop(0)
+
+
+def method():
+    return SendMessage(chat_id=1, text="тест")
+
+
+class TestTokenBucket:
+    def test_reservations_are_spaced(self):
+        """Тест того, что занятые вперед токены выдаются с интервалом 1/rate"""
+        bucket = TokenBucket(rate=10, capacity=1)
+        now = bucket.updated
+        
+        assert bucket.reserve(now) == 0
+        assert bucket.reserve(now) == pytest.approx(0.1)
+        assert bucket.reserve(now) == pytest.approx(0.2)
+        # Через секунду корзина снова полна
+        assert bucket.reserve(now + 1.3) == 0
+    
+    def test_penalize(self):
+        """Тест блокировки корзины на время retry_after"""
+        bucket = TokenBucket(rate=1, capacity=1)
+        now = bucket.updated
+        bucket.penalize(5, now)
+        
+        assert bucket.reserve(now) == pytest.approx(5)
+
+
+@pytest.mark.asyncio
+class TestSendPipeline:
+    async def test_respects_telegram_limits(self):
+        """Тест того, что конвейер не получает 429 от бота с лимитами Telegram"""
+        bot = RateLimitedBot(global_rate=100, chat_rate=10, latency=0.001)
+        pipeline = SendPipeline(bot, workers=8, global_rate=100, chat_rate=10)
+        
+        started = time.monotonic()
+        results = await asyncio.gather(*(
+            pipeline.send(chat_id=chat_id % 5, text=f"сообщение {chat_id}") for chat_id in range(50)
+        ))
+        elapsed = time.monotonic() - started
+        await pipeline.stop()
+        
+        assert all(results)
+        assert len(bot.sent) == 50
+        assert bot.rate_limited == 0
+        # 10 сообщений в каждый из 5 чатов при 10 в секунду на чат
+        assert elapsed >= 0.9
+        assert pipeline.stats()["queue_depth"] == 0
+    
+    async def test_retry_after_is_honoured(self):
+        """Тест повтора после TelegramRetryAfter не раньше retry_after"""
+        bot = ScriptedBot([TelegramRetryAfter(method(), "Too Many Requests", 1)])
+        pipeline = SendPipeline(bot, chat_rate=100)
+        
+        assert await pipeline.send(chat_id=1, text="тест")
+        await pipeline.stop()
+        
+        assert len(bot.calls) == 2
+        assert bot.calls[1] - bot.calls[0] >= 0.95
+        assert pipeline.metrics.rate_limited == 1
+        assert pipeline.metrics.retried == 1
+    
+    async def test_server_errors_back_off_then_give_up(self):
+        """Тест экспоненциальных повторов при ошибках сервера и отказа после max_retries"""
+        bot = ScriptedBot([TelegramServerError(method(), "Bad Gateway")] * 3)
+        pipeline = SendPipeline(bot, global_rate=1000, chat_rate=1000, max_retries=2, backoff=0.05)
+        
+        assert not await pipeline.send(chat_id=1, text="тест")
+        await pipeline.stop()
+        
+        assert len(bot.calls) == 3
+        assert bot.calls[2] - bot.calls[1] > bot.calls[1] - bot.calls[0]
+        assert pipeline.metrics.failed == 1
+    
+    async def test_forbidden_is_not_retried(self):
+        """Тест того, что заблокировавшему бота пользователю не отправляем повторно"""
+        bot = ScriptedBot([TelegramForbiddenError(method(), "bot was blocked by the user")])
+        pipeline = SendPipeline(bot)
+        
+        assert not await pipeline.send(chat_id=1, text="тест")
+        await pipeline.stop()
+        
+        assert len(bot.calls) == 1
+        assert pipeline.metrics.retried == 0
+    
+    async def test_busy_chat_does_not_block_others(self):
+        """Тест того, что ожидание лимита одного чата не занимает воркер"""
+        bot = RateLimitedBot(global_rate=1000, chat_rate=4, latency=0)
+        pipeline = SendPipeline(bot, workers=1, global_rate=1000, chat_rate=4)
+        
+        busy = [pipeline.submit(chat_id=1, text=f"в группу {i}") for i in range(3)]
+        started = time.monotonic()
+        assert await pipeline.send(chat_id=2, text="в личку")
+        
+        assert time.monotonic() - started < 0.2
+        assert all(await asyncio.gather(*busy))
+        await pipeline.stop()
@@ -0,0 +1,88 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import pytest
+
+from db.database import Database
+from db.timezones import format_local, get_zone, localize, normalize_zone
+from handlers.commands import cmd_timezone
+
+
+def utc(*args) -> int:
+    return int(datetime(*args, tzinfo=timezone.utc).timestamp())
+
+
+class TestTimeZones:
+    def test_normalize_zone(self):
+        """Тест разбора пояса: имена IANA без учета регистра и смещения от UTC"""
+        assert normalize_zone("europe/moscow") == "Europe/Moscow"
+        assert normalize_zone("Asia/Yekaterinburg") == "Asia/Yekaterinburg"
+        assert normalize_zone("UTC+3") == "Etc/GMT-3"
+        assert normalize_zone("-05:00") == "Etc/GMT+5"
+        assert normalize_zone("gmt") == "UTC"
+        assert normalize_zone("Mars/Olympus") is None
+        assert normalize_zone("UTC+15") is None
+    
+    def test_zone_objects_are_cached(self):
+        """Тест кэша поясов: один объект на имя, None - время сервера"""
+        assert get_zone("Europe/Berlin") is get_zone("Europe/Berlin")
+        assert get_zone(None) is None
+    
+    def test_render_across_fall_back(self):
+        """Тест вывода в час, который повторяется при переходе на зимнее время"""
+        zone = get_zone("America/New_York")
+        # 3 ноября 2024: 01:30 бывает дважды, сначала по EDT (-4), потом по EST (-5)
+        assert format_local(utc(2024, 11, 3, 5, 30), zone) == "03.11.2024 01:30"
+        assert format_local(utc(2024, 11, 3, 6, 30), zone) == "03.11.2024 01:30"
+        assert format_local(utc(2024, 11, 3, 7, 30), zone) == "03.11.2024 02:30"
+    
+    def test_input_across_spring_forward(self):
+        """Тест даты из команды в поясе пользователя вокруг перехода на летнее время"""
+        zone = get_zone("Europe/Berlin")
+        assert int(localize(datetime(2024, 3, 30, 10, 0), zone).timestamp()) == utc(2024, 3, 30, 9, 0)
+        assert int(localize(datetime(2024, 3, 31, 10, 0), zone).timestamp()) == utc(2024, 3, 31, 8, 0)
+        # 02:30 31 марта в Берлине не бывает: время считается по зимнему смещению
+        # и на часах оказывается 03:30
+        moment = int(localize(datetime(2024, 3, 31, 2, 30), zone).timestamp())
+        assert format_local(moment, zone) == "31.03.2024 03:30"
+
+
+class FakeBot:
+    """Бот, у которого пользователь 1 - администратор группы, а остальные - участники"""
+    
+    async def get_chat_member(self, chat_id: int, user_id: int):
+        return SimpleNamespace(status="administrator" if user_id == 1 else "member")
+
+
+@pytest.mark.asyncio
+async def test_group_zone_needs_admin(tmp_path):
+    """Тест /timezone в группе: пояс чата меняют только администраторы, посмотреть может любой"""
+    db = Database(str(tmp_path / "calendar.db"))
+    answers = []
+    
+    async def answer(text, **kwargs):
+        answers.append(text)
+    
+    def message(text: str, user_id: int, chat_id: int = -100):
+        return SimpleNamespace(
+            text=text, chat=SimpleNamespace(id=chat_id), from_user=SimpleNamespace(id=user_id),
+            sender_chat=None, answer=answer,
+        )
+    
+    try:
+        await cmd_timezone(message("/timezone Europe/Moscow", 2), FakeBot(), db)
+        assert "администраторы" in answers[-1]
+        assert await db.get_time_zone(-100, 2) is None
+        
+        await cmd_timezone(message("/timezone Europe/Moscow", 1), FakeBot(), db)
+        assert await db.get_time_zone(-100, 2) == "Europe/Moscow"
+        
+        await cmd_timezone(message("/timezone off", 2), FakeBot(), db)
+        assert await db.get_time_zone(-100, 2) == "Europe/Moscow"
+        await cmd_timezone(message("/timezone", 2), FakeBot(), db)
+        assert "Europe/Moscow" in answers[-1]
+        
+        # В личном чате свой пояс меняет сам пользователь
+        await cmd_timezone(message("/timezone UTC+3", 2, chat_id=2), FakeBot(), db)
+        assert await db.get_time_zone(2, 2) is not None
+    finally:
+        db.close()
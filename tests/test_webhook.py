@@ -0,0 +1,69 @@
+import asyncio
+import pytest
+from aiogram import Bot, Dispatcher, Router
+from aiogram.filters import Command
+from aiohttp.test_utils import TestClient, TestServer
+
+from benchmarks.fakes import make_update
+from main.webhook import SECRET_HEADER, WebhookServer
+
+TOKEN = "42:TEST"
+
+
+def make_server(handled, delay: float = 0.0, **kwargs) -> WebhookServer:
+    router = Router()
+    
+    @router.message(Command("events"))
+    async def record(message):
+        await asyncio.sleep(delay)
+        handled.append(message.from_user.id)
+    
+    dp = Dispatcher()
+    dp.include_router(router)
+    return WebhookServer(dp, Bot(TOKEN), **kwargs)
+
+
+class TestWebhookServer:
+    @pytest.mark.asyncio
+    async def test_updates_are_processed(self):
+        """Тест того, что POST с обновлением доходит до обработчика"""
+        handled = []
+        server = make_server(handled, concurrency=4)
+        async with TestClient(TestServer(server.make_app())) as client:
+            for update_id in range(10):
+                response = await client.post("/webhook", json=make_update(update_id, "/events", update_id))
+                assert response.status == 200
+            
+            response = await client.post("/webhook", data="not json")
+            assert response.status == 400
+        
+        # Выход из клиента останавливает сервер и дожидается очереди
+        assert sorted(handled) == list(range(10))
+        assert server.stats()["processed"] == 10
+    
+    @pytest.mark.asyncio
+    async def test_secret_token(self):
+        """Тест проверки секретного заголовка"""
+        handled = []
+        server = make_server(handled, secret_token="s3cret")
+        async with TestClient(TestServer(server.make_app())) as client:
+            response = await client.post("/webhook", json=make_update(1, "/events", 1))
+            assert response.status == 401
+            response = await client.post("/webhook", json=make_update(2, "/events", 2), headers={SECRET_HEADER: "s3cret"})
+            assert response.status == 200
+        
+        assert handled == [2]
+    
+    @pytest.mark.asyncio
+    async def test_shutdown_drains_queue(self):
+        """Тест того, что при остановке принятые обновления дообрабатываются"""
+        handled = []
+        server = make_server(handled, delay=0.05, concurrency=2)
+        async with TestClient(TestServer(server.make_app())) as client:
+            for update_id in range(8):
+                await client.post("/webhook", json=make_update(update_id, "/events", update_id))
+            # Ответы пришли раньше, чем обновления обработаны
+            assert len(handled) < 8
+        
+        assert len(handled) == 8
+        assert server.stats()["queue_depth"] == 0